@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+协程监控引擎
+
+核心思路：
+- 每路流是一个协程会话，全部会话分摊到少量事件循环线程上运行，不再一路流一个系统线程。
+- PyAV 的 av.open 与 demux 都是阻塞调用，统一放入有界线程池执行；
+  每次只读取一个时间片（async_read_slice_ms）的数据包，随后让出线程池给其他会话，
+  未读取的数据暂存在 socket/libav 缓冲区中。
+- 会话复用 StreamSession 的全部处理逻辑，写入指标表的状态字段与线程引擎完全一致，
+  并提供 start/is_alive/join/stop 等线程式接口，GUI 与报表无需区分引擎。
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rtsp_engine import SETTINGS, STREAM_ERRORS, StreamSession
+
+
+class AsyncMonitorEngine:
+    """少量事件循环线程 + 有界阻塞读取线程池"""
+    def __init__(self, loop_threads, executor_workers):
+        self.loops = []
+        self.threads = []
+        self.executor = ThreadPoolExecutor(max_workers=max(1, executor_workers), thread_name_prefix="协程读取")
+        for i in range(max(1, loop_threads)):
+            loop = asyncio.new_event_loop()
+            t = threading.Thread(target=self._run_loop, args=(loop,), name=f"协程循环-{i+1:02d}", daemon=True)
+            t.start()
+            self.loops.append(loop)
+            self.threads.append(t)
+        self._next_loop = itertools.count()
+
+    def _run_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(self, coro):
+        """将会话协程轮询分配到某个事件循环，返回 concurrent.futures.Future"""
+        loop = self.loops[next(self._next_loop) % len(self.loops)]
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run_blocking(self, func, *args):
+        """在有界线程池中执行阻塞调用，只能在会话协程内 await"""
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def shutdown(self, timeout=2.0):
+        """停止所有事件循环并释放线程池"""
+        for loop in self.loops:
+            loop.call_soon_threadsafe(loop.stop)
+        for t in self.threads:
+            t.join(timeout=timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+ASYNC_ENGINE = None
+ASYNC_ENGINE_LOCK = threading.Lock()
+
+def get_async_engine():
+    """按当前设置懒加载全局协程引擎"""
+    global ASYNC_ENGINE
+    with ASYNC_ENGINE_LOCK:
+        if ASYNC_ENGINE is None:
+            ASYNC_ENGINE = AsyncMonitorEngine(SETTINGS.async_loop_threads, SETTINGS.async_executor_workers)
+        return ASYNC_ENGINE
+
+def shutdown_async_engine():
+    """关闭全局协程引擎，下次使用时按最新设置重建"""
+    global ASYNC_ENGINE
+    with ASYNC_ENGINE_LOCK:
+        if ASYNC_ENGINE is not None:
+            ASYNC_ENGINE.shutdown()
+            ASYNC_ENGINE = None
+
+
+class AsyncStreamMonitor(StreamSession):
+    """协程版流监控会话，对外提供与 RTSPStreamMonitor 一致的线程式接口"""
+    def __init__(self, url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol='UDP', start_at=0.0):
+        super().__init__(url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol, start_at)
+        self.name = self.log_name
+        self._future = None
+        self._packet_iter = None
+
+    def start(self):
+        self._future = get_async_engine().submit(self.run_async())
+
+    def is_alive(self):
+        return self._future is not None and not self._future.done()
+
+    def join(self, timeout=None):
+        if self._future is None:
+            return
+        try:
+            self._future.result(timeout)
+        except Exception:
+            pass
+
+    def stop(self):
+        self.stop_event.set()
+
+    async def _sleep(self, seconds):
+        """可被停止信号打断的休眠"""
+        deadline = time.time() + seconds
+        while not self.stop_event.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 0.2))
+
+    async def _backoff_sleep(self, seconds):
+        """重试退避等待，实际等待时间计入重试退避"""
+        start = time.monotonic()
+        await self._sleep(seconds)
+        self.record_backoff(time.monotonic() - start)
+
+    async def _wait_connect_permit(self):
+        """协程版等待连接许可，熔断和限速等待不占用线程池"""
+        while not self.stop_event.is_set():
+            allowed, wait = self.connect_permit()
+            await self._sleep(wait)
+            if allowed:
+                break
+        return not self.stop_event.is_set()
+
+    async def connect(self, engine):
+        """协程版重试连接，重试等待不占用线程池；返回最后一次尝试的开始时刻，停止时返回 None"""
+        options = self.build_connect_options()
+        max_retries = self.get_max_retries()
+
+        for retry in range(max_retries):
+            current_options = self.get_attempt_options(options, retry, max_retries)
+            if not await self._wait_connect_permit():
+                return None
+            start_time = time.time()
+            try:
+                self.container = await engine.run_blocking(self.open_stream, current_options)
+                self.on_connect_succeeded()
+                return start_time
+            except Exception as e:
+                self.on_connect_failed()
+                if retry < max_retries - 1:
+                    retry_delay = self.next_retry_delay(str(e))
+                    transport_type = current_options.get('rtsp_transport', 'default')
+                    self.logger.warning(f"连接尝试 {retry + 1} 失败 ({transport_type}): {e}, {retry_delay:.1f}秒后重试...")
+                    await self._backoff_sleep(retry_delay)
+                else:
+                    raise e
+
+        raise Exception(f"所有连接尝试都失败，无法连接到RTSP流: {self.url}")
+
+    def _read_slice(self):
+        """在线程池中读取一个时间片内的视频包，返回流是否仍可继续读取"""
+        deadline = time.time() + SETTINGS.async_read_slice_ms / 1000.0
+        try:
+            for packet in self._packet_iter:
+                if self.stop_event.is_set():
+                    return False
+                self.process_packet(packet)
+                if time.time() >= deadline:
+                    return True
+        except Exception as demux_error:
+            self.logger.error(f"处理视频包时发生错误: {demux_error}")
+        return False
+
+    async def run_async(self):
+        engine = get_async_engine()
+        if not self.prepare_url():
+            return
+        # 加压等待不占用事件循环和线程池
+        await self._sleep(self.start_delay())
+
+        while not self.stop_event.is_set():
+            try:
+                self.logger.debug(f"正在尝试连接: {self.url}...")
+                start_time = await self.connect(engine)
+                if self.container is None:
+                    break
+                self.on_connected(start_time)
+
+                if self.container:
+                    self._packet_iter = self.container.demux(video=0)
+                    while not self.stop_event.is_set():
+                        if not await engine.run_blocking(self._read_slice):
+                            break
+
+                if not self.stop_event.is_set():
+                    raise Exception("流结束或中断")
+
+            except STREAM_ERRORS as e:
+                retry_delay = self.reconnect_delay()
+                self.handle_stream_error(e, retry_delay)
+                await self._backoff_sleep(retry_delay)
+            except Exception as e:
+                self.logger.error(f"发生未知异常: {e}")
+                await self._backoff_sleep(self.reconnect_delay())
+            finally:
+                self._packet_iter = None
+                if self.container:
+                    await engine.run_blocking(self.close_container)
+
+        self.publish_final_status()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+线程引擎 vs 协程引擎压测对比
+
+对每种引擎按流数量逐级加压，统计：
+- RSS 内存、进程 CPU（折算为单核百分比）、系统线程数
+- 实收帧 / 理论帧，达到阈值（默认 95%）视为可持续
+最后输出每种引擎的最大可持续流数量。
+
+用法：
+    python bench/bench_engines.py                      # 合成流，无需 RTSP 服务器
+    python bench/bench_engines.py --url rtsp://...     # 真实流
+    python bench/bench_engines.py --counts 100,500,1000,2000 --duration 15
+"""
+
+import argparse
+import logging
+import time
+
+import psutil
+
+import synthetic_source
+
+import rtsp_engine
+from rtsp_engine import SETTINGS, METRICS_TABLE, STOP_EVENT, RTSPStreamMonitor
+from async_monitor import AsyncStreamMonitor, shutdown_async_engine
+
+
+def run_level(engine, count, args):
+    """启动 count 路会话，返回本级的资源与帧率统计"""
+    STOP_EVENT.clear()
+    METRICS_TABLE.reset(count)
+    monitor_class = AsyncStreamMonitor if engine == "协程" else RTSPStreamMonitor
+    sessions = [
+        monitor_class(url=args.url, thread_id=f"{i // 100 + 1}-{i % 100 + 1}", parent_item_id="bench",
+                      parent_url_id=i // 100 + 1, thread_idx=i % 100, total_threads=count, protocol=args.protocol)
+        for i in range(count)
+    ]
+    proc = psutil.Process()
+    for s in sessions:
+        s.start()
+
+    time.sleep(args.warmup)
+    frames_before = sum(s.total_frames for s in sessions)
+    cpu_before = proc.cpu_times()
+    t0 = time.time()
+    time.sleep(args.duration)
+    elapsed = time.time() - t0
+    cpu_after = proc.cpu_times()
+    frames_after = sum(s.total_frames for s in sessions)
+    rss_mb = proc.memory_info().rss / 1024 / 1024
+    thread_count = proc.num_threads()
+
+    STOP_EVENT.set()
+    deadline = time.time() + 10.0
+    for s in sessions:
+        s.join(timeout=max(0.0, deadline - time.time()))
+    if engine == "协程":
+        shutdown_async_engine()
+
+    cpu_used = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+    expected = count * args.fps * elapsed
+    return {
+        'count': count,
+        'rss_mb': rss_mb,
+        'cpu_percent': cpu_used / elapsed * 100,
+        'threads': thread_count,
+        'ratio': (frames_after - frames_before) / expected if expected > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="线程引擎与协程引擎的资源占用和最大可持续流数量对比")
+    parser.add_argument('--url', default="rtsp://127.0.0.1:554/stream", help="RTSP地址，不指定 --real 时使用合成流")
+    parser.add_argument('--real', action='store_true', help="连接真实RTSP流而不是合成流")
+    parser.add_argument('--protocol', default='TCP', choices=['TCP', 'UDP'])
+    parser.add_argument('--engines', default="线程,协程", help="逗号分隔: 线程,协程")
+    parser.add_argument('--counts', default="50,100,200,400,800,1600", help="逐级加压的流数量")
+    parser.add_argument('--fps', type=float, default=25.0, help="每路流的理论帧率")
+    parser.add_argument('--duration', type=float, default=10.0, help="每级统计时长，秒")
+    parser.add_argument('--warmup', type=float, default=3.0, help="每级预热时长，秒")
+    parser.add_argument('--threshold', type=float, default=0.95, help="实收/理论帧比例达到该值视为可持续")
+    parser.add_argument('--loop-threads', type=int, default=SETTINGS.async_loop_threads)
+    parser.add_argument('--workers', type=int, default=SETTINGS.async_executor_workers)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if not args.real:
+        synthetic_source.install(fps=args.fps)
+    SETTINGS.async_loop_threads = args.loop_threads
+    SETTINGS.async_executor_workers = args.workers
+    SETTINGS.reconnect_wait_time = 1
+
+    counts = [int(c) for c in args.counts.split(',') if c.strip()]
+    summary = {}
+    for engine in [e.strip() for e in args.engines.split(',') if e.strip()]:
+        print(f"\n=== {engine}引擎 ===")
+        print(f"{'流数量':>8} {'RSS(MB)':>10} {'CPU(%)':>8} {'线程数':>8} {'实收/理论':>10}")
+        max_ok = 0
+        for count in counts:
+            result = run_level(engine, count, args)
+            rtsp_engine.LOG_QUEUE.clear()
+            print(f"{result['count']:>8} {result['rss_mb']:>10.1f} {result['cpu_percent']:>8.1f} "
+                  f"{result['threads']:>8} {result['ratio'] * 100:>9.1f}%")
+            if result['ratio'] < args.threshold:
+                break
+            max_ok = count
+        summary[engine] = max_ok
+
+    print("\n=== 最大可持续流数量 ===")
+    for engine, max_ok in summary.items():
+        print(f"{engine}引擎: {max_ok}")
+
+
+if __name__ == '__main__':
+    main()
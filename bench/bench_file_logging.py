@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+重连风暴下的日志写盘微基准
+
+模拟 1000 路流同时重连：若干风暴线程以各路流的 线程-XX-YY 日志器按设定速率写重连日志，
+同时主线程用真实的 av.Packet 反复调用 process_packet（与 bench_hot_path 相同的逐包路径），
+按墙钟时间统计解复用吞吐，对比：
+- 不写文件：日志只进入界面日志队列
+- 同步写盘：根日志器直接挂 FileHandler，记录日志的线程自己写文件
+- 异步写盘：file_logging 的 QueueHandler/QueueListener，记录日志的线程只入队
+同时统计风暴线程单次记录日志的耗时分位数，即监控线程在日志上被阻塞的时间。
+三种模式交替运行 --rounds 轮，吞吐取中位数以减小机器波动的影响。
+
+用法：
+    python bench/bench_file_logging.py
+    python bench/bench_file_logging.py --streams 1000 --rate 5000 --seconds 3 --rounds 5 --per-stream
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+import av
+
+import synthetic_source
+
+import file_logging
+from rtsp_engine import LOG_QUEUE, SETTINGS, StreamSession
+
+
+def build_packets(fps, gop=50, frame_bytes=20000):
+    packets = []
+    time_base = synthetic_source.SyntheticContainer(fps).time_base
+    for n in range(gop):
+        packet = av.Packet(b'\x00\x00\x00\x01' + bytes((frame_bytes * 8 if n == 0 else frame_bytes) - 4))
+        packet.time_base = time_base
+        packets.append(packet)
+    return packets
+
+
+def storm(loggers, rate, stop_event, latencies):
+    """按 rate 条/秒轮流以各路流的日志器写重连日志，记录每次调用耗时"""
+    interval = 1.0 / rate
+    next_time = time.perf_counter()
+    n = 0
+    while not stop_event.is_set():
+        logger = loggers[n % len(loggers)]
+        start = time.perf_counter()
+        logger.error(f"连接或拉流失败: Connection refused。第 {n // len(loggers) + 1} 次重试中...")
+        latencies.append(time.perf_counter() - start)
+        n += 1
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0:
+            # 跟不上设定速率时不补发
+            next_time = time.perf_counter()
+
+
+def demux(seconds, fps=25.0):
+    """主线程逐包处理，返回包/秒"""
+    session = StreamSession(url="rtsp://127.0.0.1/bench", thread_id="bench-1", parent_item_id="bench",
+                            parent_url_id=1, thread_idx=0, total_threads=1, protocol='TCP')
+    session.container = synthetic_source.SyntheticContainer(fps)
+    session.on_connected(time.time())
+    packets = build_packets(fps)
+    ticks_per_frame = int(90000 / fps)
+    process_packet = session.process_packet
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            packet = packets[count % len(packets)]
+            packet.pts = count * ticks_per_frame
+            process_packet(packet)
+            count += 1
+    return count / (time.perf_counter() - start)
+
+
+def run_case(mode, args, log_dir):
+    root = logging.getLogger()
+    handler = None
+    session = None
+    if mode == "同步写盘":
+        handler = logging.FileHandler(os.path.join(log_dir, "sync.log"), encoding='utf-8')
+        handler.setFormatter(logging.Formatter(file_logging.LOG_FORMAT))
+        root.addHandler(handler)
+    elif mode == "异步写盘":
+        SETTINGS.file_log_dir = log_dir
+        session = file_logging.start_file_logging(SETTINGS)
+
+    loggers = [logging.getLogger(f"线程-{i // 100 + 1:02d}-{i % 100 + 1:02d}") for i in range(args.streams)]
+    stop_event = threading.Event()
+    per_thread = [[] for _ in range(args.storm_threads)]
+    threads = [threading.Thread(target=storm, args=(loggers[i::args.storm_threads], args.rate / args.storm_threads,
+                                                    stop_event, per_thread[i]), daemon=True)
+               for i in range(args.storm_threads)]
+    for t in threads:
+        t.start()
+    packets_per_second = demux(args.seconds)
+    stop_event.set()
+    for t in threads:
+        t.join()
+    LOG_QUEUE.clear()
+    LOG_QUEUE.take_dropped()
+
+    if handler is not None:
+        root.removeHandler(handler)
+        handler.close()
+    if session is not None:
+        session.stop()
+    latencies = [value for samples in per_thread for value in samples]
+    return packets_per_second, latencies
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重连风暴下 不写文件/同步写盘/异步写盘 的解复用吞吐对比")
+    parser.add_argument('--streams', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=5000, help="全部流合计每秒日志条数")
+    parser.add_argument('--storm-threads', type=int, default=8, help="写日志的线程数")
+    parser.add_argument('--seconds', type=float, default=3.0, help="每种模式每轮的时长")
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--per-stream', action='store_true', help="异步写盘时每路流单独写文件")
+    parser.add_argument('--dir', default=None, help="日志目录，默认使用临时目录")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    SETTINGS.file_log_per_stream = args.per_stream
+    log_dir = args.dir or tempfile.mkdtemp(prefix="bench_log_")
+    print(f"{args.streams} 路流重连风暴，{args.rate:g} 条/秒，{args.storm_threads} 个写日志线程，目录 {log_dir}")
+    print(f"{'模式':<10} {'解复用 包/秒':>14} {'相对':>7} {'记录耗时 p50':>12} {'p99':>10} {'最大':>10} {'条数':>8}")
+    modes = ("不写文件", "同步写盘", "异步写盘")
+    throughput = {mode: [] for mode in modes}
+    latencies = {mode: [] for mode in modes}
+    try:
+        for _ in range(args.rounds):
+            for mode in modes:
+                packets_per_second, samples = run_case(mode, args, log_dir)
+                throughput[mode].append(packets_per_second)
+                latencies[mode].extend(samples)
+        baseline = statistics.median(throughput[modes[0]])
+        for mode in modes:
+            packets_per_second = statistics.median(throughput[mode])
+            samples = sorted(latencies[mode])
+            print(f"{mode:<10} {packets_per_second:>14.0f} {packets_per_second / baseline:>6.0%} "
+                  f"{percentile(samples, 0.5) * 1e6:>10.1f}us {percentile(samples, 0.99) * 1e6:>8.1f}us "
+                  f"{(samples[-1] if samples else 0) * 1e6:>8.0f}us {len(samples):>8}")
+    finally:
+        if args.dir is None:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+表格刷新微基准
+
+创建真实的 StressTestFrame 窗口，按行数插入 URL 行与线程子行，每轮向指标表写入变化的合成数据后
+调用一次 update_statuses 并等待 Tk 完成重绘，统计每次刷新的耗时（毫秒），对比：
+- 全量刷新：每轮格式化并写入全部行（改造前的方式）
+- 视口刷新：只格式化并写入视口内可见且数值有变化的行，受 gui_refresh_budget_ms 约束
+
+需要图形界面（Linux 下需设置 DISPLAY）。
+
+用法：
+    python bench/bench_gui_refresh.py
+    python bench/bench_gui_refresh.py --rows 100,1000,5000 --threads-per-url 4 --ticks 20
+"""
+
+import argparse
+import logging
+import time
+import tkinter as tk
+
+import synthetic_source  # noqa: F401  设置项目根目录导入路径
+
+from index import PARENT_TOTALS_ZERO, StressTestFrame
+from rtsp_engine import SETTINGS, METRICS_TABLE, THREAD_NAME_MAP
+
+
+class FakeMonitor:
+    """只提供 update_statuses 会访问的属性"""
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+
+    def is_alive(self):
+        return True
+
+
+class FullRefreshFrame(StressTestFrame):
+    """改造前的刷新方式：每轮格式化并写入全部行"""
+    def _visible_tree_rows(self):
+        rows = []
+        for item_id in self.tree.get_children():
+            rows.append(item_id)
+            rows.extend(self.tree.get_children(item_id))
+        return rows
+
+    def update_statuses(self):
+        self.rendered_rows.clear()
+        budget = SETTINGS.gui_refresh_budget_ms
+        SETTINGS.gui_refresh_budget_ms = float('inf')
+        try:
+            super().update_statuses()
+        finally:
+            SETTINGS.gui_refresh_budget_ms = budget
+
+
+def build(root, frame_class, rows, threads_per_url):
+    frame = frame_class(root)
+    frame.pack(fill='both', expand=True)
+    # 由基准自行驱动刷新，取消构造时排定的定时任务
+    for after_id in root.tk.splitlist(root.tk.call('after', 'info')):
+        root.after_cancel(after_id)
+    frame.after = lambda *args, **kwargs: None
+
+    METRICS_TABLE.reset(rows)
+    THREAD_NAME_MAP.clear()
+    handles = []
+    url_count = -(-rows // threads_per_url)
+    for u in range(url_count):
+        frame.add_url(f"rtsp://10.{u // 62500}.{u // 250 % 250}.{u % 250 + 1}:554/live")
+        item_id = f"url_{frame.url_counter}"
+        url_data = frame.url_list_data[item_id]
+        frame.parent_totals[item_id] = list(PARENT_TOTALS_ZERO)
+        for i in range(min(threads_per_url, rows - len(handles))):
+            thread_id = f"{url_data['id']}-{i+1}"
+            url_data['children'].append(thread_id)
+            THREAD_NAME_MAP[thread_id] = f"线程-{url_data['id']:02d}-{i+1:02d}"
+            frame.tree.insert(item_id, 'end', iid=f"thread_{thread_id}",
+                              values=(thread_id, THREAD_NAME_MAP[thread_id], '未启动') + ('0',) * 8,
+                              tags=('thread_row',))
+            frame.monitor_threads.append(FakeMonitor(thread_id))
+            frame.thread_registry[thread_id] = frame.monitor_threads[-1]
+            frame.thread_parent[thread_id] = item_id
+            handles.append(METRICS_TABLE.register(thread_id))
+        frame.tree.item(item_id, open=True)
+    root.update()
+    return frame, handles
+
+
+def write_tick(handles, tick, interval_s):
+    """模拟所有流在一个刷新周期内继续收帧"""
+    for n, row in enumerate(handles):
+        frames = int((tick + 1) * interval_s * 25) + n % 7
+        row.write_running(frames, frames, frames * 40000, 0, 0.2, 25.0 - n % 3, frames + n % 5, n % 5, 25.0, 0)
+
+
+def measure(frame_class, rows, threads_per_url, ticks):
+    root = tk.Tk()
+    root.geometry("1000x800")
+    try:
+        frame, handles = build(root, frame_class, rows, threads_per_url)
+        interval_s = SETTINGS.gui_refresh_interval / 1000.0
+        costs = []
+        for tick in range(ticks + 1):
+            write_tick(handles, tick, interval_s)
+            start = time.perf_counter()
+            frame.update_statuses()
+            root.update_idletasks()
+            cost = (time.perf_counter() - start) * 1000
+            # 第一轮包含首次布局，不计入
+            if tick:
+                costs.append(cost)
+        return sum(costs) / len(costs), max(costs)
+    finally:
+        root.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="表格 全量/视口 刷新耗时对比")
+    parser.add_argument('--rows', default="100,1000,5000", help="逗号分隔的线程子行数量")
+    parser.add_argument('--threads-per-url', type=int, default=4)
+    parser.add_argument('--ticks', type=int, default=20, help="每种规模计时的刷新次数")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # 不启动系统监控线程，避免干扰计时
+    SETTINGS.sys_monitor_enabled = False
+    try:
+        tk.Tk().destroy()
+    except tk.TclError as e:
+        print(f"无法创建窗口，需要图形界面: {e}")
+        return
+
+    print(f"每个URL {args.threads_per_url} 路，刷新预算 {SETTINGS.gui_refresh_budget_ms}ms")
+    print(f"{'行数':>6} {'全量 平均/最大':>20} {'视口 平均/最大':>20}")
+    for rows in [int(r) for r in args.rows.split(',') if r.strip()]:
+        full_avg, full_max = measure(FullRefreshFrame, rows, args.threads_per_url, args.ticks)
+        view_avg, view_max = measure(StressTestFrame, rows, args.threads_per_url, args.ticks)
+        print(f"{rows:>6} {full_avg:>11.1f} / {full_max:>6.1f} ms {view_avg:>11.1f} / {view_max:>6.1f} ms"
+              f"  ({full_avg / view_avg:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
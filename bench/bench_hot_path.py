@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+逐包热路径微基准
+
+在单线程内用真实的 av.Packet（4K 码流大小）反复调用 process_packet，按进程 CPU 时间
+统计每核每秒可处理的包数，对比：
+- 改造前：逐包整包复制读取包头、逐包记录帧率时间戳、逐包计算统计并构造状态字典推送队列
+- 改造后：逐包只更新计数并暂存PTS，统计按 stats_interval_ms 周期批量完成
+
+用法：
+    python bench/bench_hot_path.py
+    python bench/bench_hot_path.py --packets 200000 --bitrate 25000 --intervals 50,200,1000
+"""
+
+import argparse
+import logging
+import time
+
+import av
+
+import synthetic_source
+
+from rtsp_engine import SETTINGS, STATUS_QUEUES, StreamSession
+
+
+class LegacyPacketSession(StreamSession):
+    """改造前的逐包处理逻辑，仅用于对比"""
+    def process_packet(self, packet):
+        real_packet_lost = self.legacy_analyze_rtp_packet_loss(packet)
+        if real_packet_lost:
+            self.real_packet_loss_count += 1
+        self.rtp_sequence += 1
+        self.i_frame_lost_detected = False
+        self.total_bytes += packet.size if packet and packet.size is not None else 0
+        self.total_frames += 1
+        self.fps_frames_count += 1
+        self.fps_detector.add_frame_timestamp(time.time() * 1000)
+
+        current_time = time.time()
+        elapsed_time = current_time - self.fps_start_time
+        if elapsed_time >= 0.5:
+            self.last_fps = self.fps_frames_count / elapsed_time
+            self.fps_frames_count = 0
+            self.fps_start_time = current_time
+
+        total_elapsed_time = current_time - self.start_time
+        current_fps = self.real_fps or self.fps_detector.calculate_fps_from_timestamps() or 25.0
+        expected_frames = int(total_elapsed_time * current_fps)
+        pts_stats = self.pts_detector.get_loss_statistics()
+        if pts_stats['total_lost'] > 0:
+            lost_frames = pts_stats['total_lost']
+        else:
+            lost_frames = max(0, expected_frames - self.total_frames)
+
+        status_info = {
+            'thread_id': self.thread_id,
+            'parent_item_id': self.parent_item_id,
+            'status': "运行中",
+            'total_frames': self.total_frames,
+            'received_frames': self.total_frames,
+            'total_bytes': self.total_bytes,
+            'reconnect_count': self.reconnect_count,
+            'connect_latency': self.connect_latency,
+            'current_fps': self.last_fps,
+            'expected_frames': expected_frames,
+            'lost_frames': lost_frames,
+            'real_fps': current_fps,
+            'pts_frame_loss': self.pts_frame_loss_count
+        }
+        if STATUS_QUEUES[self.thread_id].qsize() < 10:
+            STATUS_QUEUES[self.thread_id].put(status_info)
+
+    def legacy_analyze_rtp_packet_loss(self, packet):
+        # 改造前通过 bytes(packet) 取包头，会复制整个包
+        packet_data = bytes(packet)
+        seq_num = int.from_bytes(packet_data[2:4], byteorder='big')
+        last = getattr(self, 'last_rtp_seq', None)
+        self.last_rtp_seq = seq_num
+        return last is not None and seq_num != ((last + 1) & 0xFFFF)
+
+
+def build_packets(bitrate_kbps, fps, gop):
+    """按 4K 码流的平均包大小构造一个 GOP 的真实 av.Packet"""
+    frame_bytes = int(bitrate_kbps * 1000 / 8 / fps)
+    p_size = max(64, int(frame_bytes * gop / (gop + 7)))
+    packets = []
+    for n in range(gop):
+        size = p_size * 8 if n == 0 else p_size
+        packet = av.Packet(b'\x00\x00\x00\x01' + bytes(size - 4))
+        packet.time_base = synthetic_source.SyntheticContainer(fps).time_base
+        packets.append(packet)
+    return packets
+
+
+def measure(session_class, packets, count, fps):
+    session = session_class(url="rtsp://127.0.0.1/bench", thread_id="bench-1", parent_item_id="bench",
+                            parent_url_id=1, thread_idx=0, total_threads=1, protocol='TCP')
+    session.container = synthetic_source.SyntheticContainer(fps)
+    session.on_connected(time.time())
+    ticks_per_frame = int(90000 / fps)
+    gop = len(packets)
+    process_packet = session.process_packet
+
+    cpu_start = time.process_time()
+    for n in range(count):
+        packet = packets[n % gop]
+        packet.pts = n * ticks_per_frame
+        process_packet(packet)
+    cpu_used = time.process_time() - cpu_start
+    STATUS_QUEUES.clear()
+    return count / cpu_used if cpu_used > 0 else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="逐包热路径改造前后的 包/秒/核 对比")
+    parser.add_argument('--packets', type=int, default=100000, help="每轮处理的包数量")
+    parser.add_argument('--bitrate', type=float, default=16000, help="模拟码流码率 kbps，默认 4K H.265 约 16Mbps")
+    parser.add_argument('--fps', type=float, default=25.0)
+    parser.add_argument('--gop', type=int, default=50)
+    parser.add_argument('--intervals', default="200", help="逗号分隔的统计周期 stats_interval_ms")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    packets = build_packets(args.bitrate, args.fps, args.gop)
+    avg_size = sum(p.size for p in packets) / len(packets)
+    print(f"平均包大小 {avg_size / 1024:.1f} KB，每轮 {args.packets} 包")
+
+    before = measure(LegacyPacketSession, packets, args.packets, args.fps)
+    print(f"{'改造前':<16} {before:>12.0f} 包/秒/核")
+    for interval in [int(i) for i in args.intervals.split(',') if i.strip()]:
+        SETTINGS.stats_interval_ms = interval
+        after = measure(StreamSession, packets, args.packets, args.fps)
+        print(f"{'改造后 ' + str(interval) + 'ms':<16} {after:>12.0f} 包/秒/核  ({after / before:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+PTS丢帧检测微基准
+
+先用随机生成的PTS序列（含丢帧、连续丢帧、抖动、小幅回退、PTS重置和中途帧率切换）校验批量检测器
+与逐帧检测器的结果完全一致，并检查无丢帧的帧率切换不会产生丢帧告警，再模拟 60fps × 1000 路流按 stats_interval_ms 周期送检，按进程 CPU 时间对比
+每帧检测代价：
+- 逐帧：每个PTS调用一次 detect_frame_loss
+- 批量：与 StreamSession 相同的送检策略，PTS攒够 MIN_VECTOR_FRAMES 帧（或 PTS_WINDOW_MAX_AGE 秒）
+  后整窗调用一次 detect_batch
+
+用法：
+    python bench/bench_pts_detector.py
+    python bench/bench_pts_detector.py --streams 1000 --fps 60 --seconds 10 --intervals 200,500,1000
+"""
+
+import argparse
+import random
+import time
+
+import synthetic_source  # noqa: F401  设置项目根目录导入路径
+
+from rtsp_engine import SETTINGS, PTS_WINDOW_MAX_AGE, BatchPTSFrameLossDetector, PTSFrameLossDetector
+
+TICKS_PER_SECOND = 90000
+UNIT_MS = 1000.0 / TICKS_PER_SECOND
+
+
+def generate_trace(rng, frames, fps, loss_rate=0.01):
+    """生成 90kHz 时间基下的PTS序列"""
+    step = int(TICKS_PER_SECOND / fps)
+    pts = rng.randrange(0, 1 << 30)
+    trace = []
+    n = 0
+    while n < frames:
+        roll = rng.random()
+        if roll < loss_rate:
+            # 丢帧，偶尔连续丢多帧
+            pts += step * rng.randint(1, 6)
+        elif roll < loss_rate + 0.0005:
+            # PTS重置
+            pts = rng.randrange(0, 1 << 20)
+        elif roll < loss_rate + 0.002:
+            # 小幅回退（不足重置阈值）
+            pts -= step // 2
+        elif roll < loss_rate + 0.0025:
+            # 帧率切换（带宽自适应降帧或恢复）
+            step = step * 2 if rng.random() < 0.5 else max(1, step // 2)
+        trace.append(pts)
+        pts += step + rng.randint(-step // 20, step // 20)
+        n += 1
+    return trace
+
+
+def detector_state(detector):
+    return (detector.total_frames_lost, detector.total_frames_detected, detector.consecutive_losses,
+            detector.last_pts, detector.expected_frame_interval, list(detector.pts_history),
+            list(detector.interval_median.window), list(detector.pending_intervals), detector.frame_rate_changes)
+
+
+def check_rate_change():
+    """25fps 降到 12.5fps 且没有丢帧：不应计入丢帧"""
+    step = TICKS_PER_SECOND // 25
+    trace = [n * step for n in range(200)]
+    trace += [trace[-1] + (n + 1) * step * 2 for n in range(200)]
+    detector = BatchPTSFrameLossDetector()
+    detector.update_frame_rate(25)
+    result = detector.detect_batch(trace, UNIT_MS)
+    if result['frames_lost'] or result['consecutive_loss_alerts'] or result['frame_rate_changes'] != 1:
+        raise AssertionError(f"帧率切换被误报为丢帧: {result}")
+    return 1000.0 / detector.expected_frame_interval
+
+
+def check_equivalence(rng, rounds=200):
+    """逐帧与批量检测结果逐项比对，返回比对的帧数"""
+    checked = 0
+    for _ in range(rounds):
+        SETTINGS.pts_tolerance_ms = rng.choice((0, 5, 100))
+        fps = rng.choice((15, 25, 30, 60))
+        trace = generate_trace(rng, rng.randint(1, 3000), fps, loss_rate=rng.choice((0.0, 0.01, 0.2)))
+        scalar = PTSFrameLossDetector()
+        batch = BatchPTSFrameLossDetector()
+        # 一半用例强制所有窗口都走向量化路径
+        if rng.random() < 0.5:
+            batch.MIN_VECTOR_FRAMES = 1
+        if rng.random() < 0.5:
+            scalar.update_frame_rate(fps)
+            batch.update_frame_rate(fps)
+
+        expected = {'frames_lost': 0, 'abnormal_intervals': 0, 'consecutive_loss_alerts': 0, 'pts_resets': 0}
+        for pts in trace:
+            result = scalar.detect_frame_loss(pts * UNIT_MS)
+            expected['frames_lost'] += result['frames_lost']
+            expected['abnormal_intervals'] += int(result['interval_abnormal'])
+            expected['consecutive_loss_alerts'] += int(bool(result.get('consecutive_loss_alert')))
+            expected['pts_resets'] += int(result['pts_reset'])
+
+        actual = dict.fromkeys(expected, 0)
+        pos = 0
+        while pos < len(trace):
+            size = rng.randint(1, 200)
+            result = batch.detect_batch(trace[pos:pos + size], UNIT_MS)
+            for key in actual:
+                actual[key] += result[key]
+            pos += size
+
+        if actual != expected or detector_state(scalar) != detector_state(batch):
+            raise AssertionError(f"结果不一致: {expected} / {actual}\n{detector_state(scalar)}\n{detector_state(batch)}")
+        checked += len(trace)
+    return checked
+
+
+def window_frames(fps, interval_ms):
+    """按会话的送检策略计算每次送检的帧数"""
+    per_interval = max(1, int(fps * interval_ms / 1000))
+    min_frames = min(BatchPTSFrameLossDetector.MIN_VECTOR_FRAMES, max(1, int(fps * PTS_WINDOW_MAX_AGE)))
+    return -(-min_frames // per_interval) * per_interval
+
+
+def measure(streams, fps, seconds, interval_ms, batched):
+    rng = random.Random(1)
+    frames = int(fps * seconds)
+    per_batch = window_frames(fps, interval_ms) if batched else max(1, int(fps * interval_ms / 1000))
+    # 第一秒用于填满帧间隔中位数窗口，不计时
+    warmup = int(fps)
+    traces = [generate_trace(rng, warmup + frames, fps) for _ in range(streams)]
+    detector_class = BatchPTSFrameLossDetector if batched else PTSFrameLossDetector
+    detectors = [detector_class() for _ in range(streams)]
+    for detector, trace in zip(detectors, traces):
+        for pts in trace[:warmup]:
+            detector.detect_frame_loss(pts * UNIT_MS)
+
+    cpu_start = time.process_time()
+    for start in range(warmup, warmup + frames, per_batch):
+        for detector, trace in zip(detectors, traces):
+            batch = trace[start:start + per_batch]
+            if batched:
+                detector.detect_batch(batch, UNIT_MS)
+            else:
+                for pts in batch:
+                    detector.detect_frame_loss(pts * UNIT_MS)
+    cpu_used = time.process_time() - cpu_start
+    return cpu_used / (frames * streams) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PTS丢帧检测 逐帧/批量 每帧代价对比")
+    parser.add_argument('--streams', type=int, default=1000)
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--seconds', type=float, default=5.0, help="每路流模拟的时长")
+    parser.add_argument('--intervals', default="200,500,1000", help="逗号分隔的统计周期 stats_interval_ms")
+    args = parser.parse_args()
+
+    tolerance_ms = SETTINGS.pts_tolerance_ms
+    checked = check_equivalence(random.Random(7))
+    SETTINGS.pts_tolerance_ms = 0
+    new_fps = check_rate_change()
+    SETTINGS.pts_tolerance_ms = tolerance_ms
+    print(f"一致性校验通过：{checked} 帧（重置阈值 {SETTINGS.pts_reset_threshold}ms）")
+    print(f"帧率切换校验通过：25fps → {new_fps:g}fps，无丢帧告警")
+
+    print(f"{args.streams} 路 × {args.fps:g}fps × {args.seconds:g}s")
+    scalar_ns = measure(args.streams, args.fps, args.seconds, 200, batched=False)
+    print(f"{'逐帧':<18} {scalar_ns:>10.0f} ns/帧")
+    for interval in [int(i) for i in args.intervals.split(',') if i.strip()]:
+        batch_ns = measure(args.streams, args.fps, args.seconds, interval, batched=True)
+        label = f"批量 {interval}ms/{window_frames(args.fps, interval)}帧"
+        print(f"{label:<18} {batch_ns:>10.0f} ns/帧  ({scalar_ns / batch_ns:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
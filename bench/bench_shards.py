@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+多进程分片引擎按核扩展测试
+
+固定总流数和帧率，让逐包处理成为瓶颈，依次使用 1/2/4/... 个工作进程（可绑核），
+统计整体每秒处理包数、每核包数以及相对单进程的加速比。
+
+用法：
+    python bench/bench_shards.py --streams 200 --fps 500 --workers 1,2,4 --pin-cpu
+"""
+
+import argparse
+import logging
+import time
+
+import psutil
+
+import synthetic_source
+
+from rtsp_engine import SETTINGS, STOP_EVENT
+from mp_monitor import ShardSupervisor
+
+
+def run_level(worker_count, args):
+    STOP_EVENT.clear()
+    supervisor = ShardSupervisor(worker_count, pin_cpu=args.pin_cpu,
+                                 worker_init=(synthetic_source.install, {'fps': args.fps}))
+    for i in range(args.streams):
+        supervisor.add_stream(url=args.url, thread_id=f"{i // 100 + 1}-{i % 100 + 1}", parent_item_id="bench",
+                              parent_url_id=i // 100 + 1, thread_idx=i % 100, total_threads=args.streams,
+                              protocol='TCP')
+    supervisor.start()
+
+    time.sleep(args.warmup)
+    frames_before = sum(supervisor.scaling_snapshot())
+    t0 = time.time()
+    time.sleep(args.duration)
+    elapsed = time.time() - t0
+    frames_after = sum(supervisor.scaling_snapshot())
+
+    STOP_EVENT.set()
+    supervisor.join(timeout=15.0)
+    return (frames_after - frames_before) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程分片引擎的按核扩展测试（合成流）")
+    parser.add_argument('--url', default="rtsp://127.0.0.1:554/stream")
+    parser.add_argument('--streams', type=int, default=200, help="总流数量")
+    parser.add_argument('--fps', type=float, default=500.0, help="每路合成流帧率，取高值使逐包处理成为瓶颈")
+    parser.add_argument('--workers', default="", help="逗号分隔的工作进程数，默认 1,2,4... 直到CPU核心数")
+    parser.add_argument('--pin-cpu', action='store_true', help="工作进程绑定CPU核心")
+    parser.add_argument('--engine', default="线程", choices=["线程", "协程"], help="工作进程内部引擎")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    SETTINGS.mp_worker_engine = args.engine
+    SETTINGS.mp_report_interval_ms = 200
+
+    if args.workers:
+        levels = [int(w) for w in args.workers.split(',') if w.strip()]
+    else:
+        cores = psutil.cpu_count(logical=True) or 1
+        levels = []
+        w = 1
+        while w <= cores:
+            levels.append(w)
+            w *= 2
+
+    print(f"总流数 {args.streams}，每路 {args.fps:.0f} FPS，理论 {args.streams * args.fps:.0f} 包/秒")
+    print(f"{'进程数':>6} {'包/秒':>12} {'包/秒/核':>12} {'加速比':>8}")
+    baseline = None
+    for worker_count in levels:
+        pps = run_level(worker_count, args)
+        baseline = baseline or pps
+        print(f"{worker_count:>6} {pps:>12.0f} {pps / worker_count:>12.0f} {pps / baseline if baseline else 0:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+合成视频流，用于在没有 RTSP 服务器的机器上压测监控引擎。
+
+install() 会替换 av.open，使 StreamSession.open_container 得到一个按真实帧率
+节奏产出数据包的容器：数据包按墙钟时间到期，读取方落后时会一次性取走积压的包，
+行为与 socket/libav 缓冲区类似。
+"""
+
+import os
+import sys
+import time
+from fractions import Fraction
+from types import SimpleNamespace
+
+import av
+
+# 让 bench 目录下的脚本可以直接导入项目根目录的模块
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+class SyntheticPacket:
+    """模拟 PyAV 的视频包，只提供监控逻辑会访问的属性"""
+    __slots__ = ('size', 'pts', 'dts', 'time_base', 'is_keyframe', '_data')
+
+    def __init__(self, size, pts, time_base, is_keyframe, data):
+        self.size = size
+        self.pts = pts
+        self.dts = pts
+        self.time_base = time_base
+        self.is_keyframe = is_keyframe
+        self._data = data
+
+    def to_bytes(self):
+        return self._data
+
+    def __bytes__(self):
+        return self._data
+
+
+class SyntheticContainer:
+    """按固定帧率、码率和 GOP 产出数据包的容器"""
+    def __init__(self, fps=25.0, bitrate_kbps=4000, gop=50, width=1920, height=1080):
+        self.fps = float(fps)
+        self.gop = max(1, int(gop))
+        self.time_base = Fraction(1, 90000)
+        frame_bytes = int(bitrate_kbps * 1000 / 8 / self.fps)
+        # 关键帧约为普通帧的 8 倍，保证整体码率接近设定值
+        self.p_size = max(64, int(frame_bytes * self.gop / (self.gop + 7)))
+        self.i_size = self.p_size * 8
+        self._idr = b'\x00\x00\x00\x01\x65\x88\x84' + bytes(57)
+        self._non_idr = b'\x00\x00\x00\x01\x41\x9a\x00' + bytes(57)
+        # 字段与 stream_param_cache.read_stream_params 读取的一致，没有 SPS/PPS
+        codec_context = SimpleNamespace(framerate=Fraction(self.fps).limit_denominator(1001),
+                                        width=width, height=height, name='h264', extradata=b'')
+        video = SimpleNamespace(average_rate=Fraction(self.fps).limit_denominator(1001), time_base=self.time_base,
+                                duration=None, codec_context=codec_context, width=width, height=height)
+        self.streams = SimpleNamespace(video=[video])
+        self._closed = False
+
+    def demux(self, video=0):
+        start = time.monotonic()
+        ticks_per_frame = int(90000 / self.fps)
+        n = 0
+        while not self._closed:
+            due = start + n / self.fps
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+            key = n % self.gop == 0
+            yield SyntheticPacket(self.i_size if key else self.p_size, n * ticks_per_frame, self.time_base,
+                                  key, self._idr if key else self._non_idr)
+            n += 1
+
+    def close(self):
+        self._closed = True
+
+
+def install(fps=25.0, bitrate_kbps=4000, gop=50, width=1920, height=1080):
+    """替换 av.open，后续所有会话都连接到合成流"""
+    def synthetic_open(url, mode='r', options=None, **kwargs):
+        return SyntheticContainer(fps=fps, bitrate_kbps=bitrate_kbps, gop=gop, width=width, height=height)
+    av.open = synthetic_open
+    # 合成流的参数不写入流参数缓存文件，以免之后连接同一地址的真实流命中
+    from rtsp_engine import SETTINGS
+    SETTINGS.param_cache_enabled = False
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+容量探测：闭环搜索最大可持续并发
+
+核心思路：
+- 按 URL 列表轮流增加会话，每步增加 capacity_step 路，等待 capacity_settle_seconds 秒让新会话完成连接，
+  再观察 capacity_hold_seconds 秒，用窗口内的增量评估 SLA：
+  丢帧率（packet_loss_threshold）、窗口内建立连接的会话的连接延迟（rtp_timeout_threshold）、
+  每路每分钟重连次数（capacity_max_reconnect_rate），以及窗口结束时未处于运行中的会话。
+- 同一窗口读取 SystemMonitor 的压测机 CPU、内存、网卡接收速率：压测机先到达上限时该窗口同样不达标，
+  并把结果标记为压测机受限，避免把压测机的瓶颈误判为服务器容量。
+- 首次不达标后回退，在 [最后达标, 首次不达标) 区间内二分：每次把会话增减到中点并重新观察一个窗口；
+  区间缩小到 capacity_resolution 后，在下界再连续观察 capacity_confirm_rounds 个窗口，
+  全部达标才作为最大稳定并发，否则下移区间继续搜索。
+- 会话使用各自的停止事件，可以单独停止；多进程引擎无法单独停止某一路流，改用其工作进程内的引擎。
+"""
+
+import datetime
+import logging
+import threading
+import time
+
+import psutil
+
+from rtsp_engine import (SETTINGS, METRICS_TABLE, LATEST_SYSTEM_INFO, STOP_EVENT, THREAD_NAME_MAP,
+                         create_monitor_factory)
+
+
+def nic_capacity_mbps():
+    """已启用的非回环网卡的标称速率之和（Mbps），无法获取时返回 0"""
+    try:
+        stats = psutil.net_if_stats()
+    except (OSError, psutil.Error):
+        return 0
+    return sum(s.speed for name, s in stats.items() if s.isup and s.speed > 0 and not name.lower().startswith('lo'))
+
+
+class CapacityFinder:
+    """逐步加压并二分搜索服务器的最大稳定并发
+
+    targets 为 [(url, protocol), ...]，会话按顺序轮流分配到各 URL；
+    monitor_class 为会话构造函数（create_monitor_factory 的返回值，非多进程引擎）；
+    on_window 在每个观察窗口结束后以窗口结果调用，用于输出进度。
+    """
+    def __init__(self, targets, monitor_class, on_window=None):
+        self.targets = list(targets)
+        self.monitor_class = monitor_class
+        self.on_window = on_window
+        self.active = []
+        self.retired = []
+        self.windows = []
+        self.started_count = 0
+        self.nic_mbps = nic_capacity_mbps()
+        self.started = time.time()
+        # 最后达标与首次不达标的会话数，搜索过程中逐步收窄
+        self.lo = 0
+        self.hi = None
+
+    # ----- 会话增减 -----
+    def _add_session(self):
+        url_index = self.started_count % len(self.targets)
+        thread_idx = self.started_count // len(self.targets)
+        self.started_count += 1
+        url, protocol = self.targets[url_index]
+        thread_id = f"{url_index + 1}-{thread_idx + 1}"
+        monitor = self.monitor_class(
+            url=url,
+            thread_id=thread_id,
+            parent_item_id=f"url_{url_index + 1}",
+            parent_url_id=url_index + 1,
+            thread_idx=thread_idx,
+            total_threads=0,
+            protocol=protocol
+        )
+        # 每路会话独立的停止事件，二分回退时可以只停掉多出的会话
+        monitor.stop_event = threading.Event()
+        THREAD_NAME_MAP[thread_id] = monitor.log_name
+        monitor.start()
+        self.active.append(monitor)
+
+    def scale_to(self, count):
+        """增减会话到 count 路，减少时先停最后启动的会话"""
+        while len(self.active) < count:
+            self._add_session()
+        while len(self.active) > count:
+            monitor = self.active.pop()
+            monitor.stop_event.set()
+            self.retired.append(monitor)
+
+    def stop(self, timeout=5.0):
+        self.scale_to(0)
+        deadline = time.time() + timeout
+        for monitor in self.retired:
+            monitor.join(timeout=max(0.0, deadline - time.time()))
+
+    # ----- 观察窗口 -----
+    def _wait(self, seconds, samples=None):
+        """等待 seconds 秒，期间每秒记录一次压测机状态；收到全局停止信号时返回 False"""
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            if STOP_EVENT.wait(min(1.0, max(0.0, deadline - time.time()))):
+                return False
+            if samples is not None and LATEST_SYSTEM_INFO:
+                samples.append(dict(LATEST_SYSTEM_INFO))
+        return True
+
+    def probe(self, count):
+        """把会话调整到 count 路并观察一个窗口，返回窗口结果；收到停止信号时返回 None"""
+        previous = len(self.active)
+        self.scale_to(count)
+        new_ids = {m.thread_id for m in self.active[previous:]}
+        if not self._wait(SETTINGS.capacity_settle_seconds):
+            return None
+
+        ids = [m.thread_id for m in self.active]
+        before = METRICS_TABLE.status_dicts()
+        samples = []
+        start = time.time()
+        if not self._wait(SETTINGS.capacity_hold_seconds, samples):
+            return None
+        elapsed = time.time() - start
+        after = METRICS_TABLE.status_dicts()
+
+        window = self._evaluate(count, ids, new_ids, before, after, elapsed, samples)
+        self.windows.append(window)
+        if self.on_window is not None:
+            self.on_window(window)
+        return window
+
+    def _evaluate(self, count, ids, new_ids, before, after, elapsed, samples):
+        expected = 0
+        lost = 0
+        reconnects = 0
+        not_running = 0
+        latencies = []
+        for thread_id in ids:
+            end = after.get(thread_id)
+            if end is None or end.get('status') != "运行中":
+                not_running += 1
+                continue
+            begin = before.get(thread_id) or {}
+            stream_reconnects = end.get('reconnect_count', 0) - begin.get('reconnect_count', 0)
+            reconnects += max(0, stream_reconnects)
+            # 重连后理论帧与丢帧按新连接重新累计，窗口内的增量取新连接的值
+            if stream_reconnects or begin.get('status') != "运行中":
+                expected += end.get('expected_frames', 0)
+                lost += end.get('lost_frames', 0)
+            else:
+                expected += max(0, end.get('expected_frames', 0) - begin.get('expected_frames', 0))
+                lost += max(0, end.get('lost_frames', 0) - begin.get('lost_frames', 0))
+            if thread_id in new_ids or stream_reconnects:
+                latencies.append(end.get('connect_latency', 0.0))
+
+        loss_rate = lost / expected * 100 if expected else 0.0
+        max_latency = max(latencies, default=0.0)
+        reconnect_rate = reconnects / max(1, len(ids)) / (elapsed / 60.0) if elapsed > 0 else 0.0
+
+        violations = []
+        if loss_rate > SETTINGS.packet_loss_threshold:
+            violations.append(f"丢帧率 {loss_rate:.2f}% > {SETTINGS.packet_loss_threshold}%")
+        latency_limit = SETTINGS.rtp_timeout_threshold / 1000.0
+        if max_latency > latency_limit:
+            violations.append(f"连接延迟 {max_latency:.2f}s > {latency_limit:.2f}s")
+        if reconnect_rate > SETTINGS.capacity_max_reconnect_rate:
+            violations.append(f"重连 {reconnect_rate:.2f} 次/路/分钟 > {SETTINGS.capacity_max_reconnect_rate}")
+        if not_running:
+            violations.append(f"{not_running} 路会话未在运行")
+
+        cpu = max((s.get('cpu_percent', 0.0) for s in samples), default=0.0)
+        mem = max((s.get('mem_percent', 0.0) for s in samples), default=0.0)
+        net = sum(s.get('net_recv_mbps', 0.0) for s in samples) / len(samples) if samples else 0.0
+        nic_usage = net / self.nic_mbps * 100 if self.nic_mbps else 0.0
+        client_limits = []
+        if cpu >= SETTINGS.max_cpu_usage:
+            client_limits.append(f"压测机CPU {cpu:.0f}% ≥ {SETTINGS.max_cpu_usage}%")
+        if mem >= SETTINGS.max_memory_usage:
+            client_limits.append(f"压测机内存 {mem:.0f}% ≥ {SETTINGS.max_memory_usage}%")
+        if self.nic_mbps and nic_usage >= SETTINGS.capacity_nic_usage:
+            client_limits.append(f"网卡接收 {net:.0f}Mbps，占标称 {self.nic_mbps}Mbps 的 {nic_usage:.0f}%")
+
+        return {
+            'sessions': count,
+            'passed': not violations and not client_limits,
+            'loss_rate': loss_rate,
+            'max_latency': max_latency,
+            'reconnect_rate': reconnect_rate,
+            'not_running': not_running,
+            'cpu_percent': cpu,
+            'mem_percent': mem,
+            'net_recv_mbps': net,
+            'violations': violations,
+            'client_limits': client_limits,
+        }
+
+    # ----- 搜索 -----
+    def run(self):
+        """执行完整搜索并返回结果字典，收到全局停止信号时返回已得到的部分结果"""
+        step = max(1, SETTINGS.capacity_step)
+        resolution = max(1, SETTINGS.capacity_resolution)
+        max_sessions = max(step, SETTINGS.capacity_max_sessions)
+
+        # 逐步加压，直到首次不达标或达到会话上限
+        count = step
+        while count <= max_sessions:
+            window = self.probe(count)
+            if window is None:
+                return self.result(aborted=True)
+            if not window['passed']:
+                self.hi = count
+                break
+            self.lo = count
+            count += step
+        if self.hi is None:
+            return self.result()
+
+        while True:
+            # 在 (lo, hi) 内二分，中点达标则上移下界，否则下移上界
+            while self.hi - self.lo > resolution:
+                mid = (self.lo + self.hi) // 2
+                window = self.probe(mid)
+                if window is None:
+                    return self.result(aborted=True)
+                if window['passed']:
+                    self.lo = mid
+                else:
+                    self.hi = mid
+            if self.lo == 0:
+                return self.result()
+            # 在下界连续确认，任一窗口不达标说明下界本身不稳定，向下扩展区间重新搜索
+            for _ in range(SETTINGS.capacity_confirm_rounds):
+                window = self.probe(self.lo)
+                if window is None:
+                    return self.result(aborted=True)
+                if not window['passed']:
+                    self.hi = self.lo
+                    self.lo = max(0, self.lo - step)
+                    break
+            else:
+                return self.result()
+
+    def result(self, aborted=False):
+        """按当前搜索进度汇总结果，中途停止时同样可用"""
+        lo, hi = self.lo, self.hi
+        failing = [w for w in self.windows if not w['passed'] and (hi is None or w['sessions'] >= hi)]
+        client_limited = any(w['client_limits'] for w in failing)
+        server_limited = any(w['violations'] for w in failing)
+        if hi is None:
+            bottleneck = "已中止" if aborted else "未达到拐点"
+        elif client_limited and not server_limited:
+            bottleneck = "压测机"
+        elif client_limited:
+            bottleneck = "压测机与服务器同时"
+        else:
+            bottleneck = "服务器"
+        return {
+            'max_stable_sessions': lo,
+            'first_failing_sessions': hi,
+            'bottleneck': bottleneck,
+            'aborted': aborted,
+            'duration': time.time() - self.started,
+            'urls': [url for url, _ in self.targets],
+            'windows': self.windows,
+        }
+
+
+def format_window(window):
+    """单个观察窗口的一行摘要"""
+    state = "达标" if window['passed'] else "不达标"
+    line = (f"{window['sessions']:>5} 路 {state:<3} | 丢帧率 {window['loss_rate']:.2f}% | "
+            f"连接延迟 {window['max_latency']:.2f}s | 重连 {window['reconnect_rate']:.2f}/路/分 | "
+            f"CPU {window['cpu_percent']:.0f}% 网络 {window['net_recv_mbps']:.0f}Mbps")
+    reasons = window['violations'] + window['client_limits']
+    if reasons:
+        line += " | " + "；".join(reasons)
+    return line
+
+
+def write_capacity_report(f, result):
+    """写出容量探测报告"""
+    f.write(f"RTSP 容量探测报告 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    f.write("=" * 60 + "\n\n")
+    f.write(f"URL 数量: {len(result['urls'])}，探测耗时: {result['duration'] / 60:.1f} 分钟\n")
+    f.write(f"SLA: 丢帧率 ≤ {SETTINGS.packet_loss_threshold}%，连接延迟 ≤ {SETTINGS.rtp_timeout_threshold / 1000.0:.1f}s，"
+            f"重连 ≤ {SETTINGS.capacity_max_reconnect_rate} 次/路/分钟\n")
+    f.write(f"每个窗口: 等待 {SETTINGS.capacity_settle_seconds}s + 观察 {SETTINGS.capacity_hold_seconds}s，"
+            f"下界确认 {SETTINGS.capacity_confirm_rounds} 个窗口\n\n")
+
+    lo, hi = result['max_stable_sessions'], result['first_failing_sessions']
+    f.write(f"最大稳定并发: {lo} 路\n")
+    if hi is not None:
+        f.write(f"拐点区间: ({lo}, {hi}] 路，{hi} 路时不达标\n")
+    else:
+        f.write(f"{'探测已中止' if result['aborted'] else '达到会话上限仍全部达标'}，最大稳定并发为下限\n")
+    f.write(f"瓶颈: {result['bottleneck']}\n")
+    if result['bottleneck'].startswith("压测机"):
+        f.write("注意: 压测机先到达资源上限，结果是压测机能力的下限，不代表服务器容量\n")
+
+    f.write("\n### 观察窗口\n")
+    f.write("-" * 60 + "\n")
+    for window in result['windows']:
+        f.write(format_window(window) + "\n")
+
+
+def capacity_monitor_class(engine):
+    """容量探测需要单独停止会话，多进程引擎改用其工作进程内的引擎"""
+    if engine == "多进程":
+        logging.warning(f"容量探测需要单独停止会话，多进程引擎改用进程内的{SETTINGS.mp_worker_engine}引擎")
+        engine = SETTINGS.mp_worker_engine
+    monitor_class, _ = create_monitor_factory(engine)
+    return monitor_class
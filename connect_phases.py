@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+连接阶段耗时分解
+
+核心思路：
+- connect_latency 只有一个总数，分不清是 DNS 慢、握手慢还是首个关键帧来得晚；会话按阶段分别计时：
+  DNS 解析、TCP 建连、RTSP 握手、打开与流探测、首包、首个关键帧，以及重试退避的等待。
+- 各阶段首尾相接：首包从流打开（av.open 返回或 PLAY 应答）起算，首个关键帧从首包起算。
+- 能观测到多少记多少：RTP 直连引擎自己完成握手，DNS/TCP/握手都能精确计时；libav 引擎的握手与流探测都在
+  av.open 内部，只能合并为“打开与流探测”，DNS 由会话在打开前经 DNS 缓存（见 dns_cache）单独解析计时，
+  TCP 建连需开启 connect_phase_probe（打开前另建一次短连接，会多占用服务器一次连接）。
+- 本模块只做计时与汇总，不依赖全局配置；每次成功连接的阶段耗时记入延迟直方图（见 histograms），
+  最近一次连接的值写入指标表，报表同时给出分布与逐路明细。
+"""
+
+import ipaddress
+import socket
+import time
+
+# 指标表中的阶段字段，与 MetricsRow.write_phases 的槽位顺序一致
+PHASE_FIELDS = ('phase_dns_ms', 'phase_tcp_ms', 'phase_handshake_ms', 'phase_probe_ms', 'phase_first_packet_ms',
+                'phase_first_keyframe_ms')
+PHASE_NAMES = ('DNS', 'TCP', '握手', '打开探测', '首包', '首关键帧')
+
+
+def is_ip_literal(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def tcp_connect_timed(family, address, port, timeout):
+    """建立一次 TCP 短连接并立即关闭，返回建连耗时秒"""
+    start = time.monotonic()
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect((address, port))
+        return time.monotonic() - start
+    finally:
+        sock.close()
+
+
+class ConnectPhases:
+    """单路会话最近一次连接的各阶段耗时（秒，未观测到为 None）与累计退避等待"""
+    __slots__ = ('dns', 'tcp', 'handshake', 'probe', 'opened', 'first_packet', 'first_keyframe', 'backoff')
+
+    def __init__(self):
+        self.reset()
+        self.backoff = 0.0
+
+    def reset(self):
+        """新一次连接尝试开始，opened/first_packet/first_keyframe 为从发起连接起算的时刻"""
+        self.dns = None
+        self.tcp = None
+        self.handshake = None
+        self.probe = None
+        self.opened = None
+        self.first_packet = None
+        self.first_keyframe = None
+
+    def durations_ms(self):
+        """按 PHASE_FIELDS 顺序返回首尾相接的各阶段耗时，毫秒，未观测到的阶段为 0"""
+        first_packet = first_keyframe = 0.0
+        if self.first_packet is not None and self.opened is not None:
+            first_packet = max(0.0, self.first_packet - self.opened)
+        if self.first_keyframe is not None:
+            start = self.first_packet if self.first_packet is not None else self.opened
+            if start is not None:
+                first_keyframe = max(0.0, self.first_keyframe - start)
+        values = (self.dns, self.tcp, self.handshake, self.probe)
+        return tuple((v or 0.0) * 1000.0 for v in values) + (first_packet * 1000.0, first_keyframe * 1000.0)
+
+
+def summarize_connect_phases(statuses):
+    """按指标表的状态字典整理每路最近一次连接的阶段耗时与累计退避，没有任何阶段数据的流不列出"""
+    rows = []
+    for thread_id, status_info in statuses.items():
+        values = [status_info.get(name, 0.0) for name in PHASE_FIELDS]
+        backoff = status_info.get('backoff_seconds', 0.0)
+        if not any(values) and not backoff:
+            continue
+        row = dict(zip(PHASE_FIELDS, values), thread_id=thread_id, backoff_seconds=backoff)
+        row['total_ms'] = sum(values)
+        rows.append(row)
+    return rows
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+解码压测
+
+核心思路：
+- 默认只解复用不解码；开启解码压测后，会话每次连接成功时创建一个 StreamDecoder：
+  拉流线程（或协程读取线程）只把视频包放入有界队列，独立的解码线程按顺序解码，
+  网络接收不被解码拖慢，解码跟不上时表现为队列积压和丢帧，与视频墙客户端的行为一致。
+- 队列满时丢弃新到的包，并一直丢到下一个关键帧（参考帧缺失后继续解码只会得到花屏），
+  丢弃的包与解码出错的包都计为解码丢帧。
+- 解码线程数与线程类型（帧级/片级/自动）直接设置到 libav 解码器；
+  可按 skip_frame 只解码参考帧或关键帧，评估降级显示时的容量。
+- 解码线程只累加解码侧统计，拉流侧的队列丢包单独计数，两者各有唯一写入方，
+  由所属会话在统计周期内合并写入指标表（每行只有一个写入方）：
+  解码帧数、丢帧、队列深度、累计解码耗时（墙钟）、解码线程 CPU 时间、像素数。
+- 报表给出每路每帧解码耗时、每百万像素 CPU，以及进程（含子进程）CPU 按解码像素总量折算的汇总值。
+  多线程解码时 libav 工作线程的 CPU 不计入单路值，单路值只作横向比较，容量评估以汇总值为准。
+"""
+
+import queue
+import threading
+import time
+
+import av
+import av.error
+import psutil
+
+# 界面选项 -> libav skip_frame
+DECODE_SKIP_MODES = {"全部帧": "DEFAULT", "跳过非参考帧": "NONREF", "仅关键帧": "NONKEY"}
+# 界面选项 -> libav thread_type
+DECODE_THREAD_TYPES = {"自动": "AUTO", "帧级": "FRAME", "片级": "SLICE"}
+
+# 解码线程等待新包的超时，秒；超时后检查停止标志
+DECODE_POLL_INTERVAL = 0.5
+
+_run_cpu_start = 0.0
+
+
+class DecodeStats:
+    """单路会话的累计解码统计，跨重连保留，由解码线程更新、会话读取；
+    queue_dropped 只由拉流侧更新，dropped 只由解码线程更新，读取时相加"""
+    __slots__ = ('frames', 'dropped', 'queue_dropped', 'decode_seconds', 'cpu_seconds', 'mpixels', 'max_ms')
+
+    def __init__(self):
+        self.frames = 0
+        self.dropped = 0
+        self.queue_dropped = 0
+        self.decode_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.mpixels = 0.0
+        self.max_ms = 0.0
+
+
+class StreamDecoder:
+    """一次连接的解码器：有界包队列 + 独立解码线程"""
+    def __init__(self, stream, stats, name, logger, queue_size, thread_count, thread_type, skip_mode, extradata=None):
+        self.stats = stats
+        self.logger = logger
+        self.codec = av.CodecContext.create(stream.codec_context.name, 'r')
+        # extradata 为 None 时使用流自带的；快速探测没有拿到时由会话传入缓存的参数集
+        self.codec.extradata = stream.codec_context.extradata if extradata is None else extradata
+        # 0 表示由 libav 按 CPU 核数决定
+        self.codec.thread_count = thread_count
+        self.codec.thread_type = DECODE_THREAD_TYPES.get(thread_type, "AUTO")
+        self.codec.skip_frame = DECODE_SKIP_MODES.get(skip_mode, "DEFAULT")
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        # 连接后的首个关键帧之前的包无法解码，直接跳过，不计丢帧
+        self.synced = False
+        self.resyncing = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._decode_loop, name=f"{name}-解码", daemon=True)
+        self.thread.start()
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def submit(self, packet):
+        """拉流侧调用，不阻塞：队列满时丢包并等待下一个关键帧"""
+        if not self.synced:
+            if not packet.is_keyframe:
+                if self.resyncing:
+                    self.stats.queue_dropped += 1
+                return
+            self.synced = True
+            self.resyncing = False
+        try:
+            self.queue.put_nowait(packet)
+        except queue.Full:
+            self.stats.queue_dropped += 1
+            self.synced = False
+            self.resyncing = True
+
+    def _decode_loop(self):
+        stats = self.stats
+        codec = self.codec
+        while not self.stopped:
+            try:
+                packet = self.queue.get(timeout=DECODE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if packet is None:
+                break
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                frames = codec.decode(packet)
+            except (av.error.FFmpegError, ValueError) as e:
+                stats.dropped += 1
+                self.logger.debug(f"解码失败: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            stats.cpu_seconds += time.thread_time() - cpu_start
+            stats.decode_seconds += elapsed
+            if elapsed * 1000.0 > stats.max_ms:
+                stats.max_ms = elapsed * 1000.0
+            for frame in frames:
+                stats.frames += 1
+                stats.mpixels += frame.width * frame.height / 1e6
+
+    def close(self):
+        """停止解码线程，队列中未解码的包丢弃"""
+        self.stopped = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.thread.join(DECODE_POLL_INTERVAL * 4)
+
+
+def process_tree_cpu_seconds():
+    """本进程及其子进程（多进程引擎的工作进程）累计占用的 CPU 秒数"""
+    process = psutil.Process()
+    times = process.cpu_times()
+    total = times.user + times.system
+    for child in process.children(recursive=True):
+        try:
+            child_times = child.cpu_times()
+            total += child_times.user + child_times.system
+        except psutil.Error:
+            pass
+    return total
+
+
+def mark_run_start():
+    """开始监控时记录进程 CPU 基准，汇总每百万像素 CPU 时扣除"""
+    global _run_cpu_start
+    _run_cpu_start = process_tree_cpu_seconds()
+
+
+def summarize_decode(statuses):
+    """按指标表的状态字典汇总解码统计，返回 (每路行列表, 汇总字典)；没有会话解码过时返回 ([], None)
+
+    statuses 为 thread_id -> 状态字典。
+    """
+    rows = []
+    for thread_id, status_info in statuses.items():
+        frames = status_info.get('decoded_frames', 0)
+        dropped = status_info.get('decode_dropped', 0)
+        if not frames and not dropped:
+            continue
+        mpixels = status_info.get('decoded_mpixels', 0.0)
+        decode_seconds = status_info.get('decode_seconds', 0.0)
+        rows.append({
+            'thread_id': thread_id,
+            'frames': frames,
+            'dropped': dropped,
+            'queue_depth': status_info.get('decode_queue_depth', 0),
+            'decode_seconds': decode_seconds,
+            'avg_ms': decode_seconds / frames * 1000.0 if frames else 0.0,
+            'max_ms': status_info.get('decode_max_ms', 0.0),
+            'mpixels': mpixels,
+            'cpu_ms_per_mp': status_info.get('decode_cpu_seconds', 0.0) / mpixels * 1000.0 if mpixels else 0.0,
+        })
+    if not rows:
+        return [], None
+
+    frames = sum(row['frames'] for row in rows)
+    mpixels = sum(row['mpixels'] for row in rows)
+    cpu_seconds = max(0.0, process_tree_cpu_seconds() - _run_cpu_start)
+    total = {
+        'streams': len(rows),
+        'frames': frames,
+        'dropped': sum(row['dropped'] for row in rows),
+        'mpixels': mpixels,
+        'avg_ms': sum(row['decode_seconds'] for row in rows) / frames * 1000.0 if frames else 0.0,
+        'max_ms': max(row['max_ms'] for row in rows),
+        'process_cpu_seconds': cpu_seconds,
+        'cpu_ms_per_mp': cpu_seconds / mpixels * 1000.0 if mpixels else 0.0,
+    }
+    return rows, total
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+进程内共享的 DNS 解析缓存
+
+核心思路：
+- 大量会话共用少量主机名（threads_per_url > 1、同一台 NVR 的多个通道），每次连接和重连都重新解析会产生成批的
+  解析请求，并把解析器的抖动带进连接耗时。会话改为经由本缓存解析，同一主机名在 TTL 内只解析一次。
+- 解析失败同样缓存（负缓存，TTL 较短），主机名写错或 DNS 故障时不会让每路会话每次重连都去等解析超时。
+- 同一主机名同时未命中时只有一个调用方真正解析，其余调用方等待其结果（single-flight），缓存过期瞬间也不会突发。
+- 启动压测前由 prefetch 并行预解析整个 URL 列表；多进程引擎由监督线程预解析后把条目随启动参数交给工作进程。
+- getaddrinfo 拿不到记录本身的 TTL，缓存时长按配置固定；本模块不依赖全局配置，参数由调用方传入。
+"""
+
+import concurrent.futures
+import socket
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from connect_phases import is_ip_literal
+
+# 等待其他调用方解析结果的上限，秒，超时后自行解析
+PENDING_WAIT = 30.0
+
+
+class CachedResolveError(socket.gaierror):
+    """命中负缓存：该主机名最近解析失败，未再次解析"""
+
+
+class _Entry:
+    __slots__ = ('addresses', 'error', 'expires')
+
+    def __init__(self, addresses, error, expires):
+        # [(地址族, IP)]，解析失败时为空列表并记录错误信息
+        self.addresses = addresses
+        self.error = error
+        self.expires = expires
+
+
+class DnsCache:
+    """主机名 -> 地址列表的 TTL 缓存，带负缓存与并发去重"""
+    def __init__(self):
+        self.entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port, ttl, negative_ttl, force=False):
+        """返回 (地址列表, 是否命中缓存)
+
+        解析失败时抛出 socket.gaierror，命中负缓存时抛出其子类 CachedResolveError；
+        ttl <= 0 时不使用缓存；force 为 True 时忽略未过期的条目重新解析（仍与正在进行的解析合并）。
+        """
+        if ttl <= 0:
+            return _getaddrinfo(host, port), False
+        while True:
+            with self._lock:
+                entry = self.entries.get(host)
+                if not force and entry is not None and entry.expires > time.monotonic():
+                    return self._result(entry), True
+                pending = self._pending.get(host)
+                if pending is None:
+                    pending = self._pending[host] = threading.Event()
+                    break
+            # 其他调用方正在解析同一主机名，等待其结果后按命中处理
+            if not pending.wait(PENDING_WAIT):
+                return _getaddrinfo(host, port), False
+            force = False
+        try:
+            return self._refresh(host, port, ttl, negative_ttl), False
+        finally:
+            with self._lock:
+                self._pending.pop(host, None)
+            pending.set()
+
+    def _refresh(self, host, port, ttl, negative_ttl):
+        try:
+            addresses = _getaddrinfo(host, port)
+        except socket.gaierror as e:
+            with self._lock:
+                self.entries[host] = _Entry([], str(e), time.monotonic() + negative_ttl)
+            raise
+        with self._lock:
+            self.entries[host] = _Entry(addresses, None, time.monotonic() + ttl)
+        return addresses
+
+    @staticmethod
+    def _result(entry):
+        if entry.error is not None:
+            raise CachedResolveError(f"{entry.error}（DNS 负缓存）")
+        return entry.addresses
+
+    def lookup(self, host):
+        """只查缓存不解析，未命中或已过期时返回 None，解析失败的条目同样返回 None"""
+        with self._lock:
+            entry = self.entries.get(host)
+            if entry is None or entry.expires <= time.monotonic() or entry.error is not None:
+                return None
+            return entry.addresses
+
+    def snapshot(self):
+        """有效条目的 {主机名: (地址列表, 错误, 剩余秒数)}，用于交给多进程引擎的工作进程"""
+        now = time.monotonic()
+        with self._lock:
+            return {host: (entry.addresses, entry.error, entry.expires - now)
+                    for host, entry in self.entries.items() if entry.expires > now}
+
+    def seed(self, snapshot):
+        now = time.monotonic()
+        with self._lock:
+            for host, (addresses, error, remaining) in snapshot.items():
+                self.entries[host] = _Entry(list(addresses), error, now + remaining)
+
+    def prefetch(self, hosts, port, ttl, negative_ttl, workers):
+        """并行重新解析全部主机名并写入缓存，返回 (成功数, 失败数, 耗时秒)"""
+        hosts = sorted(set(hosts))
+        if not hosts or ttl <= 0:
+            return 0, 0, 0.0
+        start = time.monotonic()
+        failed = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts))),
+                                                   thread_name_prefix="DNS预解析") as pool:
+            futures = [pool.submit(self.resolve, host, port, ttl, negative_ttl, True) for host in hosts]
+            for future in futures:
+                try:
+                    future.result()
+                except (socket.gaierror, OSError):
+                    failed += 1
+        return len(hosts) - failed, failed, time.monotonic() - start
+
+
+def _getaddrinfo(host, port):
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [(family, sockaddr[0]) for family, _, _, _, sockaddr in infos]
+
+
+def url_hosts(urls):
+    """URL 列表中需要解析的主机名（IP 地址不需要解析）"""
+    hosts = set()
+    for url in urls:
+        try:
+            host = urlsplit(url if '://' in url else f"rtsp://{url}").hostname
+        except ValueError:
+            continue
+        if host and not is_ip_literal(host):
+            hosts.add(host)
+    return hosts
+
+
+def replace_host(url, address):
+    """把 URL 中的主机名换成解析得到的地址，保留用户名密码、端口与路径"""
+    parts = urlsplit(url)
+    host = f"[{address}]" if ':' in address else address
+    userinfo, _, _ = parts.netloc.rpartition('@')
+    netloc = f"{userinfo}@{host}" if userinfo else host
+    if parts.port:
+        netloc += f":{parts.port}"
+    return urlunsplit((parts.scheme, netloc, parts.path, parts.query, parts.fragment))
+
+
+DNS_CACHE = DnsCache()
+
+
+def summarize_dns(statuses):
+    """按指标表的状态字典汇总各路会话的 DNS 缓存命中、未命中次数与实际解析耗时，没有解析记录时返回 None"""
+    hits = sum(s.get('dns_hits', 0) for s in statuses.values())
+    misses = sum(s.get('dns_misses', 0) for s in statuses.values())
+    if not hits and not misses:
+        return None
+    seconds = sum(s.get('dns_resolve_seconds', 0.0) for s in statuses.values())
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) * 100.0,
+        'resolve_seconds': seconds,
+        'avg_miss_ms': seconds / misses * 1000.0 if misses else 0.0,
+    }
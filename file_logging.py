@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+压测日志异步写盘
+
+核心思路：
+- 根日志器上挂一个 QueueHandler，监控线程记录日志时只把格式化后的记录追加到内存队列（deque），
+  队列满时丢弃并计数，从不等待磁盘 I/O，也不唤醒其他线程。
+- 后台写盘线程每隔 FILE_LOG_FLUSH_INTERVAL 秒整批取出记录写文件：每次运行在日志根目录下新建一个子目录，
+  主日志 run.log 记录全部日志；开启按流拆分时，线程-XX-YY 的日志改写入各自的文件。
+- 日志文件按大小或时间轮转（先到者触发），轮转出的文件可选 gzip 压缩，压缩同样在后台线程完成。
+- 按流拆分时同时打开的文件数有上限，最久未写入的文件先关闭，下次写入时再以追加方式打开；
+  每批日志先按流归组，每个文件每批只打开一次，上千路流轮流写日志时不会每条都重新打开文件。
+- 多进程引擎的工作进程各自启动一份，写入同一运行目录下的 worker-N.log（及各自流的文件）。
+"""
+
+import datetime
+import gzip
+import logging
+import logging.handlers
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+
+FILE_LOG_QUEUE_MAX = 100000
+# 按流拆分时同时保持打开的日志文件数上限
+MAX_OPEN_STREAM_FILES = 128
+STREAM_LOGGER_PREFIX = "线程-"
+# 写盘线程整批写出的间隔（秒）
+FILE_LOG_FLUSH_INTERVAL = 0.5
+LOG_FORMAT = "%(asctime)s [%(levelname)s] [%(name)s] %(message)s"
+
+_ACTIVE = None
+
+
+def new_run_dir(base_dir):
+    """在 base_dir 下创建本次运行的日志目录"""
+    name = datetime.datetime.now().strftime("rtsp_%Y%m%d_%H%M%S")
+    path = os.path.join(base_dir, name)
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(base_dir, f"{name}_{suffix}")
+    os.makedirs(path)
+    return path
+
+
+class RotatingLogFileHandler(logging.handlers.BaseRotatingHandler):
+    """按大小或时间轮转的日志文件，轮转出的文件以时间戳命名（如 run.log.20250823-101500-123456），可选 gzip 压缩
+
+    max_bytes 为 0 时不按大小轮转，rotate_seconds 为 0 时不按时间轮转；
+    每个日志文件最多保留 backup_count 份轮转文件。
+    """
+    def __init__(self, filename, max_bytes=0, rotate_seconds=0, backup_count=10, compress=False):
+        super().__init__(filename, 'a', encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.compress = compress
+        self.rollover_at = time.time() + rotate_seconds if rotate_seconds > 0 else None
+
+    def flush(self):
+        # 每条日志写入后不刷新，由写盘线程每批写完后调用 flush_batch
+        pass
+
+    def flush_batch(self):
+        self.acquire()
+        try:
+            if self.stream:
+                self.stream.flush()
+        finally:
+            self.release()
+
+    def close_stream(self):
+        """关闭文件但保留处理器，下次写入时重新以追加方式打开"""
+        self.acquire()
+        try:
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+        finally:
+            self.release()
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            position = self.stream.tell()
+            # 单条日志超过上限时不反复轮转空文件
+            if position and position + len(self.format(record)) + 1 > self.max_bytes:
+                return True
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            # 时间戳精确到微秒，文件名顺序即轮转顺序
+            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            target = f"{self.baseFilename}.{stamp}"
+            while os.path.exists(target) or os.path.exists(target + ".gz"):
+                time.sleep(0.000001)
+                stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+                target = f"{self.baseFilename}.{stamp}"
+            os.replace(self.baseFilename, target)
+            if self.compress:
+                with open(target, 'rb') as src, gzip.open(target + ".gz", 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(target)
+            self._remove_old_backups()
+        if self.rotate_seconds > 0:
+            self.rollover_at = time.time() + self.rotate_seconds
+
+    def _remove_old_backups(self):
+        directory, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + "."
+        backups = [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith(prefix)]
+        if len(backups) <= self.backup_count:
+            return
+        backups.sort()
+        for path in backups[:len(backups) - self.backup_count]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class StreamLogRouter:
+    """运行在写盘线程内：全部日志写入主日志，开启按流拆分时线程-XX-YY 的日志写入各自的文件"""
+    def __init__(self, run_dir, main_name, per_stream, handler_options):
+        self.run_dir = run_dir
+        self.per_stream = per_stream
+        self.handler_options = handler_options
+        self.main = self._create_handler(main_name)
+        self.streams = {}
+        # 当前持有打开文件的流日志处理器，按最近写入排序
+        self.open_streams = OrderedDict()
+
+    def _create_handler(self, name):
+        handler = RotatingLogFileHandler(os.path.join(self.run_dir, f"{name}.log"), **self.handler_options)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        return handler
+
+    def write_batch(self, records):
+        """写入一批日志：各流的日志先按流归组，每个文件每批只打开、刷新一次"""
+        grouped = {}
+        for record in records:
+            if self.per_stream and record.name.startswith(STREAM_LOGGER_PREFIX):
+                grouped.setdefault(record.name, []).append(record)
+            else:
+                self.main.handle(record)
+        self.main.flush_batch()
+        for name, stream_records in grouped.items():
+            handler = self.streams.get(name)
+            if handler is None:
+                handler = self._create_handler(name)
+                self.streams[name] = handler
+            for record in stream_records:
+                handler.handle(record)
+            handler.flush_batch()
+            self.open_streams[name] = handler
+            self.open_streams.move_to_end(name)
+            if len(self.open_streams) > MAX_OPEN_STREAM_FILES:
+                _, idle = self.open_streams.popitem(last=False)
+                idle.close_stream()
+
+    def close(self):
+        for handler in self.streams.values():
+            handler.close()
+        self.main.close()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """监控线程侧的处理器：只追加到无锁的 deque，不唤醒写盘线程；队列满时丢弃并计数"""
+    def __init__(self, log_queue, max_size=FILE_LOG_QUEUE_MAX):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if len(self.queue) >= self.max_size:
+            self.dropped += 1
+        else:
+            self.queue.append(record)
+
+
+class FileLogSession:
+    """一次运行的日志写盘：根日志器上的入队处理器与后台写盘线程"""
+    def __init__(self, run_dir, main_name, settings):
+        self.run_dir = run_dir
+        handler_options = {
+            'max_bytes': int(settings.file_log_max_mb * 1024 * 1024),
+            'rotate_seconds': int(settings.file_log_rotate_hours * 3600),
+            'backup_count': settings.file_log_backup_count,
+            'compress': settings.file_log_compress,
+        }
+        self.router = StreamLogRouter(run_dir, main_name, settings.file_log_per_stream, handler_options)
+        self.queue = deque()
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.setLevel(settings.log_level)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._write_loop, name="日志写盘", daemon=True)
+        self.stopped = False
+
+    def _write_loop(self):
+        # 按固定间隔整批写出，写盘线程不随每条日志唤醒，不与监控线程频繁争抢 GIL
+        while not self.stop_event.wait(FILE_LOG_FLUSH_INTERVAL):
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        count = len(self.queue)
+        if count:
+            popleft = self.queue.popleft
+            self.router.write_batch([popleft() for _ in range(count)])
+
+    def start(self):
+        self.thread.start()
+        logging.getLogger().addHandler(self.handler)
+
+    def stop(self):
+        """摘除处理器并等待队列中的日志全部写完，可重复调用"""
+        global _ACTIVE
+        if _ACTIVE is self:
+            _ACTIVE = None
+        if self.stopped:
+            return
+        self.stopped = True
+        logging.getLogger().removeHandler(self.handler)
+        self.stop_event.set()
+        self.thread.join()
+        self.router.close()
+        if self.handler.dropped:
+            logging.warning(f"日志写盘队列已满，丢弃 {self.handler.dropped} 条日志")
+
+
+def start_file_logging(settings, run_dir=None, main_name="run"):
+    """开始把日志写入文件并返回会话；run_dir 为空时在 settings.file_log_dir 下新建运行目录"""
+    global _ACTIVE
+    stop_file_logging()
+    created = run_dir is None
+    if created:
+        run_dir = new_run_dir(settings.file_log_dir)
+    session = FileLogSession(run_dir, main_name, settings)
+    session.start()
+    _ACTIVE = session
+    if created:
+        logging.info(f"日志写入目录: {run_dir}")
+    return session
+
+
+def stop_file_logging():
+    if _ACTIVE is not None:
+        _ACTIVE.stop()
+
+
+def active_log_dir():
+    """当前运行的日志目录，未开启写盘时为 None"""
+    return _ACTIVE.run_dir if _ACTIVE is not None else None
+
+
+def detach_inherited_logging():
+    """fork 出的子进程继承了父进程的入队处理器但没有监听线程，摘除以免日志堆积在队列中"""
+    global _ACTIVE
+    if _ACTIVE is not None:
+        logging.getLogger().removeHandler(_ACTIVE.handler)
+        _ACTIVE = None
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+码率与 GOP 统计（不解码）
+
+核心思路：
+- 只用解复用得到的包信息（是否关键帧、大小、PTS），不依赖解码，默认开启。
+- 逐包只判断关键帧标志，关键帧时暂存 (帧序号, PTS, 到达时刻, 大小)；
+  码率按统计周期读取累计字节数计算，逐包没有额外开销。
+- 码率：滑动窗口（bitrate_window_seconds）平均码率，以及按 1 秒统计的峰值码率。
+- GOP：相邻关键帧之间的帧数（当前值与最大值），关键帧间隔按 PTS 计算均值与标准差（抖动），
+  没有 PTS 时退回到达时刻；关键帧与非关键帧平均大小之比用于发现码率配置异常。
+- 统计跨重连累计，重连后从新连接的第一个关键帧重新计算间隔，不跨连接求差。
+"""
+
+import collections
+
+# 峰值码率的统计粒度，秒
+PEAK_INTERVAL = 1.0
+
+
+class GopStats:
+    """单路会话的码率与 GOP 统计，由会话在统计周期内更新"""
+    __slots__ = ('samples', 'bitrate', 'peak_bitrate', 'peak_start', 'last_key', 'gop_length', 'max_gop_length',
+                 'keyframes', 'keyframe_bytes', 'intervals', 'interval_mean', 'interval_m2', 'max_interval')
+
+    def __init__(self):
+        # (时刻, 累计字节) 采样，覆盖一个滑动窗口
+        self.samples = collections.deque()
+        self.bitrate = 0.0
+        self.peak_bitrate = 0.0
+        self.peak_start = None
+        # 上一个关键帧的 (帧序号, 秒)
+        self.last_key = None
+        self.gop_length = 0
+        self.max_gop_length = 0
+        self.keyframes = 0
+        self.keyframe_bytes = 0
+        # 关键帧间隔（秒）的样本数、均值与平方差累计（Welford）
+        self.intervals = 0
+        self.interval_mean = 0.0
+        self.interval_m2 = 0.0
+        self.max_interval = 0.0
+
+    def on_connect(self):
+        """新连接的帧序号与时间戳不连续，间隔从下一个关键帧重新计算"""
+        self.last_key = None
+        self.peak_start = None
+
+    def add_keyframes(self, marks, unit_seconds):
+        """marks 为 [(帧序号, PTS 或 None, 到达时刻, 大小)]，unit_seconds 为 PTS 单位对应的秒数"""
+        for frame_index, pts, arrival, size in marks:
+            self.keyframes += 1
+            self.keyframe_bytes += size
+            seconds = pts * unit_seconds if pts is not None and unit_seconds else arrival
+            if self.last_key is not None:
+                last_index, last_seconds = self.last_key
+                self.gop_length = frame_index - last_index
+                if self.gop_length > self.max_gop_length:
+                    self.max_gop_length = self.gop_length
+                interval = seconds - last_seconds
+                # 时间戳回绕或跳变时丢弃该间隔
+                if 0 < interval < 3600:
+                    self.intervals += 1
+                    delta = interval - self.interval_mean
+                    self.interval_mean += delta / self.intervals
+                    self.interval_m2 += delta * (interval - self.interval_mean)
+                    if interval > self.max_interval:
+                        self.max_interval = interval
+            self.last_key = (frame_index, seconds)
+
+    def update_bitrate(self, now, total_bytes, window_seconds):
+        """按累计字节数更新滑动窗口码率与峰值码率，单位 Mbps"""
+        samples = self.samples
+        samples.append((now, total_bytes))
+        while len(samples) > 2 and now - samples[1][0] >= window_seconds:
+            samples.popleft()
+        start_time, start_bytes = samples[0]
+        if now > start_time:
+            self.bitrate = (total_bytes - start_bytes) * 8 / (now - start_time) / 1e6
+
+        if self.peak_start is None:
+            self.peak_start = (now, total_bytes)
+        elif now - self.peak_start[0] >= PEAK_INTERVAL:
+            peak = (total_bytes - self.peak_start[1]) * 8 / (now - self.peak_start[0]) / 1e6
+            if peak > self.peak_bitrate:
+                self.peak_bitrate = peak
+            self.peak_start = (now, total_bytes)
+
+    def interval_ms(self):
+        return self.interval_mean * 1000.0
+
+    def jitter_ms(self):
+        """关键帧间隔的标准差"""
+        return (self.interval_m2 / self.intervals) ** 0.5 * 1000.0 if self.intervals > 1 else 0.0
+
+    def keyframe_size_ratio(self, total_frames, total_bytes):
+        """关键帧平均大小 / 非关键帧平均大小"""
+        other_frames = total_frames - self.keyframes
+        other_bytes = total_bytes - self.keyframe_bytes
+        if not self.keyframes or other_frames <= 0 or other_bytes <= 0:
+            return 0.0
+        return (self.keyframe_bytes / self.keyframes) / (other_bytes / other_frames)
+
+
+def summarize_gop(statuses):
+    """按指标表的状态字典整理每路码率与 GOP 统计，返回有关键帧数据的行，统计不到时返回空列表"""
+    rows = []
+    for thread_id, status_info in statuses.items():
+        if not status_info.get('keyframes', 0) and not status_info.get('bitrate_mbps', 0.0):
+            continue
+        rows.append({
+            'thread_id': thread_id,
+            'bitrate_mbps': status_info.get('bitrate_mbps', 0.0),
+            'peak_bitrate_mbps': status_info.get('peak_bitrate_mbps', 0.0),
+            'gop_length': status_info.get('gop_length', 0),
+            'max_gop_length': status_info.get('max_gop_length', 0),
+            'keyframes': status_info.get('keyframes', 0),
+            'keyframe_interval_ms': status_info.get('keyframe_interval_ms', 0.0),
+            'keyframe_jitter_ms': status_info.get('keyframe_jitter_ms', 0.0),
+            'keyframe_max_interval_ms': status_info.get('keyframe_max_interval_ms', 0.0),
+            'keyframe_size_ratio': status_info.get('keyframe_size_ratio', 0.0),
+        })
+    return rows
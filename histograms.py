@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+对数分桶延迟直方图
+
+核心思路：
+- 参照 HdrHistogram 分桶：数值以微秒为单位，小于 2×SUB_BUCKETS 的值每微秒一个桶，
+  之后每个 2 的幂区间等分为 SUB_BUCKETS 个桶，相对误差不超过 1/SUB_BUCKETS（约 6%，按桶上界报告），
+  1 微秒到约 35 分钟共 HIST_BUCKETS 个桶，每个直方图占用固定内存。
+- 每路流记录四种直方图：连接耗时、首包耗时、首个关键帧耗时（均从发起连接起算）与包到达间隔；
+  开启 phase_histograms_enabled 时另按连接阶段（见 connect_phases）记录 DNS 解析、TCP 建连、RTSP 握手、
+  打开与流探测各自的耗时和每次重试退避的等待。每种直方图每路约 3.5 KB，连接阶段的五种默认不分配，
+  5000 路时指标表的直方图约 70 MB，开启后约 160 MB（多进程引擎位于共享内存）。
+  单次记录只是给一个整数桶加 1，为 O(1)；逐包的到达间隔在统计周期内批量向量化分桶。
+- 直方图就是计数数组，按位相加即可合并：单路、URL、分组与全局的统计都由各路直方图相加得到，
+  多进程引擎的直方图存放在共享内存中（见 metrics_table），监督进程直接合并，无需回传样本。
+- 报表给出 p50/p95/p99/p99.9/最大值，不再用平均值掩盖卡顿。
+"""
+
+import numpy as np
+
+HIST_CONNECT = 0
+HIST_FIRST_PACKET = 1
+HIST_FIRST_KEYFRAME = 2
+HIST_INTER_ARRIVAL = 3
+HIST_DNS = 4
+HIST_TCP = 5
+HIST_HANDSHAKE = 6
+HIST_PROBE = 7
+HIST_BACKOFF = 8
+HIST_KINDS = ('connect', 'first_packet', 'first_keyframe', 'inter_arrival', 'dns', 'tcp', 'handshake', 'probe',
+              'backoff')
+# 前四种始终记录，其余为连接阶段，指标表按需分配
+BASE_HIST_KINDS = 4
+HIST_NAMES = ('连接耗时', '首包耗时', '首个关键帧耗时', '包到达间隔', 'DNS解析', 'TCP建连', 'RTSP握手（RTP直连）',
+              '打开与流探测（libav，含握手）', '重试退避等待')
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_VALUE_US = (1 << 31) - 1
+PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('p999', 0.999))
+
+
+def bucket_index(value_us):
+    """微秒数对应的桶号，超出范围的值计入最后一个桶"""
+    v = min(max(int(value_us), 0), MAX_VALUE_US)
+    if v < 2 * SUB_BUCKETS:
+        return v
+    shift = v.bit_length() - SUB_BUCKET_BITS - 1
+    return SUB_BUCKETS * (shift + 1) + (v >> shift) - SUB_BUCKETS
+
+
+HIST_BUCKETS = bucket_index(MAX_VALUE_US) + 1
+
+
+def bucket_indices(values_us):
+    """bucket_index 的向量化版本，values_us 为整数数组"""
+    v = np.clip(values_us, 0, MAX_VALUE_US).astype(np.int64)
+    bits = np.frexp(v.astype(np.float64))[1]
+    shift = np.maximum(bits - SUB_BUCKET_BITS - 1, 0)
+    return np.where(v < 2 * SUB_BUCKETS, v, SUB_BUCKETS * (shift + 1) + (v >> shift) - SUB_BUCKETS)
+
+
+def bucket_upper_us(index):
+    """桶内最大的微秒数"""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    sub = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((sub + 1) << shift) - 1
+
+
+def new_histograms(rows=None, kinds=len(HIST_KINDS)):
+    """一路流（rows 为 None）或多路流的空直方图"""
+    shape = (kinds, HIST_BUCKETS) if rows is None else (rows, kinds, HIST_BUCKETS)
+    return np.zeros(shape, dtype=np.int64)
+
+
+def record(hist, kind, seconds):
+    """记录一个以秒为单位的样本，hist 为单路流的直方图"""
+    hist[kind, bucket_index(seconds * 1e6)] += 1
+
+
+def record_many(hist, kind, seconds):
+    """批量记录以秒为单位的样本数组"""
+    if len(seconds):
+        hist[kind] += np.bincount(bucket_indices(np.asarray(seconds) * 1e6), minlength=HIST_BUCKETS)
+
+
+def summarize(counts):
+    """单个直方图（一维计数）的样本数、分位数与最大值，单位毫秒"""
+    total = int(counts.sum())
+    summary = {'count': total}
+    if not total:
+        summary.update({name: 0.0 for name, _ in PERCENTILES}, max=0.0)
+        return summary
+    cumulative = np.cumsum(counts)
+    for name, q in PERCENTILES:
+        index = int(np.searchsorted(cumulative, max(1, int(np.ceil(total * q)))))
+        summary[name] = bucket_upper_us(index) / 1000.0
+    summary['max'] = bucket_upper_us(int(np.flatnonzero(counts)[-1])) / 1000.0
+    return summary
+
+
+def merge_groups(thread_ids, data, groups):
+    """按分组合并各路直方图
+
+    thread_ids/data 为 MetricsTable.histograms() 的结果，groups 为 [(名称, [thread_id, ...])]，
+    返回 [(名称, 合并后的直方图)]。
+    """
+    position = {thread_id: i for i, thread_id in enumerate(thread_ids)}
+    merged = []
+    for label, members in groups:
+        rows = [position[t] for t in members if t in position]
+        merged.append((label, data[rows].sum(axis=0) if rows else new_histograms(kinds=data.shape[1])))
+    return merged
+
+
+def summarize_groups(sections):
+    """[(名称, 直方图)] -> {名称: {类型: 摘要}}，用于 JSON 报告"""
+    return {label: {kind: summarize(hist[i]) for i, kind in enumerate(HIST_KINDS[:len(hist)])}
+            for label, hist in sections}
@@ -6,993 +6,38 @@ import os
 import time
 import re
 import logging
-import queue
 import logging.handlers
-from collections import defaultdict, deque
-import psutil
-import av
-import av.error
 import datetime
 import subprocess
 import platform
 
-# ==============================================================================
-# 全局配置管理
-# ==============================================================================
-class SettingsManager:
-    """管理所有可配置参数的类"""
-    def __init__(self):
-        # 保存原始默认值，用于重置
-        self.defaults = {}
-        
-        # GUI和系统参数
-        self.gui_refresh_interval = 200      # GUI刷新频率，毫秒
-        self.reconnect_wait_time = 5         # 重连等待时间，秒
-        self.fps_smooth_window = 10          # 父项汇总 FPS 平滑窗口大小
-        self.threads_per_url = 1             # 每个URL的监控线程数
-        self.sys_monitor_enabled = True      # 是否启用系统监控线程
-        
-        # 数据质量参数
-        self.enable_real_packet_loss = True  # 启用真实丢包检测
-        self.enable_frame_analysis = True    # 启用帧类型分析
-        self.quality_level = "高级"           # 数据质量等级: 基础/标准/高级
-        
-        # 核心RTSP参数
-        self.rtsp_timeout = 5000000          # PyAV拉流超时，微秒
-        self.rtsp_buffer_size = 2097152      # RTSP缓冲区大小，字节
-        self.rtsp_user_agent = "LibVLC/3.0.0" # RTSP用户代理
-        self.rtsp_max_delay = 500000         # 最大延迟，微秒
-        self.rtsp_probe_size = 2097152       # 探测大小，字节
-        self.rtsp_analyzeduration = 2000000 # 分析时长，微秒
-        self.strict_protocol = True         # 默认严格使用用户选择的协议
-        
-        # 质量监控参数
-        self.rtp_timeout_threshold = 5000    # RTP超时阈值，毫秒
-        self.packet_loss_threshold = 5.0     # 丢帧率阈值，百分比
-        
-        # PTS丢帧检测参数
-        self.pts_tolerance_ms = 100          # PTS时间戳容错范围，毫秒
-        self.frame_interval_tolerance = 0.15 # 帧间隔容错比例
-        self.missing_frame_threshold = 3     # 连续丢帧判断阈值
-        self.pts_reset_threshold = 5000      # PTS重置检测阈值，毫秒
-        self.enable_pts_smoothing = True     # 启用PTS平滑算法
-        self.pts_history_size = 50           # PTS历史缓存大小
-        
-        # 丢帧统计参数
-        self.frame_loss_window_size = 1000   # 丢帧统计窗口大小
-        self.frame_loss_report_interval = 10 # 丢帧报告间隔，秒
-        self.enable_iframe_priority = True   # I帧丢失优先级检测
-        
-        # 真实帧率检测参数
-        self.fps_detection_method = "自动"    # 帧率检测方法: 自动/手动/混合
-        self.fps_calculation_window = 100    # 动态计算窗口大小
-        self.fps_update_interval = 5         # 帧率更新频率，秒
-        
-        # 系统性能参数
-        self.max_cpu_usage = 80              # 最大CPU使用率，百分比
-        self.max_memory_usage = 70           # 最大内存使用率，百分比
-        self.enable_performance_limit = True # 启用性能限制
-        self.log_level = "INFO"              # 日志级别
-        
-        # 保存初始化后的默认值
-        self._save_defaults()
-    
-    def _save_defaults(self):
-        """保存当前所有参数值作为默认值"""
-        for attr_name in dir(self):
-            if not attr_name.startswith('_') and not callable(getattr(self, attr_name)) and attr_name != 'defaults':
-                self.defaults[attr_name] = getattr(self, attr_name)
-    
-    def reset_to_defaults(self):
-        """重置所有参数为默认值"""
-        for attr_name, default_value in self.defaults.items():
-            setattr(self, attr_name, default_value)
-    
-    def get_quality_config(self):
-        """根据质量等级返回对应配置"""
-        if self.quality_level == "基础":
-            return {
-                "enable_real_packet_loss": False,
-                "enable_frame_analysis": False
-            }
-        elif self.quality_level == "标准":
-            return {
-                "enable_real_packet_loss": True,
-                "enable_frame_analysis": False
-            }
-        else:  # 高级
-            return {
-                "enable_real_packet_loss": True,
-                "enable_frame_analysis": True
-            }
-
-SETTINGS = SettingsManager()
-SYSTEM_MONITOR_ID = -1
+from rtsp_engine import (SETTINGS, SYSTEM_MONITOR_ID, STATUS_QUEUES, METRICS_TABLE, LOG_QUEUE, AGGREGATED_DATA,
+                         THREAD_NAME_MAP, STOP_EVENT, SystemMonitor,
+                         create_metrics_exporter, create_monitor_factory, start_dns_prefetch,
+                         write_stress_report)
+from file_logging import start_file_logging
+from decode_stage import DECODE_SKIP_MODES, DECODE_THREAD_TYPES, mark_run_start, summarize_decode
+from gop_stats import summarize_gop
+from histograms import merge_groups
+from slice_parser import summarize_slices
+from stream_param_cache import summarize_probe
+from connect_phases import summarize_connect_phases
+from dns_cache import summarize_dns
+from load_profile import LOAD_PROFILES, build_load_schedule, summarize_phases
+from reconnect_policy import BREAKER_CLOSED, BREAKER_STATE_NAMES, reset_reconnect_policy
+from timeseries_store import start_recording
 
 # ==============================================================================
-# 全局状态管理
+# GUI 全局状态
 # ==============================================================================
-STATUS_QUEUES = defaultdict(queue.Queue)
-LOG_QUEUE = deque()
-THREAD_TO_URL_MAP = {}
-def create_aggregated_data():
-    return {
-        'total_frames': 0,
-        'total_bytes': 0,
-        'total_reconnects': 0,
-        'total_expected_frames': 0,
-        'total_lost_frames': 0,
-        'fps_list': deque(maxlen=SETTINGS.fps_smooth_window),
-        'latency_list': deque(maxlen=100),
-        'start_time': None,
-    }
-
-AGGREGATED_DATA = defaultdict(create_aggregated_data)
-THREAD_NAME_MAP = {}
-STOP_EVENT = threading.Event()
 STOP_CHECK_ID = None
-SYSTEM_MONITOR_STOP_EVENT = threading.Event()
 SYSTEM_MONITOR_THREAD = None
 
-# ==============================================================================
-# 线程安全日志处理器
-# ==============================================================================
-class ThreadSafeLogHandler(logging.Handler):
-    """用于将日志发送到GUI队列"""
-    def __init__(self, log_queue):
-        super().__init__()
-        self.log_queue = log_queue
-
-    def emit(self, record):
-        # 移除RTSP流监控线程的日志，避免刷屏
-        # if record.name.startswith("线程-") or record.name == "root":
-        #     return
-            
-        # 修正：将日志名作为前缀，并移除冗余信息，添加日期
-        log_time = datetime.datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
-        log_name = record.name if record.name != "root" else "System"
-        log_message = f"[{log_time}] - [{log_name}] - [{record.levelname}] - {self.format(record)}"
-        self.log_queue.append((record.levelno, log_message))
-
-logging.basicConfig(level=logging.DEBUG)
-for handler in logging.getLogger().handlers[:]:
-    logging.getLogger().removeHandler(handler)
-
-gui_handler = ThreadSafeLogHandler(LOG_QUEUE)
-gui_handler.setFormatter(logging.Formatter('%(message)s'))
-logging.getLogger().addHandler(gui_handler)
-
-# ==============================================================================
-# 已移除QoE评分相关功能
-# ==============================================================================
-
-# ==============================================================================
-# PTS丢帧检测类
-# ==============================================================================
-class PTSFrameLossDetector:
-    """基于PTS时间戳的真实丢帧检测器"""
-    def __init__(self):
-        self.pts_history = deque(maxlen=SETTINGS.pts_history_size)
-        self.last_pts = None
-        self.expected_frame_interval = None
-        self.frame_rate = None
-        self.total_frames_detected = 0
-        self.total_frames_lost = 0
-        self.consecutive_losses = 0
-        self.pts_reset_detected = False
-        
-    def update_frame_rate(self, fps):
-        """更新帧率并计算期望帧间隔"""
-        if fps and fps > 0:
-            self.frame_rate = fps
-            self.expected_frame_interval = 1000.0 / fps  # 毫秒
-    
-    def detect_frame_loss(self, current_pts_ms):
-        """检测基于PTS的帧丢失
-        Args:
-            current_pts_ms: 当前帧的PTS时间戳(毫秒)
-        Returns:
-            dict: 包含丢帧信息的字典
-        """
-        result = {
-            'frames_lost': 0,
-            'pts_reset': False,
-            'interval_abnormal': False,
-            'total_lost': self.total_frames_lost
-        }
-        
-        if self.last_pts is None:
-            # 第一帧，初始化
-            self.last_pts = current_pts_ms
-            self.pts_history.append(current_pts_ms)
-            return result
-        
-        # 检测PTS重置或回退
-        if current_pts_ms < self.last_pts:
-            if (self.last_pts - current_pts_ms) > SETTINGS.pts_reset_threshold:
-                result['pts_reset'] = True
-                self.pts_reset_detected = True
-                self._reset_detector()
-                return result
-        
-        # 计算PTS间隔
-        pts_interval = current_pts_ms - self.last_pts
-        
-        # 动态学习帧间隔（如果没有预设帧率）
-        if self.expected_frame_interval is None and len(self.pts_history) >= 10:
-            self._calculate_expected_interval()
-        
-        if self.expected_frame_interval:
-            # 计算丢失的帧数
-            expected_frames = round(pts_interval / self.expected_frame_interval)
-            
-            # 容错处理
-            tolerance_ms = SETTINGS.pts_tolerance_ms
-            interval_tolerance = SETTINGS.frame_interval_tolerance
-            
-            min_expected = self.expected_frame_interval * (1 - interval_tolerance)
-            max_expected = self.expected_frame_interval * (1 + interval_tolerance)
-            
-            if pts_interval > (max_expected + tolerance_ms):
-                # 检测到帧丢失
-                frames_lost = max(0, expected_frames - 1)
-                result['frames_lost'] = frames_lost
-                result['interval_abnormal'] = True
-                
-                self.total_frames_lost += frames_lost
-                self.consecutive_losses += 1
-                
-                # 连续丢帧告警
-                if self.consecutive_losses >= SETTINGS.missing_frame_threshold:
-                    result['consecutive_loss_alert'] = True
-            else:
-                self.consecutive_losses = 0
-        
-        # 更新历史记录
-        self.pts_history.append(current_pts_ms)
-        self.last_pts = current_pts_ms
-        self.total_frames_detected += 1
-        result['total_lost'] = self.total_frames_lost
-        
-        return result
-    
-    def _calculate_expected_interval(self):
-        """从历史PTS数据计算期望帧间隔"""
-        if len(self.pts_history) < 2:
-            return
-            
-        intervals = []
-        for i in range(1, len(self.pts_history)):
-            interval = self.pts_history[i] - self.pts_history[i-1]
-            if interval > 0:  # 过滤异常值
-                intervals.append(interval)
-        
-        if intervals:
-            # 使用中位数作为期望间隔，更稳定
-            intervals.sort()
-            median_idx = len(intervals) // 2
-            self.expected_frame_interval = intervals[median_idx]
-    
-    def _reset_detector(self):
-        """重置检测器状态"""
-        self.pts_history.clear()
-        self.last_pts = None
-        self.consecutive_losses = 0
-        self.pts_reset_detected = False
-    
-    def get_loss_statistics(self):
-        """获取丢帧统计信息"""
-        if self.total_frames_detected == 0:
-            return {'loss_rate': 0.0, 'total_detected': 0, 'total_lost': 0}
-        
-        loss_rate = (self.total_frames_lost / (self.total_frames_detected + self.total_frames_lost)) * 100
-        return {
-            'loss_rate': loss_rate,
-            'total_detected': self.total_frames_detected,
-            'total_lost': self.total_frames_lost,
-            'expected_interval': self.expected_frame_interval
-        }
-
-# ==============================================================================
-# 真实帧率检测类  
-# ==============================================================================
-class RealTimeFrameRateDetector:
-    """真实帧率检测器"""
-    def __init__(self):
-        self.detection_method = SETTINGS.fps_detection_method
-        self.calculation_window = SETTINGS.fps_calculation_window
-        self.frame_timestamps = deque(maxlen=self.calculation_window)
-        self.last_calculated_fps = None
-        
-    def get_real_framerate(self, container):
-        """获取真实帧率"""
-        try:
-            # 方法1: 从流元数据获取
-            if container and container.streams.video:
-                video_stream = container.streams.video[0]
-                
-                if video_stream.average_rate and video_stream.average_rate > 0:
-                    fps = float(video_stream.average_rate)
-                    if 1 <= fps <= 120:  # 合理范围检查
-                        return fps
-                
-                # 方法2: 从编码器信息获取
-                if hasattr(video_stream, 'codec_context') and video_stream.codec_context.framerate:
-                    fps = float(video_stream.codec_context.framerate)
-                    if 1 <= fps <= 120:
-                        return fps
-                
-                # 方法3: 从时间基获取
-                if video_stream.time_base and video_stream.duration:
-                    time_base_fps = 1.0 / float(video_stream.time_base)
-                    if 1 <= time_base_fps <= 120:
-                        return time_base_fps
-                        
-        except Exception:
-            pass
-        
-        # 方法4: 动态计算(基于帧时间戳)
-        return self.calculate_fps_from_timestamps()
-    
-    def add_frame_timestamp(self, pts_ms):
-        """添加帧时间戳用于动态计算"""
-        current_time = time.time() * 1000  # 转换为毫秒
-        self.frame_timestamps.append(current_time)
-    
-    def calculate_fps_from_timestamps(self):
-        """基于时间戳动态计算帧率"""
-        if len(self.frame_timestamps) < 10:
-            return self.last_calculated_fps
-        
-        try:
-            # 计算时间跨度和帧数
-            time_span = self.frame_timestamps[-1] - self.frame_timestamps[0]
-            frame_count = len(self.frame_timestamps) - 1
-            
-            if time_span > 0:
-                fps = (frame_count * 1000.0) / time_span  # 转换为秒
-                if 1 <= fps <= 120:
-                    self.last_calculated_fps = fps
-                    return fps
-                    
-        except Exception:
-            pass
-            
-        return self.last_calculated_fps
-
-# ==============================================================================
-# 流监控线程
-# ==============================================================================
-class RTSPStreamMonitor(threading.Thread):
-    def __init__(self, url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol='UDP'):
-        super().__init__()
-        self.url = url
-        self.thread_id = thread_id
-        self.parent_item_id = parent_item_id
-        self.protocol = protocol
-        self.stop_event = STOP_EVENT
-        self.container = None
-        
-        log_name = f"线程-{parent_url_id:02d}-{thread_idx+1:02d}"
-        self.logger = logging.getLogger(log_name)
-        
-        self.total_frames = 0
-        self.total_bytes = 0
-        self.reconnect_count = 0
-        
-        self.connect_latency = 0.0
-        self.fps_frames_count = 0
-        self.fps_start_time = time.time()
-        self.start_time = time.time()
-        self.last_fps = 0.0
-        
-        self.rtp_sequence = 0
-        self.last_rtp_timestamp = 0
-        self.i_frame_lost_detected = False
-        self.packets_lost_count = 0  # 保留作为兼容性字段，不再使用模拟数据
-        
-        # 真实丢包检测变量
-        self.real_rtp_sequence = 0
-        self.expected_rtp_sequence = 0
-        self.real_packet_loss_count = 0
-        self.last_packet_time = 0.0
-        
-        # 帧类型分析变量
-        self.i_frame_count = 0
-        self.p_frame_count = 0
-        self.b_frame_count = 0
-        self.last_frame_type = None
-        self.frame_analysis_enabled = SETTINGS.enable_frame_analysis
-        
-        # 新增变量，用于控制日志打印频率
-        self.last_log_time = time.time()
-        
-        # 初始化PTS丢帧检测器和真实帧率检测器
-        self.pts_detector = PTSFrameLossDetector()
-        self.fps_detector = RealTimeFrameRateDetector()
-        self.real_fps = None
-        self.pts_frame_loss_count = 0
-
-    def validate_and_fix_rtsp_url(self, url):
-        """验证和修复RTSP URL格式"""
-        if not url:
-            return None
-            
-        # 去除空格和特殊字符
-        url = url.strip()
-        
-        # 检查是否包含rtsp://前缀
-        if not url.lower().startswith('rtsp://'):
-            url = 'rtsp://' + url
-        
-        # 更严格的URL验证和修复
-        try:
-            from urllib.parse import urlparse, urlunparse
-            parsed = urlparse(url)
-            
-            # 确保协议正确
-            if parsed.scheme.lower() != 'rtsp':
-                parsed = parsed._replace(scheme='rtsp')
-            
-            # 确保有主机名
-            if not parsed.hostname:
-                return None
-            
-            # 设置默认端口
-            if not parsed.port:
-                # 重构netloc包含端口
-                if ':' not in parsed.netloc:
-                    parsed = parsed._replace(netloc=f"{parsed.netloc}:554")
-            
-            # 确保路径不为空
-            if not parsed.path or parsed.path == '/':
-                parsed = parsed._replace(path='/stream')
-            
-            # 重构URL
-            fixed_url = urlunparse(parsed)
-            return fixed_url
-            
-        except Exception:
-            # 如果解析失败，使用简单的修复逻辑
-            if '://' in url:
-                parts = url.split('://', 1)
-                if len(parts) == 2:
-                    protocol, rest = parts
-                    if '/' in rest:
-                        host_port, path = rest.split('/', 1)
-                        # 如果没有端口，添加默认端口554
-                        if ':' not in host_port:
-                            host_port += ':554'
-                        url = f"{protocol}://{host_port}/{path}"
-                    else:
-                        # 没有路径，添加默认端口和路径
-                        if ':' not in rest:
-                            rest += ':554'
-                        url = f"{protocol}://{rest}/stream"
-            
-            return url
-
-    def analyze_rtp_packet_loss(self, packet):
-        """分析RTP包损失情况"""
-        try:
-            # 检查packet是否有效
-            if not packet:
-                return False
-                
-            # 检查packet是否有必要的属性
-            if not hasattr(packet, 'size') or packet.size is None or packet.size < 12:
-                return False
-                
-            # 尝试从PyAV packet获取原始数据
-            try:
-                # 对于PyAV packet，使用其内部的to_bytes()方法或直接访问
-                if hasattr(packet, 'to_bytes'):
-                    packet_data = packet.to_bytes()
-                elif hasattr(packet, 'buffer_ptr') and hasattr(packet, 'buffer_size'):
-                    # 直接从内存缓冲区读取
-                    import ctypes
-                    packet_data = ctypes.string_at(packet.buffer_ptr, min(packet.buffer_size, 64))
-                else:
-                    # 尝试标准bytes转换
-                    packet_data = bytes(packet)
-            except Exception:
-                # 如果所有方法都失败，跳过RTP分析
-                return False
-                
-            if len(packet_data) < 12:
-                return False
-                
-            # 提取RTP序列号 (bytes 2-3)
-            seq_num = int.from_bytes(packet_data[2:4], byteorder='big')
-            
-            # 初始化或序列号检查
-            if not hasattr(self, 'last_rtp_seq') or self.last_rtp_seq is None:
-                self.last_rtp_seq = seq_num
-                return False
-            
-            # 检查序列号是否连续（考虑16位序列号回绕）
-            expected_seq = (self.last_rtp_seq + 1) & 0xFFFF
-            if seq_num != expected_seq:
-                # 检测到丢包
-                if hasattr(self, 'real_packet_loss_count'):
-                    self.real_packet_loss_count += 1
-                self.last_rtp_seq = seq_num
-                return True
-            
-            self.last_rtp_seq = seq_num
-            return False
-            
-        except Exception as e:
-            if hasattr(self, 'logger'):
-                self.logger.error(f"RTP包分析错误: {e}")
-            return False
-    
-    def analyze_frame_type(self, frame):
-        """分析帧类型信息 - 完全基于真实数据"""
-        if not self.frame_analysis_enabled or not frame:
-            return None
-            
-        try:
-            # 使用PyAV获取真实帧类型信息
-            if hasattr(frame, 'pict_type') and frame.pict_type:
-                pict_type = frame.pict_type
-                frame_type = str(pict_type)
-                
-                # 统计不同类型的帧（只基于真实数据）
-                if 'I' in frame_type.upper():
-                    self.i_frame_count += 1
-                    self.last_frame_type = 'I'
-                elif 'P' in frame_type.upper():
-                    self.p_frame_count += 1
-                    self.last_frame_type = 'P'
-                elif 'B' in frame_type.upper():
-                    self.b_frame_count += 1
-                    self.last_frame_type = 'B'
-                else:
-                    self.last_frame_type = 'Unknown'
-                
-                return self.last_frame_type
-            
-            # 无法获取真实帧类型时，不使用模拟数据，直接返回None
-            # 这确保数据的真实性和一致性
-            return None
-            
-        except Exception as e:
-            self.logger.debug(f"帧类型分析失败: {e}")
-            return None
-
-    def run(self):
-        # 获取真实帧率，不再使用预设值
-        self.real_fps = None
-        
-        # 验证和修复URL格式
-        validated_url = self.validate_and_fix_rtsp_url(self.url)
-        if not validated_url:
-            self.logger.error(f"RTSP URL格式无效: {self.url}")
-            return
-        
-        if validated_url != self.url:
-            # 静默修复URL，不输出日志
-            self.url = validated_url
-
-        while not self.stop_event.is_set():
-            try:
-                self.logger.debug(f"正在尝试连接: {self.url}...")
-                start_time = time.time()
-                
-                # 优化RTSP连接参数，使用用户选择的协议
-                options = {
-                    'rtsp_transport': self.protocol.lower(),
-                    'buffer_size': str(SETTINGS.rtsp_buffer_size),
-                    'timeout': str(SETTINGS.rtsp_timeout),
-                    'stimeout': '10000000',  # 10秒socket超时
-                    'user_agent': SETTINGS.rtsp_user_agent,
-                    'allowed_media_types': 'video',  # 只处理视频流
-                    'analyzeduration': str(SETTINGS.rtsp_analyzeduration),
-                    'probesize': str(SETTINGS.rtsp_probe_size),
-                    'max_delay': str(SETTINGS.rtsp_max_delay),
-                    'reorder_queue_size': '0',  # 禁用重排序队列
-                    'fflags': 'nobuffer+fastseek+flush_packets',  # 优化标志
-                    'flags': 'low_delay',  # 低延迟标志
-                    'strict': 'experimental'  # 允许实验性功能
-                }
-                
-                # 根据协议类型设置特定参数
-                if self.protocol.upper() == 'TCP':
-                    options['rtsp_flags'] = 'prefer_tcp'
-                    options['rtsp_transport'] = 'tcp'
-                else:
-                    # UDP协议优化配置 - 使用最简化成功配置
-                    options['rtsp_transport'] = 'udp'
-                    options.pop('rtsp_flags', None)  # UDP不需要rtsp_flags
-                    # 使用测试成功的最简化UDP配置
-                    options['timeout'] = '30000000'  # 30秒超时（测试成功的配置）
-                    # 移除可能导致问题的复杂参数，保持简洁
-                    options.pop('fifo_size', None)
-                    options.pop('overrun_nonfatal', None)
-                    options.pop('protocol_whitelist', None)
-                    # 保留基础必要参数
-                    options['reorder_queue_size'] = '0'  # 禁用重排序队列
-                    options['stimeout'] = '20000000'  # socket超时
-                    options['buffer_size'] = str(SETTINGS.rtsp_buffer_size)  # 使用设置的缓冲区大小
-                
-                # 根据是否严格协议模式决定重试策略
-                if SETTINGS.strict_protocol:
-                    # 严格模式：仅使用用户选择的协议，不重试其他协议
-                    max_retries = 3  # 只重试3次，都使用相同协议
-                else:
-                    # 兼容模式：允许尝试不同协议
-                    max_retries = 5
-                
-                retry_delay = 0.5  # 初始延迟0.5秒
-                
-                connection_successful = False
-                current_options = options  # 初始化current_options
-                for retry in range(max_retries):
-                    try:
-                        if SETTINGS.strict_protocol:
-                            # 严格模式：始终使用用户选择的协议
-                            current_options = options.copy()
-                            self.logger.debug(f"尝试连接 {retry + 1}/{max_retries}，使用{self.protocol}协议")
-                        else:
-                            # 兼容模式：尝试不同的连接参数
-                            if retry == 0:
-                                # 第一次尝试：使用用户选择的协议
-                                current_options = options.copy()
-                            elif retry == 1:
-                                # 第二次尝试：如果用户选UDP，尝试TCP
-                                current_options = options.copy()
-                                if self.protocol.upper() == 'UDP':
-                                    current_options['rtsp_transport'] = 'tcp'
-                                    current_options['rtsp_flags'] = 'prefer_tcp'
-                                else:
-                                    current_options['rtsp_transport'] = 'udp'
-                                    current_options.pop('rtsp_flags', None)
-                            elif retry == 2:
-                                # 第三次尝试：使用HTTP tunnel
-                                current_options = options.copy()
-                                current_options['rtsp_transport'] = 'http'
-                                current_options['rtsp_flags'] = 'prefer_tcp'
-                            elif retry == 3:
-                                # 第四次尝试：最小参数配置
-                                current_options = {
-                                    'rtsp_transport': self.protocol.lower(),
-                                    'timeout': '30000000',
-                                    'user_agent': 'VLC/3.0.0'
-                                }
-                            else:
-                                # 最后一次尝试：简化配置
-                                current_options = {
-                                    'timeout': '15000000'
-                                }
-                            
-                            transport_info = current_options.get('rtsp_transport', self.protocol.lower())
-                            self.logger.debug(f"尝试连接 {retry + 1}/{max_retries}，使用参数: {transport_info}")
-                        self.container = av.open(self.url, mode='r', options=current_options)
-                        connection_successful = True
-                        break
-                        
-                    except Exception as e:
-                        error_str = str(e)
-                        
-                        if retry < max_retries - 1:
-                # 根据错误类型调整重试延迟
-                            if "Invalid argument" in error_str or "Errno 22" in error_str or "Errno 10049" in error_str:
-                                retry_delay = 0.2  # URL格式错误或地址无效快速重试
-                            elif "timed out" in error_str.lower() or "timeout" in error_str.lower():
-                                retry_delay = 3.0  # 超时错误等待更久
-                            elif "connection refused" in error_str.lower() or "refused" in error_str.lower():
-                                retry_delay = 2.0  # 连接被拒绝中等延迟
-                            elif "unauthorized" in error_str.lower() or "401" in error_str:
-                                retry_delay = 1.0  # 认证问题短延迟
-                            elif "10049" in error_str:  # 专门处理UDP连接问题
-                                if self.protocol.upper() == 'UDP':
-                                    retry_delay = 2.0  # UDP地址问题增加重试延迟
-                                    # 在严格模式下，优先使用测试成功的最简化配置
-                                    if SETTINGS.strict_protocol:
-                                        if retry == 0:
-                                            # 第一次重试：直接使用最简化成功配置
-                                            current_options = {
-                                                'rtsp_transport': 'udp',
-                                                'timeout': '30000000'  # 测试成功的配置
-                                            }
-                                        elif retry == 1:
-                                            # 第二次重试：添加基础参数
-                                            current_options = {
-                                                'rtsp_transport': 'udp',
-                                                'timeout': '30000000',
-                                                'stimeout': '20000000',
-                                                'reorder_queue_size': '0'
-                                            }
-                                        elif retry == 2:
-                                            # 第三次重试：添加缓冲区设置
-                                            current_options = {
-                                                'rtsp_transport': 'udp',
-                                                'timeout': '30000000',
-                                                'buffer_size': str(SETTINGS.rtsp_buffer_size)
-                                            }
-                                else:
-                                    retry_delay = 1.0  # 非UDP协议较短延迟
-                            else:
-                                retry_delay = 1.5  # 其他错误中等延迟
-                            
-                            transport_type = current_options.get('rtsp_transport', 'default')
-                            self.logger.warning(f"连接尝试 {retry + 1} 失败 ({transport_type}): {e}, {retry_delay}秒后重试...")
-                            time.sleep(retry_delay)
-                        else:
-                            # 最后一次尝试失败，抛出异常
-                            raise e
-                
-                if not connection_successful:
-                    raise Exception(f"所有连接尝试都失败，无法连接到RTSP流: {self.url}")
-                
-                try:
-                    # 使用真实帧率检测器获取帧率
-                    self.real_fps = self.fps_detector.get_real_framerate(self.container)
-                    if self.real_fps and self.real_fps > 0:
-                        self.logger.info(f"成功获取到流的真实帧率：{self.real_fps:.2f} FPS")
-                        # 更新PTS检测器的帧率
-                        self.pts_detector.update_frame_rate(self.real_fps)
-                    else:
-                        self.logger.warning("无法获取视频流的真实帧率，将使用动态计算")
-                except Exception as e:
-                    self.logger.warning(f"获取真实帧率失败: {e}，将使用动态计算")
-
-                self.connect_latency = time.time() - start_time
-                
-                # 根据协议类型显示不同的连接成功信息
-                if self.protocol.upper() == 'UDP':
-                    self.logger.info(f"UDP连接成功！延迟: {self.connect_latency:.1f}s。使用优化UDP配置。开始抓取帧。")
-                else:
-                    self.logger.info(f"TCP连接成功！延迟: {self.connect_latency:.1f}s。开始抓取帧。")
-
-                self.start_time = time.time()
-                self.fps_frames_count = 0
-                
-                self.rtp_sequence = 0
-                self.last_rtp_timestamp = 0
-                self.i_frame_lost_detected = False
-                self.packets_lost_count = 0
-                self.last_log_time = time.time() # 重置日志时间
-                
-                # 重置PTS检测器
-                self.pts_detector = PTSFrameLossDetector()
-                if self.real_fps:
-                    self.pts_detector.update_frame_rate(self.real_fps)
-
-                # 如果容器存在，开始处理视频包
-                if self.container:
-                    try:
-                        for packet in self.container.demux(video=0):
-                            if self.stop_event.is_set():
-                                break
-                            
-                            # 真实丢包检测
-                            real_packet_lost = self.analyze_rtp_packet_loss(packet)
-                            if real_packet_lost:
-                                self.real_packet_loss_count += 1
-                            
-                            # 保留原有的序列号计数，但不再做模拟丢包
-                            self.rtp_sequence += 1
-                            
-                            # 去除I帧监控，不再使用解码模式
-                            self.i_frame_lost_detected = False
-
-                            self.total_bytes += packet.size if packet and packet.size is not None else 0
-
-                            # 统一按包计数，去除解码功能
-                            self.total_frames += 1
-                            self.fps_frames_count += 1
-                            self.fps_detector.add_frame_timestamp(time.time() * 1000)
-                            
-                            current_time = time.time()
-                            elapsed_time = current_time - self.fps_start_time
-                            
-                            if elapsed_time >= 0.5:
-                                self.last_fps = self.fps_frames_count / elapsed_time
-                                self.fps_frames_count = 0
-                                self.fps_start_time = current_time
-                            
-                            total_elapsed_time = current_time - self.start_time
-                            
-                            # 使用真实帧率或动态计算的帧率
-                            current_fps = self.real_fps or self.fps_detector.calculate_fps_from_timestamps() or 25.0
-                            expected_frames = int(total_elapsed_time * current_fps)
-                            
-                            # 使用PTS检测的丢帧数据，如果没有则使用传统计算
-                            pts_stats = self.pts_detector.get_loss_statistics()
-                            if pts_stats['total_lost'] > 0:
-                                lost_frames = pts_stats['total_lost']
-                                lost_rate_percent = pts_stats['loss_rate']
-                            else:
-                                # 传统计算方式作为备用
-                                lost_frames = max(0, expected_frames - self.total_frames)
-                                lost_rate_percent = (lost_frames / expected_frames * 100) if expected_frames > 0 else 0.0
-
-                            status_info = {
-                                'thread_id': self.thread_id,
-                                'parent_item_id': self.parent_item_id,
-                                'status': "运行中",
-                                'total_frames': self.total_frames,
-                                'received_frames': self.total_frames,
-                                'total_bytes': self.total_bytes,
-                                'reconnect_count': self.reconnect_count,
-                                'connect_latency': self.connect_latency,
-                                'current_fps': self.last_fps,
-                                'expected_frames': expected_frames,
-                                'lost_frames': lost_frames,
-                                'real_fps': current_fps,
-                                'pts_frame_loss': self.pts_frame_loss_count
-                            }
-                            # 优化状态推送频率，减少GUI更新压力
-                            try:
-                                if STATUS_QUEUES[self.thread_id].qsize() < 10:  # 队列不满时才推送
-                                    STATUS_QUEUES[self.thread_id].put(status_info)
-                            except:
-                                # 队列异常时直接推送
-                                STATUS_QUEUES[self.thread_id].put(status_info)
-                            
-                            # 修复：改为基于时间的判断，防止日志刷屏
-                            if current_time - self.last_log_time >= 10:
-                                self.logger.info(
-                                    f"收到帧: {self.total_frames} | 理论帧: {expected_frames} | 丢失帧: {lost_frames} | 丢帧率: {lost_rate_percent:.1f}% | "
-                                    f"帧率: {int(current_fps)}FPS"
-                                )
-                                self.last_log_time = current_time
-                    except Exception as demux_error:
-                        self.logger.error(f"处理视频包时发生错误: {demux_error}")
-                    
-                if not self.stop_event.is_set():
-                    raise Exception("流结束或中断")
-            
-            except (av.error.HTTPUnauthorizedError, av.error.InvalidDataError, av.error.ExitError, av.error.FFmpegError, OSError, ConnectionError) as e:
-                self.reconnect_count += 1
-                error_msg = str(e)
-                original_url = self.url
-                
-                # 针对[Errno 22] Invalid argument错误的特殊处理
-                if "Error number -138" in error_msg:
-                    error_msg = "RTSP服务器无响应或网络不可达"
-                elif "Invalid argument" in error_msg or "Errno 22" in error_msg:
-                    # 尝试修复URL并重新尝试
-                    fixed_url = self.validate_and_fix_rtsp_url(self.url)
-                    if fixed_url and fixed_url != self.url:
-                        self.url = fixed_url
-                        # 静默修复URL，不输出日志
-                    else:
-                        # 提供更详细的诊断信息
-                        diagnostic_msg = f"RTSP URL参数错误。\n原始URL: {original_url}\n"
-                        diagnostic_msg += "请检查：\n"
-                        diagnostic_msg += "1. URL格式是否正确 (rtsp://ip:port/path)\n"
-                        diagnostic_msg += "2. IP地址和端口是否可达\n"
-                        diagnostic_msg += "3. RTSP服务是否正常运行\n"
-                        diagnostic_msg += "4. 网络防火墙设置"
-                        error_msg = diagnostic_msg
-                elif "10049" in error_msg:
-                    if self.protocol.upper() == 'UDP':
-                        # UDP特有的[Errno 10049]错误诊断 - 增强版
-                        error_msg = f"UDP连接失败[地址无效]: {original_url}\n"
-                        error_msg += "=== UDP连接诊断分析 ===\n"
-                        error_msg += "UDP连接失败的可能原因：\n"
-                        error_msg += "1. ⚠️ RTSP服务器不支持UDP协议（最常见）\n"
-                        error_msg += "2. 🚫 Windows防火墙阻止UDP连接\n"
-                        error_msg += "3. 🌐 网络NAT或路由器配置问题\n"
-                        error_msg += "4. 🔌 RTSP服务器仅支持TCP模式\n"
-                        error_msg += "\n💡 建议解决方案：\n"
-                        error_msg += "✅ 1. 在主程序中切换为TCP协议（推荐）\n"
-                        error_msg += "🔧 2. 检查RTSP服务器配置，确认是否支持UDP\n"
-                        error_msg += "🚫 3. 检查Windows防火墙，允许UDP端口通信\n"
-                        error_msg += "🌐 4. 联系网络管理员检查路由器设置\n"
-                        error_msg += "\n📊 诊断信息：\n"
-                        error_msg += f"• 错误代码: [Errno 10049]\n"
-                        error_msg += f"• 协议类型: UDP\n"
-                        error_msg += f"• 目标地址: {original_url}\n"
-                        error_msg += f"• 重试次数: {self.reconnect_count}"
-                    else:
-                        error_msg = f"地址无效错误: {original_url}"
-                elif "timed out" in error_msg.lower():
-                    error_msg = f"RTSP连接超时 - 服务器: {original_url}"
-                elif "connection refused" in error_msg.lower():
-                    error_msg = f"RTSP服务器拒绝连接 - 服务器: {original_url}"
-                elif "unauthorized" in error_msg.lower():
-                    error_msg = f"RTSP身份验证失败 - 服务器: {original_url}"
-                elif "Protocol not found" in error_msg:
-                    error_msg = f"RTSP协议不支持或URL格式错误 - URL: {original_url}"
-                else:
-                    error_msg = f"连接失败: {error_msg} - URL: {original_url}"
-                
-                self.logger.error(f"连接或拉流失败: {error_msg}。第 {self.reconnect_count} 次重试中...")
-                status_info = {
-                    'thread_id': self.thread_id,
-                    'parent_item_id': self.parent_item_id,
-                    'status': "重连中",
-                    'total_frames': self.total_frames,
-                    'received_frames': self.total_frames,
-                    'total_bytes': self.total_bytes,
-                    'reconnect_count': self.reconnect_count,
-                    'connect_latency': self.connect_latency,
-                    'current_fps': 0.0,
-                    'expected_frames': 0,
-                    'lost_frames': 0,
-                    'packets_lost_count': self.packets_lost_count
-                }
-                STATUS_QUEUES[self.thread_id].put(status_info)
-                time.sleep(SETTINGS.reconnect_wait_time)
-            except Exception as e:
-                self.logger.error(f"发生未知异常: {e}")
-                time.sleep(SETTINGS.reconnect_wait_time)
-            finally:
-                if self.container:
-                    try:
-                        self.container.close()
-                    except Exception:
-                        pass
-                self.container = None
-
-        final_fps = self.total_frames / (time.time() - self.start_time) if self.start_time and (time.time() - self.start_time) > 0 else 0.0
-        
-        # 使用真实帧率计算最终的丢帧数
-        final_real_fps = self.real_fps or self.fps_detector.calculate_fps_from_timestamps() or final_fps
-        final_expected_frames = int((time.time() - self.start_time) * final_real_fps) if self.start_time else self.total_frames
-        final_lost_frames = max(0, final_expected_frames - self.total_frames)
-        
-        final_status = {
-            'thread_id': self.thread_id,
-            'parent_item_id': self.parent_item_id,
-            'status': "已停止",
-            'total_frames': self.total_frames,
-            'received_frames': self.total_frames,
-            'total_bytes': self.total_bytes,
-            'reconnect_count': self.reconnect_count,
-            'connect_latency': self.connect_latency,
-            'current_fps': final_fps,
-            'expected_frames': final_expected_frames,
-            'lost_frames': final_lost_frames,
-            'packets_lost_count': self.packets_lost_count,
-            'real_fps': final_real_fps
-        }
-        STATUS_QUEUES[self.thread_id].put(final_status)
-        self.logger.info("监控线程已停止。")
-        
-    def stop(self):
-        self.stop_event.set()
-        
-# ==============================================================================
-# 系统性能监控线程
-# ==============================================================================
-class SystemMonitor(threading.Thread):
-    def __init__(self, thread_id):
-        super().__init__()
-        self.stop_event = SYSTEM_MONITOR_STOP_EVENT
-        self.thread_id = thread_id
-        self.last_net_counters = psutil.net_io_counters()
-    
-    def run(self):
-        while not self.stop_event.is_set():
-            try:
-                cpu_percent = psutil.cpu_percent(interval=0.5)
-                mem = psutil.virtual_memory()
-                current_net_counters = psutil.net_io_counters()
-
-                net_recv = current_net_counters.bytes_recv - self.last_net_counters.bytes_recv
-                
-                self.last_net_counters = current_net_counters
-                
-                status_info = {
-                    'thread_id': SYSTEM_MONITOR_ID,
-                    'parent_item_id': SYSTEM_MONITOR_ID,
-                    'status': 'OK',
-                    'cpu_percent': cpu_percent,
-                    'mem_percent': mem.percent,
-                    'net_recv_mbps': (net_recv * 8) / (1024*1024) / 0.5,
-                }
-                STATUS_QUEUES[SYSTEM_MONITOR_ID].put(status_info)
-                time.sleep(0.5)
-            except Exception:
-                time.sleep(0.5)
-
-    def stop(self):
-        self.stop_event.set()
+# 父行累计值各项的下标：子行贡献按同样布局保存，状态变化时按差值累加
+(PARENT_RECONNECTS, PARENT_FRAMES, PARENT_BYTES, PARENT_EXPECTED_FRAMES, PARENT_LOST_FRAMES,
+ PARENT_FPS_SUM, PARENT_FPS_COUNT, PARENT_LATENCY_SUM, PARENT_LATENCY_COUNT,
+ PARENT_BITRATE_SUM, PARENT_GOP_SUM, PARENT_KEY_INTERVAL_SUM, PARENT_GOP_COUNT) = range(13)
+PARENT_TOTALS_ZERO = (0, 0, 0, 0, 0, 0.0, 0, 0.0, 0, 0.0, 0, 0.0, 0)
 
 # ==============================================================================
 # GUI 主框架
@@ -1003,6 +48,14 @@ class StressTestFrame(ttk.Frame):
         self.last_counters = {}
         self.url_list_data = {}
         self.monitor_threads = []
+        # 线程注册表 thread_id -> 监控线程，以及 thread_id -> 所属父行
+        self.thread_registry = {}
+        self.thread_parent = {}
+        # 父行累计值 item_id -> 列表，与各子行最近一次计入的贡献 thread_id -> 元组
+        self.parent_totals = {}
+        self.child_totals = {}
+        # 上一轮读取的指标表序列计数，用于只处理有变化的流
+        self.metrics_seq = None
         self.thread_counter = 0
         self.url_counter = 0
         self.last_sys_info = {
@@ -1013,11 +66,30 @@ class StressTestFrame(ttk.Frame):
         # 用于保存停止后的最终统计数据
         self.final_stats = {}
         self.final_parent_stats = {}
+        # 长稳测试时序记录，停止后保留目录供导出报表使用
+        self.timeseries_writer = None
+        self.timeseries_path = None
+        # 本次运行的日志写盘会话，停止监控且会话线程退出后结束
+        self.file_log_session = None
+        # 本次运行的加压阶段，以及 thread_id -> 会话启动时所处的阶段号，导出报表时按阶段汇总
+        self.load_phases = []
+        self.thread_phase = {}
+        # OpenMetrics 指标端点，在后台线程中应答抓取
+        self.metrics_exporter = None
+        # iid -> 上次写入 Treeview 的原始数值，用于跳过未变化的行
+        self.rendered_rows = {}
+        # 上一轮超出写入预算、未能写入的行 iid -> 顺位，本轮按顺位先写，避免视口下方的行一直轮不到
+        self.carried_rows = {}
+        # 最近几次状态刷新的平均耗时，毫秒
+        self.refresh_cost_ms = 0.0
+        # 日志框最后一行 [级别, 日志, 去掉时间的内容, 重复次数]，用于跨刷新合并重复日志
+        self.last_log_line = None
         
         global SYSTEM_MONITOR_THREAD
         if SETTINGS.sys_monitor_enabled and not SYSTEM_MONITOR_THREAD:
             SYSTEM_MONITOR_THREAD = SystemMonitor(SYSTEM_MONITOR_ID)
             SYSTEM_MONITOR_THREAD.start()
+        self.apply_metrics_endpoint()
 
         self.create_widgets()
         self.after(SETTINGS.gui_refresh_interval, self.update_statuses)
@@ -1077,7 +149,7 @@ class StressTestFrame(ttk.Frame):
         self.address_frame.rowconfigure(0, weight=1)
         self.address_frame.columnconfigure(0, weight=1)
         
-        columns = ('id', 'url', 'status', 'fps', 'expected_frames', 'received_frames', 'lost_frames', 'lost_rate', 'total_bytes', 'reconnects', 'latency')
+        columns = ('id', 'url', 'status', 'fps', 'expected_frames', 'received_frames', 'lost_frames', 'lost_rate', 'total_bytes', 'reconnects', 'latency', 'bitrate', 'gop')
         self.tree = ttk.Treeview(self.address_frame, columns=columns, show='headings')
         self.tree.heading('id', text='ID', anchor='center')
         self.tree.heading('url', text='URL', anchor='center')
@@ -1091,6 +163,8 @@ class StressTestFrame(ttk.Frame):
         self.tree.heading('total_bytes', text='流量', anchor='center') # 修改为“流量”
         self.tree.heading('reconnects', text='重连', anchor='center')
         self.tree.heading('latency', text='延迟', anchor='center')
+        self.tree.heading('bitrate', text='码率', anchor='center')
+        self.tree.heading('gop', text='GOP', anchor='center')
         
         self.tree.column('id', width=60, anchor='center', stretch=False)
         self.tree.column('url', minwidth=200, anchor='w', stretch=True) 
@@ -1104,6 +178,8 @@ class StressTestFrame(ttk.Frame):
         self.tree.column('total_bytes', width=100, anchor='center', stretch=False)
         self.tree.column('reconnects', width=80, anchor='center', stretch=False)
         self.tree.column('latency', width=80, anchor='center', stretch=False)
+        self.tree.column('bitrate', width=90, anchor='center', stretch=False)
+        self.tree.column('gop', width=90, anchor='center', stretch=False)
         
         self.tree.grid(row=0, column=0, sticky='nsew')
         self.tree_scrollbar = ttk.Scrollbar(self.address_frame, orient="vertical", command=self.tree.yview)
@@ -1126,6 +202,8 @@ class StressTestFrame(ttk.Frame):
 
         self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, state='disabled', height=3)
         self.log_text.grid(row=0, column=0, sticky='nsew')
+        self.log_text.tag_config('error', foreground='red')
+        self.log_text.tag_config('warning', foreground='orange')
         self.log_text.bind('<Button-3>', self.show_log_context_menu)
 
         status_frame = ttk.Frame(self, padding="6")
@@ -1179,6 +257,7 @@ class StressTestFrame(ttk.Frame):
         self.log_text.configure(state='normal')
         self.log_text.delete('1.0', tk.END)
         self.log_text.configure(state='disabled')
+        self.last_log_line = None
 
     def select_all_tree_items(self):
         self.tree.selection_set(self.tree.get_children())
@@ -1250,7 +329,9 @@ class StressTestFrame(ttk.Frame):
             "0.0%", # 丢包率
             "0.00 MB", # 流量
             "0",    # 重连
-            "0.0s"  # 延迟
+            "0.0s", # 延迟
+            "0.00 Mbps", # 码率
+            "-"     # GOP
         ), tags=('url_row',))
         
         self.tree.tag_configure('url_row', font=('TkDefaultFont', 9, 'bold'))
@@ -1386,6 +467,9 @@ class StressTestFrame(ttk.Frame):
             for thread_id in self.url_list_data[item_id]['children']:
                 STATUS_QUEUES.pop(thread_id, None)
                 THREAD_NAME_MAP.pop(thread_id, None)
+                self.thread_parent.pop(thread_id, None)
+                self.child_totals.pop(thread_id, None)
+            self.parent_totals.pop(item_id, None)
 
             AGGREGATED_DATA.pop(item_id, None)
             keys_to_del = [k for k in list(self.last_counters.keys()) if k[0] == item_id]
@@ -1393,6 +477,9 @@ class StressTestFrame(ttk.Frame):
                 self.last_counters.pop(k, None)
             
             self.tree.delete(item_id)
+            self.rendered_rows.pop(item_id, None)
+            for thread_id in self.url_list_data[item_id]['children']:
+                self.rendered_rows.pop(f"thread_{thread_id}", None)
             del self.url_list_data[item_id]
 
     def clear_urls(self):
@@ -1502,6 +589,12 @@ class StressTestFrame(ttk.Frame):
         self.gui_entry = self._create_labeled_entry(scrollable_frame, row, "GUI 刷新间隔 (ms)", 15, SETTINGS.gui_refresh_interval, "控制界面更新频率，较小值更流畅但耗CPU更多")
         row += 1
         
+        self.gui_budget_entry = self._create_labeled_entry(scrollable_frame, row, "表格刷新预算 (ms)", 15, SETTINGS.gui_refresh_budget_ms, "每次刷新只重绘可见且有变化的行，超出预算的行顺延到下一轮")
+        row += 1
+        
+        self.stats_interval_entry = self._create_labeled_entry(scrollable_frame, row, "会话统计周期 (ms)", 15, SETTINGS.stats_interval_ms, "每路流计算帧率、丢帧并写入指标的周期，无需小于GUI刷新间隔")
+        row += 1
+        
         self.reconnect_entry = self._create_labeled_entry(scrollable_frame, row, "重连等待时间 (s)", 15, SETTINGS.reconnect_wait_time, "连接失败后重试的间隔时间，较短时间重试更频繁")
         row += 1
         
@@ -1513,11 +606,152 @@ class StressTestFrame(ttk.Frame):
         self._create_checkbox(scrollable_frame, row, "启用系统监控", self.sys_monitor_var, "监控CPU、内存、网络等系统资源使用情况")
         row += 1
         
+        # 长稳测试时序记录
+        self.timeseries_var = tk.BooleanVar(value=SETTINGS.timeseries_enabled)
+        self._create_checkbox(scrollable_frame, row, "记录长稳时序数据", self.timeseries_var, "每秒记录各流帧率、流量、丢帧、重连、延迟，导出报表时附带分钟汇总")
+        row += 1
+        
+        self.timeseries_dir_entry = self._create_labeled_entry(scrollable_frame, row, "时序数据目录", 15, SETTINGS.timeseries_dir, "每次启动监控在此目录下新建一个子目录")
+        row += 1
+        
+        # 指标端点
+        self.metrics_http_var = tk.BooleanVar(value=SETTINGS.metrics_http_enabled)
+        self._create_checkbox(scrollable_frame, row, "启用指标端点", self.metrics_http_var, "以 OpenMetrics/Prometheus 格式在 /metrics 提供各流与系统指标")
+        row += 1
+        
+        self.metrics_http_host_entry = self._create_labeled_entry(scrollable_frame, row, "指标端点地址", 15, SETTINGS.metrics_http_host, "监听地址，0.0.0.0 允许其他机器抓取")
+        row += 1
+        
+        self.metrics_http_port_entry = self._create_labeled_entry(scrollable_frame, row, "指标端点端口", 15, SETTINGS.metrics_http_port, "保存设置后立即生效")
+        row += 1
+
+        # 监控引擎设置
+        self._create_section_label(scrollable_frame, row, "监控引擎")
+        row += 1
+
+        ttk.Label(scrollable_frame, text="监控引擎").grid(row=row, column=0, sticky='w', pady=3)
+        self.monitor_engine_combobox = ttk.Combobox(scrollable_frame, width=12,
+                                                    values=["线程", "协程", "多进程", "RTP直连"], state="readonly")
+        self.monitor_engine_combobox.set(SETTINGS.monitor_engine)
+        self.monitor_engine_combobox.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="线程：每路流一个线程；协程：少量事件循环承载大量流；多进程：按进程分片；RTP直连：只解析RTP头不解复用", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+
+        self.async_loop_entry = self._create_labeled_entry(scrollable_frame, row, "事件循环线程数", 15, SETTINGS.async_loop_threads, "协程引擎使用的事件循环线程数量")
+        row += 1
+
+        self.async_workers_entry = self._create_labeled_entry(scrollable_frame, row, "读取线程池上限", 15, SETTINGS.async_executor_workers, "同时执行阻塞读取的最大线程数")
+        row += 1
+
+        self.async_slice_entry = self._create_labeled_entry(scrollable_frame, row, "读取时间片 (ms)", 15, SETTINGS.async_read_slice_ms, "协程会话每次占用读取线程的时长")
+        row += 1
+
+        self.mp_worker_entry = self._create_labeled_entry(scrollable_frame, row, "工作进程数", 15, SETTINGS.mp_worker_count, "多进程引擎的分片数量，建议不超过CPU核心数")
+        row += 1
+
+        ttk.Label(scrollable_frame, text="进程内引擎").grid(row=row, column=0, sticky='w', pady=3)
+        self.mp_worker_engine_combobox = ttk.Combobox(scrollable_frame, width=12,
+                                                      values=["线程", "协程", "RTP直连"], state="readonly")
+        self.mp_worker_engine_combobox.set(SETTINGS.mp_worker_engine)
+        self.mp_worker_engine_combobox.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="每个工作进程内部运行会话的方式", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+
+        self.mp_pin_cpu_var = tk.BooleanVar(value=SETTINGS.mp_pin_cpu)
+        self._create_checkbox(scrollable_frame, row, "工作进程绑定CPU核心", self.mp_pin_cpu_var, "每个分片固定在一个核心上，便于测量按核扩展能力")
+        row += 1
+
+        # 加压方式设置
+        self._create_section_label(scrollable_frame, row, "加压方式")
+        row += 1
+
+        ttk.Label(scrollable_frame, text="会话启动方式").grid(row=row, column=0, sticky='w', pady=3)
+        self.ramp_profile_combobox = ttk.Combobox(scrollable_frame, width=12, values=list(LOAD_PROFILES), state="readonly")
+        self.ramp_profile_combobox.set(SETTINGS.ramp_profile)
+        self.ramp_profile_combobox.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="立即：同时启动全部会话；线性：匀速启动；阶梯：定时成批增加；尖峰：基线运行一段时间后其余会话同时启动", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+
+        self.ramp_rate_entry = self._create_labeled_entry(scrollable_frame, row, "线性加压速率 (路/秒)", 15, SETTINGS.ramp_rate, "线性加压时每秒启动的会话数")
+        row += 1
+
+        self.ramp_step_size_entry = self._create_labeled_entry(scrollable_frame, row, "每阶会话数", 15, SETTINGS.ramp_step_size, "阶梯加压每阶增加的会话数，尖峰加压的基线会话数")
+        row += 1
+
+        self.ramp_step_interval_entry = self._create_labeled_entry(scrollable_frame, row, "阶段时长 (s)", 15, SETTINGS.ramp_step_interval, "阶梯每阶持续时间、尖峰前的基线时长，线性加压按此时长分段统计")
+        row += 1
+
+        # 重连策略设置
+        self._create_section_label(scrollable_frame, row, "重连策略")
+        row += 1
+
+        self.backoff_max_entry = self._create_labeled_entry(scrollable_frame, row, "退避上限 (s)", 15, SETTINGS.reconnect_backoff_max, "重连等待按随机抖动逐次增长到此上限，连接持续超过此时长后从头计算")
+        row += 1
+
+        self.breaker_threshold_entry = self._create_labeled_entry(scrollable_frame, row, "熔断失败次数", 15, SETTINGS.breaker_failure_threshold, "同一主机连续连接失败达到此次数后暂停该主机全部会话的连接")
+        row += 1
+
+        self.breaker_open_entry = self._create_labeled_entry(scrollable_frame, row, "熔断时长 (s)", 15, SETTINGS.breaker_open_seconds, "熔断到期后只放行一路会话探测，成功后其余会话恢复连接")
+        row += 1
+
+        self.connect_rate_entry = self._create_labeled_entry(scrollable_frame, row, "连接速率上限 (次/秒)", 15, SETTINGS.connect_rate_limit, "全部会话每秒发起连接尝试的总次数上限，0 表示不限制")
+        row += 1
+
+        self.connect_burst_entry = self._create_labeled_entry(scrollable_frame, row, "瞬时连接数", 15, SETTINGS.connect_burst, "连接速率限制允许的突发连接次数")
+        row += 1
+
+        self.connect_phase_probe_var = tk.BooleanVar(value=SETTINGS.connect_phase_probe)
+        self._create_checkbox(scrollable_frame, row, "测量TCP建连耗时", self.connect_phase_probe_var, "线程/协程/多进程引擎打开流前另建一次TCP短连接计时，会多占用服务器一次连接")
+        row += 1
+
+        self.phase_histograms_var = tk.BooleanVar(value=SETTINGS.phase_histograms_enabled)
+        self._create_checkbox(scrollable_frame, row, "连接阶段延迟分布", self.phase_histograms_var, "报表给出DNS/TCP/握手/探测/退避各阶段的分位数，每路多占约18KB内存")
+        row += 1
+
+        self.dns_cache_var = tk.BooleanVar(value=SETTINGS.dns_cache_enabled)
+        self._create_checkbox(scrollable_frame, row, "DNS缓存", self.dns_cache_var, "全部会话共用解析结果，启动前并行预解析URL列表中的主机名")
+        row += 1
+
+        self.dns_ttl_entry = self._create_labeled_entry(scrollable_frame, row, "DNS缓存时长 (s)", 15, SETTINGS.dns_cache_ttl, "解析结果在此时长内直接复用，解析失败的结果缓存时长较短")
+        row += 1
+
+        self.dns_rewrite_var = tk.BooleanVar(value=SETTINGS.dns_rewrite_urls)
+        self._create_checkbox(scrollable_frame, row, "URL改用解析地址", self.dns_rewrite_var, "线程/协程/多进程引擎连接时把主机名替换为缓存中的地址，依赖主机名的服务器可能拒绝")
+        row += 1
+
         frame.basic_controls = {
             'gui_entry': self.gui_entry,
+            'gui_budget_entry': self.gui_budget_entry,
+            'stats_interval_entry': self.stats_interval_entry,
             'reconnect_entry': self.reconnect_entry,
             'fps_smooth_entry': self.fps_smooth_entry,
-            'sys_monitor_var': self.sys_monitor_var
+            'sys_monitor_var': self.sys_monitor_var,
+            'timeseries_var': self.timeseries_var,
+            'timeseries_dir_entry': self.timeseries_dir_entry,
+            'metrics_http_var': self.metrics_http_var,
+            'metrics_http_host_entry': self.metrics_http_host_entry,
+            'metrics_http_port_entry': self.metrics_http_port_entry,
+            'monitor_engine_combobox': self.monitor_engine_combobox,
+            'async_loop_entry': self.async_loop_entry,
+            'async_workers_entry': self.async_workers_entry,
+            'async_slice_entry': self.async_slice_entry,
+            'mp_worker_entry': self.mp_worker_entry,
+            'mp_worker_engine_combobox': self.mp_worker_engine_combobox,
+            'mp_pin_cpu_var': self.mp_pin_cpu_var,
+            'ramp_profile_combobox': self.ramp_profile_combobox,
+            'ramp_rate_entry': self.ramp_rate_entry,
+            'ramp_step_size_entry': self.ramp_step_size_entry,
+            'ramp_step_interval_entry': self.ramp_step_interval_entry,
+            'backoff_max_entry': self.backoff_max_entry,
+            'breaker_threshold_entry': self.breaker_threshold_entry,
+            'breaker_open_entry': self.breaker_open_entry,
+            'connect_rate_entry': self.connect_rate_entry,
+            'connect_burst_entry': self.connect_burst_entry,
+            'connect_phase_probe_var': self.connect_phase_probe_var,
+            'phase_histograms_var': self.phase_histograms_var,
+            'dns_cache_var': self.dns_cache_var,
+            'dns_ttl_entry': self.dns_ttl_entry,
+            'dns_rewrite_var': self.dns_rewrite_var
         }
         
     def _create_section_label(self, parent, row, text):
@@ -1659,13 +893,32 @@ class StressTestFrame(ttk.Frame):
         self.analyze_duration_entry.insert(0, str(SETTINGS.rtsp_analyzeduration))
         self.analyze_duration_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
         ttk.Label(scrollable_frame, text="流信息分析的时间长度，影响启动时间", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        # 流参数缓存
+        self.param_cache_var = tk.BooleanVar(value=SETTINGS.param_cache_enabled)
+        self._create_checkbox(scrollable_frame, row, "启用流参数缓存", self.param_cache_var, "按URL缓存编码、分辨率、帧率与SPS/PPS，重连时快速探测，参数不一致时回退完整探测")
+        row += 1
+        
+        self.fast_probe_size_entry = self._create_labeled_entry(scrollable_frame, row, "快速探测大小 (字节)", 15, SETTINGS.fast_probe_size, "命中流参数缓存时使用的探测大小")
+        row += 1
+        
+        self.fast_analyze_duration_entry = self._create_labeled_entry(scrollable_frame, row, "快速分析时长 (微秒)", 15, SETTINGS.fast_analyzeduration, "命中流参数缓存时使用的分析时长")
+        row += 1
+        
+        self.tune_profiles_var = tk.BooleanVar(value=SETTINGS.tune_profiles_enabled)
+        self._create_checkbox(scrollable_frame, row, "使用调优配置", self.tune_profiles_var, "连接已调优的主机时使用其调优配置中的缓冲区、探测、延迟与超时参数（stress_cli.py --tune 生成）")
         
         frame.rtsp_controls = {
             'rtsp_timeout_entry': self.rtsp_timeout_entry,
             'buffer_size_entry': self.buffer_size_entry,
             'max_delay_entry': self.max_delay_entry,
             'probe_size_entry': self.probe_size_entry,
-            'analyze_duration_entry': self.analyze_duration_entry
+            'analyze_duration_entry': self.analyze_duration_entry,
+            'param_cache_var': self.param_cache_var,
+            'fast_probe_size_entry': self.fast_probe_size_entry,
+            'fast_analyze_duration_entry': self.fast_analyze_duration_entry,
+            'tune_profiles_var': self.tune_profiles_var
         }
         
     def create_quality_tab(self, notebook):
@@ -1719,6 +972,54 @@ class StressTestFrame(ttk.Frame):
         ttk.Label(scrollable_frame, text="使用PyAV库分析I/P/B帧类型，需要解码模式", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
         row += 1
         
+        self.slice_analysis_var = tk.BooleanVar(value=SETTINGS.slice_analysis_enabled)
+        slice_check = ttk.Checkbutton(scrollable_frame, text="码流级帧类型识别",
+                                      variable=self.slice_analysis_var)
+        slice_check.grid(row=row, column=0, columnspan=2, sticky='w', pady=3)
+        ttk.Label(scrollable_frame, text="解析H.264/H.265片头统计I/P/B帧与参考帧缺失，无需解码，每包增加少量CPU", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        # 解码压测
+        label = ttk.Label(scrollable_frame, text="解码压测", font=('TkDefaultFont', 10, 'bold'))
+        label.grid(row=row, column=0, columnspan=3, sticky='w', pady=(15, 5))
+        row += 1
+        
+        self.decode_var = tk.BooleanVar(value=SETTINGS.decode_enabled)
+        decode_check = ttk.Checkbutton(scrollable_frame, text="启用解码压测", variable=self.decode_var)
+        decode_check.grid(row=row, column=0, columnspan=2, sticky='w', pady=3)
+        ttk.Label(scrollable_frame, text="每路流实际解码视频帧，报表统计解码耗时、丢帧和每百万像素CPU（RTP直连引擎不支持）", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="解码线程数").grid(row=row, column=0, sticky='w', pady=3)
+        self.decode_threads_entry = ttk.Entry(scrollable_frame, width=15)
+        self.decode_threads_entry.insert(0, str(SETTINGS.decode_threads))
+        self.decode_threads_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="每路解码器的线程数，0 表示按CPU核数自动决定", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="解码线程类型").grid(row=row, column=0, sticky='w', pady=3)
+        self.decode_thread_type_combobox = ttk.Combobox(scrollable_frame, width=12,
+                                                        values=list(DECODE_THREAD_TYPES), state="readonly")
+        self.decode_thread_type_combobox.set(SETTINGS.decode_thread_type)
+        self.decode_thread_type_combobox.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="帧级多线程吞吐高但增加延迟，片级多线程依赖码流按片编码", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="解码范围").grid(row=row, column=0, sticky='w', pady=3)
+        self.decode_skip_combobox = ttk.Combobox(scrollable_frame, width=12,
+                                                 values=list(DECODE_SKIP_MODES), state="readonly")
+        self.decode_skip_combobox.set(SETTINGS.decode_skip)
+        self.decode_skip_combobox.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="跳过非参考帧或只解关键帧，评估降帧显示时的容量", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="解码队列上限").grid(row=row, column=0, sticky='w', pady=3)
+        self.decode_queue_entry = ttk.Entry(scrollable_frame, width=15)
+        self.decode_queue_entry.insert(0, str(SETTINGS.decode_queue_size))
+        self.decode_queue_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="每路待解码包数上限，解码跟不上时丢到下一个关键帧", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
         # 质量监控参数
         label = ttk.Label(scrollable_frame, text="质量监控参数", font=('TkDefaultFont', 10, 'bold'))
         label.grid(row=row, column=0, columnspan=3, sticky='w', pady=(15, 5))
@@ -1757,6 +1058,13 @@ class StressTestFrame(ttk.Frame):
         ttk.Label(scrollable_frame, text="连续丢帧判断阈值", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
         row += 1
         
+        ttk.Label(scrollable_frame, text="帧率变化确认帧数").grid(row=row, column=0, sticky='w', pady=3)
+        self.frame_rate_change_entry = ttk.Entry(scrollable_frame, width=15)
+        self.frame_rate_change_entry.insert(0, str(SETTINGS.frame_rate_change_frames))
+        self.frame_rate_change_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="连续相近的长间隔视为降帧而非丢帧，小于2关闭", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
         ttk.Label(scrollable_frame, text="丢帧率阈值 (%)").grid(row=row, column=0, sticky='w', pady=3)
         self.packet_loss_threshold_entry = ttk.Entry(scrollable_frame, width=15)
         self.packet_loss_threshold_entry.insert(0, str(SETTINGS.packet_loss_threshold))
@@ -1767,11 +1075,18 @@ class StressTestFrame(ttk.Frame):
             'quality_level_combobox': self.quality_level_combobox,
             'real_packet_loss_var': self.real_packet_loss_var,
             'frame_analysis_var': self.frame_analysis_var,
+            'slice_analysis_var': self.slice_analysis_var,
             'rtp_timeout_entry': self.rtp_timeout_entry,
             'pts_tolerance_entry': self.pts_tolerance_entry,
             'frame_interval_tolerance_entry': self.frame_interval_tolerance_entry,
             'missing_frame_threshold_entry': self.missing_frame_threshold_entry,
-            'packet_loss_threshold_entry': self.packet_loss_threshold_entry
+            'frame_rate_change_entry': self.frame_rate_change_entry,
+            'packet_loss_threshold_entry': self.packet_loss_threshold_entry,
+            'decode_var': self.decode_var,
+            'decode_threads_entry': self.decode_threads_entry,
+            'decode_thread_type_combobox': self.decode_thread_type_combobox,
+            'decode_skip_combobox': self.decode_skip_combobox,
+            'decode_queue_entry': self.decode_queue_entry
         }
         
     def create_system_tab(self, notebook):
@@ -1834,12 +1149,70 @@ class StressTestFrame(ttk.Frame):
         self.log_level_combobox.set(SETTINGS.log_level)
         self.log_level_combobox.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
         ttk.Label(scrollable_frame, text="日志详细程度", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="日志框保留行数").grid(row=row, column=0, sticky='w', pady=3)
+        self.log_max_lines_entry = ttk.Entry(scrollable_frame, width=15)
+        self.log_max_lines_entry.insert(0, str(SETTINGS.log_max_lines))
+        self.log_max_lines_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="超出后成批删除最旧的行", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        self.file_log_var = tk.BooleanVar(value=SETTINGS.file_log_enabled)
+        ttk.Checkbutton(scrollable_frame, text="日志写入文件", variable=self.file_log_var).grid(row=row, column=0, columnspan=2, sticky='w', pady=3)
+        ttk.Label(scrollable_frame, text="后台线程写盘，不阻塞监控线程", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="日志目录").grid(row=row, column=0, sticky='w', pady=3)
+        self.file_log_dir_entry = ttk.Entry(scrollable_frame, width=15)
+        self.file_log_dir_entry.insert(0, str(SETTINGS.file_log_dir))
+        self.file_log_dir_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="每次启动监控新建一个子目录", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        self.file_log_per_stream_var = tk.BooleanVar(value=SETTINGS.file_log_per_stream)
+        ttk.Checkbutton(scrollable_frame, text="每路流单独写文件", variable=self.file_log_per_stream_var).grid(row=row, column=0, columnspan=2, sticky='w', pady=3)
+        ttk.Label(scrollable_frame, text="线程-XX-YY 的日志另写入各自的文件", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="单个文件上限 (MB)").grid(row=row, column=0, sticky='w', pady=3)
+        self.file_log_max_mb_entry = ttk.Entry(scrollable_frame, width=15)
+        self.file_log_max_mb_entry.insert(0, str(SETTINGS.file_log_max_mb))
+        self.file_log_max_mb_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="超出后轮转，0 不按大小轮转", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="轮转间隔 (小时)").grid(row=row, column=0, sticky='w', pady=3)
+        self.file_log_rotate_entry = ttk.Entry(scrollable_frame, width=15)
+        self.file_log_rotate_entry.insert(0, str(SETTINGS.file_log_rotate_hours))
+        self.file_log_rotate_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="0 不按时间轮转", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        ttk.Label(scrollable_frame, text="保留轮转份数").grid(row=row, column=0, sticky='w', pady=3)
+        self.file_log_backup_entry = ttk.Entry(scrollable_frame, width=15)
+        self.file_log_backup_entry.insert(0, str(SETTINGS.file_log_backup_count))
+        self.file_log_backup_entry.grid(row=row, column=1, sticky='w', pady=3, padx=(10, 5))
+        ttk.Label(scrollable_frame, text="每个日志文件保留的历史份数", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
+        row += 1
+        
+        self.file_log_compress_var = tk.BooleanVar(value=SETTINGS.file_log_compress)
+        ttk.Checkbutton(scrollable_frame, text="压缩轮转出的日志", variable=self.file_log_compress_var).grid(row=row, column=0, columnspan=2, sticky='w', pady=3)
+        ttk.Label(scrollable_frame, text="gzip 压缩，在写盘线程中完成", foreground="gray").grid(row=row, column=2, sticky='w', padx=5)
         
         frame.system_controls = {
             'performance_limit_var': self.performance_limit_var,
             'max_cpu_entry': self.max_cpu_entry,
             'max_memory_entry': self.max_memory_entry,
-            'log_level_combobox': self.log_level_combobox
+            'log_level_combobox': self.log_level_combobox,
+            'log_max_lines_entry': self.log_max_lines_entry,
+            'file_log_var': self.file_log_var,
+            'file_log_dir_entry': self.file_log_dir_entry,
+            'file_log_per_stream_var': self.file_log_per_stream_var,
+            'file_log_max_mb_entry': self.file_log_max_mb_entry,
+            'file_log_rotate_entry': self.file_log_rotate_entry,
+            'file_log_backup_entry': self.file_log_backup_entry,
+            'file_log_compress_var': self.file_log_compress_var
         }
         
     def reset_to_defaults(self, win):
@@ -1917,9 +1290,44 @@ class StressTestFrame(ttk.Frame):
                 if hasattr(tab_frame, 'basic_controls'):
                     controls = tab_frame.basic_controls
                     SETTINGS.gui_refresh_interval = int(controls['gui_entry'].get())
+                    SETTINGS.gui_refresh_budget_ms = int(controls['gui_budget_entry'].get())
+                    SETTINGS.stats_interval_ms = int(controls['stats_interval_entry'].get())
                     SETTINGS.reconnect_wait_time = int(controls['reconnect_entry'].get())
                     SETTINGS.fps_smooth_window = int(controls['fps_smooth_entry'].get())
                     SETTINGS.sys_monitor_enabled = controls['sys_monitor_var'].get()
+                    SETTINGS.timeseries_enabled = controls['timeseries_var'].get()
+                    SETTINGS.timeseries_dir = controls['timeseries_dir_entry'].get().strip() or SETTINGS.defaults['timeseries_dir']
+                    SETTINGS.metrics_http_enabled = controls['metrics_http_var'].get()
+                    SETTINGS.metrics_http_host = controls['metrics_http_host_entry'].get().strip() or SETTINGS.defaults['metrics_http_host']
+                    SETTINGS.metrics_http_port = int(controls['metrics_http_port_entry'].get())
+                    SETTINGS.monitor_engine = controls['monitor_engine_combobox'].get()
+                    async_loop_threads = int(controls['async_loop_entry'].get())
+                    async_executor_workers = int(controls['async_workers_entry'].get())
+                    SETTINGS.async_read_slice_ms = int(controls['async_slice_entry'].get())
+                    SETTINGS.mp_worker_count = int(controls['mp_worker_entry'].get())
+                    SETTINGS.mp_worker_engine = controls['mp_worker_engine_combobox'].get()
+                    SETTINGS.mp_pin_cpu = controls['mp_pin_cpu_var'].get()
+                    SETTINGS.ramp_profile = controls['ramp_profile_combobox'].get()
+                    SETTINGS.ramp_rate = float(controls['ramp_rate_entry'].get())
+                    SETTINGS.ramp_step_size = int(controls['ramp_step_size_entry'].get())
+                    SETTINGS.ramp_step_interval = float(controls['ramp_step_interval_entry'].get())
+                    SETTINGS.reconnect_backoff_max = float(controls['backoff_max_entry'].get())
+                    SETTINGS.breaker_failure_threshold = int(controls['breaker_threshold_entry'].get())
+                    SETTINGS.breaker_open_seconds = float(controls['breaker_open_entry'].get())
+                    SETTINGS.connect_rate_limit = float(controls['connect_rate_entry'].get())
+                    SETTINGS.connect_burst = int(controls['connect_burst_entry'].get())
+                    SETTINGS.connect_phase_probe = controls['connect_phase_probe_var'].get()
+                    SETTINGS.phase_histograms_enabled = controls['phase_histograms_var'].get()
+                    SETTINGS.dns_cache_enabled = controls['dns_cache_var'].get()
+                    SETTINGS.dns_cache_ttl = float(controls['dns_ttl_entry'].get())
+                    SETTINGS.dns_rewrite_urls = controls['dns_rewrite_var'].get()
+                    if (async_loop_threads, async_executor_workers) != (SETTINGS.async_loop_threads, SETTINGS.async_executor_workers):
+                        SETTINGS.async_loop_threads = async_loop_threads
+                        SETTINGS.async_executor_workers = async_executor_workers
+                        # 协程引擎空闲时按新参数重建
+                        if not self.monitor_threads:
+                            from async_monitor import shutdown_async_engine
+                            shutdown_async_engine()
                 
                 elif hasattr(tab_frame, 'rtsp_controls'):
                     controls = tab_frame.rtsp_controls
@@ -1928,17 +1336,28 @@ class StressTestFrame(ttk.Frame):
                     SETTINGS.rtsp_max_delay = int(controls['max_delay_entry'].get())
                     SETTINGS.rtsp_probe_size = int(controls['probe_size_entry'].get())
                     SETTINGS.rtsp_analyzeduration = int(controls['analyze_duration_entry'].get())
+                    SETTINGS.param_cache_enabled = controls['param_cache_var'].get()
+                    SETTINGS.fast_probe_size = int(controls['fast_probe_size_entry'].get())
+                    SETTINGS.fast_analyzeduration = int(controls['fast_analyze_duration_entry'].get())
+                    SETTINGS.tune_profiles_enabled = controls['tune_profiles_var'].get()
                 
                 elif hasattr(tab_frame, 'quality_controls'):
                     controls = tab_frame.quality_controls
                     SETTINGS.quality_level = controls['quality_level_combobox'].get()
                     SETTINGS.enable_real_packet_loss = controls['real_packet_loss_var'].get()
                     SETTINGS.enable_frame_analysis = controls['frame_analysis_var'].get()
+                    SETTINGS.slice_analysis_enabled = controls['slice_analysis_var'].get()
                     SETTINGS.rtp_timeout_threshold = int(controls['rtp_timeout_entry'].get())
                     SETTINGS.pts_tolerance_ms = int(controls['pts_tolerance_entry'].get())
                     SETTINGS.frame_interval_tolerance = float(controls['frame_interval_tolerance_entry'].get())
                     SETTINGS.missing_frame_threshold = int(controls['missing_frame_threshold_entry'].get())
+                    SETTINGS.frame_rate_change_frames = int(controls['frame_rate_change_entry'].get())
                     SETTINGS.packet_loss_threshold = float(controls['packet_loss_threshold_entry'].get())
+                    SETTINGS.decode_enabled = controls['decode_var'].get()
+                    SETTINGS.decode_threads = int(controls['decode_threads_entry'].get())
+                    SETTINGS.decode_thread_type = controls['decode_thread_type_combobox'].get()
+                    SETTINGS.decode_skip = controls['decode_skip_combobox'].get()
+                    SETTINGS.decode_queue_size = int(controls['decode_queue_entry'].get())
                 
                 elif hasattr(tab_frame, 'system_controls'):
                     controls = tab_frame.system_controls
@@ -1946,7 +1365,16 @@ class StressTestFrame(ttk.Frame):
                     SETTINGS.max_cpu_usage = int(controls['max_cpu_entry'].get())
                     SETTINGS.max_memory_usage = int(controls['max_memory_entry'].get())
                     SETTINGS.log_level = controls['log_level_combobox'].get()
+                    SETTINGS.log_max_lines = int(controls['log_max_lines_entry'].get())
+                    SETTINGS.file_log_enabled = controls['file_log_var'].get()
+                    SETTINGS.file_log_dir = controls['file_log_dir_entry'].get().strip() or SETTINGS.defaults['file_log_dir']
+                    SETTINGS.file_log_per_stream = controls['file_log_per_stream_var'].get()
+                    SETTINGS.file_log_max_mb = float(controls['file_log_max_mb_entry'].get())
+                    SETTINGS.file_log_rotate_hours = float(controls['file_log_rotate_entry'].get())
+                    SETTINGS.file_log_backup_count = int(controls['file_log_backup_entry'].get())
+                    SETTINGS.file_log_compress = controls['file_log_compress_var'].get()
             
+            self.apply_metrics_endpoint()
             messagebox.showinfo("保存成功", "参数已保存并即时生效。")
             win.destroy()
             
@@ -1955,6 +1383,17 @@ class StressTestFrame(ttk.Frame):
         except Exception as e:
             messagebox.showerror("错误", f"保存设置时发生错误：{e}")
 
+    def apply_metrics_endpoint(self):
+        """按设置启动、重启或关闭指标端点"""
+        wanted = (SETTINGS.metrics_http_host, SETTINGS.metrics_http_port) if SETTINGS.metrics_http_enabled else None
+        exporter = self.metrics_exporter
+        if exporter is not None and (exporter.host, exporter.port) != wanted:
+            exporter.stop()
+            self.metrics_exporter = None
+            logging.info("指标端点已关闭")
+        if wanted and self.metrics_exporter is None:
+            self.metrics_exporter = create_metrics_exporter()
+
     def export_report(self):
         filename = filedialog.asksaveasfilename(
             defaultextension=".txt",
@@ -1965,79 +1404,43 @@ class StressTestFrame(ttk.Frame):
             return
             
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"RTSP 压测报告 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write("=" * 60 + "\n\n")
-
-                total_url_count = len(self.url_list_data)
-                total_threads_count = len(self.monitor_threads)
-                
-                f.write(f"总监控地址数: {total_url_count}\n")
-                f.write(f"总监控线程数: {total_threads_count}\n\n")
-
-                f.write("### 各流监控统计\n")
-                f.write("-" * 50 + "\n")
-                
-                all_status_info = []
-                for child_iid in self.tree.get_children():
-                    if child_iid.startswith("url_"):
-                        # Aggregate data for URL parent items
-                        url_data = self.url_list_data.get(child_iid)
-                        if url_data:
-                            aggregated = AGGREGATED_DATA.get(child_iid)
-                            if aggregated:
-                                total_duration = (time.time() - aggregated['start_time']) if aggregated.get('start_time') else 0
-                                # 使用默认帧率作为备用
-                                default_fps = 25.0
-                                total_expected_frames = int(total_duration * default_fps * len(url_data['children']))
-                                final_lost_rate = (aggregated.get('total_lost_frames', 0) / total_expected_frames * 100) if total_expected_frames > 0 else 0.0
-                                qoe_scores = []
-                                avg_qoe = 0.0
-                                
-                                url_status = self.tree.item(child_iid, 'values')
-                                url_report_data = {
-                                    'url': url_status[1],
-                                    'status': url_status[2],
-                                    'lost_rate': f"{final_lost_rate:.1f}",
-                                    'reconnects': aggregated['total_reconnects'],
-                                    'total_bytes': aggregated['total_bytes'],
-                                    'total_frames': aggregated['total_frames']
-                                }
-                                all_status_info.append(url_report_data)
+            all_status_info = []
+            for child_iid in self.tree.get_children():
+                if child_iid.startswith("url_"):
+                    # Aggregate data for URL parent items
+                    url_data = self.url_list_data.get(child_iid)
+                    if url_data:
+                        aggregated = AGGREGATED_DATA.get(child_iid)
+                        if aggregated:
+                            total_duration = (time.time() - aggregated['start_time']) if aggregated.get('start_time') else 0
+                            # 使用默认帧率作为备用
+                            default_fps = 25.0
+                            total_expected_frames = int(total_duration * default_fps * len(url_data['children']))
+                            final_lost_rate = (aggregated.get('total_lost_frames', 0) / total_expected_frames * 100) if total_expected_frames > 0 else 0.0
                             
-                for item in all_status_info:
-                    f.write(f"URL: {item['url']}\n")
-                    f.write(f"  状态: {item['status']}\n")
-                    f.write(f"  丢包率: {item['lost_rate']}%\n")
-                    f.write(f"  总流量: {item['total_bytes'] / 1024 / 1024:.2f} MB\n")
-                    f.write(f"  总重连次数: {item['reconnects']}\n")
-                    f.write("-" * 50 + "\n")
-
-                f.write("\n\n### 性能指标汇总\n")
-                f.write("=" * 60 + "\n")
-                f.write(f"CPU 使用率: {self.last_sys_info['cpu_percent']:.1f}%\n")
-                f.write(f"内存使用率: {self.last_sys_info['mem_percent']:.1f}%\n")
-                f.write(f"网络下载速率: {self.last_sys_info['net_recv_mbps']:.1f} Mbps\n")
-
-                f.write("\n\n### 丢包率最高TOP 3\n")
-                f.write("=" * 60 + "\n")
-                all_lost_rates = []
-                for item_id in AGGREGATED_DATA:
-                    aggregated = AGGREGATED_DATA[item_id]
-                    if 'start_time' in aggregated and aggregated['start_time']:
-                        total_duration = time.time() - aggregated['start_time']
-                        # 使用默认帧率作为备用
-                        default_fps = 25.0
-                        total_expected_frames = int(total_duration * default_fps * len(self.url_list_data[item_id]['children']))
-                        lost_rate = (aggregated.get('total_lost_frames', 0) / total_expected_frames * 100) if total_expected_frames > 0 else 0.0
-                        all_lost_rates.append({
-                            'url': self.url_list_data[item_id]['url'],
-                            'lost_rate': lost_rate
-                        })
-
-                top_3_lost = sorted(all_lost_rates, key=lambda x: x['lost_rate'], reverse=True)[:3]
-                for i, item in enumerate(top_3_lost):
-                    f.write(f"  {i+1}. {item['url']} - 丢包率: {item['lost_rate']:.1f}%\n")
+                            url_status = self._url_row_values(child_iid)
+                            url_report_data = {
+                                'url': url_status[1],
+                                'status': url_status[2],
+                                'lost_rate': final_lost_rate,
+                                'reconnects': aggregated['total_reconnects'],
+                                'total_bytes': aggregated['total_bytes'],
+                                'total_frames': aggregated['total_frames']
+                            }
+                            all_status_info.append(url_report_data)
+
+            with open(filename, 'w', encoding='utf-8') as f:
+                statuses = METRICS_TABLE.status_dicts()
+                phase_rows = summarize_phases(self.load_phases, self.thread_phase, statuses)
+                thread_ids, histograms = METRICS_TABLE.histograms()
+                latency_sections = merge_groups(
+                    thread_ids, histograms,
+                    [("全部", thread_ids)] + [(url_data['url'], url_data['children']) for url_data in self.url_list_data.values()])
+                write_stress_report(f, len(self.url_list_data), len(self.monitor_threads),
+                                    all_status_info, self.last_sys_info, self.timeseries_path, phase_rows,
+                                    summarize_decode(statuses), latency_sections, summarize_gop(statuses),
+                                    summarize_slices(statuses), summarize_probe(statuses),
+                                    summarize_connect_phases(statuses), summarize_dns(statuses))
                 
             messagebox.showinfo("成功", "报表已导出。")
         except Exception as e:
@@ -2069,12 +1472,30 @@ class StressTestFrame(ttk.Frame):
                 self.after_cancel(STOP_CHECK_ID)
                 STOP_CHECK_ID = None
             
+            # 所有线程共用一个退出截止时间，避免流数量多时串行等待过久
+            deadline = time.time() + 2.0
             for t in self.monitor_threads:
                 if t.is_alive():
-                    t.join(timeout=1.0)
+                    t.join(timeout=max(0.0, deadline - time.time()))
                     if t.is_alive():
                         logging.warning(f"线程 {t.name} 未能在超时时间内退出。")
         
+        if SETTINGS.monitor_engine in ("协程", "RTP直连"):
+            from async_monitor import shutdown_async_engine
+            shutdown_async_engine()
+
+        if self.timeseries_writer is not None:
+            self.timeseries_writer.stop()
+            self.timeseries_writer = None
+
+        if self.file_log_session is not None:
+            self.file_log_session.stop()
+            self.file_log_session = None
+
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
+
         if SYSTEM_MONITOR_THREAD and SYSTEM_MONITOR_THREAD.is_alive():
             SYSTEM_MONITOR_THREAD.stop()
             SYSTEM_MONITOR_THREAD.join(timeout=1.0)
@@ -2099,6 +1520,11 @@ class StressTestFrame(ttk.Frame):
         STATUS_QUEUES.clear()
         AGGREGATED_DATA.clear()
         self.last_counters.clear()
+        self.thread_registry.clear()
+        self.thread_parent.clear()
+        self.parent_totals.clear()
+        self.child_totals.clear()
+        self.metrics_seq = None
         THREAD_NAME_MAP.clear()
         # 清空最终统计数据
         self.final_stats.clear()
@@ -2112,6 +1538,7 @@ class StressTestFrame(ttk.Frame):
             children = self.tree.get_children(item_id)
             for child in children:
                 self.tree.delete(child)
+        self.rendered_rows.clear()
 
         # 更新线程数设置
         try:
@@ -2124,25 +1551,74 @@ class StressTestFrame(ttk.Frame):
             messagebox.showerror("错误", "线程数输入无效！")
             return
 
+        # 按本次流数量预分配指标表，多进程引擎由监督线程改用共享内存
+        METRICS_TABLE.reset(len(self.url_list_data) * SETTINGS.threads_per_url,
+                            phase_histograms=SETTINGS.phase_histograms_enabled)
+        reset_reconnect_policy()
+        mark_run_start()
+
+        # 长稳测试时序记录：独立线程每秒采样指标表，不占用会话线程
+        self.timeseries_path = None
+        if SETTINGS.timeseries_enabled:
+            try:
+                self.timeseries_writer = start_recording(METRICS_TABLE, SETTINGS.timeseries_dir,
+                                                         len(self.url_list_data) * SETTINGS.threads_per_url)
+                self.timeseries_path = self.timeseries_writer.path
+            except OSError as e:
+                logging.error(f"无法创建时序数据目录: {e}")
+
+        # 日志异步写盘：会话线程只入队，由后台线程写文件
+        if SETTINGS.file_log_enabled:
+            try:
+                self.file_log_session = start_file_logging(SETTINGS)
+            except OSError as e:
+                logging.error(f"无法创建日志目录: {e}")
+
+        # 按设置选择监控引擎，各引擎对外接口一致
+        monitor_class, supervisor = create_monitor_factory(SETTINGS.monitor_engine)
+        logging.info(f"使用{SETTINGS.monitor_engine}监控引擎")
+        if supervisor is None:
+            # 后台预解析，不阻塞界面；多进程引擎由监督线程预解析
+            start_dns_prefetch(url_data['url'] for url_data in self.url_list_data.values())
+
+        # 按加压方式计算每路会话的启动时刻，会话各自等待到点后再连接
+        schedule, self.load_phases = build_load_schedule(
+            len(self.url_list_data) * SETTINGS.threads_per_url, SETTINGS.ramp_profile,
+            SETTINGS.ramp_rate, SETTINGS.ramp_step_size, SETTINGS.ramp_step_interval)
+        self.thread_phase.clear()
+        if len(self.load_phases) > 1:
+            logging.info(f"加压方式: {SETTINGS.ramp_profile}，共{len(self.load_phases)}个阶段，"
+                         f"最后一批会话在 {self.load_phases[-1]['offset']:.0f} 秒后启动")
+        schedule_start = time.time()
+        stream_index = 0
+
         for item_id, url_data in self.url_list_data.items():
             parent_url = url_data['url']
             parent_url_id = url_data['id']
             protocol = self.protocol_combobox.get()
+            self.parent_totals[item_id] = list(PARENT_TOTALS_ZERO)
+            AGGREGATED_DATA[item_id]['start_time'] = time.time()
             
             # 创建 RTSP 监控线程和其 Treeview 子项
             for i in range(SETTINGS.threads_per_url):
                 thread_id_str = f"{parent_url_id}-{i+1}"
+                start_offset, phase = schedule[stream_index]
+                stream_index += 1
                 
-                monitor_thread = RTSPStreamMonitor(
+                monitor_thread = monitor_class(
                     url=parent_url,
                     thread_id=thread_id_str,
                     parent_item_id=item_id,
                     parent_url_id=parent_url_id,
                     thread_idx=i,
                     total_threads=SETTINGS.threads_per_url,
-                    protocol=protocol
+                    protocol=protocol,
+                    start_at=schedule_start + start_offset
                 )
+                self.thread_phase[thread_id_str] = phase
                 self.monitor_threads.append(monitor_thread)
+                self.thread_registry[thread_id_str] = monitor_thread
+                self.thread_parent[thread_id_str] = item_id
                 url_data['children'].append(thread_id_str)
                 
                 log_name = f"线程-{parent_url_id:02d}-{i+1:02d}"
@@ -2160,13 +1636,19 @@ class StressTestFrame(ttk.Frame):
                     '0.0%',     # 丢包率
                     '0.00 MB',  # 流量
                     '0',        # 重连
-                    '0.0s'      # 延迟
+                    '0.0s',     # 延迟
+                    '0.00 Mbps', # 码率
+                    '-'         # GOP
                 ), tags=('thread_row',))
                 monitor_thread.start()
                 logging.info(f"已启动监控线程: {log_name} (ID: {thread_id_str})。URL: {parent_url}")
             
             self.tree.item(item_id, open=True) # 默认展开父级节点
 
+        if supervisor is not None:
+            supervisor.start()
+            logging.info(f"多进程引擎已启动 {supervisor.worker_count} 个工作进程")
+
         self.start_button['state'] = tk.DISABLED
         self.stop_button['state'] = tk.NORMAL
         self.status_label['text'] = "正在运行..."
@@ -2195,7 +1677,7 @@ class StressTestFrame(ttk.Frame):
         self.final_parent_stats = {}
         for item_id in self.tree.get_children():
             if item_id.startswith("url_"):
-                parent_values = self.tree.item(item_id, 'values')
+                parent_values = self._url_row_values(item_id)
                 self.final_parent_stats[item_id] = {
                     'status': "已停止",
                     'fps': parent_values[3] if len(parent_values) > 3 else "0.0",
@@ -2205,17 +1687,29 @@ class StressTestFrame(ttk.Frame):
                     'lost_rate': parent_values[7] if len(parent_values) > 7 else "0.0%",
                     'total_bytes': parent_values[8] if len(parent_values) > 8 else "0.00 MB",
                     'reconnects': parent_values[9] if len(parent_values) > 9 else "0",
-                    'latency': parent_values[10] if len(parent_values) > 10 else "0.0s"
+                    'latency': parent_values[10] if len(parent_values) > 10 else "0.0s",
+                    'bitrate': parent_values[11] if len(parent_values) > 11 else "0.00 Mbps",
+                    'gop': parent_values[12] if len(parent_values) > 12 else "-"
                 }
         
         # 3. 异步等待线程退出，避免阻塞界面
+        monitor_threads = self.monitor_threads
+        timeseries_writer = self.timeseries_writer
+        self.timeseries_writer = None
+        file_log_session = self.file_log_session
+        self.file_log_session = None
         def stop_threads_async():
-            for t in self.monitor_threads:
+            for t in monitor_threads:
                 if t.is_alive():
                     # 使用更短的超时时间，避免长时间阻塞
                     t.join(timeout=0.5)
                     if t.is_alive():
                         logging.warning(f"线程 {t.name} 未能在超时时间内退出，将强制停止。")
+            # 会话写完最终状态后再结束时序记录
+            if timeseries_writer is not None:
+                timeseries_writer.stop()
+            if file_log_session is not None:
+                file_log_session.stop()
         
         # 在单独线程中停止，避免阻塞主线程
         stop_thread = threading.Thread(target=stop_threads_async, daemon=True)
@@ -2223,6 +1717,8 @@ class StressTestFrame(ttk.Frame):
 
         # 4. 立即清理线程列表和状态
         self.monitor_threads = []
+        self.thread_registry.clear()
+        self.thread_parent.clear()
         STATUS_QUEUES.clear()
         # 注意：不清空 self.last_counters，保留最后的数据
         
@@ -2242,6 +1738,8 @@ class StressTestFrame(ttk.Frame):
         
     def update_final_display(self):
         """更新停止后的最终显示数据"""
+        # 以下直接写入所有行，使脏行缓存失效
+        self.rendered_rows.clear()
         # 更新所有子线程的显示
         for thread_id, status_info in self.final_stats.items():
             child_iid = f"thread_{thread_id}"
@@ -2254,6 +1752,8 @@ class StressTestFrame(ttk.Frame):
                 connect_latency = status_info.get('connect_latency', 0.0)
                 expected_frames = received_frames + lost_frames
                 lost_rate = (lost_frames / expected_frames * 100) if expected_frames > 0 else 0.0
+                gop_length = status_info.get('gop_length', 0)
+                keyframe_interval = status_info.get('keyframe_interval_ms', 0.0) / 1000.0
                 
                 # 状态显示为已停止
                 final_status = "已停止"
@@ -2270,7 +1770,9 @@ class StressTestFrame(ttk.Frame):
                     f"{lost_rate:.1f}%",
                     f"{total_bytes_thread / 1024 / 1024:.2f} MB",
                     reconnects,
-                    f"{connect_latency:.1f}s"
+                    f"{connect_latency:.1f}s",
+                    f"{status_info.get('bitrate_mbps', 0.0):.2f} Mbps",
+                    self._format_gop(gop_length, keyframe_interval)
                 ))
         
         # 更新父行的显示
@@ -2287,198 +1789,281 @@ class StressTestFrame(ttk.Frame):
                     parent_stats['lost_rate'],
                     parent_stats['total_bytes'],
                     parent_stats['reconnects'],
-                    parent_stats['latency']
+                    parent_stats['latency'],
+                    parent_stats['bitrate'],
+                    parent_stats['gop']
                 ))
         
-    def update_statuses(self):
-        has_active_threads = False
-        
-        # 调试信息：检查线程和队列状态
-        total_monitor_threads = len(self.monitor_threads)
-        total_queues = len(STATUS_QUEUES)
-        
-        if total_monitor_threads > 0:
-            # 只在有线程时输出调试信息
-            pass  # 可以在这里加入 logging.debug 信息
-        
-        for item_id in self.tree.get_children():
-            if item_id.startswith("url_"):
-                # 获取该 URL 下的所有子线程
-                url_data = self.url_list_data.get(item_id, {})
-                thread_ids = url_data.get('children', [])
-                
-                # 检查是否有任何线程仍在运行
-                thread_running = False
-                for t in self.monitor_threads:
-                    if t.thread_id in thread_ids and t.is_alive():
-                        thread_running = True
-                        break
-                
-                if thread_running:
-                    has_active_threads = True
-
-                # Update child thread status
-                all_reconnects = []
-                all_frames = []
-                all_bytes = []
-                all_expected_frames = []
-                all_lost_frames = []
-                all_latencies = []
-                all_fps = []
-                
-                for thread_id in url_data.get('children', []):
-                    child_iid = f"thread_{thread_id}"
-                    
-                    # 关键修复: 在更新前检查Treeview子项是否存在
-                    if not self.tree.exists(child_iid):
-                        continue
-
-                    # 检查并获取最新的状态信息
-                    if thread_id in STATUS_QUEUES:
-                        while not STATUS_QUEUES[thread_id].empty():
-                            status_info = STATUS_QUEUES[thread_id].get()
-                            self.last_counters[thread_id] = status_info
-                    
-                    # 获取状态信息，如果没有数据则检查线程状态
-                    status_info = self.last_counters.get(thread_id, {})
-                    
-                    # 如果没有状态信息但线程正在运行，显示连接中状态
-                    if not status_info:
-                        thread_alive = any(t.thread_id == thread_id and t.is_alive() for t in self.monitor_threads)
-                        if thread_alive:
-                            status_info = {
-                                'status': '连接中...',
-                                'current_fps': 0.0,
-                                'received_frames': 0,
-                                'total_bytes': 0,
-                                'reconnect_count': 0,
-                                'connect_latency': 0.0
-                            }
-                        
-                    status_info = self.last_counters.get(thread_id, status_info)
-                    
-                    current_status = status_info.get('status', '未启动')
-                    current_fps = status_info.get('current_fps', 0.0)
-                    received_frames = status_info.get('received_frames', 0)
-                    lost_frames = status_info.get('lost_frames', 0)
-                    total_bytes_thread = status_info.get('total_bytes', 0)
-                    reconnects = status_info.get('reconnect_count', 0)
-                    connect_latency = status_info.get('connect_latency', 0.0)
-                    expected_frames = received_frames + lost_frames
-                    
-                    lost_rate = (lost_frames / expected_frames * 100) if expected_frames > 0 else 0.0
-
-                    # 更新子项的显示
-                    self.tree.item(child_iid, values=(
-                        thread_id,
-                        THREAD_NAME_MAP.get(thread_id, 'N/A'),
-                        current_status,
-                        f"{int(current_fps)}",
-                        expected_frames,
-                        received_frames,
-                        lost_frames,
-                        f"{lost_rate:.1f}%",
-                        f"{total_bytes_thread / 1024 / 1024:.2f} MB",
-                        reconnects,
-                        f"{connect_latency:.1f}s"
-                    ))
-                    
-                    # 汇总数据
-                    all_reconnects.append(reconnects)
-                    all_frames.append(received_frames)
-                    all_bytes.append(total_bytes_thread)
-                    all_expected_frames.append(expected_frames)
-                    all_lost_frames.append(lost_frames)
-                    
-                    # 收集FPS数据
-                    if current_fps > 0:
-                        all_fps.append(current_fps)
-                    
-                    if connect_latency > 0:
-                        all_latencies.append(connect_latency)
-
-                # Update Parent URL status - 计算平均值
-                num_threads = len(url_data.get('children', []))
-                
-                # 检查是否已停止且有最终数据
-                if hasattr(self, 'final_parent_stats') and item_id in self.final_parent_stats and num_threads == 0:
-                    # 使用最终保存的数据
-                    parent_stats = self.final_parent_stats[item_id]
-                    self.tree.item(item_id, values=(
-                        self.url_list_data[item_id]['id'],
-                        self.url_list_data[item_id]['url'].replace('rtsp://', ''),
-                        parent_stats['status'],  # 已停止
-                        parent_stats['fps'],
-                        parent_stats['expected_frames'],
-                        parent_stats['received_frames'],
-                        parent_stats['lost_frames'],
-                        parent_stats['lost_rate'],
-                        parent_stats['total_bytes'],
-                        parent_stats['reconnects'],
-                        parent_stats['latency']
-                    ))
-                    continue  # 跳过后续计算和更新
-                
-                # 使用更安全的计算方法，避免除零错误
-                avg_reconnects = sum(all_reconnects) / max(1, num_threads)
-                avg_frames = sum(all_frames) / max(1, num_threads)
-                avg_bytes = sum(all_bytes) / max(1, num_threads)
-                avg_expected_frames = sum(all_expected_frames) / max(1, num_threads)
-                avg_lost_frames = sum(all_lost_frames) / max(1, num_threads)
-                
-                avg_fps = sum(all_fps) / len(all_fps) if all_fps else 0.0
-                avg_latency = sum(all_latencies) / len(all_latencies) if all_latencies else 0.0
-                lost_rate = (avg_lost_frames / avg_expected_frames * 100) if avg_expected_frames > 0 else 0.0
-                
-                # 状态判断逻辑
-                if num_threads == 0:
-                    status = "未启动"
-                elif avg_frames == 0 and avg_reconnects > 0:
-                    status = "重连中..."
-                elif avg_frames == 0 and avg_reconnects == 0:
-                    # 检查是否有线程正在运行（可能正在连接）
-                    any_thread_alive = any(t.thread_id in thread_ids and t.is_alive() for t in self.monitor_threads)
-                    if any_thread_alive:
-                        status = "连接中..."
-                    else:
-                        status = "未启动"
-                else:
-                    status = "运行中"
+    def _visible_tree_rows(self):
+        """返回当前视口内可见的行（父行和已展开的子行），按从上到下的顺序"""
+        tree = self.tree
+        if not tree.get_children():
+            return []
+        height = tree.winfo_height()
+        # 跳过表头找到第一条可见行，再按行高逐行定位
+        y = 0
+        first = ''
+        while y < height and not first:
+            first = tree.identify_row(y)
+            if not first:
+                y += 4
+        bbox = tree.bbox(first) if first else None
+        if not bbox:
+            return [first] if first else []
+        row_height = max(1, bbox[3])
+        rows = [first]
+        y = bbox[1] + row_height + row_height // 2
+        while y < height:
+            item = tree.identify_row(y)
+            if not item:
+                break
+            rows.append(item)
+            y += row_height
+        return rows
+
+    @staticmethod
+    def _format_gop(gop_length, keyframe_interval):
+        """GOP 列：最近一个 GOP 的帧数 / 平均关键帧间隔"""
+        if not gop_length:
+            return "-"
+        return f"{gop_length:.0f} / {keyframe_interval:.1f}s"
+
+    @staticmethod
+    def _format_thread_row(key):
+        (thread_id, status, fps, expected_frames, received_frames, lost_frames, total_bytes, reconnects, latency,
+         bitrate, gop_length, keyframe_interval) = key
+        lost_rate = (lost_frames / expected_frames * 100) if expected_frames > 0 else 0.0
+        return (
+            thread_id,
+            THREAD_NAME_MAP.get(thread_id, 'N/A'),
+            status,
+            f"{int(fps)}",
+            expected_frames,
+            received_frames,
+            lost_frames,
+            f"{lost_rate:.1f}%",
+            f"{total_bytes / 1024 / 1024:.2f} MB",
+            reconnects,
+            f"{latency:.1f}s",
+            f"{bitrate:.2f} Mbps",
+            StressTestFrame._format_gop(gop_length, keyframe_interval)
+        )
 
-                self.tree.item(item_id, values=(
-                    self.url_list_data[item_id]['id'],
-                    self.url_list_data[item_id]['url'].replace('rtsp://', ''),
-                    status,
-                    f"{int(avg_fps)}",
-                    int(avg_expected_frames),
-                    int(avg_frames),
-                    int(avg_lost_frames),
-                    f"{lost_rate:.1f}%",
-                    f"{avg_bytes / 1024 / 1024:.2f} MB",
-                    int(avg_reconnects),
-                    f"{avg_latency:.1f}s"
-                ))
-                
-                # Update aggregated data (for reports)
-                if not 'start_time' in AGGREGATED_DATA[item_id] or AGGREGATED_DATA[item_id]['start_time'] is None:
-                    AGGREGATED_DATA[item_id]['start_time'] = time.time()
-                AGGREGATED_DATA[item_id]['total_reconnects'] = sum(all_reconnects)
-                AGGREGATED_DATA[item_id]['total_frames'] = sum(all_frames)
-                AGGREGATED_DATA[item_id]['total_bytes'] = sum(all_bytes)
-                AGGREGATED_DATA[item_id]['total_expected_frames'] = sum(all_expected_frames)
-                AGGREGATED_DATA[item_id]['total_lost_frames'] = sum(all_lost_frames)
-                
-                # 确保列表类型正确
-                if not isinstance(AGGREGATED_DATA[item_id]['fps_list'], deque):
-                    AGGREGATED_DATA[item_id]['fps_list'] = deque(maxlen=SETTINGS.fps_smooth_window)
-                if not isinstance(AGGREGATED_DATA[item_id]['latency_list'], deque):
-                    AGGREGATED_DATA[item_id]['latency_list'] = deque(maxlen=100)
-                
-                # 安全扩展数据
-                for fps in all_fps:
-                    AGGREGATED_DATA[item_id]['fps_list'].append(fps)
-                for latency in all_latencies:
-                    AGGREGATED_DATA[item_id]['latency_list'].append(latency)
+    @staticmethod
+    def _format_url_row(key):
+        (url_id, url, status, fps, expected_frames, received_frames, lost_frames, total_bytes, reconnects, latency,
+         bitrate, gop_length, keyframe_interval) = key
+        lost_rate = (lost_frames / expected_frames * 100) if expected_frames > 0 else 0.0
+        return (
+            url_id,
+            url.replace('rtsp://', ''),
+            status,
+            f"{int(fps)}",
+            int(expected_frames),
+            int(received_frames),
+            int(lost_frames),
+            f"{lost_rate:.1f}%",
+            f"{total_bytes / 1024 / 1024:.2f} MB",
+            int(reconnects),
+            f"{latency:.1f}s",
+            f"{bitrate:.2f} Mbps",
+            StressTestFrame._format_gop(gop_length, keyframe_interval)
+        )
+
+    def _apply_child_status(self, item_id, thread_id, status_info):
+        """用一路流的新状态按差值更新所属父行的累计值"""
+        received_frames = status_info.get('received_frames', 0)
+        lost_frames = status_info.get('lost_frames', 0)
+        current_fps = status_info.get('current_fps', 0.0)
+        connect_latency = status_info.get('connect_latency', 0.0)
+        gop_length = status_info.get('gop_length', 0)
+        contribution = (
+            status_info.get('reconnect_count', 0),
+            received_frames,
+            status_info.get('total_bytes', 0),
+            received_frames + lost_frames,
+            lost_frames,
+            current_fps if current_fps > 0 else 0.0,
+            1 if current_fps > 0 else 0,
+            connect_latency if connect_latency > 0 else 0.0,
+            1 if connect_latency > 0 else 0,
+            status_info.get('bitrate_mbps', 0.0),
+            gop_length,
+            status_info.get('keyframe_interval_ms', 0.0) if gop_length else 0.0,
+            1 if gop_length else 0,
+        )
+        previous = self.child_totals.get(thread_id, PARENT_TOTALS_ZERO)
+        totals = self.parent_totals[item_id]
+        for i, value in enumerate(contribution):
+            totals[i] += value - previous[i]
+        # 没有样本时清零，避免浮点差值累积的残差
+        if not totals[PARENT_FPS_COUNT]:
+            totals[PARENT_FPS_SUM] = 0.0
+        if not totals[PARENT_LATENCY_COUNT]:
+            totals[PARENT_LATENCY_SUM] = 0.0
+        if not totals[PARENT_GOP_COUNT]:
+            totals[PARENT_KEY_INTERVAL_SUM] = 0.0
+        self.child_totals[thread_id] = contribution
+
+    def _thread_row_key(self, thread_id):
+        """线程子行的原始显示数值"""
+        status_info = self.last_counters.get(thread_id)
+        if not status_info:
+            # 尚无状态但线程正在运行，显示连接中
+            monitor = self.thread_registry.get(thread_id)
+            status = '连接中...' if monitor is not None and monitor.is_alive() else '未启动'
+            return (thread_id, status, 0.0, 0, 0, 0, 0, 0, 0.0, 0.0, 0, 0.0)
+        received_frames = status_info.get('received_frames', 0)
+        lost_frames = status_info.get('lost_frames', 0)
+        status = status_info.get('status', '未启动')
+        breaker_state = status_info.get('breaker_state', BREAKER_CLOSED)
+        if breaker_state != BREAKER_CLOSED:
+            # 所属主机熔断或正在探测时，在状态后标注
+            status = f"{status} ({BREAKER_STATE_NAMES[breaker_state]})"
+        return (
+            thread_id,
+            status,
+            status_info.get('current_fps', 0.0),
+            received_frames + lost_frames,
+            received_frames,
+            lost_frames,
+            status_info.get('total_bytes', 0),
+            status_info.get('reconnect_count', 0),
+            status_info.get('connect_latency', 0.0),
+            status_info.get('bitrate_mbps', 0.0),
+            status_info.get('gop_length', 0),
+            status_info.get('keyframe_interval_ms', 0.0) / 1000.0,
+        )
+
+    def _url_row_key(self, item_id):
+        """父行的原始显示数值及其格式化函数，由累计值直接得出，与子行数量无关"""
+        url_data = self.url_list_data[item_id]
+        thread_ids = url_data['children']
+        num_threads = len(thread_ids)
+        
+        # 检查是否已停止且有最终数据
+        if item_id in self.final_parent_stats and num_threads == 0:
+            parent_stats = self.final_parent_stats[item_id]
+            return (
+                url_data['id'],
+                url_data['url'].replace('rtsp://', ''),
+                parent_stats['status'],  # 已停止
+                parent_stats['fps'],
+                parent_stats['expected_frames'],
+                parent_stats['received_frames'],
+                parent_stats['lost_frames'],
+                parent_stats['lost_rate'],
+                parent_stats['total_bytes'],
+                parent_stats['reconnects'],
+                parent_stats['latency'],
+                parent_stats['bitrate'],
+                parent_stats['gop']
+            ), tuple
+
+        totals = self.parent_totals.get(item_id, PARENT_TOTALS_ZERO)
+        divisor = max(1, num_threads)
+        avg_reconnects = totals[PARENT_RECONNECTS] / divisor
+        avg_frames = totals[PARENT_FRAMES] / divisor
+        avg_fps = totals[PARENT_FPS_SUM] / totals[PARENT_FPS_COUNT] if totals[PARENT_FPS_COUNT] else 0.0
+        avg_latency = (totals[PARENT_LATENCY_SUM] / totals[PARENT_LATENCY_COUNT]
+                       if totals[PARENT_LATENCY_COUNT] else 0.0)
+        gop_count = totals[PARENT_GOP_COUNT]
+        avg_gop = totals[PARENT_GOP_SUM] / gop_count if gop_count else 0
+        avg_key_interval = totals[PARENT_KEY_INTERVAL_SUM] / gop_count / 1000.0 if gop_count else 0.0
+
+        # 状态判断逻辑
+        if num_threads == 0:
+            status = "未启动"
+        elif avg_frames == 0 and avg_reconnects > 0:
+            status = "重连中..."
+        elif avg_frames == 0 and avg_reconnects == 0:
+            # 检查是否有线程正在运行（可能正在连接）
+            any_thread_alive = any(self.thread_registry[t].is_alive() for t in thread_ids if t in self.thread_registry)
+            status = "连接中..." if any_thread_alive else "未启动"
+        else:
+            status = "运行中"
+
+        return (
+            url_data['id'],
+            url_data['url'],
+            status,
+            avg_fps,
+            totals[PARENT_EXPECTED_FRAMES] / divisor,
+            avg_frames,
+            totals[PARENT_LOST_FRAMES] / divisor,
+            totals[PARENT_BYTES] / divisor,
+            avg_reconnects,
+            avg_latency,
+            totals[PARENT_BITRATE_SUM] / divisor,
+            avg_gop,
+            avg_key_interval,
+        ), self._format_url_row
+
+    def _url_row_values(self, item_id):
+        """父行当前应显示的各列，不依赖该行是否在视口内刷新过"""
+        key, format_row = self._url_row_key(item_id)
+        return format_row(key)
+
+    def update_statuses(self):
+        refresh_start = time.perf_counter()
+
+        # 只取有变化的流：按序列计数比对上一轮快照，父行累计值按差值更新
+        changes, self.metrics_seq = METRICS_TABLE.status_changes(self.metrics_seq)
+        changed_parents = {}
+        for thread_id, status_info in changes.items():
+            item_id = self.thread_parent.get(thread_id)
+            if item_id is None or item_id not in self.parent_totals:
+                continue
+            self.last_counters[thread_id] = status_info
+            self._apply_child_status(item_id, thread_id, status_info)
+            changed_parents.setdefault(item_id, []).append(status_info)
+
+        # Update aggregated data (for reports)，只更新有子行变化的父项
+        for item_id, statuses in changed_parents.items():
+            totals = self.parent_totals[item_id]
+            aggregated = AGGREGATED_DATA[item_id]
+            if aggregated['start_time'] is None:
+                aggregated['start_time'] = time.time()
+            aggregated['total_reconnects'] = totals[PARENT_RECONNECTS]
+            aggregated['total_frames'] = totals[PARENT_FRAMES]
+            aggregated['total_bytes'] = totals[PARENT_BYTES]
+            aggregated['total_expected_frames'] = totals[PARENT_EXPECTED_FRAMES]
+            aggregated['total_lost_frames'] = totals[PARENT_LOST_FRAMES]
+            for status_info in statuses:
+                if status_info.get('current_fps', 0.0) > 0:
+                    aggregated['fps_list'].append(status_info['current_fps'])
+                if status_info.get('connect_latency', 0.0) > 0:
+                    aggregated['latency_list'].append(status_info['connect_latency'])
+
+        # 只有视口内可见且数值有变化的行才格式化并写入 Treeview，
+        # 不可见的行保留上次写入的内容，滚动进入视口后按缓存比对补写
+        dirty_rows = []
+        for iid in self._visible_tree_rows():
+            if iid.startswith("thread_"):
+                thread_id = iid[len("thread_"):]
+                if thread_id not in self.thread_parent:
+                    continue
+                key, format_row = self._thread_row_key(thread_id), self._format_thread_row
+            elif iid in self.url_list_data:
+                key, format_row = self._url_row_key(iid)
+            else:
+                continue
+            if self.rendered_rows.get(iid) != key:
+                dirty_rows.append((iid, key, format_row))
+
+        # 按预算写入待刷新的行：上一轮顺延的行按顺位排在前面，其余保持视口顺序排在后面，
+        # 每轮都从上次停下的位置继续，所有可见行轮流写到；预算只计写入本身，不含前面的汇总
+        carried = self.carried_rows
+        dirty_rows.sort(key=lambda row: carried.get(row[0], len(carried)))
+        deadline = time.perf_counter() + SETTINGS.gui_refresh_budget_ms / 1000.0
+        written = 0
+        for iid, key, format_row in dirty_rows:
+            self.tree.item(iid, values=format_row(key))
+            self.rendered_rows[iid] = key
+            written += 1
+            if time.perf_counter() > deadline:
+                break
+        self.carried_rows = {row[0]: rank for rank, row in enumerate(dirty_rows[written:])}
                 
         # Update system info
         if SYSTEM_MONITOR_ID in STATUS_QUEUES:
@@ -2490,38 +2075,76 @@ class StressTestFrame(ttk.Frame):
         self.mem_label['text'] = f"内存: {self.last_sys_info['mem_percent']:.1f}%"
         self.net_label['text'] = f"网络: ↓{self.last_sys_info['net_recv_mbps']:.1f}Mbps"
 
-        # 动态调整更新间隔，多线程时降低更新频率
-        active_thread_count = total_monitor_threads
-        if active_thread_count > 10:
-            update_interval = SETTINGS.gui_refresh_interval * 2  # 多线程时降低频率
-        elif active_thread_count > 5:
-            update_interval = int(SETTINGS.gui_refresh_interval * 1.5)
-        else:
-            update_interval = SETTINGS.gui_refresh_interval
+        # 按实测的刷新耗时调整间隔，刷新占用界面线程的时间不超过约五分之一
+        refresh_ms = (time.perf_counter() - refresh_start) * 1000
+        self.refresh_cost_ms = refresh_ms if not self.refresh_cost_ms else self.refresh_cost_ms * 0.8 + refresh_ms * 0.2
+        update_interval = max(SETTINGS.gui_refresh_interval, int(self.refresh_cost_ms * 5))
         
-        # 检查是否所有线程都已停止 - 只有在明确停止且有最终数据时才停止更新
-        if not has_active_threads and hasattr(self, 'final_stats') and self.final_stats and not self.monitor_threads:
-            # 如果已停止且有最终统计数据，使用最终数据显示
+        # 已停止且有最终统计数据时，使用最终数据显示并停止更新
+        if self.final_stats and not self.monitor_threads:
             self.update_final_display()
             return
 
         self.after(update_interval, self.update_statuses)
 
     def update_logs(self):
-        while LOG_QUEUE:
-            level, message = LOG_QUEUE.popleft()
-            self.log_text.configure(state='normal')
-            if level == logging.ERROR:
-                self.log_text.tag_config('error', foreground='red')
-                self.log_text.insert(tk.END, message + "\n", 'error')
+        # 只取本轮开始时已在队列中的日志，避免日志持续涌入时无法返回
+        entries = [LOG_QUEUE.popleft() for _ in range(len(LOG_QUEUE))]
+        dropped = LOG_QUEUE.take_dropped()
+        if dropped:
+            # 被丢弃的是队列中最旧的日志，提示放在本批最前面
+            log_time = datetime.datetime.now().strftime("%H:%M:%S")
+            entries.insert(0, (logging.WARNING, f"[{log_time}] - [System] - [WARNING] - 日志过多，已丢弃 {dropped} 条"))
+        if entries:
+            self.append_log_entries(entries)
+        self.after(SETTINGS.gui_refresh_interval, self.update_logs)
+
+    def append_log_entries(self, entries):
+        """合并连续重复的日志后一次性写入日志框，超出保留行数时成批删除最旧的行"""
+        max_lines = max(1, SETTINGS.log_max_lines)
+        lines = []
+        replace_last = False
+        for level, message in entries:
+            # 去掉时间前缀后比较，重复的日志只保留最后一条的时间并标注次数
+            key = (level, message.split(' - ', 1)[-1])
+            if lines and lines[-1][2] == key:
+                lines[-1][1] = message
+                lines[-1][3] += 1
+            elif not lines and self.last_log_line and self.last_log_line[2] == key:
+                lines.append([level, message, key, self.last_log_line[3] + 1])
+                replace_last = True
+            else:
+                lines.append([level, message, key, 1])
+
+        text = self.log_text
+        text.configure(state='normal')
+        if len(lines) >= max_lines:
+            # 本批已超过保留行数，旧内容全部丢弃
+            lines = lines[-max_lines:]
+            text.delete('1.0', tk.END)
+        elif replace_last:
+            text.delete('end-2l linestart', 'end-1c')
+
+        chunks = []
+        for level, message, key, count in lines:
+            if count > 1:
+                message = f"{message} (×{count})"
+            if level >= logging.ERROR:
+                tags = ('error',)
             elif level == logging.WARNING:
-                self.log_text.tag_config('warning', foreground='orange')
-                self.log_text.insert(tk.END, message + "\n", 'warning')
+                tags = ('warning',)
             else:
-                self.log_text.insert(tk.END, message + "\n")
-            self.log_text.see(tk.END)
-            self.log_text.configure(state='disabled')
-        self.after(SETTINGS.gui_refresh_interval, self.update_logs)
+                tags = ()
+            chunks.extend((message + "\n", tags))
+        text.insert(tk.END, *chunks)
+
+        # 超出保留行数一成以上时才删除，避免每轮都删
+        line_count = int(text.index('end-1c').split('.')[0]) - 1
+        if line_count > max_lines + max_lines // 10:
+            text.delete('1.0', f"{line_count - max_lines + 1}.0")
+        text.see(tk.END)
+        text.configure(state='disabled')
+        self.last_log_line = lines[-1]
 
 if __name__ == '__main__':
     root = tk.Tk()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+会话加压方式
+
+核心思路：
+- 启动监控时按加压方式为每路会话计算启动时刻，会话在自己的线程/协程内等待到点后再连接，
+  各引擎（含多进程工作进程）行为一致，不再一次性同时发起全部连接。
+- 立即：全部会话同时启动（原方式）；线性：每秒启动 ramp_rate 路；
+  阶梯：每隔 ramp_step_interval 秒增加 ramp_step_size 路；
+  尖峰：先启动 ramp_step_size 路作为基线，ramp_step_interval 秒后其余会话同时启动。
+- 每路会话记录其启动时所处的阶段，报表按阶段汇总丢帧率、连接延迟和重连，
+  对比各阶段即可看出媒体服务器从哪一级负载开始劣化。
+"""
+
+LOAD_PROFILES = ("立即", "线性", "阶梯", "尖峰")
+
+
+def build_load_schedule(count, profile, rate, step_size, step_interval):
+    """返回 (每路会话的 (启动偏移秒, 阶段号) 列表, 阶段列表)
+
+    阶段列表每项包含 index/name/offset/count/total，total 为该阶段结束时已启动的会话数。
+    线性加压按 step_interval 划分报告阶段。
+    """
+    rate = max(float(rate), 0.001)
+    step_size = max(int(step_size), 1)
+    step_interval = max(float(step_interval), 0.0)
+
+    if profile == "线性":
+        offsets = [k / rate for k in range(count)]
+        if step_interval > 0:
+            slots = [int(offset // step_interval) for offset in offsets]
+        else:
+            slots = [0] * count
+    elif profile == "阶梯":
+        slots = [k // step_size for k in range(count)]
+        offsets = [slot * step_interval for slot in slots]
+    elif profile == "尖峰":
+        slots = [0 if k < step_size else 1 for k in range(count)]
+        offsets = [slot * step_interval for slot in slots]
+    else:
+        slots = [0] * count
+        offsets = [0.0] * count
+
+    # 按出现顺序把时间槽重新编号为连续的阶段号（线性加压速率很低时可能跳过空槽）
+    phase_of_slot = {}
+    phases = []
+    schedule = []
+    for offset, slot in zip(offsets, slots):
+        phase = phase_of_slot.get(slot)
+        if phase is None:
+            phase = len(phases)
+            phase_of_slot[slot] = phase
+            phases.append({'index': phase, 'name': '', 'offset': offset, 'count': 0, 'total': 0})
+        phases[phase]['count'] += 1
+        schedule.append((offset, phase))
+
+    total = 0
+    for phase in phases:
+        total += phase['count']
+        phase['total'] = total
+        if profile == "尖峰":
+            phase['name'] = "基线" if phase['index'] == 0 else "尖峰"
+        elif profile in ("线性", "阶梯"):
+            phase['name'] = f"第{phase['index'] + 1}阶段"
+        else:
+            phase['name'] = "全部"
+    return schedule, phases
+
+
+def summarize_phases(phases, thread_phase, statuses):
+    """按会话启动阶段汇总最终统计
+
+    thread_phase 为 thread_id -> 阶段号；statuses 为 thread_id -> 状态字典（指标表 status_dicts 的格式）。
+    连接延迟只统计已成功连接过的会话。
+    """
+    grouped = [[] for _ in phases]
+    for thread_id, phase in thread_phase.items():
+        status_info = statuses.get(thread_id)
+        if status_info is not None:
+            grouped[phase].append(status_info)
+
+    rows = []
+    for phase, members in zip(phases, grouped):
+        latencies = [s.get('connect_latency', 0.0) for s in members if s.get('total_frames', 0) > 0]
+        expected = 0
+        lost = 0
+        for s in members:
+            stream_expected = s.get('expected_frames', 0) or s.get('received_frames', 0) + s.get('lost_frames', 0)
+            expected += stream_expected
+            lost += s.get('lost_frames', 0)
+        rows.append({
+            'phase': phase['name'],
+            'offset': phase['offset'],
+            'sessions': phase['count'],
+            'total_sessions': phase['total'],
+            'connected': len(latencies),
+            'lost_rate': lost / expected * 100 if expected else 0.0,
+            'avg_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+            'max_latency': max(latencies, default=0.0),
+            'reconnects': sum(s.get('reconnect_count', 0) for s in members),
+        })
+    return rows
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+OpenMetrics/Prometheus 指标端点
+
+核心思路：
+- 内置 http.server 在独立守护线程中提供 /metrics，GUI 主循环与会话线程都不参与。
+- 数据直接取自指标表快照（序列锁读取，会话不加锁、不感知抓取），系统指标取自 SystemMonitor 的最新采样，
+  不解析 Treeview 上的字符串。
+- 渲染结果按 cache_ttl 缓存，多个抓取方或高频抓取共用一次渲染；每路流的样本前缀按行号缓存复用，
+  每次渲染只格式化数值；客户端支持时返回 gzip 压缩的结果。
+- 默认输出 Prometheus 文本格式 0.0.4，请求头 Accept 含 application/openmetrics-text 时输出 OpenMetrics 1.0。
+"""
+
+import gzip
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from metrics_table import STATUS_CODES, STATUS_NAMES
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# 每路流指标：(指标名, 类型, 指标表字段, 换算系数, 说明)
+STREAM_METRICS = (
+    ('rtsp_stream_frames', 'counter', 'total_frames', None, "已接收帧数"),
+    ('rtsp_stream_bytes', 'counter', 'total_bytes', None, "已接收字节数"),
+    ('rtsp_stream_reconnects', 'counter', 'reconnect_count', None, "重连次数"),
+    ('rtsp_stream_pts_lost_frames', 'counter', 'pts_frame_loss', None, "按PTS检测的丢帧数"),
+    ('rtsp_stream_lost_frames', 'gauge', 'lost_frames', None, "当前估算的丢失帧数"),
+    ('rtsp_stream_expected_frames', 'gauge', 'expected_frames', None, "当前理论帧数"),
+    ('rtsp_stream_fps', 'gauge', 'current_fps', None, "当前帧率"),
+    ('rtsp_stream_connect_latency_seconds', 'gauge', 'connect_latency', None, "最近一次连接耗时，秒"),
+    ('rtsp_stream_rtp_jitter_seconds', 'gauge', 'rtp_jitter_ms', 0.001, "RTP到达抖动（RTP直连引擎），秒"),
+    ('rtsp_stream_breaker_state', 'gauge', 'breaker_state', None, "所属主机熔断状态（0 正常，1 熔断，2 探测）"),
+    ('rtsp_stream_retry_delay_seconds', 'gauge', 'retry_delay', None, "最近一次断线后的重连等待，秒"),
+    ('rtsp_stream_decoded_frames', 'counter', 'decoded_frames', None, "已解码帧数（解码压测）"),
+    ('rtsp_stream_decode_dropped_frames', 'counter', 'decode_dropped', None, "解码跟不上或解码失败丢弃的帧数（解码压测）"),
+    ('rtsp_stream_decode_queue_depth', 'gauge', 'decode_queue_depth', None, "待解码包队列深度（解码压测）"),
+    ('rtsp_stream_decode_seconds', 'counter', 'decode_seconds', None, "累计解码耗时，秒（解码压测）"),
+    ('rtsp_stream_bitrate_bits', 'gauge', 'bitrate_mbps', 1e6, "滑动窗口码率，bit/s"),
+    ('rtsp_stream_peak_bitrate_bits', 'gauge', 'peak_bitrate_mbps', 1e6, "按秒统计的峰值码率，bit/s"),
+    ('rtsp_stream_gop_frames', 'gauge', 'gop_length', None, "最近一个GOP的帧数"),
+    ('rtsp_stream_keyframe_interval_seconds', 'gauge', 'keyframe_interval_ms', 0.001, "平均关键帧间隔，秒"),
+    ('rtsp_stream_keyframe_interval_jitter_seconds', 'gauge', 'keyframe_jitter_ms', 0.001, "关键帧间隔标准差，秒"),
+    ('rtsp_stream_i_frames', 'counter', 'i_frames', None, "I帧数（码流解析）"),
+    ('rtsp_stream_p_frames', 'counter', 'p_frames', None, "P帧数（码流解析）"),
+    ('rtsp_stream_b_frames', 'counter', 'b_frames', None, "B帧数（码流解析）"),
+    ('rtsp_stream_idr_frames', 'counter', 'idr_frames', None, "IDR帧数（码流解析）"),
+    ('rtsp_stream_missing_reference_frames', 'counter', 'missing_refs', None, "缺少参考帧的帧数（码流解析）"),
+    ('rtsp_stream_fast_probe_connects', 'counter', 'probe_fast_connects', None, "命中流参数缓存、快速探测的连接次数"),
+    ('rtsp_stream_full_probe_connects', 'counter', 'probe_full_connects', None, "完整探测的连接次数"),
+    ('rtsp_stream_probe_fallbacks', 'counter', 'probe_fallbacks', None, "快速探测参数与缓存不一致、回退完整探测的次数"),
+    ('rtsp_stream_probe_saved_seconds', 'gauge', 'probe_saved_seconds', None, "快速探测相对完整探测累计节省的连接耗时，秒"),
+    ('rtsp_stream_connect_dns_seconds', 'gauge', 'phase_dns_ms', 0.001, "最近一次连接的DNS解析耗时，秒"),
+    ('rtsp_stream_connect_tcp_seconds', 'gauge', 'phase_tcp_ms', 0.001, "最近一次连接的TCP建连耗时，秒"),
+    ('rtsp_stream_connect_handshake_seconds', 'gauge', 'phase_handshake_ms', 0.001, "最近一次连接的RTSP握手耗时（RTP直连），秒"),
+    ('rtsp_stream_connect_probe_seconds', 'gauge', 'phase_probe_ms', 0.001, "最近一次连接的打开与流探测耗时（libav），秒"),
+    ('rtsp_stream_connect_first_packet_seconds', 'gauge', 'phase_first_packet_ms', 0.001, "流打开后到首包的耗时，秒"),
+    ('rtsp_stream_connect_first_keyframe_seconds', 'gauge', 'phase_first_keyframe_ms', 0.001, "首包后到首个关键帧的耗时，秒"),
+    ('rtsp_stream_backoff_seconds', 'counter', 'backoff_seconds', None, "重试退避累计等待，秒"),
+    ('rtsp_stream_dns_cache_hits', 'counter', 'dns_hits', None, "DNS缓存命中次数"),
+    ('rtsp_stream_dns_cache_misses', 'counter', 'dns_misses', None, "DNS缓存未命中、实际解析的次数"),
+    ('rtsp_stream_dns_resolve_seconds', 'counter', 'dns_resolve_seconds', None, "实际解析累计耗时，秒"),
+)
+
+# 汇总指标：(指标名, 类型, 指标表字段, 说明)
+TOTAL_METRICS = (
+    ('rtsp_frames', 'counter', 'total_frames', "全部流已接收帧数"),
+    ('rtsp_bytes', 'counter', 'total_bytes', "全部流已接收字节数"),
+    ('rtsp_reconnects', 'counter', 'reconnect_count', "全部流重连次数"),
+    ('rtsp_lost_frames', 'gauge', 'lost_frames', "全部流估算的丢失帧数"),
+    ('rtsp_fps', 'gauge', 'current_fps', "全部流帧率之和"),
+)
+
+# 系统指标：(指标名, system_info 键, 说明)
+SYSTEM_METRICS = (
+    ('rtsp_system_cpu_percent', 'cpu_percent', "压测机CPU使用率，百分比"),
+    ('rtsp_system_memory_percent', 'mem_percent', "压测机内存使用率，百分比"),
+    ('rtsp_system_net_recv_mbps', 'net_recv_mbps', "压测机网络下载速率，Mbps"),
+)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsExporter:
+    """在后台线程提供 /metrics 的指标端点
+
+    table 为指标表；system_info 为 SystemMonitor 持续更新的最新采样字典；
+    names 为 thread_id -> 显示名称的映射（可选，作为 name 标签）。
+    cache_ttl 内最多渲染一次，5000 路流单次渲染约 30ms，与抓取方数量无关。
+    """
+    def __init__(self, table, host="127.0.0.1", port=9108, system_info=None, names=None, cache_ttl=1.0):
+        self.table = table
+        self.host = host
+        self.port = port
+        self.system_info = system_info if system_info is not None else {}
+        self.names = names if names is not None else {}
+        self.cache_ttl = cache_ttl
+        self.server = None
+        self.thread = None
+        self.renders = 0
+        self._render_lock = threading.Lock()
+        self._cache = {}
+        self._label_ids = []
+        # 样本名 -> 每路流 "样本名{标签} " 前缀，流列表变化时清空
+        self._prefixes = {}
+
+    @property
+    def url(self):
+        if self.server is None:
+            return None
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        exporter = self
+
+        class Handler(MetricsRequestHandler):
+            pass
+        Handler.exporter = exporter
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsHTTP", daemon=True)
+        self.thread.start()
+        logging.info(f"指标端点已启动: {self.url}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    # ----- 渲染 -----
+    def render(self, openmetrics=False, compressed=False):
+        """返回编码后的指标文本（compressed 时为 gzip），cache_ttl 内重复请求直接复用"""
+        with self._render_lock:
+            now = time.monotonic()
+            key = (openmetrics, compressed)
+            cached = self._cache.get(key)
+            if cached is not None and now - cached[0] < self.cache_ttl:
+                return cached[1]
+            plain = self._cache.get((openmetrics, False))
+            if plain is None or now - plain[0] >= self.cache_ttl:
+                plain = (now, self._render(openmetrics).encode('utf-8'))
+                self._cache[(openmetrics, False)] = plain
+                self.renders += 1
+            body = plain[1]
+            if compressed:
+                # zlib 压缩时释放 GIL，5000 路约 3MB 文本压缩后不足十分之一
+                body = gzip.compress(body, compresslevel=1)
+                self._cache[key] = (plain[0], body)
+            return body
+
+    def _stream_prefixes(self, sample, thread_ids):
+        """按行号缓存每路流的样本前缀，只包含已分配给流的行"""
+        if thread_ids != self._label_ids:
+            self._label_ids = list(thread_ids)
+            self._prefixes = {}
+        prefixes = self._prefixes.get(sample)
+        if prefixes is None:
+            prefixes = [f'{sample}{{stream="{_escape(t)}",name="{_escape(self.names.get(t, t))}"}} '
+                        for t in thread_ids if t is not None]
+            self._prefixes[sample] = prefixes
+        return prefixes
+
+    def _render(self, openmetrics):
+        data = self.table.snapshot()
+        thread_ids = self.table.thread_ids[:len(data)]
+        # 只输出已分配给流的行（工作进程挂载的共享表中可能有空行）
+        if None in thread_ids:
+            data = data[[i for i, thread_id in enumerate(thread_ids) if thread_id is not None]]
+
+        lines = []
+
+        def family(name, kind, help_text):
+            """写出 HELP/TYPE，返回样本名；OpenMetrics 的计数器族名不带 _total，Prometheus 文本格式带"""
+            sample = f"{name}_total" if kind == 'counter' else name
+            header = name if openmetrics else sample
+            lines.append(f"# HELP {header} {help_text}")
+            lines.append(f"# TYPE {header} {kind}")
+            return sample
+
+        for name, kind, field, scale, help_text in STREAM_METRICS:
+            sample = family(name, kind, help_text)
+            values = data[field] * scale if scale else data[field]
+            prefixes = self._stream_prefixes(sample, thread_ids)
+            lines.extend([prefix + str(value) for prefix, value in zip(prefixes, values.tolist())])
+
+        sample = family('rtsp_stream_up', 'gauge', "会话是否处于运行中（1 运行中，0 其他状态）")
+        running = (data['status'] == STATUS_CODES['运行中']).astype(np.int8).tolist()
+        prefixes = self._stream_prefixes(sample, thread_ids)
+        lines.extend([prefix + str(value) for prefix, value in zip(prefixes, running)])
+
+        for name, kind, field, help_text in TOTAL_METRICS:
+            sample = family(name, kind, help_text)
+            lines.append(f"{sample} {data[field].sum().item()}")
+
+        sample = family('rtsp_streams', 'gauge', "各状态的会话数量")
+        counts = np.bincount(data['status'], minlength=len(STATUS_NAMES)) if len(data) else [0] * len(STATUS_NAMES)
+        for code, status_name in enumerate(STATUS_NAMES):
+            lines.append(f'{sample}{{state="{status_name}"}} {int(counts[code])}')
+
+        system_info = dict(self.system_info)
+        for name, key, help_text in SYSTEM_METRICS:
+            if key in system_info:
+                sample = family(name, 'gauge', help_text)
+                lines.append(f"{sample} {float(system_info[key])}")
+
+        sample = family('rtsp_exporter_renders', 'counter', "指标端点渲染次数（缓存命中不计）")
+        lines.append(f"{sample} {self.renders + 1}")
+
+        if openmetrics:
+            lines.append("# EOF")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """/metrics 返回指标文本，其余路径返回简单说明"""
+    exporter = None
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+            compressed = 'gzip' in self.headers.get('Accept-Encoding', '')
+            try:
+                body = self.exporter.render(openmetrics, compressed)
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+            content_type = OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+        elif path == '/':
+            body = "RTSP 压测指标端点，见 /metrics\n".encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+            compressed = False
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求不写入日志，避免刷屏
+        pass
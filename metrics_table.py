@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+"""
+定长共享指标表
+
+核心思路：
+- 每路流占用一行固定布局的 8 字节槽位（整数用 int64，浮点用 float64），会话直接原地改写自己的行，
+  不再为每个包构造状态字典并经过队列推送。
+- 每行首个槽位是序列锁计数：写入前加 1（奇数表示写入中），写完再加 1；读取方整表复制后比对前后计数，
+  只对被撕裂的行单独重读，无需加锁，读取代价为 O(流数量)。
+- 进程内使用普通内存，按段扩容，已分配的行地址不变；多进程引擎使用 multiprocessing.shared_memory，
+  工作进程按行号挂载同一张表，GUI 进程直接读取，不再经由管道回传状态。
+- 每行只有一个写入方（所属会话），读取方可以是 GUI、报表、导出等任意多个。
+- 每路流的延迟直方图（见 histograms）存放在与行号对应的独立缓冲区中，不参与快照复制，报表导出时才读取；
+  连接阶段的直方图每行约多占 18 KB，只在 reset(phase_histograms=True) 时分配。
+"""
+
+import atexit
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from histograms import BASE_HIST_KINDS, HIST_BUCKETS, HIST_KINDS
+
+# (字段名, 类型)，'q' 为 int64，'d' 为 float64；新增字段追加在末尾
+FIELDS = (
+    ('seq', 'q'),
+    ('status', 'q'),
+    ('total_frames', 'q'),
+    ('received_frames', 'q'),
+    ('total_bytes', 'q'),
+    ('reconnect_count', 'q'),
+    ('expected_frames', 'q'),
+    ('lost_frames', 'q'),
+    ('pts_frame_loss', 'q'),
+    ('packets_lost_count', 'q'),
+    ('rtp_expected_packets', 'q'),
+    ('rtp_lost_packets', 'q'),
+    ('rtp_reordered', 'q'),
+    ('rtp_duplicates', 'q'),
+    ('connect_latency', 'd'),
+    ('current_fps', 'd'),
+    ('real_fps', 'd'),
+    ('rtp_jitter_ms', 'd'),
+    ('updated_at', 'd'),
+    ('breaker_state', 'q'),
+    ('retry_delay', 'd'),
+    ('decoded_frames', 'q'),
+    ('decode_dropped', 'q'),
+    ('decode_queue_depth', 'q'),
+    ('decode_seconds', 'd'),
+    ('decode_cpu_seconds', 'd'),
+    ('decoded_mpixels', 'd'),
+    ('decode_max_ms', 'd'),
+    ('bitrate_mbps', 'd'),
+    ('peak_bitrate_mbps', 'd'),
+    ('gop_length', 'q'),
+    ('max_gop_length', 'q'),
+    ('keyframes', 'q'),
+    ('keyframe_interval_ms', 'd'),
+    ('keyframe_jitter_ms', 'd'),
+    ('keyframe_max_interval_ms', 'd'),
+    ('keyframe_size_ratio', 'd'),
+    ('i_frames', 'q'),
+    ('p_frames', 'q'),
+    ('b_frames', 'q'),
+    ('idr_frames', 'q'),
+    ('missing_refs', 'q'),
+    ('probe_fast_connects', 'q'),
+    ('probe_full_connects', 'q'),
+    ('probe_fallbacks', 'q'),
+    ('probe_fast_seconds', 'd'),
+    ('probe_full_seconds', 'd'),
+    ('probe_saved_seconds', 'd'),
+    ('phase_dns_ms', 'd'),
+    ('phase_tcp_ms', 'd'),
+    ('phase_handshake_ms', 'd'),
+    ('phase_probe_ms', 'd'),
+    ('phase_first_packet_ms', 'd'),
+    ('phase_first_keyframe_ms', 'd'),
+    ('backoff_seconds', 'd'),
+    ('dns_hits', 'q'),
+    ('dns_misses', 'q'),
+    ('dns_resolve_seconds', 'd'),
+)
+SLOT = {name: i for i, (name, _) in enumerate(FIELDS)}
+# 状态字典包含的字段（不含 seq）
+FIELD_NAMES = tuple(name for name, _ in FIELDS[1:])
+FLOAT_FIELDS = frozenset(name for name, kind in FIELDS if kind == 'd')
+ROW_SLOTS = len(FIELDS)
+DECODE_SLOT = SLOT['decoded_frames']
+GOP_SLOT = SLOT['bitrate_mbps']
+SLICE_SLOT = SLOT['i_frames']
+PROBE_SLOT = SLOT['probe_fast_connects']
+PHASE_SLOT = SLOT['phase_dns_ms']
+DNS_SLOT = SLOT['dns_hits']
+ROW_DTYPE = np.dtype([(name, '<i8' if kind == 'q' else '<f8') for name, kind in FIELDS])
+
+# 状态编码，0 表示该行尚未写入
+STATUS_NAMES = ('未启动', '连接中...', '运行中', '重连中', '已停止')
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+STATUS_RUNNING = STATUS_CODES['运行中']
+
+SEGMENT_ROWS = 256
+TORN_RETRIES = 100
+
+
+class MetricsRow:
+    """单路流的写入句柄，只能由所属会话使用"""
+    __slots__ = ('index', '_q', '_d', '_base', 'hist')
+
+    def __init__(self, index, q_view, d_view, base, hist):
+        self.index = index
+        self._q = q_view
+        self._d = d_view
+        self._base = base
+        # 本路流的直方图，会话用 histograms.record/record_many 直接累加
+        self.hist = hist
+
+    def write_running(self, total_frames, received_frames, total_bytes, reconnect_count, connect_latency,
+                      current_fps, expected_frames, lost_frames, real_fps, pts_frame_loss):
+        """统计阶段按 stats_interval_ms 周期调用：原地写入运行中状态"""
+        q = self._q
+        d = self._d
+        b = self._base
+        q[b] += 1
+        q[b + 1] = STATUS_RUNNING
+        q[b + 2] = total_frames
+        q[b + 3] = received_frames
+        q[b + 4] = total_bytes
+        q[b + 5] = reconnect_count
+        q[b + 6] = expected_frames
+        q[b + 7] = lost_frames
+        q[b + 8] = pts_frame_loss
+        d[b + 14] = connect_latency
+        d[b + 15] = current_fps
+        d[b + 16] = real_fps
+        d[b + 18] = time.time()
+        q[b] += 1
+
+    def write_decode(self, frames, dropped, queue_depth, decode_seconds, cpu_seconds, mpixels, max_ms):
+        """解码压测统计，按 FIELDS 中 decoded_frames 起的连续槽位写入"""
+        q = self._q
+        d = self._d
+        b = self._base + DECODE_SLOT
+        q[self._base] += 1
+        q[b] = frames
+        q[b + 1] = dropped
+        q[b + 2] = queue_depth
+        d[b + 3] = decode_seconds
+        d[b + 4] = cpu_seconds
+        d[b + 5] = mpixels
+        d[b + 6] = max_ms
+        q[self._base] += 1
+
+    def write_gop(self, bitrate, peak_bitrate, gop_length, max_gop_length, keyframes, interval_ms, jitter_ms,
+                  max_interval_ms, size_ratio):
+        """码率与 GOP 统计，按 FIELDS 中 bitrate_mbps 起的连续槽位写入"""
+        q = self._q
+        d = self._d
+        b = self._base + GOP_SLOT
+        q[self._base] += 1
+        d[b] = bitrate
+        d[b + 1] = peak_bitrate
+        q[b + 2] = gop_length
+        q[b + 3] = max_gop_length
+        q[b + 4] = keyframes
+        d[b + 5] = interval_ms
+        d[b + 6] = jitter_ms
+        d[b + 7] = max_interval_ms
+        d[b + 8] = size_ratio
+        q[self._base] += 1
+
+    def write_slices(self, i_frames, p_frames, b_frames, idr_frames, missing_refs):
+        """帧类型统计，按 FIELDS 中 i_frames 起的连续槽位写入"""
+        q = self._q
+        b = self._base + SLICE_SLOT
+        q[self._base] += 1
+        q[b] = i_frames
+        q[b + 1] = p_frames
+        q[b + 2] = b_frames
+        q[b + 3] = idr_frames
+        q[b + 4] = missing_refs
+        q[self._base] += 1
+
+    def write_probe(self, fast_connects, full_connects, fallbacks, fast_seconds, full_seconds, saved_seconds):
+        """流参数缓存的连接统计，按 FIELDS 中 probe_fast_connects 起的连续槽位写入"""
+        q = self._q
+        d = self._d
+        b = self._base + PROBE_SLOT
+        q[self._base] += 1
+        q[b] = fast_connects
+        q[b + 1] = full_connects
+        q[b + 2] = fallbacks
+        d[b + 3] = fast_seconds
+        d[b + 4] = full_seconds
+        d[b + 5] = saved_seconds
+        q[self._base] += 1
+
+    def write_phases(self, durations_ms, backoff_seconds):
+        """连接阶段耗时（connect_phases.PHASE_FIELDS 顺序）与累计退避，按 FIELDS 中 phase_dns_ms 起的连续槽位写入"""
+        d = self._d
+        b = self._base + PHASE_SLOT
+        self._q[self._base] += 1
+        for i, value in enumerate(durations_ms):
+            d[b + i] = value
+        d[b + len(durations_ms)] = backoff_seconds
+        self._q[self._base] += 1
+
+    def write_dns(self, hits, misses, resolve_seconds):
+        """DNS 缓存命中统计，按 FIELDS 中 dns_hits 起的连续槽位写入"""
+        q = self._q
+        b = self._base + DNS_SLOT
+        q[self._base] += 1
+        q[b] = hits
+        q[b + 1] = misses
+        self._d[b + 2] = resolve_seconds
+        q[self._base] += 1
+
+    def write(self, status_info):
+        """按状态字典写入，未出现的字段保持原值，用于状态切换等低频场景"""
+        q = self._q
+        d = self._d
+        b = self._base
+        q[b] += 1
+        for name, value in status_info.items():
+            slot = SLOT.get(name)
+            if slot is None or slot == 0:
+                continue
+            if name == 'status':
+                q[b + 1] = STATUS_CODES.get(value, 0)
+            elif name in FLOAT_FIELDS:
+                d[b + slot] = float(value or 0.0)
+            else:
+                q[b + slot] = int(value or 0)
+        d[b + SLOT['updated_at']] = time.time()
+        q[b] += 1
+
+    def clear(self):
+        q = self._q
+        b = self._base
+        q[b] += 1
+        for slot in range(1, ROW_SLOTS):
+            q[b + slot] = 0
+        q[b] += 1
+        self.hist[...] = 0
+
+
+def hist_row_bytes(kinds):
+    """每路流的直方图：(类型, 桶) 的 int64 计数"""
+    return kinds * HIST_BUCKETS * 8
+
+
+class _Segment:
+    """一段连续的行存储及对应的直方图存储"""
+    def __init__(self, buf, hist_buf, start, rows, kinds):
+        self.start = start
+        self.rows = rows
+        self.raw = memoryview(buf).cast('B')
+        self.q = self.raw.cast('q')
+        self.d = self.raw.cast('d')
+        self.array = np.frombuffer(buf, dtype=ROW_DTYPE, count=rows)
+        self.hist = np.frombuffer(hist_buf, dtype=np.int64, count=rows * kinds * HIST_BUCKETS).reshape(
+            (rows, kinds, HIST_BUCKETS))
+
+    @classmethod
+    def allocate(cls, start, rows, kinds):
+        return cls(bytearray(rows * ROW_DTYPE.itemsize), bytearray(rows * hist_row_bytes(kinds)), start, rows, kinds)
+
+    def release(self):
+        self.array = None
+        self.hist = None
+        for view in (self.q, self.d, self.raw):
+            view.release()
+
+
+class MetricsTable:
+    """按 thread_id 分配行的指标表，读取方通过 snapshot()/status_dicts() 获取一致快照"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._segments = []
+        self._shm = None
+        self._hist_shm = None
+        # 创建共享内存的进程号，fork 出的工作进程继承本对象时不能删除共享内存
+        self._owner_pid = None
+        self.thread_ids = []
+        self.rows = {}
+        # 每路流的直方图类型数：不含连接阶段时只有前 BASE_HIST_KINDS 种
+        self.hist_kinds = BASE_HIST_KINDS
+
+    # ----- 分配 -----
+    def reset(self, capacity=0, shared=False, phase_histograms=False):
+        """清空并重新分配，shared=True 时使用共享内存（容量固定），phase_histograms=True 时另分配连接阶段直方图"""
+        with self._lock:
+            self._release()
+            self.hist_kinds = len(HIST_KINDS) if phase_histograms else BASE_HIST_KINDS
+            if shared:
+                rows = max(1, capacity)
+                size = rows * ROW_DTYPE.itemsize
+                hist_size = rows * hist_row_bytes(self.hist_kinds)
+                self._shm = shared_memory.SharedMemory(create=True, size=size)
+                self._hist_shm = shared_memory.SharedMemory(create=True, size=hist_size)
+                self._owner_pid = os.getpid()
+                self._shm.buf[:size] = bytes(size)
+                self._hist_shm.buf[:hist_size] = bytes(hist_size)
+                self._segments.append(_Segment(self._shm.buf, self._hist_shm.buf, 0, rows, self.hist_kinds))
+            elif capacity > 0:
+                self._segments.append(_Segment.allocate(0, capacity, self.hist_kinds))
+
+    def attach_shared(self, name, capacity, thread_rows, hist_name, hist_kinds):
+        """工作进程挂载 GUI/监督进程创建的共享表，thread_rows 为 {thread_id: 行号}，hist_name 为直方图共享内存名"""
+        with self._lock:
+            self._release()
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._hist_shm = shared_memory.SharedMemory(name=hist_name)
+            self._owner_pid = None
+            self.hist_kinds = hist_kinds
+            self._segments.append(_Segment(self._shm.buf, self._hist_shm.buf, 0, capacity, hist_kinds))
+            self.thread_ids = [None] * capacity
+            for thread_id, index in thread_rows.items():
+                self.thread_ids[index] = thread_id
+                self.rows[thread_id] = index
+
+    @property
+    def shared_name(self):
+        return self._shm.name if self._shm is not None else None
+
+    @property
+    def histogram_shared_name(self):
+        return self._hist_shm.name if self._hist_shm is not None else None
+
+    @property
+    def capacity(self):
+        return sum(segment.rows for segment in self._segments)
+
+    def register(self, thread_id):
+        """为一路流分配（或取回已分配的）行，返回写入句柄"""
+        with self._lock:
+            index = self.rows.get(thread_id)
+            fresh = index is None
+            if fresh:
+                index = len(self.thread_ids)
+                if index >= self.capacity:
+                    if self._shm is not None:
+                        raise RuntimeError("共享指标表容量不足")
+                    rows = max(SEGMENT_ROWS, self.capacity)
+                    self._segments.append(_Segment.allocate(self.capacity, rows, self.hist_kinds))
+                self.thread_ids.append(thread_id)
+                self.rows[thread_id] = index
+            row = self._row_handle(index)
+        if fresh:
+            row.clear()
+        return row
+
+    def _row_handle(self, index):
+        for segment in self._segments:
+            if segment.start <= index < segment.start + segment.rows:
+                return MetricsRow(index, segment.q, segment.d, (index - segment.start) * ROW_SLOTS,
+                                  segment.hist[index - segment.start])
+        raise IndexError(index)
+
+    def _release(self):
+        segments = self._segments
+        self._segments = []
+        self.thread_ids = []
+        self.rows = {}
+        if self._shm is not None:
+            shared = (self._shm, self._hist_shm)
+            self._shm = None
+            self._hist_shm = None
+            for segment in segments:
+                try:
+                    segment.release()
+                except BufferError:
+                    # 仍有会话持有行句柄，交给垃圾回收
+                    pass
+            for shm in shared:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+                if self._owner_pid == os.getpid():
+                    try:
+                        shm.unlink()
+                    except FileNotFoundError:
+                        pass
+
+    def close(self):
+        with self._lock:
+            self._release()
+
+    # ----- 读取 -----
+    def snapshot(self):
+        """返回全部已分配行的一致副本（numpy 结构化数组），行号与 thread_ids 对应"""
+        with self._lock:
+            count = len(self.thread_ids)
+            parts = []
+            for segment in self._segments:
+                rows = min(segment.rows, count - segment.start)
+                if rows <= 0:
+                    break
+                parts.append(self._consistent_copy(segment.array[:rows]))
+        if not parts:
+            return np.zeros(0, dtype=ROW_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    @staticmethod
+    def _consistent_copy(live):
+        before = live['seq'].copy()
+        data = live.copy()
+        torn = np.flatnonzero((before != live['seq']) | (before & 1).astype(bool))
+        for i in torn:
+            for _ in range(TORN_RETRIES):
+                seq = live['seq'][i]
+                row = live[i].copy()
+                if not seq & 1 and seq == live['seq'][i]:
+                    break
+                time.sleep(0)
+            # 写入方若在写入途中崩溃，序列计数会一直是奇数，此时接受最后一次读取的值
+            data[i] = row
+        return data
+
+    @staticmethod
+    def row_to_status(row):
+        return _values_to_status(row.tolist())
+
+    def status_dicts(self):
+        """返回 {thread_id: 状态字典}，未写入过的行不包含在内"""
+        return self.status_changes()[0]
+
+    def status_changes(self, last_seq=None):
+        """返回 ({thread_id: 状态字典}, seq)，只包含序列计数与 last_seq 不同的已写入行
+
+        last_seq 传入上一次返回的 seq，为 None 时返回全部已写入行；读取方据此只处理有变化的流。
+        """
+        data = self.snapshot()
+        seq = data['seq']
+        changed = data['status'] != 0
+        if last_seq is not None:
+            count = min(len(seq), len(last_seq))
+            changed[:count] &= seq[:count] != last_seq[:count]
+        thread_ids = self.thread_ids
+        indices = np.flatnonzero(changed)
+        result = {}
+        # 整批转换为 Python 元组，比逐行逐字段 .item() 快一个数量级
+        for index, values in zip(indices.tolist(), data[indices].tolist()):
+            if index < len(thread_ids) and thread_ids[index] is not None:
+                status = _values_to_status(values)
+                status['thread_id'] = thread_ids[index]
+                result[thread_ids[index]] = status
+        return result, seq
+
+    def histograms(self):
+        """返回 (thread_ids, 直方图副本)，副本形状为 (行数, 类型, 桶)，行号与 thread_ids 对应"""
+        with self._lock:
+            count = len(self.thread_ids)
+            thread_ids = list(self.thread_ids)
+            parts = []
+            for segment in self._segments:
+                rows = min(segment.rows, count - segment.start)
+                if rows <= 0:
+                    break
+                parts.append(segment.hist[:rows].copy())
+        if not parts:
+            return thread_ids, np.zeros((0, self.hist_kinds, HIST_BUCKETS), dtype=np.int64)
+        return thread_ids, parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def status_of(self, thread_id):
+        index = self.rows.get(thread_id)
+        if index is None:
+            return None
+        with self._lock:
+            for segment in self._segments:
+                if segment.start <= index < segment.start + segment.rows:
+                    return STATUS_NAMES[int(segment.array['status'][index - segment.start])]
+        return None
+
+
+def _values_to_status(values):
+    """一行的字段值元组（含 seq）转为状态字典"""
+    status = dict(zip(FIELD_NAMES, values[1:]))
+    code = status['status']
+    status['status'] = STATUS_NAMES[code] if 0 <= code < len(STATUS_NAMES) else '未启动'
+    return status
+
+
+def _close_at_exit(table):
+    table.close()
+
+
+def create_metrics_table():
+    table = MetricsTable()
+    atexit.register(_close_at_exit, table)
+    return table
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+多进程分片监控引擎
+
+核心思路：
+- 所有流按轮询方式分配到 N 个工作进程，每个进程内部仍使用线程或协程引擎运行会话，
+  逐包的 Python 处理不再共享 GUI 进程的 GIL；libav 崩溃也只会带走单个工作进程。
+- 工作进程可选绑定到指定 CPU 核心，便于测量按核扩展的吞吐。
+- 指标表放在共享内存中，工作进程内的会话直接写入各自的行，GUI 进程按快照读取，状态不经过管道；
+  日志按 mp_report_interval_ms 批量回传，监督线程写回 LOG_QUEUE。
+- 监督线程发现工作进程异常退出时，用指标表中保留的累计计数重新拉起该分片的全部流。
+- 监督线程启动工作进程前统一预解析全部主机名，DNS 缓存条目随启动参数交给各工作进程，不再各自解析一遍。
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+import threading
+import time
+
+import psutil
+
+from dns_cache import DNS_CACHE
+from file_logging import active_log_dir, detach_inherited_logging, start_file_logging, stop_file_logging
+from rtsp_engine import (SETTINGS, METRICS_TABLE, LOG_QUEUE, STOP_EVENT,
+                         RTSPStreamMonitor, prefetch_dns)
+
+
+def _drain_logs():
+    dropped = LOG_QUEUE.take_dropped()
+    if dropped:
+        # 经日志处理器写回队列，格式与其他日志一致，随本批一起回传
+        logging.warning(f"工作进程日志过多，已丢弃 {dropped} 条")
+    logs = []
+    while LOG_QUEUE:
+        logs.append(LOG_QUEUE.popleft())
+    return logs
+
+
+def shard_worker_main(shard_id, specs, settings_snapshot, resume_state, metrics_layout, result_conn, stop_flag, cpu_core,
+                      worker_init=None, log_dir=None, dns_entries=None):
+    """工作进程入口：运行分配到本分片的全部流，状态写入共享指标表，日志周期性回传"""
+    for name, value in settings_snapshot.items():
+        setattr(SETTINGS, name, value)
+    if worker_init is not None:
+        init_func, init_kwargs = worker_init
+        init_func(**init_kwargs)
+
+    if cpu_core is not None:
+        try:
+            psutil.Process().cpu_affinity([cpu_core])
+        except (AttributeError, ValueError, psutil.Error):
+            # 部分平台（如 macOS）不支持设置 CPU 亲和性
+            pass
+
+    # fork 方式启动时会继承父进程的全局状态，这里统一清空
+    LOG_QUEUE.clear()
+    STOP_EVENT.clear()
+    METRICS_TABLE.attach_shared(*metrics_layout)
+    if dns_entries:
+        DNS_CACHE.seed(dns_entries)
+    detach_inherited_logging()
+    if log_dir is not None:
+        # 与主进程写入同一运行目录，各分片使用自己的主日志文件
+        try:
+            start_file_logging(SETTINGS, run_dir=log_dir, main_name=f"worker-{shard_id:02d}")
+        except OSError as e:
+            logging.error(f"分片 {shard_id} 无法写入日志目录: {e}")
+
+    if SETTINGS.mp_worker_engine == "协程":
+        from async_monitor import AsyncStreamMonitor
+        monitor_class = AsyncStreamMonitor
+    elif SETTINGS.mp_worker_engine == "RTP直连":
+        from rtp_client import NativeRTPMonitor
+        monitor_class = NativeRTPMonitor
+    else:
+        monitor_class = RTSPStreamMonitor
+
+    monitors = []
+    for spec in specs:
+        monitor = monitor_class(**spec)
+        state = resume_state.get(spec['thread_id'])
+        if state:
+            monitor.total_frames = state.get('total_frames', 0)
+            monitor.total_bytes = state.get('total_bytes', 0)
+            monitor.reconnect_count = state.get('reconnect_count', 0)
+        monitors.append(monitor)
+    for monitor in monitors:
+        monitor.start()
+    logging.info(f"分片 {shard_id} 已启动 {len(monitors)} 路流" + (f"，绑定CPU {cpu_core}" if cpu_core is not None else ""))
+
+    interval = SETTINGS.mp_report_interval_ms / 1000.0
+    while not stop_flag.value:
+        time.sleep(interval)
+        logs = _drain_logs()
+        if logs:
+            result_conn.send(('log', shard_id, logs))
+
+    # 收到停止信号后等待会话退出，并回传最终状态
+    STOP_EVENT.set()
+    deadline = time.time() + 2.0
+    for monitor in monitors:
+        monitor.join(timeout=max(0.0, deadline - time.time()))
+    stop_file_logging()
+    result_conn.send(('log', shard_id, _drain_logs()))
+    result_conn.send(('exit', shard_id, None))
+    result_conn.close()
+
+
+class ShardedStreamProxy:
+    """GUI 侧代表单路流的对象，提供与监控线程一致的接口"""
+    def __init__(self, supervisor, thread_id, log_name):
+        self.supervisor = supervisor
+        self.thread_id = thread_id
+        self.name = log_name
+
+    def start(self):
+        # 所有流由监督线程统一启动
+        pass
+
+    def is_alive(self):
+        return self.supervisor.is_alive() and METRICS_TABLE.status_of(self.thread_id) != "已停止"
+
+    def join(self, timeout=None):
+        self.supervisor.join(timeout)
+
+    def stop(self):
+        STOP_EVENT.set()
+
+
+class ShardSupervisor(threading.Thread):
+    """启动并看护工作进程，把回传的状态写回 GUI 进程的全局队列"""
+    def __init__(self, worker_count, pin_cpu=False, worker_init=None):
+        super().__init__(name="分片监督", daemon=True)
+        self.worker_count = max(1, worker_count)
+        self.pin_cpu = pin_cpu
+        self.worker_init = worker_init
+        self.ctx = multiprocessing.get_context()
+        # 每个工作进程独占一条管道，进程被强杀时不会连带锁死其他分片的回传通道
+        self.result_conns = {}
+        # 停止标志使用无锁共享内存：被强杀的进程若正阻塞在 multiprocessing.Event 上，会使 set() 永久等待
+        self.worker_stop_flag = self.ctx.RawValue('b', 0)
+        self.shards = [[] for _ in range(self.worker_count)]
+        self.processes = [None] * self.worker_count
+        self.process_start_times = [0.0] * self.worker_count
+        # 已回传 'exit' 的分片：工作进程正常结束，不再重启
+        self.exited_shards = set()
+        self.restart_counts = [0] * self.worker_count
+        self.metrics_layout = None
+        self._next_shard = 0
+
+    def add_stream(self, url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol='UDP',
+                   start_at=0.0):
+        """登记一路流并返回其代理对象，需在 start() 之前调用"""
+        spec = {
+            'url': url,
+            'thread_id': thread_id,
+            'parent_item_id': parent_item_id,
+            'parent_url_id': parent_url_id,
+            'thread_idx': thread_idx,
+            'total_threads': total_threads,
+            'protocol': protocol,
+            # 启动时刻为绝对时间，分片重启后已过时刻的流立即恢复
+            'start_at': start_at,
+        }
+        self.shards[self._next_shard % self.worker_count].append(spec)
+        self._next_shard += 1
+        return ShardedStreamProxy(self, thread_id, f"线程-{parent_url_id:02d}-{thread_idx+1:02d}")
+
+    def _cpu_core_for(self, shard_id):
+        if not self.pin_cpu:
+            return None
+        cores = psutil.cpu_count(logical=True) or 1
+        return shard_id % cores
+
+    def _spawn(self, shard_id, resume_state):
+        settings_snapshot = {name: getattr(SETTINGS, name) for name in SETTINGS.defaults}
+        reader, writer = self.ctx.Pipe(duplex=False)
+        process = self.ctx.Process(
+            target=shard_worker_main,
+            args=(shard_id, self.shards[shard_id], settings_snapshot, resume_state,
+                  self.metrics_layout, writer, self.worker_stop_flag, self._cpu_core_for(shard_id), self.worker_init,
+                  active_log_dir(), DNS_CACHE.snapshot()),
+            name=f"分片-{shard_id:02d}",
+            daemon=True,
+        )
+        process.start()
+        writer.close()
+        self.exited_shards.discard(shard_id)
+        self.result_conns[reader] = shard_id
+        self.processes[shard_id] = process
+        self.process_start_times[shard_id] = time.time()
+
+    def _resume_state_for(self, shard_id):
+        """用指标表中保留的累计值恢复分片，重启本身计为一次重连"""
+        state = {}
+        statuses = METRICS_TABLE.status_dicts()
+        for spec in self.shards[shard_id]:
+            last = statuses.get(spec['thread_id'])
+            if last:
+                state[spec['thread_id']] = {
+                    'total_frames': last.get('total_frames', 0),
+                    'total_bytes': last.get('total_bytes', 0),
+                    'reconnect_count': last.get('reconnect_count', 0) + 1,
+                }
+        return state
+
+    def _handle_message(self, message):
+        kind, shard_id, payload = message
+        if kind == 'log':
+            LOG_QUEUE.extend(payload)
+        elif kind == 'exit':
+            self.exited_shards.add(shard_id)
+
+    def _drain(self, timeout):
+        if not self.result_conns:
+            time.sleep(timeout)
+            return
+        for conn in multiprocessing.connection.wait(list(self.result_conns), timeout):
+            try:
+                while conn.poll():
+                    self._handle_message(conn.recv())
+            except (EOFError, OSError):
+                # 工作进程已退出，管道关闭
+                self.result_conns.pop(conn, None)
+                conn.close()
+
+    def _check_workers(self):
+        """重启异常退出的工作进程，短时间内反复崩溃时延迟重启"""
+        # 先收完已退出进程留在管道里的消息，正常结束的分片据 'exit' 消息跳过
+        self._drain(timeout=0)
+        for shard_id, process in enumerate(self.processes):
+            if process is None or process.is_alive() or not self.shards[shard_id]:
+                continue
+            if shard_id in self.exited_shards:
+                continue
+            uptime = time.time() - self.process_start_times[shard_id]
+            if uptime < SETTINGS.mp_restart_delay:
+                continue
+            self.restart_counts[shard_id] += 1
+            logging.warning(f"分片 {shard_id} 工作进程异常退出 (exitcode={process.exitcode})，"
+                            f"第 {self.restart_counts[shard_id]} 次重启，恢复 {len(self.shards[shard_id])} 路流")
+            self._spawn(shard_id, self._resume_state_for(shard_id))
+
+    def run(self):
+        # 按登记顺序在共享内存中为每路流分配一行，工作进程按行号挂载
+        all_specs = [spec for specs in self.shards for spec in specs]
+        METRICS_TABLE.reset(len(all_specs), shared=True, phase_histograms=SETTINGS.phase_histograms_enabled)
+        for spec in all_specs:
+            METRICS_TABLE.register(spec['thread_id'])
+        self.metrics_layout = (METRICS_TABLE.shared_name, METRICS_TABLE.capacity, dict(METRICS_TABLE.rows),
+                               METRICS_TABLE.histogram_shared_name, METRICS_TABLE.hist_kinds)
+        prefetch_dns(spec['url'] for spec in all_specs)
+
+        for shard_id in range(self.worker_count):
+            if self.shards[shard_id]:
+                self._spawn(shard_id, {})
+
+        last_check = time.time()
+        while not STOP_EVENT.is_set():
+            self._drain(timeout=0.2)
+            if time.time() - last_check >= 1.0:
+                self._check_workers()
+                last_check = time.time()
+
+        # 停止所有工作进程，超时未退出的强制终止
+        self.worker_stop_flag.value = 1
+        deadline = time.time() + 5.0
+        alive = [p for p in self.processes if p is not None]
+        while time.time() < deadline and any(p.is_alive() for p in alive):
+            self._drain(timeout=0.1)
+        for process in alive:
+            if process.is_alive():
+                logging.warning(f"工作进程 {process.name} 未能在超时时间内退出，强制终止。")
+                process.terminate()
+            process.join(timeout=1.0)
+        self._drain(timeout=0.1)
+
+    def scaling_snapshot(self):
+        """返回各分片当前的累计帧数，用于测量按核扩展的吞吐"""
+        totals = [0] * self.worker_count
+        statuses = METRICS_TABLE.status_dicts()
+        for shard_id, specs in enumerate(self.shards):
+            for spec in specs:
+                totals[shard_id] += statuses.get(spec['thread_id'], {}).get('total_frames', 0)
+        return totals
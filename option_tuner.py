@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+RTSP 连接参数自动调优与调优配置
+
+核心思路：
+- 用一路样本 URL 扫描 TUNE_CANDIDATES 中的 libav 连接参数（缓冲区、探测大小、分析时长、最大延迟），
+  每个参数组合用真实会话连接 tune_trial_seconds 秒，重复 tune_trials 次，记录连接耗时、首个关键帧耗时、
+  丢帧率与本进程 CPU 占用；组合内任一次连接失败或未收到关键帧即淘汰该组合。
+- 全组合数量随参数个数成倍增长，这里按坐标轮换搜索：从当前设置出发，每次只改变一个参数，
+  其余参数取已选出的最佳值，扫描次数为各参数候选值个数之和。
+- 评分为秒：连接耗时 + 首个关键帧耗时 + 丢帧率与 CPU 按权重折算的惩罚，越小越好；差距小于 SCORE_TOLERANCE
+  时保留当前值，避免把测量抖动当成改进。
+- 超时不影响正常连接的任何指标，不参与扫描；按扫描中观测到的最长“连接到首个关键帧”耗时留出余量后给出。
+- 结果保存为命名的调优配置（通常按摄像机型号命名）并登记适用的主机，之后连接这些主机的会话
+  自动使用该配置的参数；同一主机只属于最近保存的一个配置。
+- 调优期间关闭流参数缓存（否则探测参数不生效）和已有调优配置，结束后恢复原设置。
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from stream_param_cache import cache_key
+
+# 参与扫描的设置项与候选值，当前设置不在候选中时同样作为候选
+TUNE_CANDIDATES = (
+    ('rtsp_buffer_size', (262144, 1048576, 2097152, 4194304)),
+    ('rtsp_probe_size', (32768, 262144, 1048576, 2097152)),
+    ('rtsp_analyzeduration', (100000, 500000, 1000000, 2000000)),
+    ('rtsp_max_delay', (0, 100000, 500000, 1000000)),
+)
+# 调优配置可覆盖的设置项
+PROFILE_SETTINGS = tuple(name for name, _ in TUNE_CANDIDATES) + ('rtsp_timeout',)
+
+# 丢帧率每 1% 折算的惩罚，秒
+SCORE_LOSS_WEIGHT = 1.0
+# CPU 占用每 1%（单核）折算的惩罚，秒
+SCORE_CPU_WEIGHT = 0.01
+# 新组合至少好出这么多才替换当前值，秒
+SCORE_TOLERANCE = 0.05
+# 推荐超时为观测到的最长连接到首个关键帧耗时的倍数，并限制在上下限之间，微秒
+TIMEOUT_MARGIN = 3.0
+TIMEOUT_MIN = 2000000
+TIMEOUT_MAX = 30000000
+
+
+def host_of(url):
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    return host.lower() if host else None
+
+
+# ==============================================================================
+# 调优配置
+# ==============================================================================
+class TuneProfiles:
+    """命名调优配置：{名称: {'hosts': [...], 'settings': {...}, ...}}，按主机查找，读写加锁"""
+    def __init__(self):
+        self.profiles = {}
+        self.path = None
+        self._by_host = {}
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """切换到 path 对应的配置文件，路径未变时不重复读取"""
+        with self._lock:
+            if path == self.path:
+                return
+            self.path = path
+            self.profiles = self._read_file(path)
+            self._index()
+
+    def _index(self):
+        self._by_host = {}
+        for name, profile in self.profiles.items():
+            for host in profile.get('hosts', ()):
+                self._by_host[host.lower()] = name
+
+    def lookup(self, url):
+        """URL 所在主机的 (配置名, 设置覆盖)，没有配置时返回 None"""
+        host = host_of(url)
+        with self._lock:
+            name = self._by_host.get(host) if host else None
+            if name is None:
+                return None
+            settings = self.profiles[name].get('settings', {})
+            return name, {k: v for k, v in settings.items() if k in PROFILE_SETTINGS}
+
+    def save(self, name, hosts, settings, info=None):
+        """保存配置并登记主机，主机原先所属的其他配置中去掉该主机"""
+        hosts = sorted({host.lower() for host in hosts if host})
+        with self._lock:
+            # 与其他进程写入的配置合并
+            self.profiles.update({k: v for k, v in self._read_file(self.path).items() if k not in self.profiles})
+            for other in self.profiles.values():
+                other['hosts'] = [host for host in other.get('hosts', []) if host not in hosts]
+            self.profiles[name] = dict(info or {}, hosts=hosts, settings=dict(settings),
+                                       saved_at=datetime.datetime.now().isoformat(timespec='seconds'))
+            self._index()
+            self._write_file()
+
+    @staticmethod
+    def _read_file(path):
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                profiles = json.load(f)
+            if not isinstance(profiles, dict):
+                raise ValueError("顶层必须是字典")
+            return profiles
+        except (OSError, ValueError) as e:
+            logging.warning(f"调优配置文件 {path} 无法读取，将使用全局设置: {e}")
+            return {}
+
+    def _write_file(self):
+        if not self.path:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.profiles, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"调优配置写入失败: {e}")
+
+
+TUNE_PROFILES = TuneProfiles()
+
+
+# ==============================================================================
+# 参数扫描
+# ==============================================================================
+class OptionTuner:
+    """对样本 URL 按坐标轮换扫描连接参数，返回最佳设置
+
+    settings 为全局设置对象，扫描期间临时改写 PROFILE_SETTINGS 中的项；
+    monitor_class 为会话构造函数（线程或协程引擎），metrics_table 为指标表，每次试连前重置为一行；
+    on_trial 在每个组合测完后以结果调用，用于输出进度；stop_event 置位时尽快结束。
+    """
+    def __init__(self, url, protocol, settings, monitor_class, metrics_table, stop_event, on_trial=None):
+        self.url = url
+        self.protocol = protocol
+        self.settings = settings
+        self.monitor_class = monitor_class
+        self.metrics_table = metrics_table
+        self.stop_event = stop_event
+        self.on_trial = on_trial
+        self.results = []
+        self.trial_count = 0
+
+    def _trial(self, values):
+        """用 values 连接一次，返回该次的测量值；连接失败或未收到关键帧时 'ok' 为 False"""
+        for name, value in values.items():
+            setattr(self.settings, name, value)
+        self.trial_count += 1
+        thread_id = f"tune-{self.trial_count}"
+        self.metrics_table.reset(1)
+        monitor = self.monitor_class(url=self.url, thread_id=thread_id, parent_item_id="tune", parent_url_id=1,
+                                     thread_idx=0, total_threads=1, protocol=self.protocol)
+        monitor.stop_event = threading.Event()
+        cpu_start = time.process_time()
+        wall_start = time.monotonic()
+        monitor.start()
+        self.stop_event.wait(self.settings.tune_trial_seconds)
+        status = self.metrics_table.status_dicts().get(thread_id) or {}
+        cpu = (time.process_time() - cpu_start) / max(1e-6, time.monotonic() - wall_start) * 100.0
+        monitor.stop_event.set()
+        monitor.join(timeout=5.0)
+
+        keyframe = (status.get('phase_first_packet_ms', 0.0) + status.get('phase_first_keyframe_ms', 0.0)) / 1000.0
+        expected = status.get('expected_frames', 0)
+        return {
+            'ok': status.get('status') == "运行中" and status.get('keyframes', 0) > 0,
+            'connect': status.get('connect_latency', 0.0),
+            'keyframe': keyframe,
+            'loss_rate': status.get('lost_frames', 0) / expected * 100.0 if expected else 0.0,
+            'cpu_percent': cpu,
+        }
+
+    def measure(self, values):
+        """测量一个参数组合，返回汇总结果，score 为 None 表示该组合被淘汰"""
+        trials = []
+        for _ in range(max(1, self.settings.tune_trials)):
+            if self.stop_event.is_set():
+                break
+            trials.append(self._trial(values))
+            if not trials[-1]['ok']:
+                break
+        count = len(trials)
+        passed = count and all(t['ok'] for t in trials) and count == max(1, self.settings.tune_trials)
+        result = {'settings': dict(values), 'trials': count}
+        for key in ('connect', 'keyframe', 'loss_rate', 'cpu_percent'):
+            result[key] = sum(t[key] for t in trials) / count if count else 0.0
+        result['worst_ready'] = max((t['connect'] + t['keyframe'] for t in trials if t['ok']), default=0.0)
+        result['score'] = (result['connect'] + result['keyframe'] + result['loss_rate'] * SCORE_LOSS_WEIGHT
+                           + result['cpu_percent'] * SCORE_CPU_WEIGHT) if passed else None
+        self.results.append(result)
+        if self.on_trial is not None:
+            self.on_trial(result)
+        return result
+
+    def run(self):
+        """坐标轮换扫描，返回 (最佳设置, 最佳结果)；基准组合都连不上时最佳结果为 None"""
+        saved = {name: getattr(self.settings, name) for name in PROFILE_SETTINGS}
+        saved_flags = (self.settings.param_cache_enabled, self.settings.tune_profiles_enabled)
+        self.settings.param_cache_enabled = False
+        self.settings.tune_profiles_enabled = False
+        try:
+            best_values = {name: saved[name] for name, _ in TUNE_CANDIDATES}
+            best = self.measure(best_values)
+            for name, candidates in TUNE_CANDIDATES:
+                for value in candidates:
+                    if self.stop_event.is_set():
+                        break
+                    if value == best_values[name]:
+                        continue
+                    result = self.measure(dict(best_values, **{name: value}))
+                    if result['score'] is None:
+                        continue
+                    if best['score'] is None or result['score'] < best['score'] - SCORE_TOLERANCE:
+                        best_values, best = dict(result['settings']), result
+        finally:
+            for name, value in saved.items():
+                setattr(self.settings, name, value)
+            self.settings.param_cache_enabled, self.settings.tune_profiles_enabled = saved_flags
+        if best['score'] is None:
+            return None, None
+        ready = max(r['worst_ready'] for r in self.results)
+        timeout = int(min(TIMEOUT_MAX, max(TIMEOUT_MIN, ready * TIMEOUT_MARGIN * 1000000)))
+        return dict(best_values, rtsp_timeout=timeout), best
+
+    def profile_info(self, best):
+        """随配置一同保存的调优记录，URL 中的用户名密码不写入"""
+        return {
+            'sample_url': cache_key(self.url),
+            'protocol': self.protocol,
+            'score': best['score'],
+            'connect': best['connect'],
+            'keyframe': best['keyframe'],
+            'loss_rate': best['loss_rate'],
+            'cpu_percent': best['cpu_percent'],
+        }
+
+
+def format_trial(result):
+    """单个参数组合的一行摘要"""
+    values = " ".join(f"{name}={value}" for name, value in result['settings'].items())
+    if result['score'] is None:
+        return f"淘汰 | {values} | 完成 {result['trials']} 次"
+    return (f"{result['score']:6.2f} | 连接 {result['connect']:.2f}s 首关键帧 {result['keyframe']:.2f}s "
+            f"丢帧率 {result['loss_rate']:.2f}% CPU {result['cpu_percent']:.0f}% | {values}")
+
+
+def write_tune_report(f, name, hosts, url, best_settings, results):
+    """写出调优报告：各组合测量结果与最终配置"""
+    f.write(f"RTSP 连接参数调优报告 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    f.write("=" * 60 + "\n\n")
+    f.write(f"配置名: {name}，样本: {cache_key(url)}\n")
+    f.write(f"适用主机: {', '.join(sorted(hosts))}\n")
+    f.write(f"评分 = 连接耗时 + 首关键帧耗时 + 丢帧率×{SCORE_LOSS_WEIGHT}s + CPU%×{SCORE_CPU_WEIGHT}s，越小越好\n\n")
+    if best_settings:
+        f.write("### 最终配置\n")
+        f.write("-" * 60 + "\n")
+        for key, value in best_settings.items():
+            f.write(f"{key}: {value}\n")
+    else:
+        f.write("全部组合都无法连接或未收到关键帧，未生成配置\n")
+    f.write("\n### 参数组合\n")
+    f.write("-" * 60 + "\n")
+    for result in results:
+        f.write(format_trial(result) + "\n")
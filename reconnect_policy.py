@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+重连策略：去相关抖动退避、按主机熔断、全局连接令牌桶
+
+核心思路：
+- 退避：每次等待在 [基数, 上次等待×3] 内随机取值并以上限截断（decorrelated jitter），
+  同一台 NVR 重启时其下各路会话的重试时刻自然错开，不会同步地反复冲击服务器。
+- 熔断：同一主机（host:port）上的会话共用一个熔断器，连续连接失败达到阈值后打开，
+  打开期间该主机的会话都不再发起连接；到期后转为半开，只放行一路会话探测，
+  探测成功则关闭、其余会话恢复连接，失败则重新打开。
+- 令牌桶：全局限制每秒连接尝试次数，会话预约令牌后等待到点再连接，熔断恢复或批量启动时平滑放行。
+- 本模块不依赖全局配置，参数由调用方（StreamSession）按 SETTINGS 传入；多进程引擎的每个工作进程各自维护一份。
+"""
+
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+BREAKER_CLOSED = 0
+BREAKER_OPEN = 1
+BREAKER_HALF_OPEN = 2
+BREAKER_STATE_NAMES = ('正常', '熔断', '探测')
+
+# 半开状态下等待探测结果的会话轮询间隔，秒（实际取 0.5~1.5 倍随机值）
+HALF_OPEN_POLL = 1.0
+
+
+class DecorrelatedJitterBackoff:
+    """去相关抖动指数退避，每路会话一个实例"""
+    def __init__(self):
+        self.previous = 0.0
+
+    def next(self, base, cap):
+        """返回下一次等待秒数，base 为本次的最小等待，cap 为上限"""
+        upper = max(base, (self.previous or base) * 3)
+        delay = min(cap, random.uniform(base, upper))
+        self.previous = delay
+        return delay
+
+    def reset(self):
+        self.previous = 0.0
+
+
+class CircuitBreaker:
+    """单个主机的熔断器，由该主机的全部会话共享"""
+    def __init__(self, host):
+        self.host = host
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_owner = None
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def permit(self, owner, open_seconds):
+        """返回 (是否放行, 不放行时建议等待的秒数, 当前状态)
+
+        打开期满后第一个调用者成为探测会话并被放行；探测会话超过 open_seconds 仍未报告结果（如已停止）时由下一路接替。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == BREAKER_CLOSED:
+                return True, 0.0, self.state
+            if self.state == BREAKER_OPEN:
+                remaining = self.opened_at + open_seconds - now
+                if remaining > 0:
+                    return False, remaining, self.state
+                self.state = BREAKER_HALF_OPEN
+                self.probe_owner = None
+            if self.probe_owner is None or self.probe_owner is owner or now - self.probe_started > open_seconds:
+                if self.probe_owner is not owner:
+                    self.probe_owner = owner
+                    self.probe_started = now
+                    logging.info(f"主机 {self.host} 熔断半开，放行一路会话探测")
+                return True, 0.0, self.state
+            return False, HALF_OPEN_POLL * random.uniform(0.5, 1.5), self.state
+
+    def record_success(self, owner):
+        with self._lock:
+            self.failures = 0
+            if self.state != BREAKER_CLOSED:
+                self.state = BREAKER_CLOSED
+                self.probe_owner = None
+                logging.info(f"主机 {self.host} 探测连接成功，熔断关闭")
+            return self.state
+
+    def record_failure(self, owner, threshold):
+        with self._lock:
+            if self.state == BREAKER_HALF_OPEN:
+                if owner is self.probe_owner:
+                    self._open()
+                    logging.warning(f"主机 {self.host} 探测连接失败，熔断重新打开")
+            elif self.state == BREAKER_CLOSED:
+                self.failures += 1
+                if self.failures >= threshold:
+                    logging.warning(f"主机 {self.host} 连续 {self.failures} 次连接失败，熔断打开")
+                    self._open()
+            # 打开期间才返回的失败来自打开前已发起的连接，不影响状态
+            return self.state
+
+    def _open(self):
+        self.state = BREAKER_OPEN
+        self.opened_at = time.monotonic()
+        self.probe_owner = None
+        self.failures = 0
+
+
+class TokenBucket:
+    """全局连接尝试令牌桶，支持预约：令牌不足时返回需等待的秒数并预先扣除"""
+    def __init__(self):
+        self.tokens = None
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, rate, burst):
+        """预约一次连接尝试，返回调用方应等待的秒数；rate <= 0 时不限速"""
+        if rate <= 0:
+            return 0.0
+        burst = max(1.0, float(burst))
+        with self._lock:
+            now = time.monotonic()
+            if self.tokens is None:
+                self.tokens = burst
+            else:
+                self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / rate
+
+
+BREAKERS = {}
+BREAKERS_LOCK = threading.Lock()
+CONNECT_LIMITER = TokenBucket()
+
+
+def breaker_key(url):
+    """熔断按 host:port 划分，同一台 NVR 的不同通道共用一个熔断器"""
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port or 554
+    except ValueError:
+        return url
+    return f"{host}:{port}" if host else url
+
+
+def get_breaker(url):
+    key = breaker_key(url)
+    with BREAKERS_LOCK:
+        breaker = BREAKERS.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key)
+            BREAKERS[key] = breaker
+        return breaker
+
+
+def reset_reconnect_policy():
+    """开始新一轮监控前清空熔断器与令牌桶"""
+    with BREAKERS_LOCK:
+        BREAKERS.clear()
+    with CONNECT_LIMITER._lock:
+        CONNECT_LIMITER.tokens = None
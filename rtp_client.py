@@ -0,0 +1,721 @@
+# -*- coding: utf-8 -*-
+"""
+纯 Python RTSP/RTP 直连测量客户端
+
+核心思路：
+- 基于 asyncio 自行完成 OPTIONS/DESCRIBE/SETUP/PLAY 握手，支持 TCP 交织和 UDP 两种传输，
+  支持 Basic/Digest 认证，按会话超时周期发送 GET_PARAMETER 保活，结束时发送 TEARDOWN。
+- 直接解析 RTP 头（RFC 3550），统计真实的序列号缺口、乱序、重复包以及到达抖动（附录 A.8），
+  并依据 marker 位与时间戳划分视频帧，统计完整帧与受损帧。
+- 只测量不解码，不经过 libav，单核可承载的会话数远高于完整解复用。
+- NativeRTPMonitor 复用协程引擎的事件循环，写入与其他引擎相同的状态字段，并附带 rtp_* 指标。
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import socket
+import struct
+import time
+from urllib.parse import urlparse, urlunparse, unquote
+
+from rtsp_engine import SETTINGS
+from async_monitor import AsyncStreamMonitor
+from connect_phases import is_ip_literal
+from dns_cache import DNS_CACHE, CachedResolveError
+
+
+class RTSPError(Exception):
+    """RTSP 握手或数据接收失败"""
+
+
+# ==============================================================================
+# RTP 统计
+# ==============================================================================
+RTP_HEADER = struct.Struct('!BBHII')
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+RTP_SEQ_MOD = 1 << 16
+RTP_TS_MOD = 1 << 32
+RTP_TS_HALF = 1 << 31
+
+# 关键帧（IDR/IRAP）的 NAL 类型
+H264_KEY_NAL_TYPES = frozenset((5,))
+H265_KEY_NAL_TYPES = frozenset(range(16, 22))
+
+
+def is_keyframe_payload(codec, payload):
+    """按 RFC 6184/7798 判断 RTP 负载是否携带关键帧：单个 NAL、聚合包（STAP-A/AP）中的任一 NAL、分片包（FU）的起始分片"""
+    if not payload:
+        return False
+    if codec == 'H264':
+        nal_type = payload[0] & 0x1F
+        if nal_type == 28:
+            return len(payload) > 1 and bool(payload[1] & 0x80) and (payload[1] & 0x1F) in H264_KEY_NAL_TYPES
+        if nal_type == 24:
+            pos = 1
+            while pos + 3 <= len(payload):
+                size = (payload[pos] << 8) | payload[pos + 1]
+                if size and (payload[pos + 2] & 0x1F) in H264_KEY_NAL_TYPES:
+                    return True
+                pos += 2 + size
+            return False
+        return nal_type in H264_KEY_NAL_TYPES
+    if codec in ('H265', 'HEVC'):
+        if len(payload) < 3:
+            return False
+        nal_type = (payload[0] >> 1) & 0x3F
+        if nal_type == 49:
+            return bool(payload[2] & 0x80) and (payload[2] & 0x3F) in H265_KEY_NAL_TYPES
+        if nal_type == 48:
+            pos = 2
+            while pos + 4 <= len(payload):
+                size = (payload[pos] << 8) | payload[pos + 1]
+                if size and ((payload[pos + 2] >> 1) & 0x3F) in H265_KEY_NAL_TYPES:
+                    return True
+                pos += 2 + size
+            return False
+        return nal_type in H265_KEY_NAL_TYPES
+    return False
+
+
+class RTPStreamStats:
+    """按 RFC 3550 附录 A.1/A.8 统计单个 RTP 流的丢包、乱序、重复与抖动"""
+    def __init__(self, clock_rate=90000, codec=None):
+        self.clock_rate = clock_rate
+        self.codec = (codec or '').upper()
+        self.base_ext = None
+        self.max_seq = 0
+        self.cycles = 0
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.gap_events = 0
+        self.resyncs = 0
+        self.bytes = 0
+        self.jitter = 0.0            # 以RTP时间戳为单位
+        self.frames = 0
+        self.frames_damaged = 0
+        self.last_packet_time = None
+        # 延迟直方图的原始数据：首包、首个关键帧的到达时刻与各帧收齐的时刻，由会话周期性取走
+        self.first_packet_time = None
+        self.first_keyframe_time = None
+        self.frame_arrivals = []
+        # GOP 统计的原始数据：关键帧的 (帧序号, RTP时间戳, 到达时刻, 大小)，由会话周期性取走
+        self.keyframe_marks = []
+        self._frame_key = False
+        self._frame_start_bytes = 0
+        self._prev_arrival = None
+        self._prev_ts = 0
+        self._prior_expected = 0
+        # 序列号大跳变后期望的下一个序列号：连续两个包都落在新位置才确认源已重启
+        self._bad_seq = None
+        # 按序列号记录最近一次收到时所在的回绕周期标记，用于识别重复包
+        self._seen = bytearray(RTP_SEQ_MOD)
+        self._frame_ts = None
+        self._frame_closed = True
+        self._frame_damaged = False
+
+    def on_packet(self, data, offset=0, length=None, arrival=None):
+        """处理一个 RTP 包，data[offset:offset+length] 为完整 RTP 包"""
+        if length is None:
+            length = len(data) - offset
+        if length < 12:
+            return
+        first, second, seq, timestamp, _ssrc = RTP_HEADER.unpack_from(data, offset)
+        if first >> 6 != 2:
+            return
+        if arrival is None:
+            arrival = time.monotonic()
+        marker = second & 0x80
+
+        in_order = True
+        gap = False
+        if self.base_ext is None:
+            self.base_ext = seq
+            self.max_seq = seq
+            ext = seq
+        else:
+            udelta = (seq - self.max_seq) & 0xFFFF
+            if udelta < MAX_DROPOUT:
+                ext = self.cycles + seq
+                if udelta:
+                    if seq < self.max_seq:
+                        self.cycles += RTP_SEQ_MOD
+                        ext = self.cycles + seq
+                    self.max_seq = seq
+                    if udelta > 1:
+                        gap = True
+                        self.gap_events += 1
+                else:
+                    in_order = False
+            elif udelta <= RTP_SEQ_MOD - MAX_MISORDER:
+                if seq != self._bad_seq:
+                    # 序列号大跳变：先记下位置，单个游离包不改变基准
+                    self._bad_seq = (seq + 1) & 0xFFFF
+                    return
+                # 连续两个包确认源重启：保留已统计的期望/实收，从上一个包起重新建立基准
+                self._prior_expected = self.expected_packets()
+                self._bad_seq = None
+                self.resyncs += 1
+                prev = (seq - 1) & 0xFFFF
+                self.cycles = RTP_SEQ_MOD if seq < prev else 0
+                self.base_ext = prev
+                self.max_seq = seq
+                ext = self.cycles + seq
+                self._prev_arrival = None
+                # 新序列号空间与旧流无关，清空重复包标记；被确认的前一个包补记为已收
+                self._seen = bytearray(RTP_SEQ_MOD)
+                self._seen[prev] = 1
+                self.received += 1
+            else:
+                # 迟到包：序列号落在当前最大值之前
+                in_order = False
+                ext = self.cycles + seq
+                if seq > self.max_seq:
+                    ext -= RTP_SEQ_MOD
+
+        tag = ((ext >> 16) & 0x7F) + 1
+        if self._seen[seq] == tag:
+            self.duplicates += 1
+            return
+        self._seen[seq] = tag
+        if not in_order:
+            self.reordered += 1
+
+        self.received += 1
+        self.bytes += length - 12
+        self.last_packet_time = arrival
+        if self.first_packet_time is None:
+            self.first_packet_time = arrival
+
+        # RFC 3550 A.8 到达抖动：时间戳差按有符号32位处理，跨越回绕时不产生巨大跳变
+        if self._prev_arrival is not None:
+            ts_delta = ((timestamp - self._prev_ts + RTP_TS_HALF) % RTP_TS_MOD) - RTP_TS_HALF
+            d = (arrival - self._prev_arrival) * self.clock_rate - ts_delta
+            if d < 0:
+                d = -d
+            self.jitter += (d - self.jitter) / 16.0
+        self._prev_arrival = arrival
+        self._prev_ts = timestamp
+
+        if not in_order:
+            return
+        # 按时间戳划分帧：marker 位标记帧尾，丢包所在帧记为受损
+        if timestamp != self._frame_ts:
+            if self._frame_ts is not None and not self._frame_closed:
+                # 上一帧没有收到帧尾就开始了新帧，帧尾丢失
+                self.frames += 1
+                self.frames_damaged += 1
+                gap = False
+            self._frame_ts = timestamp
+            self._frame_closed = False
+            self._frame_damaged = gap
+            # 只检查每帧的第一个包（FU 起始分片或携带参数集的聚合包）
+            self._frame_key = self._payload_is_keyframe(data, offset, length, first)
+            self._frame_start_bytes = self.bytes - (length - 12)
+            if self._frame_key and self.first_keyframe_time is None:
+                self.first_keyframe_time = arrival
+        elif gap:
+            self._frame_damaged = True
+        if marker:
+            self.frames += 1
+            self.frame_arrivals.append(arrival)
+            if self._frame_key:
+                self.keyframe_marks.append((self.frames, timestamp, arrival, self.bytes - self._frame_start_bytes))
+                self._frame_key = False
+            if self._frame_damaged:
+                self.frames_damaged += 1
+            self._frame_closed = True
+
+    def _payload_is_keyframe(self, data, offset, length, first):
+        # 跳过 CSRC 列表与头扩展
+        start = offset + 12 + (first & 0x0F) * 4
+        if first & 0x10 and start + 4 <= offset + length:
+            start += 4 + ((data[start + 2] << 8) | data[start + 3]) * 4
+        return is_keyframe_payload(self.codec, memoryview(data)[start:offset + length])
+
+    def expected_packets(self):
+        if self.base_ext is None:
+            return self._prior_expected
+        return self._prior_expected + (self.cycles + self.max_seq) - self.base_ext + 1
+
+    def lost_packets(self):
+        return max(0, self.expected_packets() - self.received)
+
+    def jitter_ms(self):
+        return self.jitter * 1000.0 / self.clock_rate if self.clock_rate else 0.0
+
+
+# ==============================================================================
+# SDP / 认证辅助
+# ==============================================================================
+def parse_sdp_video(sdp_text):
+    """返回第一个视频媒体段的 control、payload type、编码名和时钟频率"""
+    media = None
+    info = None
+    session_control = None
+    for raw in sdp_text.splitlines():
+        line = raw.strip()
+        if line.startswith('m='):
+            media = line[2:].split()
+            if media and media[0] == 'video' and info is None:
+                info = {'control': None, 'payload_type': int(media[3]) if len(media) > 3 else 96,
+                        'codec': None, 'clock_rate': 90000}
+            elif info is not None:
+                break
+        elif line.startswith('a=control:'):
+            if media is None:
+                session_control = line[len('a=control:'):]
+            elif info is not None and media[0] == 'video':
+                info['control'] = line[len('a=control:'):]
+        elif line.startswith('a=rtpmap:') and info is not None and media[0] == 'video':
+            m = re.match(r'a=rtpmap:(\d+)\s+([^/]+)/(\d+)', line)
+            if m and int(m.group(1)) == info['payload_type']:
+                info['codec'] = m.group(2)
+                info['clock_rate'] = int(m.group(3))
+    if info is not None:
+        info['session_control'] = session_control
+    return info
+
+
+def resolve_control_url(base_url, control):
+    """按 RFC 2326 C.1.1 拼接媒体控制地址"""
+    if not control or control == '*':
+        return base_url
+    if control.lower().startswith('rtsp://'):
+        return control
+    return base_url.rstrip('/') + '/' + control.lstrip('/')
+
+
+def _md5(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class _Auth:
+    """根据 WWW-Authenticate 生成 Authorization 头"""
+    def __init__(self, username, password, challenge):
+        self.username = username
+        self.password = password
+        self.scheme = challenge.split(None, 1)[0].lower()
+        self.params = dict(re.findall(r'(\w+)="?([^",]*)"?', challenge))
+        self.nc = 0
+
+    def header(self, method, uri):
+        if self.scheme == 'basic':
+            token = base64.b64encode(f"{self.username}:{self.password}".encode('utf-8')).decode('ascii')
+            return f"Basic {token}"
+        realm = self.params.get('realm', '')
+        nonce = self.params.get('nonce', '')
+        ha1 = _md5(f"{self.username}:{realm}:{self.password}")
+        ha2 = _md5(f"{method}:{uri}")
+        fields = f'username="{self.username}", realm="{realm}", nonce="{nonce}", uri="{uri}"'
+        if 'auth' in self.params.get('qop', '').split(','):
+            self.nc += 1
+            nc = f"{self.nc:08x}"
+            cnonce = os.urandom(8).hex()
+            response = _md5(f"{ha1}:{nonce}:{nc}:{cnonce}:auth:{ha2}")
+            fields += f', qop=auth, nc={nc}, cnonce="{cnonce}"'
+        else:
+            response = _md5(f"{ha1}:{nonce}:{ha2}")
+        fields += f', response="{response}"'
+        if 'opaque' in self.params:
+            fields += f', opaque="{self.params["opaque"]}"'
+        return f"Digest {fields}"
+
+
+# ==============================================================================
+# RTSP 客户端
+# ==============================================================================
+class _RTPDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, stats):
+        self.stats = stats
+
+    def datagram_received(self, data, addr):
+        self.stats.on_packet(data)
+
+
+class RTSPClient:
+    """只测量不解码的 RTSP 客户端"""
+    def __init__(self, url, protocol='TCP', logger=None):
+        parsed = urlparse(url)
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else ''
+        netloc = parsed.hostname if ':' not in (parsed.hostname or '') else f"[{parsed.hostname}]"
+        if parsed.port:
+            netloc += f":{parsed.port}"
+        self.url = urlunparse(parsed._replace(netloc=netloc))
+        self.host = parsed.hostname
+        self.port = parsed.port or 554
+        self.protocol = protocol.upper()
+        self.logger = logger
+        self.timeout = max(1.0, SETTINGS.rtsp_timeout / 1000000.0)
+        self.reader = None
+        self.writer = None
+        self.cseq = 0
+        self.session = None
+        self.session_timeout = 60
+        self.auth = None
+        self.stats = None
+        self.sdp = None
+        self.last_keepalive = 0.0
+        self.rtp_channel = 0
+        self._udp_transports = []
+        # 握手各阶段耗时，秒；主机为 IP 地址时不解析，dns 为 None
+        self.dns_seconds = None
+        self.dns_hit = False
+        self.tcp_seconds = None
+        self.handshake_seconds = None
+
+    async def open(self):
+        """完成握手并开始接收 RTP，分别记录 DNS 解析、TCP 建连与 OPTIONS 到 PLAY 应答的耗时"""
+        loop = asyncio.get_running_loop()
+        address = self.host
+        if not is_ip_literal(self.host):
+            address = (await self._resolve(loop))[0][1]
+        start = time.monotonic()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(address, self.port), self.timeout)
+        self.tcp_seconds = time.monotonic() - start
+        handshake_start = time.monotonic()
+        await self.request('OPTIONS', self.url)
+        response = await self.request('DESCRIBE', self.url, {'Accept': 'application/sdp'})
+        self.sdp = parse_sdp_video(response['body'])
+        if not self.sdp:
+            raise RTSPError("SDP 中没有视频媒体段")
+        base_url = response['headers'].get('content-base') or response['headers'].get('content-location') or self.url
+        control_url = resolve_control_url(resolve_control_url(base_url, self.sdp.get('session_control')),
+                                          self.sdp['control'])
+        self.stats = RTPStreamStats(self.sdp['clock_rate'], self.sdp.get('codec'))
+
+        if self.protocol == 'TCP':
+            transport = "RTP/AVP/TCP;unicast;interleaved=0-1"
+        else:
+            rtp_port = await self._open_udp_pair()
+            transport = f"RTP/AVP;unicast;client_port={rtp_port}-{rtp_port + 1}"
+        response = await self.request('SETUP', control_url, {'Transport': transport})
+        session = response['headers'].get('session')
+        if not session:
+            raise RTSPError("SETUP 响应缺少 Session")
+        self.session = session.split(';')[0].strip()
+        m = re.search(r'timeout=(\d+)', session)
+        if m:
+            self.session_timeout = int(m.group(1))
+        m = re.search(r'interleaved=(\d+)', response['headers'].get('transport', ''))
+        if m:
+            self.rtp_channel = int(m.group(1))
+
+        play_url = resolve_control_url(base_url, self.sdp['session_control']) if self.sdp.get('session_control') else self.url
+        await self.request('PLAY', play_url, {'Range': 'npt=0.000-'})
+        self.last_keepalive = time.monotonic()
+        self.handshake_seconds = self.last_keepalive - handshake_start
+
+    async def _resolve(self, loop):
+        """经进程内 DNS 缓存解析主机名，命中时不离开事件循环，未命中时在线程池解析"""
+        start = time.monotonic()
+        try:
+            addresses = DNS_CACHE.lookup(self.host) if SETTINGS.dns_cache_enabled else None
+            if addresses:
+                self.dns_hit = True
+                return addresses
+            ttl = SETTINGS.dns_cache_ttl if SETTINGS.dns_cache_enabled else 0
+            addresses, self.dns_hit = await asyncio.wait_for(
+                loop.run_in_executor(None, DNS_CACHE.resolve, self.host, self.port, ttl, SETTINGS.dns_negative_ttl),
+                self.timeout)
+            return addresses
+        except CachedResolveError:
+            self.dns_hit = True
+            raise
+        finally:
+            self.dns_seconds = time.monotonic() - start
+
+    async def _open_udp_pair(self):
+        """绑定一对相邻端口（RTP 偶数、RTCP 奇数），返回 RTP 端口"""
+        loop = asyncio.get_running_loop()
+        for _ in range(20):
+            rtp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            rtp_sock.bind(('0.0.0.0', 0))
+            port = rtp_sock.getsockname()[1]
+            if port % 2:
+                rtp_sock.close()
+                continue
+            rtcp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                rtcp_sock.bind(('0.0.0.0', port + 1))
+            except OSError:
+                rtp_sock.close()
+                rtcp_sock.close()
+                continue
+            try:
+                rtp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SETTINGS.rtsp_buffer_size)
+            except OSError:
+                pass
+            rtp_sock.setblocking(False)
+            rtcp_sock.setblocking(False)
+            transport, _ = await loop.create_datagram_endpoint(lambda: _RTPDatagramProtocol(self.stats), sock=rtp_sock)
+            rtcp_transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, sock=rtcp_sock)
+            self._udp_transports = [transport, rtcp_transport]
+            return port
+        raise RTSPError("无法绑定本地 UDP 端口对")
+
+    def _send(self, method, url, headers=None):
+        self.cseq += 1
+        lines = [f"{method} {url} RTSP/1.0", f"CSeq: {self.cseq}", f"User-Agent: {SETTINGS.rtsp_user_agent}"]
+        if self.session:
+            lines.append(f"Session: {self.session}")
+        if self.auth:
+            lines.append(f"Authorization: {self.auth.header(method, url)}")
+        for key, value in (headers or {}).items():
+            lines.append(f"{key}: {value}")
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+        return self.cseq
+
+    async def request(self, method, url, headers=None):
+        """发送请求并等待对应 CSeq 的响应，遇到 401 时按服务器质询认证后重试一次"""
+        for attempt in range(2):
+            cseq = self._send(method, url, headers)
+            response = await asyncio.wait_for(self._wait_response(cseq), self.timeout)
+            if response['code'] == 401 and attempt == 0 and self.username is not None:
+                challenges = response['headers'].get('www-authenticate', '')
+                self.auth = _Auth(self.username, self.password, challenges)
+                continue
+            if response['code'] != 200:
+                raise RTSPError(f"{method} 失败: {response['code']} {response['reason']}")
+            return response
+        raise RTSPError(f"{method} 失败: 401 Unauthorized")
+
+    async def _wait_response(self, cseq):
+        while True:
+            kind, payload = await self.read_message()
+            if kind == 'response' and payload['headers'].get('cseq') == str(cseq):
+                return payload
+
+    async def read_message(self):
+        """读取一条 RTSP 响应或一个 TCP 交织数据帧"""
+        first = await self.reader.readexactly(1)
+        if first == b'$':
+            header = await self.reader.readexactly(3)
+            data = await self.reader.readexactly((header[1] << 8) | header[2])
+            if header[0] == self.rtp_channel and self.stats is not None:
+                self.stats.on_packet(data)
+            return 'data', None
+        head = first + await self.reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('utf-8', 'replace').split('\r\n')
+        parts = lines[0].split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('RTSP/'):
+            raise RTSPError(f"无法解析的RTSP响应: {lines[0][:80]}")
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        body = b''
+        length = int(headers.get('content-length', '0') or 0)
+        if length:
+            body = await self.reader.readexactly(length)
+        return 'response', {'code': int(parts[1]), 'reason': parts[2] if len(parts) > 2 else '',
+                            'headers': headers, 'body': body.decode('utf-8', 'replace')}
+
+    def keepalive_due(self):
+        return time.monotonic() - self.last_keepalive >= max(5, self.session_timeout / 2)
+
+    def send_keepalive(self):
+        """发送 GET_PARAMETER 保活，响应由接收循环丢弃"""
+        self._send('GET_PARAMETER', self.url)
+        self.last_keepalive = time.monotonic()
+
+    async def close(self):
+        for transport in self._udp_transports:
+            transport.close()
+        self._udp_transports = []
+        if self.writer is not None:
+            try:
+                if self.session:
+                    self._send('TEARDOWN', self.url)
+                    await asyncio.wait_for(self.writer.drain(), 1.0)
+            except Exception:
+                pass
+            self.writer.close()
+            self.writer = None
+
+
+RTP_CLIENT_ERRORS = (RTSPError, OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError)
+
+
+# ==============================================================================
+# RTP 直连监控会话
+# ==============================================================================
+class NativeRTPMonitor(AsyncStreamMonitor):
+    """使用 RTSPClient 直连测量的会话，运行在协程引擎的事件循环上，不占用读取线程池"""
+    def __init__(self, url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol='UDP', start_at=0.0):
+        super().__init__(url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol, start_at)
+        self.client = None
+        # 历次连接累计的 RTP 统计，重连后继续累加
+        self.prior = {'frames': 0, 'damaged': 0, 'bytes': 0, 'expected': 0, 'received': 0,
+                      'reordered': 0, 'duplicates': 0}
+        self.rtp_jitter_ms = 0.0
+        self._last_frames = 0
+        self._last_fps_time = time.monotonic()
+
+    def _totals(self):
+        stats = self.client.stats if self.client and self.client.stats else None
+        totals = dict(self.prior)
+        if stats is not None:
+            totals['frames'] += stats.frames
+            totals['damaged'] += stats.frames_damaged
+            totals['bytes'] += stats.bytes
+            totals['expected'] += stats.expected_packets()
+            totals['received'] += stats.received
+            totals['reordered'] += stats.reordered
+            totals['duplicates'] += stats.duplicates
+        return totals
+
+    def _build_status(self, status):
+        totals = self._totals()
+        self.total_frames = totals['frames']
+        self.total_bytes = totals['bytes']
+        now = time.monotonic()
+        if now - self._last_fps_time >= 0.5:
+            self.last_fps = (self.total_frames - self._last_frames) / (now - self._last_fps_time)
+            self._last_frames = self.total_frames
+            self._last_fps_time = now
+        if self.client and self.client.stats:
+            self.rtp_jitter_ms = self.client.stats.jitter_ms()
+        intact = totals['frames'] - totals['damaged']
+        return {
+            'thread_id': self.thread_id,
+            'parent_item_id': self.parent_item_id,
+            'status': status,
+            'total_frames': self.total_frames,
+            'received_frames': intact,
+            'total_bytes': self.total_bytes,
+            'reconnect_count': self.reconnect_count,
+            'connect_latency': self.connect_latency,
+            'current_fps': self.last_fps if status == "运行中" else 0.0,
+            'expected_frames': totals['frames'],
+            'lost_frames': totals['damaged'],
+            'real_fps': self.last_fps,
+            'rtp_expected_packets': totals['expected'],
+            'rtp_lost_packets': max(0, totals['expected'] - totals['received']),
+            'rtp_reordered': totals['reordered'],
+            'rtp_duplicates': totals['duplicates'],
+            'rtp_jitter_ms': self.rtp_jitter_ms,
+        }
+
+    def _drain_latency(self):
+        """取走接收统计中的首包、首个关键帧与帧到达时刻，计入延迟直方图"""
+        stats = self.client.stats
+        if self.awaiting_first_packet and stats.first_packet_time is not None:
+            self.on_first_packet(stats.first_packet_time)
+        if self.awaiting_keyframe and stats.first_keyframe_time is not None:
+            self.on_first_keyframe(stats.first_keyframe_time)
+        if stats.frame_arrivals:
+            self.arrival_batch.extend(stats.frame_arrivals)
+            stats.frame_arrivals.clear()
+        self.flush_arrivals()
+        if stats.keyframe_marks:
+            self.keyframe_marks.extend(stats.keyframe_marks)
+            stats.keyframe_marks.clear()
+
+    def _accumulate(self):
+        """连接结束时把本次连接的统计并入累计值"""
+        if self.client.stats is not None:
+            self._drain_latency()
+        self.prior = self._totals()
+        self.client = None
+
+    async def _receive(self):
+        # TCP 交织模式下 RTP 包与 RTSP 响应共用控制连接；UDP 模式下这里只消费保活响应
+        while True:
+            await self.client.read_message()
+
+    async def _stream(self):
+        """接收数据并按固定间隔推送状态，超时无数据时抛出异常触发重连"""
+        receiver = asyncio.ensure_future(self._receive())
+        interval = SETTINGS.stats_interval_ms / 1000.0
+        timeout = SETTINGS.rtp_timeout_threshold / 1000.0
+        stream_start = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                done, _ = await asyncio.wait([receiver], timeout=interval)
+                if done:
+                    receiver.result()
+                    raise RTSPError("控制连接已关闭")
+                last = self.client.stats.last_packet_time or stream_start
+                if time.monotonic() - last > timeout:
+                    raise RTSPError(f"RTP数据超时: {timeout:.1f}秒未收到数据")
+                if self.client.keepalive_due():
+                    self.client.send_keepalive()
+                self._drain_latency()
+                self.metrics.write(self._build_status("运行中"))
+                self.write_gop_stats(time.monotonic())
+                if time.time() - self.last_log_time >= 10:
+                    stats = self.client.stats
+                    self.logger.info(
+                        f"RTP包: {stats.received} | 丢包: {stats.lost_packets()} | 乱序: {stats.reordered} | "
+                        f"重复: {stats.duplicates} | 抖动: {stats.jitter_ms():.2f}ms | 受损帧: {stats.frames_damaged}"
+                    )
+                    self.last_log_time = time.time()
+        finally:
+            receiver.cancel()
+
+    async def run_async(self):
+        if not self.prepare_url():
+            return
+        await self._sleep(self.start_delay())
+        # 多进程引擎重启分片时会预先写入累计计数
+        self.prior['frames'] = self.total_frames
+        self.prior['bytes'] = self.total_bytes
+
+        while not self.stop_event.is_set():
+            try:
+                if not await self._wait_connect_permit():
+                    break
+                self.logger.debug(f"正在直连: {self.url}...")
+                start_time = time.time()
+                connect_started = time.monotonic()
+                self.connect_phases.reset()
+                self.client = RTSPClient(self.url, self.protocol, self.logger)
+                try:
+                    await self.client.open()
+                except RTP_CLIENT_ERRORS:
+                    self.on_connect_failed()
+                    raise
+                finally:
+                    if self.client.dns_seconds is not None:
+                        self.record_dns(self.client.dns_seconds, self.client.dns_hit)
+                self.on_connect_succeeded()
+                self.connect_latency = time.time() - start_time
+                phases = self.connect_phases
+                phases.dns = self.client.dns_seconds
+                phases.tcp = self.client.tcp_seconds
+                phases.handshake = self.client.handshake_seconds
+                phases.opened = time.monotonic() - connect_started
+                self.start_latency_tracking(connect_started)
+                self.flush_keyframes()
+                self.keyframe_unit_seconds = 1.0 / self.client.sdp['clock_rate'] if self.client.sdp.get('clock_rate') else 0.0
+                self.gop_stats.on_connect()
+                self.start_time = time.time()
+                self.logger.info(f"{self.client.protocol} 直连成功！延迟: {self.connect_latency:.1f}s。"
+                                 f"编码: {self.client.sdp.get('codec')}，时钟: {self.client.sdp.get('clock_rate')}Hz")
+                await self._stream()
+            except RTP_CLIENT_ERRORS as e:
+                retry_delay = self.reconnect_delay()
+                self.handle_stream_error(e, retry_delay)
+                await self._backoff_sleep(retry_delay)
+            except Exception as e:
+                self.logger.error(f"发生未知异常: {e}")
+                await self._backoff_sleep(self.reconnect_delay())
+            finally:
+                if self.client is not None:
+                    await self.client.close()
+                    self._accumulate()
+
+        self.publish_final_status()
+
+    def publish_final_status(self):
+        self.metrics.write(self._build_status("已停止"))
+        self.write_gop_stats(time.monotonic())
+        self.logger.info("监控线程已停止。")
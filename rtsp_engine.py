@@ -0,0 +1,2078 @@
+# -*- coding: utf-8 -*-
+"""
+RTSP 压测引擎
+
+不依赖 tkinter 的全部压测逻辑：全局配置、状态队列、帧率与丢帧检测、单路流会话、
+线程监控引擎和系统性能监控。GUI（index.py）与无界面命令行（stress_cli.py）共用本模块。
+"""
+import bisect
+import threading
+import time
+import logging
+import queue
+import logging.handlers
+from collections import defaultdict, deque
+import psutil
+import av
+import av.error
+import datetime
+import socket
+from urllib.parse import urlsplit
+import numpy as np
+
+from metrics_table import create_metrics_table
+import reconnect_policy
+from decode_stage import DecodeStats, StreamDecoder
+from gop_stats import GopStats
+from slice_parser import SliceClassifier
+from stream_param_cache import PARAM_CACHE, check_params, read_stream_params
+from option_tuner import TUNE_PROFILES
+from connect_phases import PHASE_FIELDS, PHASE_NAMES, ConnectPhases, is_ip_literal, tcp_connect_timed
+from dns_cache import DNS_CACHE, CachedResolveError, replace_host, url_hosts
+from histograms import (HIST_BACKOFF, HIST_CONNECT, HIST_DNS, HIST_FIRST_KEYFRAME, HIST_FIRST_PACKET, HIST_HANDSHAKE,
+                        HIST_INTER_ARRIVAL, HIST_NAMES, HIST_PROBE, HIST_TCP, record, record_many, summarize)
+from reconnect_policy import BREAKER_CLOSED, DecorrelatedJitterBackoff, get_breaker
+from timeseries_store import TimeSeriesStore
+
+# ==============================================================================
+# 全局配置管理
+# ==============================================================================
+class SettingsManager:
+    """管理所有可配置参数的类"""
+    def __init__(self):
+        # 保存原始默认值，用于重置
+        self.defaults = {}
+        
+        # GUI和系统参数
+        self.gui_refresh_interval = 200      # GUI刷新频率，毫秒
+        self.gui_refresh_budget_ms = 20      # 每次刷新写入表格的时间预算，超出的行顺延到下一轮，毫秒
+        self.stats_interval_ms = 200         # 会话统计周期（帧率、丢帧、指标写入），毫秒
+        self.reconnect_wait_time = 5         # 重连等待时间，秒
+        self.fps_smooth_window = 10          # 父项汇总 FPS 平滑窗口大小
+        self.threads_per_url = 1             # 每个URL的监控线程数
+        self.sys_monitor_enabled = True      # 是否启用系统监控线程
+        self.timeseries_enabled = False      # 记录长稳测试时序数据（每秒采样，10s/1min汇总）
+        self.timeseries_dir = "soak_data"    # 时序数据根目录，每次运行一个子目录
+        self.metrics_http_enabled = False    # 启用 OpenMetrics/Prometheus 指标端点
+        self.metrics_http_host = "127.0.0.1" # 指标端点监听地址
+        self.metrics_http_port = 9108        # 指标端点端口
+        
+        # 监控引擎参数
+        self.monitor_engine = "线程"          # 监控引擎: 线程/协程/多进程/RTP直连
+        self.async_loop_threads = 2          # 协程引擎事件循环线程数
+        self.async_executor_workers = 64     # 协程引擎阻塞读取线程池上限
+        self.async_read_slice_ms = 100       # 协程会话单次读取时间片，毫秒
+        self.mp_worker_count = 2             # 多进程引擎工作进程数
+        self.mp_worker_engine = "线程"        # 工作进程内部引擎: 线程/协程/RTP直连
+        self.mp_pin_cpu = False              # 工作进程绑定CPU核心
+        self.mp_report_interval_ms = 500     # 工作进程状态回传间隔，毫秒
+        self.mp_restart_delay = 2            # 工作进程崩溃后的最短重启间隔，秒
+        
+        # 加压方式参数
+        self.ramp_profile = "立即"            # 会话启动方式: 立即/线性/阶梯/尖峰
+        self.ramp_rate = 10.0                # 线性加压每秒启动的会话数
+        self.ramp_step_size = 50             # 阶梯加压每阶增加的会话数，尖峰加压的基线会话数
+        self.ramp_step_interval = 30         # 阶梯每阶持续时间、尖峰前的基线时长、线性加压的报告分段，秒
+        
+        # 容量探测参数（stress_cli.py --capacity）
+        self.capacity_step = 10              # 逐步加压时每步增加的会话数
+        self.capacity_max_sessions = 1000    # 会话数上限，达到后仍全部达标则停止加压
+        self.capacity_settle_seconds = 5     # 调整会话数后等待连接稳定的时间，秒
+        self.capacity_hold_seconds = 20      # 每个观察窗口的时长，秒
+        self.capacity_resolution = 1         # 二分搜索停止时的区间宽度，路
+        self.capacity_confirm_rounds = 2     # 在最大稳定并发上连续确认的窗口数
+        self.capacity_max_reconnect_rate = 0.5 # 每路每分钟重连次数上限
+        self.capacity_nic_usage = 80         # 网卡接收速率占标称速率的上限，百分比
+        
+        # 重连策略参数
+        self.reconnect_backoff_max = 60      # 重连退避等待上限，秒；连接持续超过该时长后退避从头计算
+        self.breaker_failure_threshold = 5   # 同一主机连续连接失败多少次后熔断
+        self.breaker_open_seconds = 30       # 熔断持续时间，到期后放行一路会话探测，秒
+        self.connect_rate_limit = 100        # 全局每秒连接尝试次数上限，0 表示不限制
+        self.connect_burst = 100             # 连接尝试令牌桶容量（允许的瞬时并发连接数）
+        self.connect_phase_probe = False     # libav引擎打开前另建一次TCP短连接测量建连耗时（多占用服务器一次连接）
+        self.phase_histograms_enabled = False # 记录各连接阶段与重试退避的延迟分布（指标表每路多占约18KB）
+        
+        # DNS缓存参数
+        self.dns_cache_enabled = True        # 会话经进程内DNS缓存解析主机名，启动前并行预解析全部URL
+        self.dns_cache_ttl = 300             # 解析结果缓存时长，秒
+        self.dns_negative_ttl = 30           # 解析失败的缓存时长，秒
+        self.dns_prefetch_workers = 32       # 预解析并行线程数
+        self.dns_rewrite_urls = False        # libav引擎连接时把URL中的主机名替换为解析得到的地址，不再自行解析
+        
+        # 数据质量参数
+        self.enable_real_packet_loss = True  # 启用真实丢包检测
+        self.enable_frame_analysis = True    # 启用帧类型分析
+        self.slice_analysis_enabled = False  # 码流级帧类型识别：解析片头统计I/P/B帧，每包约3微秒，默认关闭
+        self.quality_level = "高级"           # 数据质量等级: 基础/标准/高级
+        
+        # 核心RTSP参数
+        self.rtsp_timeout = 5000000          # PyAV拉流超时，微秒
+        self.rtsp_buffer_size = 2097152      # RTSP缓冲区大小，字节
+        self.rtsp_user_agent = "LibVLC/3.0.0" # RTSP用户代理
+        self.rtsp_max_delay = 500000         # 最大延迟，微秒
+        self.rtsp_probe_size = 2097152       # 探测大小，字节
+        self.rtsp_analyzeduration = 2000000 # 分析时长，微秒
+        self.strict_protocol = True         # 默认严格使用用户选择的协议
+        
+        # 流参数缓存参数
+        self.param_cache_enabled = True      # 按URL缓存流参数，重连时使用快速探测，参数不一致时回退完整探测
+        self.param_cache_file = "stream_params.json" # 流参数缓存文件，压测重启后仍然生效
+        self.fast_probe_size = 32768         # 命中缓存时的探测大小，字节
+        self.fast_analyzeduration = 100000   # 命中缓存时的分析时长，微秒
+        
+        # 连接参数调优（stress_cli.py --tune）
+        self.tune_profiles_enabled = True    # 连接已登记主机时使用其调优配置中的缓冲区、探测、延迟与超时参数
+        self.tune_profiles_file = "tune_profiles.json" # 调优配置文件
+        self.tune_trial_seconds = 10         # 每次试连的观察时长，秒，应长于样本流的关键帧间隔
+        self.tune_trials = 2                 # 每个参数组合的试连次数
+        
+        # 质量监控参数
+        self.rtp_timeout_threshold = 5000    # RTP超时阈值，毫秒
+        self.packet_loss_threshold = 5.0     # 丢帧率阈值，百分比
+        
+        # PTS丢帧检测参数
+        self.pts_tolerance_ms = 100          # PTS时间戳容错范围，毫秒
+        self.frame_interval_tolerance = 0.15 # 帧间隔容错比例
+        self.missing_frame_threshold = 3     # 连续丢帧判断阈值
+        self.pts_reset_threshold = 5000      # PTS重置检测阈值，毫秒
+        self.enable_pts_smoothing = True     # 启用PTS平滑算法
+        self.pts_history_size = 50           # PTS历史缓存大小（帧间隔中位数窗口）
+        self.frame_rate_change_frames = 5    # 连续多少个相近的超长间隔判定为帧率变化，小于2关闭
+        
+        # 丢帧统计参数
+        self.frame_loss_window_size = 1000   # 丢帧统计窗口大小
+        self.frame_loss_report_interval = 10 # 丢帧报告间隔，秒
+        self.enable_iframe_priority = True   # I帧丢失优先级检测
+        
+        # 真实帧率检测参数
+        self.fps_detection_method = "自动"    # 帧率检测方法: 自动/手动/混合
+        self.fps_calculation_window = 100    # 动态计算窗口大小
+        self.fps_update_interval = 5         # 帧率更新频率，秒
+        
+        # 解码压测参数
+        self.decode_enabled = False          # 解码压测：拉流后实际解码视频帧，统计解码耗时与CPU
+        self.decode_threads = 1              # 每路解码器的线程数，0 表示由 libav 按CPU核数决定
+        self.decode_thread_type = "自动"      # 解码线程类型: 自动/帧级/片级
+        self.decode_skip = "全部帧"           # 解码范围: 全部帧/跳过非参考帧/仅关键帧
+        self.decode_queue_size = 50          # 每路待解码包队列上限，满时丢到下一个关键帧
+
+        # 码率与GOP统计参数（不解码）
+        self.bitrate_window_seconds = 10     # 码率滑动窗口，秒
+        self.gop_warn_seconds = 4.0          # 关键帧间隔超过该值时在报告中标注，秒
+        
+        # 系统性能参数
+        self.max_cpu_usage = 80              # 最大CPU使用率，百分比
+        self.max_memory_usage = 70           # 最大内存使用率，百分比
+        self.enable_performance_limit = True # 启用性能限制
+        self.log_level = "INFO"              # 日志级别
+        self.log_max_lines = 2000            # 日志框最多保留行数，超出后成批删除最旧的行
+        self.file_log_enabled = True         # 压测日志写入文件，由后台线程写盘，不阻塞会话
+        self.file_log_dir = "LOG"            # 日志根目录，每次运行一个子目录
+        self.file_log_per_stream = False     # 每路流的日志另写入各自的文件
+        self.file_log_max_mb = 20            # 单个日志文件大小上限，MB，超出后轮转；0 不按大小轮转
+        self.file_log_rotate_hours = 24      # 按时间轮转的间隔，小时；0 不按时间轮转
+        self.file_log_backup_count = 20      # 每个日志文件保留的轮转份数
+        self.file_log_compress = True        # 轮转出的日志文件用 gzip 压缩
+        
+        # 保存初始化后的默认值
+        self._save_defaults()
+    
+    def _save_defaults(self):
+        """保存当前所有参数值作为默认值"""
+        for attr_name in dir(self):
+            if not attr_name.startswith('_') and not callable(getattr(self, attr_name)) and attr_name != 'defaults':
+                self.defaults[attr_name] = getattr(self, attr_name)
+    
+    def reset_to_defaults(self):
+        """重置所有参数为默认值"""
+        for attr_name, default_value in self.defaults.items():
+            setattr(self, attr_name, default_value)
+    
+    def get_quality_config(self):
+        """根据质量等级返回对应配置"""
+        if self.quality_level == "基础":
+            return {
+                "enable_real_packet_loss": False,
+                "enable_frame_analysis": False
+            }
+        elif self.quality_level == "标准":
+            return {
+                "enable_real_packet_loss": True,
+                "enable_frame_analysis": False
+            }
+        else:  # 高级
+            return {
+                "enable_real_packet_loss": True,
+                "enable_frame_analysis": True
+            }
+
+SETTINGS = SettingsManager()
+SYSTEM_MONITOR_ID = -1
+
+# ==============================================================================
+# 全局状态管理
+# ==============================================================================
+STATUS_QUEUES = defaultdict(queue.Queue)
+# 各路流的实时指标，会话原地写入，GUI/报表按快照读取
+METRICS_TABLE = create_metrics_table()
+
+
+class BoundedLogQueue(deque):
+    """有界日志队列：满时丢弃最旧的日志并计数，消费方据此提示丢弃条数"""
+    def __init__(self, maxlen):
+        super().__init__(maxlen=maxlen)
+        self.dropped = 0
+
+    def append(self, item):
+        if len(self) == self.maxlen:
+            self.dropped += 1
+        super().append(item)
+
+    def extend(self, items):
+        items = list(items)
+        overflow = len(self) + len(items) - self.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+        super().extend(items)
+
+    def take_dropped(self):
+        """返回自上次调用以来丢弃的条数"""
+        dropped = self.dropped
+        self.dropped -= dropped
+        return dropped
+
+
+# 日志队列上限：重连风暴时每路流都在写日志，超出后丢弃最旧的日志而不是无限增长
+LOG_QUEUE_MAX = 10000
+LOG_QUEUE = BoundedLogQueue(LOG_QUEUE_MAX)
+THREAD_TO_URL_MAP = {}
+def create_aggregated_data():
+    return {
+        'total_frames': 0,
+        'total_bytes': 0,
+        'total_reconnects': 0,
+        'total_expected_frames': 0,
+        'total_lost_frames': 0,
+        'fps_list': deque(maxlen=SETTINGS.fps_smooth_window),
+        'latency_list': deque(maxlen=100),
+        'start_time': None,
+    }
+
+AGGREGATED_DATA = defaultdict(create_aggregated_data)
+THREAD_NAME_MAP = {}
+STOP_EVENT = threading.Event()
+SYSTEM_MONITOR_STOP_EVENT = threading.Event()
+# SystemMonitor 的最新一次采样，供指标端点等只读方直接读取（GUI 仍通过队列消费）
+LATEST_SYSTEM_INFO = {}
+
+# ==============================================================================
+# 线程安全日志处理器
+# ==============================================================================
+class ThreadSafeLogHandler(logging.Handler):
+    """用于将日志发送到GUI队列"""
+    def __init__(self, log_queue):
+        super().__init__()
+        self.log_queue = log_queue
+
+    def emit(self, record):
+        # 移除RTSP流监控线程的日志，避免刷屏
+        # if record.name.startswith("线程-") or record.name == "root":
+        #     return
+            
+        # 修正：将日志名作为前缀，并移除冗余信息，添加日期
+        log_time = datetime.datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
+        log_name = record.name if record.name != "root" else "System"
+        log_message = f"[{log_time}] - [{log_name}] - [{record.levelname}] - {self.format(record)}"
+        self.log_queue.append((record.levelno, log_message))
+
+logging.basicConfig(level=logging.DEBUG)
+for handler in logging.getLogger().handlers[:]:
+    logging.getLogger().removeHandler(handler)
+
+gui_handler = ThreadSafeLogHandler(LOG_QUEUE)
+gui_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.getLogger().addHandler(gui_handler)
+
+# ==============================================================================
+# 已移除QoE评分相关功能
+# ==============================================================================
+
+# ==============================================================================
+# PTS丢帧检测类
+# ==============================================================================
+class RunningMedian:
+    """滑动窗口中位数：按到达顺序保留最近 size 个值，同时维护有序副本，
+    二分定位插入与淘汰位置，中位数 O(1) 读取"""
+    def __init__(self, size):
+        self.size = max(1, size)
+        self.window = deque(maxlen=self.size)
+        self.sorted = []
+
+    def __len__(self):
+        return len(self.window)
+
+    def add(self, value):
+        if len(self.window) == self.size:
+            del self.sorted[bisect.bisect_left(self.sorted, self.window[0])]
+        self.window.append(value)
+        bisect.insort(self.sorted, value)
+
+    def extend(self, values):
+        """批量追加，结果与逐个 add 相同"""
+        self.window.extend(values)
+        self.sorted = sorted(self.window)
+
+    def reset(self, values=()):
+        self.window.clear()
+        self.extend(values)
+
+    def median(self):
+        """上中位数（偶数个时取靠后的一个），窗口为空时返回 None"""
+        return self.sorted[len(self.sorted) // 2] if self.sorted else None
+
+    def quantile(self, q):
+        if not self.sorted:
+            return None
+        return self.sorted[min(len(self.sorted) - 1, int(q * len(self.sorted)))]
+
+
+class PTSFrameLossDetector:
+    """基于PTS时间戳的真实丢帧检测器
+
+    期望帧间隔取最近 pts_history_size 个正间隔的滑动中位数，随流持续更新；
+    连续 frame_rate_change_frames 个相近的超长间隔视为帧率下降（如带宽自适应 25→12.5fps），
+    直接切换期望间隔而不计丢帧，因此超长间隔要等到下一帧才能确定是否计入丢帧。
+    """
+    # 滑动中位数至少积累的间隔数，少于此数时沿用已知帧率或继续学习
+    MIN_INTERVAL_SAMPLES = 9
+
+    def __init__(self):
+        self.pts_history = deque(maxlen=SETTINGS.pts_history_size)
+        self.interval_median = RunningMedian(SETTINGS.pts_history_size)
+        self.pending_intervals = []  # 尚未确定是丢帧还是帧率变化的超长间隔
+        self.last_pts = None
+        self.expected_frame_interval = None
+        self.frame_rate = None
+        self.total_frames_detected = 0
+        self.total_frames_lost = 0
+        self.consecutive_losses = 0
+        self.frame_rate_changes = 0
+        self.pts_reset_detected = False
+        
+    def update_frame_rate(self, fps):
+        """更新帧率并计算期望帧间隔"""
+        if fps and fps > 0:
+            self.frame_rate = fps
+            self.expected_frame_interval = 1000.0 / fps  # 毫秒
+    
+    def detect_frame_loss(self, current_pts_ms):
+        """检测基于PTS的帧丢失
+        Args:
+            current_pts_ms: 当前帧的PTS时间戳(毫秒)
+        Returns:
+            dict: 包含丢帧信息的字典
+        """
+        result = {
+            'frames_lost': 0,
+            'pts_reset': False,
+            'interval_abnormal': False,
+            'total_lost': self.total_frames_lost
+        }
+        
+        if self.last_pts is None:
+            # 第一帧，初始化
+            self.last_pts = current_pts_ms
+            self.pts_history.append(current_pts_ms)
+            return result
+        
+        # 检测PTS重置或回退
+        if current_pts_ms < self.last_pts:
+            if (self.last_pts - current_pts_ms) > SETTINGS.pts_reset_threshold:
+                result['pts_reset'] = True
+                self._commit_pending(result)
+                self.pts_reset_detected = True
+                self._reset_detector()
+                result['total_lost'] = self.total_frames_lost
+                return result
+        
+        # 计算PTS间隔
+        pts_interval = current_pts_ms - self.last_pts
+        
+        # 容错处理
+        tolerance_ms = SETTINGS.pts_tolerance_ms
+        interval_tolerance = SETTINGS.frame_interval_tolerance
+        
+        if self.expected_frame_interval and pts_interval > (self.expected_frame_interval * (1 + interval_tolerance) + tolerance_ms):
+            # 超长间隔先暂存，与暂存的间隔不相近时说明不是同一次帧率变化
+            result['interval_abnormal'] = True
+            if self.pending_intervals and abs(pts_interval - self.pending_intervals[0]) > self.pending_intervals[0] * interval_tolerance:
+                self._commit_pending(result)
+            self.pending_intervals.append(pts_interval)
+            
+            if SETTINGS.frame_rate_change_frames < 2:
+                self._commit_pending(result)
+            elif len(self.pending_intervals) >= SETTINGS.frame_rate_change_frames:
+                self._apply_frame_rate_change(result)
+        else:
+            # 正常间隔：之前暂存的超长间隔确认是丢帧
+            self._commit_pending(result)
+            self.consecutive_losses = 0
+            self._learn_interval(pts_interval)
+        
+        # 更新历史记录
+        self.pts_history.append(current_pts_ms)
+        self.last_pts = current_pts_ms
+        self.total_frames_detected += 1
+        result['total_lost'] = self.total_frames_lost
+        
+        return result
+    
+    def _learn_interval(self, pts_interval):
+        """正间隔计入滑动中位数，样本足够后更新期望帧间隔"""
+        if pts_interval > 0:
+            self.interval_median.add(pts_interval)
+            if len(self.interval_median) >= min(self.MIN_INTERVAL_SAMPLES, self.interval_median.size):
+                self.expected_frame_interval = self.interval_median.median()
+    
+    def _commit_pending(self, result):
+        """暂存的超长间隔按丢帧计入统计"""
+        if not self.pending_intervals:
+            return
+        expected_interval = self.expected_frame_interval
+        for pts_interval in self.pending_intervals:
+            # 计算丢失的帧数
+            frames_lost = max(0, round(pts_interval / expected_interval) - 1)
+            result['frames_lost'] += frames_lost
+            self.total_frames_lost += frames_lost
+            self.consecutive_losses += 1
+            
+            # 连续丢帧告警
+            if self.consecutive_losses >= SETTINGS.missing_frame_threshold:
+                result['consecutive_loss_alert'] = True
+        for pts_interval in self.pending_intervals:
+            self._learn_interval(pts_interval)
+        self.pending_intervals.clear()
+    
+    def _apply_frame_rate_change(self, result):
+        """暂存的超长间隔确认为帧率变化：以其中位数作为新的期望间隔，不计丢帧"""
+        self.interval_median.reset(self.pending_intervals)
+        self.expected_frame_interval = self.interval_median.median()
+        self.frame_rate = 1000.0 / self.expected_frame_interval
+        self.pending_intervals.clear()
+        self.consecutive_losses = 0
+        self.frame_rate_changes += 1
+        result['frame_rate_change'] = self.frame_rate
+    
+    def _reset_detector(self):
+        """重置检测器状态（帧间隔中位数保留，PTS重置不改变帧率）"""
+        self.pts_history.clear()
+        self.pending_intervals.clear()
+        self.last_pts = None
+        self.consecutive_losses = 0
+        self.pts_reset_detected = False
+    
+    def get_loss_statistics(self):
+        """获取丢帧统计信息"""
+        if self.total_frames_detected == 0:
+            return {'loss_rate': 0.0, 'total_detected': 0, 'total_lost': 0}
+        
+        loss_rate = (self.total_frames_lost / (self.total_frames_detected + self.total_frames_lost)) * 100
+        return {
+            'loss_rate': loss_rate,
+            'total_detected': self.total_frames_detected,
+            'total_lost': self.total_frames_lost,
+            'expected_interval': self.expected_frame_interval,
+            'frame_rate_changes': self.frame_rate_changes
+        }
+
+# PTS窗口最长暂存时间（秒），低帧率流攒不满一个向量化窗口时按此时间送检
+PTS_WINDOW_MAX_AGE = 1.0
+
+class BatchPTSFrameLossDetector(PTSFrameLossDetector):
+    """批量版PTS丢帧检测器：按统计周期整窗处理PTS，结果与逐帧检测完全一致
+
+    中位数窗口已满且没有待定超长间隔时，用 NumPy 一次判定整窗间隔：先用滑动中位数的下界筛出
+    可能的超长间隔，只对这些候选计算当时的滑动中位数，找到第一个超长间隔或PTS重置点；
+    正常帧整段并入状态，超长间隔、重置点、起始和学习阶段退回逐帧逻辑，保证状态转换与父类相同。
+    窗口过小时向量化的固定开销高于逐帧计算，直接逐帧处理。
+    """
+    MIN_VECTOR_FRAMES = 16
+
+    def __init__(self):
+        super().__init__()
+        # 复用的窗口缓冲区，首个槽位存放上一帧PTS，容量不足时按需扩大
+        self.window = np.empty(256, dtype=np.float64)
+
+    def detect_batch(self, pts_values, unit_ms=1.0):
+        """检测一批按到达顺序排列的PTS，pts_values * unit_ms 为毫秒值
+        Returns:
+            dict: 本批丢帧数、异常间隔数、连续丢帧告警次数、PTS重置次数、帧率变化次数及累计丢帧
+        """
+        result = {
+            'frames_lost': 0,
+            'abnormal_intervals': 0,
+            'consecutive_loss_alerts': 0,
+            'pts_resets': 0,
+            'frame_rate_changes': 0,
+            'total_lost': self.total_frames_lost
+        }
+        count = len(pts_values)
+        if count < self.MIN_VECTOR_FRAMES:
+            for pts in pts_values:
+                self._merge_scalar(result, self.detect_frame_loss(pts * unit_ms))
+            result['total_lost'] = self.total_frames_lost
+            return result
+
+        if count + 1 > len(self.window):
+            self.window = np.empty(max(count + 1, len(self.window) * 2), dtype=np.float64)
+        window = self.window[:count + 1]
+        window[1:] = pts_values
+        if unit_ms != 1.0:
+            window[1:] *= unit_ms
+
+        # window[i + 1] 为第 i 帧，window[i] 为其前一帧
+        i = 0
+        while i < count:
+            if (self.last_pts is None or not self.expected_frame_interval or self.pending_intervals
+                    or len(self.interval_median) < self.interval_median.size):
+                self._merge_scalar(result, self.detect_frame_loss(float(window[i + 1])))
+                i += 1
+                continue
+
+            window[i] = self.last_pts
+            intervals = window[i + 1:] - window[i:-1]
+            end = len(intervals)
+            if intervals.min() < -SETTINGS.pts_reset_threshold:
+                end = int(np.argmax(intervals < -SETTINGS.pts_reset_threshold))
+            if end:
+                end = self._normal_prefix(intervals[:end])
+            if end:
+                self._accept_normal(window[i + 1:i + 1 + end], intervals[:end])
+            if i + end < count:
+                # 超长间隔或PTS重置点交给逐帧逻辑处理
+                self._merge_scalar(result, self.detect_frame_loss(float(window[i + 1 + end])))
+            i += end + 1
+
+        result['total_lost'] = self.total_frames_lost
+        return result
+
+    def _normal_prefix(self, intervals):
+        """返回开头连续正常间隔的个数，逐帧期望间隔为此前窗口的滑动中位数"""
+        factor = 1 + SETTINGS.frame_interval_tolerance
+        tolerance_ms = SETTINGS.pts_tolerance_ms
+        median = self.interval_median
+        half = median.size // 2
+        count = len(intervals)
+
+        # 窗口滑过 count 个新间隔时，中位数不低于原窗口第 half - count 小的值与新间隔最小值，
+        # 不超过该下界阈值的间隔一定正常，只需核对超过它的候选
+        lowest = intervals.min()
+        added = intervals if lowest > 0 else intervals[intervals > 0]
+        lower = min(self.expected_frame_interval, median.sorted[max(0, half - count)])
+        if count > half and len(added):
+            lower = min(lower, added.min())
+        candidates = np.flatnonzero(intervals > lower * factor + tolerance_ms)
+        if not len(candidates):
+            return count
+
+        # 逐个候选计算其前一刻的滑动中位数确认
+        merged = np.concatenate((np.fromiter(median.window, np.float64, median.size), added))
+        positive = intervals > 0
+        prior = np.cumsum(positive) - positive
+        for index in candidates.tolist():
+            shift = int(prior[index])
+            if shift:
+                expected_interval = np.partition(merged[shift:shift + median.size], half)[half]
+            else:
+                expected_interval = self.expected_frame_interval
+            if intervals[index] > expected_interval * factor + tolerance_ms:
+                return index
+        return count
+
+    def _accept_normal(self, segment, intervals):
+        """一段全部正常的帧整体并入检测器状态"""
+        added = [interval for interval in intervals.tolist() if interval > 0]
+        if added:
+            # 进入向量化路径时中位数窗口已满，样本数满足学习条件
+            self.interval_median.extend(added)
+            self.expected_frame_interval = self.interval_median.median()
+        self.consecutive_losses = 0
+        self.pts_history.extend(segment[-self.pts_history.maxlen:].tolist())
+        self.last_pts = float(segment[-1])
+        self.total_frames_detected += len(segment)
+
+    @staticmethod
+    def _merge_scalar(result, frame_result):
+        result['frames_lost'] += frame_result['frames_lost']
+        if frame_result['interval_abnormal']:
+            result['abnormal_intervals'] += 1
+        if frame_result.get('consecutive_loss_alert'):
+            result['consecutive_loss_alerts'] += 1
+        if frame_result['pts_reset']:
+            result['pts_resets'] += 1
+        if frame_result.get('frame_rate_change'):
+            result['frame_rate_changes'] += 1
+
+
+# ==============================================================================
+# 真实帧率检测类  
+# ==============================================================================
+class RealTimeFrameRateDetector:
+    """真实帧率检测器"""
+    def __init__(self):
+        self.detection_method = SETTINGS.fps_detection_method
+        self.calculation_window = SETTINGS.fps_calculation_window
+        self.frame_timestamps = deque(maxlen=self.calculation_window)
+        # 统计周期采样 (时间毫秒, 累计帧数)，替代逐帧记录时间戳
+        self.frame_count_samples = deque(maxlen=self.calculation_window)
+        self.last_calculated_fps = None
+        
+    def get_real_framerate(self, container):
+        """获取真实帧率"""
+        try:
+            # 方法1: 从流元数据获取
+            if container and container.streams.video:
+                video_stream = container.streams.video[0]
+                
+                if video_stream.average_rate and video_stream.average_rate > 0:
+                    fps = float(video_stream.average_rate)
+                    if 1 <= fps <= 120:  # 合理范围检查
+                        return fps
+                
+                # 方法2: 从编码器信息获取
+                if hasattr(video_stream, 'codec_context') and video_stream.codec_context.framerate:
+                    fps = float(video_stream.codec_context.framerate)
+                    if 1 <= fps <= 120:
+                        return fps
+                
+                # 方法3: 从时间基获取
+                if video_stream.time_base and video_stream.duration:
+                    time_base_fps = 1.0 / float(video_stream.time_base)
+                    if 1 <= time_base_fps <= 120:
+                        return time_base_fps
+                        
+        except Exception:
+            pass
+        
+        # 方法4: 动态计算(基于帧时间戳)
+        return self.calculate_fps_from_timestamps()
+    
+    def add_frame_timestamp(self, pts_ms):
+        """添加帧时间戳用于动态计算"""
+        current_time = time.time() * 1000  # 转换为毫秒
+        self.frame_timestamps.append(current_time)
+    
+    def add_frame_count(self, total_frames, now_ms):
+        """统计周期调用，记录当前累计帧数"""
+        samples = self.frame_count_samples
+        samples.append((now_ms, total_frames))
+        # 只保留覆盖最近 calculation_window 帧的采样
+        while len(samples) > 2 and samples[-1][1] - samples[1][1] >= self.calculation_window:
+            samples.popleft()
+    
+    def calculate_fps_from_timestamps(self):
+        """基于时间戳动态计算帧率"""
+        samples = self.frame_count_samples
+        if len(samples) >= 2 and samples[-1][1] - samples[0][1] >= 10:
+            time_span = samples[-1][0] - samples[0][0]
+            frame_count = samples[-1][1] - samples[0][1]
+        elif len(self.frame_timestamps) >= 10:
+            time_span = self.frame_timestamps[-1] - self.frame_timestamps[0]
+            frame_count = len(self.frame_timestamps) - 1
+        else:
+            return self.last_calculated_fps
+        
+        if time_span > 0:
+            fps = (frame_count * 1000.0) / time_span  # 转换为秒
+            if 1 <= fps <= 120:
+                self.last_calculated_fps = fps
+                return fps
+            
+        return self.last_calculated_fps
+
+# ==============================================================================
+# 流会话核心逻辑
+# ==============================================================================
+# 连接或拉流过程中需要触发重连的异常类型
+STREAM_ERRORS = (av.error.HTTPUnauthorizedError, av.error.InvalidDataError, av.error.ExitError, av.error.FFmpegError, OSError, ConnectionError)
+
+class StreamSession:
+    """单路RTSP流的状态与处理逻辑，不绑定执行方式，由线程或协程引擎驱动"""
+    def __init__(self, url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol='UDP', start_at=0.0):
+        self.url = url
+        # 本次连接实际打开的地址，开启 dns_rewrite_urls 时主机名替换为解析结果
+        self.connect_url = url
+        self.thread_id = thread_id
+        self.parent_item_id = parent_item_id
+        self.protocol = protocol
+        # 按加压计划的启动时刻（time.time()），0 表示立即启动
+        self.start_at = start_at
+        self.stop_event = STOP_EVENT
+        self.metrics = METRICS_TABLE.register(thread_id)
+        self.container = None
+        
+        log_name = f"线程-{parent_url_id:02d}-{thread_idx+1:02d}"
+        self.log_name = log_name
+        self.logger = logging.getLogger(log_name)
+        
+        self.total_frames = 0
+        self.total_bytes = 0
+        self.reconnect_count = 0
+        
+        # 重连退避与所属主机的熔断器（prepare_url 校验地址后获取）
+        self.backoff = DecorrelatedJitterBackoff()
+        self.breaker = None
+        self.breaker_state = BREAKER_CLOSED
+        self.connected_at = 0.0
+        
+        self.connect_latency = 0.0
+        self.fps_frames_count = 0           # 上次计算帧率时的累计帧数
+        self.fps_start_time = time.time()
+        self.start_time = time.time()
+        self.last_fps = 0.0
+        
+        self.rtp_sequence = 0
+        self.last_rtp_timestamp = 0
+        self.i_frame_lost_detected = False
+        self.packets_lost_count = 0  # 保留作为兼容性字段，不再使用模拟数据
+        
+        # 真实丢包检测变量
+        self.real_rtp_sequence = 0
+        self.expected_rtp_sequence = 0
+        self.real_packet_loss_count = 0
+        self.last_packet_time = 0.0
+        
+        # 帧类型分析变量
+        self.i_frame_count = 0
+        self.p_frame_count = 0
+        self.b_frame_count = 0
+        self.last_frame_type = None
+        self.frame_analysis_enabled = SETTINGS.enable_frame_analysis
+        # 码流级帧类型识别：解析片头，不需要解码，但每包都要解析，单独开关；计数跨重连累计，连接成功后按编码重建解析状态
+        self.slice_classifier = SliceClassifier() if SETTINGS.slice_analysis_enabled else None
+        self.slice_active = False
+        self.real_packet_loss_enabled = SETTINGS.enable_real_packet_loss
+        
+        # 新增变量，用于控制日志打印频率
+        self.last_log_time = time.time()
+        
+        # 初始化PTS丢帧检测器和真实帧率检测器
+        self.pts_detector = BatchPTSFrameLossDetector()
+        self.fps_detector = RealTimeFrameRateDetector()
+        self.real_fps = None
+        self.pts_frame_loss_count = 0
+        
+        # 解码压测：每次连接一个解码器，统计跨重连累计
+        self.decoder = None
+        self.decode_stats = DecodeStats()
+
+        # 码率与GOP：逐包只暂存关键帧，统计周期内批量计算
+        self.gop_stats = GopStats()
+        self.keyframe_marks = []
+        self.keyframe_unit_seconds = 0.0
+
+        # 流参数缓存：本次连接命中的缓存条目（快速探测成功时），连接统计跨重连累计
+        self.cached_params = None
+        self.probe_mode = None
+        self.probe_baseline = None
+        # 完整探测得到的流参数，连接建立后连同完整的连接耗时一起写入缓存
+        self.probed_params = None
+        self.probe_fast_connects = 0
+        self.probe_full_connects = 0
+        self.probe_fallbacks = 0
+        self.probe_fast_seconds = 0.0
+        self.probe_full_seconds = 0.0
+        self.probe_saved_seconds = 0.0
+        
+        # 连接阶段耗时：最近一次连接的 DNS/TCP/握手/探测/首包/首关键帧，以及累计重试退避
+        self.connect_phases = ConnectPhases()
+        self.dns_hits = 0
+        self.dns_misses = 0
+        self.dns_resolve_seconds = 0.0
+        
+        # 延迟直方图：逐包只暂存到达时刻，到期后批量分桶
+        self.arrival_batch = []
+        self.last_arrival = 0.0
+        self.connect_started = 0.0
+        self.awaiting_first_packet = False
+        self.awaiting_keyframe = False
+        
+        # 周期统计：逐包只暂存PTS，到期后批量处理
+        self.pts_batch = []
+        self.pts_unit_ms = 0.0
+        self.next_stats_time = 0.0
+        self.pts_window_start = 0.0
+
+    def validate_and_fix_rtsp_url(self, url):
+        """验证和修复RTSP URL格式"""
+        if not url:
+            return None
+            
+        # 去除空格和特殊字符
+        url = url.strip()
+        
+        # 检查是否包含rtsp://前缀
+        if not url.lower().startswith('rtsp://'):
+            url = 'rtsp://' + url
+        
+        # 更严格的URL验证和修复
+        try:
+            from urllib.parse import urlparse, urlunparse
+            parsed = urlparse(url)
+            
+            # 确保协议正确
+            if parsed.scheme.lower() != 'rtsp':
+                parsed = parsed._replace(scheme='rtsp')
+            
+            # 确保有主机名
+            if not parsed.hostname:
+                return None
+            
+            # 设置默认端口
+            if not parsed.port:
+                # 重构netloc包含端口
+                if ':' not in parsed.netloc:
+                    parsed = parsed._replace(netloc=f"{parsed.netloc}:554")
+            
+            # 确保路径不为空
+            if not parsed.path or parsed.path == '/':
+                parsed = parsed._replace(path='/stream')
+            
+            # 重构URL
+            fixed_url = urlunparse(parsed)
+            return fixed_url
+            
+        except Exception:
+            # 如果解析失败，使用简单的修复逻辑
+            if '://' in url:
+                parts = url.split('://', 1)
+                if len(parts) == 2:
+                    protocol, rest = parts
+                    if '/' in rest:
+                        host_port, path = rest.split('/', 1)
+                        # 如果没有端口，添加默认端口554
+                        if ':' not in host_port:
+                            host_port += ':554'
+                        url = f"{protocol}://{host_port}/{path}"
+                    else:
+                        # 没有路径，添加默认端口和路径
+                        if ':' not in rest:
+                            rest += ':554'
+                        url = f"{protocol}://{rest}/stream"
+            
+            return url
+
+    def analyze_rtp_packet_loss(self, packet):
+        """分析RTP包损失情况"""
+        try:
+            # 检查packet是否有效
+            if not packet:
+                return False
+                
+            # 检查packet是否有必要的属性
+            if not hasattr(packet, 'size') or packet.size is None or packet.size < 12:
+                return False
+                
+            # 尝试从PyAV packet获取原始数据
+            try:
+                # 只需要包头，优先通过缓冲区协议零拷贝读取，避免整包复制
+                packet_data = memoryview(packet)[:12]
+            except TypeError:
+                try:
+                    # 对于PyAV packet，使用其内部的to_bytes()方法或直接访问
+                    if hasattr(packet, 'to_bytes'):
+                        packet_data = packet.to_bytes()
+                    elif hasattr(packet, 'buffer_ptr') and hasattr(packet, 'buffer_size'):
+                        # 直接从内存缓冲区读取
+                        import ctypes
+                        packet_data = ctypes.string_at(packet.buffer_ptr, min(packet.buffer_size, 64))
+                    else:
+                        # 尝试标准bytes转换
+                        packet_data = bytes(packet)
+                except Exception:
+                    # 如果所有方法都失败，跳过RTP分析
+                    return False
+                
+            if len(packet_data) < 12:
+                return False
+                
+            # 提取RTP序列号 (bytes 2-3)
+            seq_num = int.from_bytes(packet_data[2:4], byteorder='big')
+            
+            # 初始化或序列号检查
+            if not hasattr(self, 'last_rtp_seq') or self.last_rtp_seq is None:
+                self.last_rtp_seq = seq_num
+                return False
+            
+            # 检查序列号是否连续（考虑16位序列号回绕）
+            expected_seq = (self.last_rtp_seq + 1) & 0xFFFF
+            if seq_num != expected_seq:
+                # 检测到丢包
+                if hasattr(self, 'real_packet_loss_count'):
+                    self.real_packet_loss_count += 1
+                self.last_rtp_seq = seq_num
+                return True
+            
+            self.last_rtp_seq = seq_num
+            return False
+            
+        except Exception as e:
+            if hasattr(self, 'logger'):
+                self.logger.error(f"RTP包分析错误: {e}")
+            return False
+    
+    def analyze_frame_type(self, frame):
+        """分析帧类型信息 - 完全基于真实数据"""
+        if not self.frame_analysis_enabled or not frame:
+            return None
+            
+        try:
+            # 使用PyAV获取真实帧类型信息
+            if hasattr(frame, 'pict_type') and frame.pict_type:
+                pict_type = frame.pict_type
+                frame_type = str(pict_type)
+                
+                # 统计不同类型的帧（只基于真实数据）
+                if 'I' in frame_type.upper():
+                    self.i_frame_count += 1
+                    self.last_frame_type = 'I'
+                elif 'P' in frame_type.upper():
+                    self.p_frame_count += 1
+                    self.last_frame_type = 'P'
+                elif 'B' in frame_type.upper():
+                    self.b_frame_count += 1
+                    self.last_frame_type = 'B'
+                else:
+                    self.last_frame_type = 'Unknown'
+                
+                return self.last_frame_type
+            
+            # 无法获取真实帧类型时，不使用模拟数据，直接返回None
+            # 这确保数据的真实性和一致性
+            return None
+            
+        except Exception as e:
+            self.logger.debug(f"帧类型分析失败: {e}")
+            return None
+
+    def prepare_url(self):
+        """校验并修复URL，返回是否可以开始拉流"""
+        # 获取真实帧率，不再使用预设值
+        self.real_fps = None
+
+        # 验证和修复URL格式
+        validated_url = self.validate_and_fix_rtsp_url(self.url)
+        if not validated_url:
+            self.logger.error(f"RTSP URL格式无效: {self.url}")
+            return False
+
+        if validated_url != self.url:
+            # 静默修复URL，不输出日志
+            self.url = validated_url
+        self.breaker = get_breaker(self.url)
+        return True
+
+    def start_delay(self):
+        """距加压计划启动时刻的剩余秒数"""
+        return max(0.0, self.start_at - time.time())
+
+    def wait_for_start(self):
+        """等待到加压计划的启动时刻，期间收到停止信号时提前返回"""
+        delay = self.start_delay()
+        if delay > 0:
+            self.logger.debug(f"按加压计划 {delay:.1f} 秒后启动")
+            self.stop_event.wait(delay)
+
+    def show_breaker_state(self, state):
+        """熔断状态变化时写入指标表，供状态列显示"""
+        if state != self.breaker_state:
+            self.breaker_state = state
+            self.metrics.write({'breaker_state': state})
+
+    def connect_permit(self):
+        """申请一次连接尝试，返回 (是否放行, 需等待的秒数)
+
+        所属主机熔断时不放行，等待后重新申请；放行后向全局令牌桶预约，等待预约的秒数后即可连接。
+        """
+        allowed, wait, state = self.breaker.permit(self, SETTINGS.breaker_open_seconds)
+        self.show_breaker_state(state)
+        if not allowed:
+            return False, wait
+        return True, reconnect_policy.CONNECT_LIMITER.reserve(SETTINGS.connect_rate_limit, SETTINGS.connect_burst)
+
+    def wait_connect_permit(self):
+        """阻塞等待连接许可，期间收到停止信号时返回 False"""
+        while not self.stop_event.is_set():
+            allowed, wait = self.connect_permit()
+            if wait > 0:
+                self.stop_event.wait(wait)
+            if allowed:
+                break
+        return not self.stop_event.is_set()
+
+    def on_connect_succeeded(self):
+        self.connected_at = time.time()
+        self.show_breaker_state(self.breaker.record_success(self))
+
+    def on_connect_failed(self):
+        self.show_breaker_state(self.breaker.record_failure(self, SETTINGS.breaker_failure_threshold))
+
+    def next_retry_delay(self, error_str):
+        """单轮连接内两次尝试的间隔：按错误类型确定最小等待，再叠加抖动退避"""
+        return self.backoff.next(self.get_retry_delay(error_str), SETTINGS.reconnect_backoff_max)
+
+    def reconnect_delay(self):
+        """断线或整轮连接失败后的重连等待；上次连接持续足够久时退避从头计算"""
+        if self.connected_at and time.time() - self.connected_at >= SETTINGS.reconnect_backoff_max:
+            self.backoff.reset()
+        self.connected_at = 0.0
+        return self.backoff.next(SETTINGS.reconnect_wait_time, SETTINGS.reconnect_backoff_max)
+
+    def tune_profile(self):
+        """本路主机登记的调优配置中的设置覆盖，没有时返回空字典"""
+        if not SETTINGS.tune_profiles_enabled:
+            return {}
+        TUNE_PROFILES.load(SETTINGS.tune_profiles_file)
+        found = TUNE_PROFILES.lookup(self.url)
+        if found is None:
+            return {}
+        name, overrides = found
+        self.logger.debug(f"使用调优配置: {name}")
+        return overrides
+
+    def build_connect_options(self):
+        """根据用户选择的协议构造PyAV连接参数，主机有调优配置时以其参数为准"""
+        profile = self.tune_profile()
+        setting = lambda name: profile.get(name, getattr(SETTINGS, name))
+        options = {
+            'rtsp_transport': self.protocol.lower(),
+            'buffer_size': str(setting('rtsp_buffer_size')),
+            'timeout': str(setting('rtsp_timeout')),
+            'stimeout': '10000000',  # 10秒socket超时
+            'user_agent': SETTINGS.rtsp_user_agent,
+            'allowed_media_types': 'video',  # 只处理视频流
+            'analyzeduration': str(setting('rtsp_analyzeduration')),
+            'probesize': str(setting('rtsp_probe_size')),
+            'max_delay': str(setting('rtsp_max_delay')),
+            'reorder_queue_size': '0',  # 禁用重排序队列
+            'fflags': 'nobuffer+fastseek+flush_packets',  # 优化标志
+            'flags': 'low_delay',  # 低延迟标志
+            'strict': 'experimental'  # 允许实验性功能
+        }
+
+        # 根据协议类型设置特定参数
+        if self.protocol.upper() == 'TCP':
+            options['rtsp_flags'] = 'prefer_tcp'
+            options['rtsp_transport'] = 'tcp'
+        else:
+            # UDP协议优化配置 - 使用最简化成功配置
+            options['rtsp_transport'] = 'udp'
+            options.pop('rtsp_flags', None)  # UDP不需要rtsp_flags
+            # 使用测试成功的最简化UDP配置，调优配置给出超时时以其为准
+            options['timeout'] = str(profile['rtsp_timeout']) if 'rtsp_timeout' in profile else '30000000'
+            # 移除可能导致问题的复杂参数，保持简洁
+            options.pop('fifo_size', None)
+            options.pop('overrun_nonfatal', None)
+            options.pop('protocol_whitelist', None)
+            # 保留基础必要参数
+            options['reorder_queue_size'] = '0'  # 禁用重排序队列
+            options['stimeout'] = '20000000'  # socket超时
+            options['buffer_size'] = str(setting('rtsp_buffer_size'))  # 使用设置的缓冲区大小
+        return options
+
+    def get_max_retries(self):
+        """根据是否严格协议模式决定单轮连接的尝试次数"""
+        if SETTINGS.strict_protocol:
+            # 严格模式：仅使用用户选择的协议，不重试其他协议
+            return 3  # 只重试3次，都使用相同协议
+        # 兼容模式：允许尝试不同协议
+        return 5
+
+    def get_attempt_options(self, options, retry, max_retries):
+        """返回第 retry 次连接尝试所使用的参数"""
+        if SETTINGS.strict_protocol:
+            # 严格模式：始终使用用户选择的协议
+            self.logger.debug(f"尝试连接 {retry + 1}/{max_retries}，使用{self.protocol}协议")
+            return options.copy()
+
+        # 兼容模式：尝试不同的连接参数
+        if retry == 0:
+            # 第一次尝试：使用用户选择的协议
+            current_options = options.copy()
+        elif retry == 1:
+            # 第二次尝试：如果用户选UDP，尝试TCP
+            current_options = options.copy()
+            if self.protocol.upper() == 'UDP':
+                current_options['rtsp_transport'] = 'tcp'
+                current_options['rtsp_flags'] = 'prefer_tcp'
+            else:
+                current_options['rtsp_transport'] = 'udp'
+                current_options.pop('rtsp_flags', None)
+        elif retry == 2:
+            # 第三次尝试：使用HTTP tunnel
+            current_options = options.copy()
+            current_options['rtsp_transport'] = 'http'
+            current_options['rtsp_flags'] = 'prefer_tcp'
+        elif retry == 3:
+            # 第四次尝试：最小参数配置
+            current_options = {
+                'rtsp_transport': self.protocol.lower(),
+                'timeout': '30000000',
+                'user_agent': 'VLC/3.0.0'
+            }
+        else:
+            # 最后一次尝试：简化配置
+            current_options = {
+                'timeout': '15000000'
+            }
+
+        transport_info = current_options.get('rtsp_transport', self.protocol.lower())
+        self.logger.debug(f"尝试连接 {retry + 1}/{max_retries}，使用参数: {transport_info}")
+        return current_options
+
+    def get_retry_delay(self, error_str):
+        """根据错误类型返回下一次连接尝试前的等待时间（秒）"""
+        if "Invalid argument" in error_str or "Errno 22" in error_str or "Errno 10049" in error_str:
+            return 0.2  # URL格式错误或地址无效快速重试
+        elif "timed out" in error_str.lower() or "timeout" in error_str.lower():
+            return 3.0  # 超时错误等待更久
+        elif "connection refused" in error_str.lower() or "refused" in error_str.lower():
+            return 2.0  # 连接被拒绝中等延迟
+        elif "unauthorized" in error_str.lower() or "401" in error_str:
+            return 1.0  # 认证问题短延迟
+        elif "10049" in error_str:  # 专门处理UDP连接问题
+            if self.protocol.upper() == 'UDP':
+                return 2.0  # UDP地址问题增加重试延迟
+            return 1.0  # 非UDP协议较短延迟
+        return 1.5  # 其他错误中等延迟
+
+    def open_container(self, options):
+        """打开RTSP流，阻塞调用"""
+        return av.open(self.connect_url, mode='r', options=options)
+
+    def open_stream(self, options):
+        """单独计时 DNS（及可选的 TCP 建连）后打开RTSP流，av.open 的耗时计为打开与流探测，阻塞调用"""
+        phases = self.connect_phases
+        phases.reset()
+        attempt_start = time.monotonic()
+        self.measure_pre_connect()
+        open_start = time.monotonic()
+        container = self.open_with_param_cache(options)
+        phases.probe = time.monotonic() - open_start
+        phases.opened = time.monotonic() - attempt_start
+        return container
+
+    def measure_pre_connect(self):
+        """经 DNS 缓存解析主机名并计时，解析失败时本次连接直接失败
+
+        开启 dns_rewrite_urls 时本次连接改用解析得到的地址；开启 connect_phase_probe 时再测一次 TCP 建连，
+        建连测量失败不影响随后的连接。
+        """
+        self.connect_url = self.url
+        try:
+            parts = urlsplit(self.url)
+            host, port = parts.hostname, parts.port or 554
+        except ValueError:
+            return
+        if not host:
+            return
+        if is_ip_literal(host):
+            family, address = socket.AF_INET6 if ':' in host else socket.AF_INET, host
+        else:
+            family, address = self.resolve_host(host, port)[0]
+            if SETTINGS.dns_rewrite_urls:
+                self.connect_url = replace_host(self.url, address)
+        if SETTINGS.connect_phase_probe:
+            try:
+                self.connect_phases.tcp = tcp_connect_timed(family, address, port, SETTINGS.rtsp_timeout / 1000000.0)
+            except OSError as e:
+                self.logger.debug(f"TCP建连测量失败: {e}")
+
+    def resolve_host(self, host, port):
+        """经进程内 DNS 缓存解析，耗时计入本次连接的 DNS 阶段，命中情况计入本路统计"""
+        ttl = SETTINGS.dns_cache_ttl if SETTINGS.dns_cache_enabled else 0
+        start = time.monotonic()
+        hit = False
+        try:
+            addresses, hit = DNS_CACHE.resolve(host, port, ttl, SETTINGS.dns_negative_ttl)
+        except CachedResolveError:
+            hit = True
+            raise
+        finally:
+            self.connect_phases.dns = time.monotonic() - start
+            self.record_dns(self.connect_phases.dns, hit)
+        return addresses
+
+    def record_dns(self, seconds, hit):
+        if hit:
+            self.dns_hits += 1
+        else:
+            self.dns_misses += 1
+            self.dns_resolve_seconds += seconds
+        self.metrics.write_dns(self.dns_hits, self.dns_misses, self.dns_resolve_seconds)
+
+    def open_with_param_cache(self, options):
+        """按流参数缓存打开RTSP流，阻塞调用
+
+        命中缓存时先用快速探测参数打开并核对流参数，不一致时关闭后按 options 完整探测重新打开；
+        完整探测的结果与耗时写入缓存。快速探测本身失败时作废缓存，下一次尝试改用完整探测。
+        """
+        self.cached_params = None
+        self.probe_mode = None
+        self.probe_baseline = None
+        self.probed_params = None
+        # 兼容模式的精简参数不含探测设置，不参与缓存
+        if not SETTINGS.param_cache_enabled or 'probesize' not in options:
+            return self.open_container(options)
+
+        PARAM_CACHE.load(SETTINGS.param_cache_file)
+        cached = PARAM_CACHE.get(self.url)
+        if cached is not None:
+            self.probe_baseline = cached.get('full_latency', 0.0)
+            fast_options = dict(options, probesize=str(SETTINGS.fast_probe_size),
+                                analyzeduration=str(SETTINGS.fast_analyzeduration))
+            try:
+                container = self.open_container(fast_options)
+            except Exception:
+                PARAM_CACHE.invalidate(self.url)
+                raise
+            try:
+                mismatch = check_params(cached, read_stream_params(container))
+            except Exception:
+                self.close_opened(container)
+                raise
+            if mismatch is None:
+                self.cached_params = cached
+                self.probe_mode = 'fast'
+                return container
+            self.close_opened(container)
+            self.probe_fallbacks += 1
+            self.logger.info(f"流参数与缓存不一致（{mismatch}），改用完整探测")
+
+        container = self.open_container(options)
+        self.probe_mode = 'full'
+        try:
+            self.probed_params = read_stream_params(container)
+        except Exception:
+            self.close_opened(container)
+            raise
+        return container
+
+    @staticmethod
+    def close_opened(container):
+        """关闭尚未交给会话的容器，关闭失败不掩盖原来的异常"""
+        try:
+            container.close()
+        except Exception:
+            pass
+
+    def record_probe_latency(self):
+        """按本次连接的探测方式累计连接耗时，快速探测节省的时间以缓存中的完整探测耗时为基准
+
+        基准与比较对象都是 connect_latency（含 DNS、打开与探测、帧率获取），完整探测的连接在这里写入缓存；
+        回退的连接多花了一次快速探测，只更新流参数，不更新基准。
+        """
+        if self.probe_mode is None:
+            return
+        if self.probed_params is not None:
+            fell_back = self.probe_baseline is not None
+            PARAM_CACHE.put(self.url, self.probed_params, None if fell_back else self.connect_latency)
+            self.probed_params = None
+        if self.probe_mode == 'fast':
+            self.probe_fast_connects += 1
+            self.probe_fast_seconds += self.connect_latency
+        else:
+            self.probe_full_connects += 1
+            self.probe_full_seconds += self.connect_latency
+        if self.probe_baseline:
+            # 回退完整探测的连接多花了一次快速探测，计为负的节省
+            self.probe_saved_seconds += self.probe_baseline - self.connect_latency
+        self.metrics.write_probe(self.probe_fast_connects, self.probe_full_connects, self.probe_fallbacks,
+                                 self.probe_fast_seconds, self.probe_full_seconds, self.probe_saved_seconds)
+
+    def stream_extradata(self, codec_context):
+        """本次连接的 extradata，快速探测没有拿到时使用缓存中的参数集"""
+        if not codec_context.extradata and self.cached_params is not None and self.cached_params['extradata']:
+            return self.cached_params['extradata']
+        return codec_context.extradata
+
+    def on_connected(self, start_time):
+        """连接建立后探测帧率并重置本轮统计"""
+        try:
+            if self.cached_params is not None and self.cached_params['fps']:
+                # 快速探测拿不准平均帧率，使用完整探测时缓存的帧率
+                self.real_fps = self.cached_params['fps']
+            else:
+                # 使用真实帧率检测器获取帧率
+                self.real_fps = self.fps_detector.get_real_framerate(self.container)
+            if self.real_fps and self.real_fps > 0:
+                self.logger.info(f"成功获取到流的真实帧率：{self.real_fps:.2f} FPS")
+                # 更新PTS检测器的帧率
+                self.pts_detector.update_frame_rate(self.real_fps)
+            else:
+                self.logger.warning("无法获取视频流的真实帧率，将使用动态计算")
+        except Exception as e:
+            self.logger.warning(f"获取真实帧率失败: {e}，将使用动态计算")
+
+        self.connect_latency = time.time() - start_time
+        self.start_latency_tracking(start_time)
+        self.record_probe_latency()
+
+        # 根据协议类型显示不同的连接成功信息
+        if self.protocol.upper() == 'UDP':
+            self.logger.info(f"UDP连接成功！延迟: {self.connect_latency:.1f}s。使用优化UDP配置。开始抓取帧。")
+        else:
+            self.logger.info(f"TCP连接成功！延迟: {self.connect_latency:.1f}s。开始抓取帧。")
+
+        self.start_time = time.time()
+        self.fps_start_time = self.start_time
+        self.fps_frames_count = self.total_frames
+        self.next_stats_time = 0.0
+        # 上一轮连接剩余的PTS交给旧检测器处理完
+        self.flush_pts_window()
+        self.flush_keyframes()
+        self.pts_unit_ms = self.get_pts_unit_ms()
+        self.keyframe_unit_seconds = self.pts_unit_ms / 1000.0
+        self.gop_stats.on_connect()
+
+        self.rtp_sequence = 0
+        self.last_rtp_timestamp = 0
+        self.i_frame_lost_detected = False
+        self.packets_lost_count = 0
+        self.last_log_time = time.time() # 重置日志时间
+
+        # 重置PTS检测器
+        self.pts_detector = BatchPTSFrameLossDetector()
+        if self.real_fps:
+            self.pts_detector.update_frame_rate(self.real_fps)
+
+        if SETTINGS.decode_enabled:
+            self.start_decoder()
+        if self.slice_classifier is not None:
+            self.start_slice_analysis()
+
+    def start_slice_analysis(self):
+        """按本次连接的视频流编码与 extradata 配置帧类型识别，非 H.264/H.265 时不解析"""
+        try:
+            codec_context = self.container.streams.video[0].codec_context
+            self.slice_active = self.slice_classifier.configure(codec_context.name, self.stream_extradata(codec_context))
+        except (IndexError, AttributeError):
+            self.slice_active = False
+
+    def write_slice_stats(self):
+        classifier = self.slice_classifier
+        self.metrics.write_slices(classifier.i_frames, classifier.p_frames, classifier.b_frames, classifier.idr_frames,
+                                  classifier.missing_refs)
+
+    def start_decoder(self):
+        """为本次连接创建解码器，解码器不可用时只解复用"""
+        try:
+            stream = self.container.streams.video[0]
+            self.decoder = StreamDecoder(stream, self.decode_stats, self.log_name, self.logger, SETTINGS.decode_queue_size,
+                                         SETTINGS.decode_threads, SETTINGS.decode_thread_type, SETTINGS.decode_skip,
+                                         self.stream_extradata(stream.codec_context))
+        except (av.error.FFmpegError, ValueError, IndexError, AttributeError) as e:
+            self.logger.warning(f"创建解码器失败，本次连接只解复用: {e}")
+            self.decoder = None
+
+    def write_decode_stats(self):
+        stats = self.decode_stats
+        depth = self.decoder.queue_depth() if self.decoder is not None else 0
+        self.metrics.write_decode(stats.frames, stats.dropped + stats.queue_dropped, depth, stats.decode_seconds,
+                                  stats.cpu_seconds, stats.mpixels, stats.max_ms)
+
+    def flush_keyframes(self):
+        """暂存的关键帧计入 GOP 统计"""
+        if self.keyframe_marks:
+            self.gop_stats.add_keyframes(self.keyframe_marks, self.keyframe_unit_seconds)
+            self.keyframe_marks.clear()
+
+    def write_gop_stats(self, current_time):
+        """更新码率并写入码率与 GOP 统计，current_time 与关键帧到达时刻同一时钟"""
+        self.flush_keyframes()
+        gop = self.gop_stats
+        gop.update_bitrate(current_time, self.total_bytes, SETTINGS.bitrate_window_seconds)
+        self.metrics.write_gop(gop.bitrate, gop.peak_bitrate, gop.gop_length, gop.max_gop_length, gop.keyframes,
+                               gop.interval_ms(), gop.jitter_ms(), gop.max_interval * 1000.0,
+                               gop.keyframe_size_ratio(self.total_frames, self.total_bytes))
+
+    def start_latency_tracking(self, start_time):
+        """记录连接耗时，并从发起连接的时刻起等待首包和首个关键帧"""
+        self.flush_arrivals()
+        hist = self.metrics.hist
+        record(hist, HIST_CONNECT, self.connect_latency)
+        phases = self.connect_phases
+        # 指标表未分配连接阶段直方图时只写入最近一次的阶段耗时
+        if len(hist) > HIST_DNS:
+            for kind, seconds in ((HIST_DNS, phases.dns), (HIST_TCP, phases.tcp), (HIST_HANDSHAKE, phases.handshake),
+                                  (HIST_PROBE, phases.probe)):
+                if seconds is not None:
+                    record(hist, kind, seconds)
+        self.write_phases()
+        self.connect_started = start_time
+        self.awaiting_first_packet = True
+        self.awaiting_keyframe = True
+        self.last_arrival = 0.0
+
+    def on_first_keyframe(self, arrival):
+        self.awaiting_keyframe = False
+        self.connect_phases.first_keyframe = arrival - self.connect_started
+        record(self.metrics.hist, HIST_FIRST_KEYFRAME, self.connect_phases.first_keyframe)
+        self.write_phases()
+
+    def on_first_packet(self, arrival):
+        self.awaiting_first_packet = False
+        self.connect_phases.first_packet = arrival - self.connect_started
+        record(self.metrics.hist, HIST_FIRST_PACKET, self.connect_phases.first_packet)
+        self.write_phases()
+
+    def write_phases(self):
+        self.metrics.write_phases(self.connect_phases.durations_ms(), self.connect_phases.backoff)
+
+    def record_backoff(self, seconds):
+        """一次重试退避的实际等待计入直方图与累计退避时间"""
+        self.connect_phases.backoff += seconds
+        if len(self.metrics.hist) > HIST_BACKOFF:
+            record(self.metrics.hist, HIST_BACKOFF, seconds)
+        self.write_phases()
+
+    def flush_arrivals(self):
+        """暂存的到达时刻批量计入首包耗时与包到达间隔直方图"""
+        arrivals = self.arrival_batch
+        if not arrivals:
+            return
+        if self.awaiting_first_packet:
+            self.on_first_packet(arrivals[0])
+        if self.last_arrival:
+            intervals = np.diff(arrivals, prepend=self.last_arrival)
+        else:
+            intervals = np.diff(arrivals)
+        self.last_arrival = arrivals[-1]
+        record_many(self.metrics.hist, HIST_INTER_ARRIVAL, intervals)
+        arrivals.clear()
+
+    def flush_pts_window(self):
+        """暂存的PTS整窗送入检测器，检测器按连接重建，这里累加其增量"""
+        if self.pts_batch:
+            batch_result = self.pts_detector.detect_batch(self.pts_batch, self.pts_unit_ms)
+            self.pts_batch.clear()
+            self.pts_frame_loss_count += batch_result['frames_lost']
+            if batch_result['frame_rate_changes']:
+                # 流中途切换帧率（如带宽自适应），以PTS检测到的新帧率为准
+                self.real_fps = self.pts_detector.frame_rate
+                self.logger.info(f"检测到帧率变化，当前帧率约 {self.real_fps:.2f} FPS")
+
+    def get_pts_unit_ms(self):
+        """视频流时间基对应的毫秒数，用于把包的PTS换算为毫秒"""
+        try:
+            time_base = self.container.streams.video[0].time_base
+            if time_base:
+                return float(time_base) * 1000.0
+        except Exception:
+            pass
+        return 1000.0 / 90000
+
+    def process_packet(self, packet):
+        """逐包热路径：只更新计数并暂存PTS，统计计算按 stats_interval_ms 周期批量完成"""
+        # 真实丢包检测
+        if self.real_packet_loss_enabled and self.analyze_rtp_packet_loss(packet):
+            self.real_packet_loss_count += 1
+
+        # 保留原有的序列号计数，但不再做模拟丢包
+        self.rtp_sequence += 1
+
+        size = packet.size
+        if size:
+            self.total_bytes += size
+
+        # 统一按包计数；解码压测时包交给解码线程，不在此处等待解码
+        if self.decoder is not None:
+            self.decoder.submit(packet)
+        if self.slice_active:
+            self.slice_classifier.classify(packet)
+        self.total_frames += 1
+        pts = packet.pts
+        if pts is not None:
+            self.pts_batch.append(pts)
+
+        current_time = time.time()
+        self.arrival_batch.append(current_time)
+        if packet.is_keyframe:
+            self.keyframe_marks.append((self.total_frames, pts, current_time, size))
+            if self.awaiting_keyframe:
+                self.on_first_keyframe(current_time)
+        if current_time >= self.next_stats_time:
+            self.run_stats_stage(current_time)
+
+    def run_stats_stage(self, current_time):
+        """周期统计：帧率、PTS丢帧、理论帧与丢失帧，结果写入指标表"""
+        self.next_stats_time = current_time + SETTINGS.stats_interval_ms / 1000.0
+        self.fps_detector.add_frame_count(self.total_frames, current_time * 1000)
+
+        elapsed_time = current_time - self.fps_start_time
+        if elapsed_time >= 0.5:
+            self.last_fps = (self.total_frames - self.fps_frames_count) / elapsed_time
+            self.fps_frames_count = self.total_frames
+            self.fps_start_time = current_time
+
+        self.flush_arrivals()
+
+        # PTS攒够一个窗口（或超过 PTS_WINDOW_MAX_AGE 秒）再整窗送检，窗口太小时向量化不划算
+        if (len(self.pts_batch) >= BatchPTSFrameLossDetector.MIN_VECTOR_FRAMES
+                or current_time - self.pts_window_start >= PTS_WINDOW_MAX_AGE):
+            self.flush_pts_window()
+            self.pts_window_start = current_time
+
+        total_elapsed_time = current_time - self.start_time
+
+        # 使用真实帧率或动态计算的帧率
+        current_fps = self.real_fps or self.fps_detector.calculate_fps_from_timestamps() or 25.0
+        expected_frames = int(total_elapsed_time * current_fps)
+
+        # 使用PTS检测的丢帧数据，如果没有则使用传统计算
+        pts_stats = self.pts_detector.get_loss_statistics()
+        if pts_stats['total_lost'] > 0:
+            lost_frames = pts_stats['total_lost']
+            lost_rate_percent = pts_stats['loss_rate']
+        else:
+            # 传统计算方式作为备用
+            lost_frames = max(0, expected_frames - self.total_frames)
+            lost_rate_percent = (lost_frames / expected_frames * 100) if expected_frames > 0 else 0.0
+
+        # 原地写入指标表，读取方按需取快照
+        self.metrics.write_running(self.total_frames, self.total_frames, self.total_bytes, self.reconnect_count,
+                                   self.connect_latency, self.last_fps, expected_frames, lost_frames,
+                                   current_fps, self.pts_frame_loss_count)
+        self.write_gop_stats(current_time)
+        if self.slice_active:
+            self.write_slice_stats()
+        if self.decoder is not None:
+            self.write_decode_stats()
+
+        # 修复：改为基于时间的判断，防止日志刷屏
+        if current_time - self.last_log_time >= 10:
+            self.logger.info(
+                f"收到帧: {self.total_frames} | 理论帧: {expected_frames} | 丢失帧: {lost_frames} | 丢帧率: {lost_rate_percent:.1f}% | "
+                f"帧率: {int(current_fps)}FPS"
+            )
+            self.last_log_time = current_time
+
+    def handle_stream_error(self, e, retry_delay=0.0):
+        """记录连接或拉流失败，并推送重连状态；retry_delay 为距下次重连的等待秒数"""
+        self.reconnect_count += 1
+        error_msg = str(e)
+        original_url = self.url
+
+        # 针对[Errno 22] Invalid argument错误的特殊处理
+        if "Error number -138" in error_msg:
+            error_msg = "RTSP服务器无响应或网络不可达"
+        elif "Invalid argument" in error_msg or "Errno 22" in error_msg:
+            # 尝试修复URL并重新尝试
+            fixed_url = self.validate_and_fix_rtsp_url(self.url)
+            if fixed_url and fixed_url != self.url:
+                self.url = fixed_url
+                # 静默修复URL，不输出日志
+            else:
+                # 提供更详细的诊断信息
+                diagnostic_msg = f"RTSP URL参数错误。\n原始URL: {original_url}\n"
+                diagnostic_msg += "请检查：\n"
+                diagnostic_msg += "1. URL格式是否正确 (rtsp://ip:port/path)\n"
+                diagnostic_msg += "2. IP地址和端口是否可达\n"
+                diagnostic_msg += "3. RTSP服务是否正常运行\n"
+                diagnostic_msg += "4. 网络防火墙设置"
+                error_msg = diagnostic_msg
+        elif "10049" in error_msg:
+            if self.protocol.upper() == 'UDP':
+                # UDP特有的[Errno 10049]错误诊断 - 增强版
+                error_msg = f"UDP连接失败[地址无效]: {original_url}\n"
+                error_msg += "=== UDP连接诊断分析 ===\n"
+                error_msg += "UDP连接失败的可能原因：\n"
+                error_msg += "1. ⚠️ RTSP服务器不支持UDP协议（最常见）\n"
+                error_msg += "2. 🚫 Windows防火墙阻止UDP连接\n"
+                error_msg += "3. 🌐 网络NAT或路由器配置问题\n"
+                error_msg += "4. 🔌 RTSP服务器仅支持TCP模式\n"
+                error_msg += "\n💡 建议解决方案：\n"
+                error_msg += "✅ 1. 在主程序中切换为TCP协议（推荐）\n"
+                error_msg += "🔧 2. 检查RTSP服务器配置，确认是否支持UDP\n"
+                error_msg += "🚫 3. 检查Windows防火墙，允许UDP端口通信\n"
+                error_msg += "🌐 4. 联系网络管理员检查路由器设置\n"
+                error_msg += "\n📊 诊断信息：\n"
+                error_msg += f"• 错误代码: [Errno 10049]\n"
+                error_msg += f"• 协议类型: UDP\n"
+                error_msg += f"• 目标地址: {original_url}\n"
+                error_msg += f"• 重试次数: {self.reconnect_count}"
+            else:
+                error_msg = f"地址无效错误: {original_url}"
+        elif "timed out" in error_msg.lower():
+            error_msg = f"RTSP连接超时 - 服务器: {original_url}"
+        elif "connection refused" in error_msg.lower():
+            error_msg = f"RTSP服务器拒绝连接 - 服务器: {original_url}"
+        elif "unauthorized" in error_msg.lower():
+            error_msg = f"RTSP身份验证失败 - 服务器: {original_url}"
+        elif "Protocol not found" in error_msg:
+            error_msg = f"RTSP协议不支持或URL格式错误 - URL: {original_url}"
+        else:
+            error_msg = f"连接失败: {error_msg} - URL: {original_url}"
+
+        self.logger.error(f"连接或拉流失败: {error_msg}。第 {self.reconnect_count} 次重试，{retry_delay:.1f} 秒后重连...")
+        status_info = {
+            'thread_id': self.thread_id,
+            'parent_item_id': self.parent_item_id,
+            'status': "重连中",
+            'total_frames': self.total_frames,
+            'received_frames': self.total_frames,
+            'total_bytes': self.total_bytes,
+            'reconnect_count': self.reconnect_count,
+            'connect_latency': self.connect_latency,
+            'current_fps': 0.0,
+            'expected_frames': 0,
+            'lost_frames': 0,
+            'packets_lost_count': self.packets_lost_count,
+            'retry_delay': retry_delay
+        }
+        self.metrics.write(status_info)
+
+    def close_container(self):
+        """停止解码器并关闭当前容器，忽略关闭异常"""
+        if self.decoder is not None:
+            self.decoder.close()
+            self.write_decode_stats()
+            self.decoder = None
+        if self.container:
+            try:
+                self.container.close()
+            except Exception:
+                pass
+        self.container = None
+
+    def publish_final_status(self):
+        """会话结束时推送最终统计"""
+        self.flush_pts_window()
+        self.flush_arrivals()
+        final_fps = self.total_frames / (time.time() - self.start_time) if self.start_time and (time.time() - self.start_time) > 0 else 0.0
+
+        # 使用真实帧率计算最终的丢帧数
+        final_real_fps = self.real_fps or self.fps_detector.calculate_fps_from_timestamps() or final_fps
+        final_expected_frames = int((time.time() - self.start_time) * final_real_fps) if self.start_time else self.total_frames
+        final_lost_frames = max(0, final_expected_frames - self.total_frames)
+
+        final_status = {
+            'thread_id': self.thread_id,
+            'parent_item_id': self.parent_item_id,
+            'status': "已停止",
+            'total_frames': self.total_frames,
+            'received_frames': self.total_frames,
+            'total_bytes': self.total_bytes,
+            'reconnect_count': self.reconnect_count,
+            'connect_latency': self.connect_latency,
+            'current_fps': final_fps,
+            'expected_frames': final_expected_frames,
+            'lost_frames': final_lost_frames,
+            'packets_lost_count': self.packets_lost_count,
+            'real_fps': final_real_fps
+        }
+        self.metrics.write(final_status)
+        self.write_gop_stats(time.time())
+        if self.slice_classifier is not None:
+            self.write_slice_stats()
+        self.logger.info("监控线程已停止。")
+
+# ==============================================================================
+# 流监控线程
+# ==============================================================================
+class RTSPStreamMonitor(StreamSession, threading.Thread):
+    """每路流一个系统线程的监控引擎"""
+    def __init__(self, url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol='UDP', start_at=0.0):
+        threading.Thread.__init__(self)
+        StreamSession.__init__(self, url, thread_id, parent_item_id, parent_url_id, thread_idx, total_threads, protocol,
+                               start_at)
+
+    def connect(self):
+        """按重试策略打开RTSP流，失败时抛出最后一次异常；等待连接许可期间停止时返回且不打开容器
+
+        返回最后一次尝试的开始时刻，连接延迟不计入熔断和限速的等待时间。
+        """
+        options = self.build_connect_options()
+        max_retries = self.get_max_retries()
+
+        for retry in range(max_retries):
+            current_options = self.get_attempt_options(options, retry, max_retries)
+            if not self.wait_connect_permit():
+                return None
+            start_time = time.time()
+            try:
+                self.container = self.open_stream(current_options)
+                self.on_connect_succeeded()
+                return start_time
+            except Exception as e:
+                self.on_connect_failed()
+                if retry < max_retries - 1:
+                    # 根据错误类型调整重试延迟，叠加抖动退避
+                    retry_delay = self.next_retry_delay(str(e))
+                    transport_type = current_options.get('rtsp_transport', 'default')
+                    self.logger.warning(f"连接尝试 {retry + 1} 失败 ({transport_type}): {e}, {retry_delay:.1f}秒后重试...")
+                    self.backoff_wait(retry_delay)
+                else:
+                    # 最后一次尝试失败，抛出异常
+                    raise e
+
+        raise Exception(f"所有连接尝试都失败，无法连接到RTSP流: {self.url}")
+
+    def run(self):
+        if not self.prepare_url():
+            return
+        self.wait_for_start()
+
+        while not self.stop_event.is_set():
+            try:
+                self.logger.debug(f"正在尝试连接: {self.url}...")
+                start_time = self.connect()
+                if self.container is None:
+                    break
+                self.on_connected(start_time)
+
+                # 如果容器存在，开始处理视频包
+                if self.container:
+                    try:
+                        for packet in self.container.demux(video=0):
+                            if self.stop_event.is_set():
+                                break
+                            self.process_packet(packet)
+                    except Exception as demux_error:
+                        self.logger.error(f"处理视频包时发生错误: {demux_error}")
+
+                if not self.stop_event.is_set():
+                    raise Exception("流结束或中断")
+
+            except STREAM_ERRORS as e:
+                retry_delay = self.reconnect_delay()
+                self.handle_stream_error(e, retry_delay)
+                self.backoff_wait(retry_delay)
+            except Exception as e:
+                self.logger.error(f"发生未知异常: {e}")
+                self.backoff_wait(self.reconnect_delay())
+            finally:
+                self.close_container()
+
+        self.publish_final_status()
+
+    def backoff_wait(self, delay):
+        """可被停止信号打断的退避等待，实际等待时间计入重试退避"""
+        start = time.monotonic()
+        self.stop_event.wait(delay)
+        self.record_backoff(time.monotonic() - start)
+
+    def stop(self):
+        self.stop_event.set()
+
+# ==============================================================================
+# 系统性能监控线程
+# ==============================================================================
+class SystemMonitor(threading.Thread):
+    def __init__(self, thread_id):
+        super().__init__()
+        self.stop_event = SYSTEM_MONITOR_STOP_EVENT
+        self.thread_id = thread_id
+        self.last_net_counters = psutil.net_io_counters()
+        self.last_net_time = time.time()
+    
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                cpu_percent = psutil.cpu_percent(interval=0.5)
+                mem = psutil.virtual_memory()
+                current_net_counters = psutil.net_io_counters()
+                now = time.time()
+
+                net_recv = current_net_counters.bytes_recv - self.last_net_counters.bytes_recv
+                # 按两次采样的实际间隔计算速率（一轮含 cpu_percent 的 0.5 秒和休眠 0.5 秒）
+                net_interval = max(now - self.last_net_time, 0.001)
+                
+                self.last_net_counters = current_net_counters
+                self.last_net_time = now
+                
+                status_info = {
+                    'thread_id': SYSTEM_MONITOR_ID,
+                    'parent_item_id': SYSTEM_MONITOR_ID,
+                    'status': 'OK',
+                    'cpu_percent': cpu_percent,
+                    'mem_percent': mem.percent,
+                    'net_recv_mbps': (net_recv * 8) / (1024*1024) / net_interval,
+                }
+                STATUS_QUEUES[SYSTEM_MONITOR_ID].put(status_info)
+                LATEST_SYSTEM_INFO.update(status_info)
+                time.sleep(0.5)
+            except Exception:
+                time.sleep(0.5)
+
+    def stop(self):
+        self.stop_event.set()
+
+# ==============================================================================
+# 引擎选择与报表输出（GUI 与命令行共用）
+# ==============================================================================
+def create_metrics_exporter():
+    """按设置创建并启动指标端点，端口被占用等错误时记录日志并返回 None"""
+    from metrics_http import MetricsExporter
+    exporter = MetricsExporter(METRICS_TABLE, SETTINGS.metrics_http_host, SETTINGS.metrics_http_port,
+                               system_info=LATEST_SYSTEM_INFO, names=THREAD_NAME_MAP)
+    try:
+        exporter.start()
+    except OSError as e:
+        logging.error(f"指标端点启动失败 {SETTINGS.metrics_http_host}:{SETTINGS.metrics_http_port}: {e}")
+        return None
+    return exporter
+
+
+def prefetch_dns(urls):
+    """并行预解析 URL 列表中的主机名，阻塞到全部完成；关闭 DNS 缓存时不做任何事"""
+    hosts = url_hosts(urls)
+    if not SETTINGS.dns_cache_enabled or not hosts:
+        return
+    resolved, failed, seconds = DNS_CACHE.prefetch(hosts, 554, SETTINGS.dns_cache_ttl, SETTINGS.dns_negative_ttl,
+                                                   SETTINGS.dns_prefetch_workers)
+    logging.info(f"DNS 预解析 {len(hosts)} 个主机名，成功 {resolved}，失败 {failed}，用时 {seconds:.2f} 秒")
+
+
+def start_dns_prefetch(urls):
+    """在后台线程预解析，先启动的会话未命中时等待同一主机名的解析结果，不会重复解析"""
+    thread = threading.Thread(target=prefetch_dns, args=(list(urls),), name="DNS预解析", daemon=True)
+    thread.start()
+    return thread
+
+
+def create_monitor_factory(engine):
+    """按引擎名称返回 (会话构造函数, 多进程监督线程)，非多进程引擎时监督线程为 None"""
+    if engine == "多进程":
+        from mp_monitor import ShardSupervisor
+        supervisor = ShardSupervisor(SETTINGS.mp_worker_count, SETTINGS.mp_pin_cpu)
+        return supervisor.add_stream, supervisor
+    if engine == "协程":
+        from async_monitor import AsyncStreamMonitor
+        return AsyncStreamMonitor, None
+    if engine == "RTP直连":
+        if SETTINGS.decode_enabled:
+            logging.warning("RTP直连引擎不经过 libav，解码压测不生效")
+        from rtp_client import NativeRTPMonitor
+        return NativeRTPMonitor, None
+    return RTSPStreamMonitor, None
+
+
+def write_stress_report(f, total_url_count, total_threads_count, url_rows, sys_info, timeseries_path=None,
+                        phase_rows=None, decode_summary=None, latency_sections=None, gop_rows=None, slice_rows=None,
+                        probe_summary=None, connect_rows=None, dns_summary=None):
+    """写出文本压测报告，url_rows 每项包含 url/status/lost_rate/reconnects/total_bytes/total_frames
+    timeseries_path 为本次运行的时序数据目录，给出时追加按分钟汇总的长稳统计
+    phase_rows 为 load_profile.summarize_phases 的结果，多于一个阶段时追加按加压阶段的统计
+    decode_summary 为 decode_stage.summarize_decode 的结果，开启解码压测时追加解码统计
+    latency_sections 为 [(名称, 直方图)]（见 histograms.merge_groups），给出时追加延迟分位数
+    gop_rows 为 gop_stats.summarize_gop 的结果，给出时追加码率与GOP统计
+    slice_rows 为 slice_parser.summarize_slices 的结果，给出时追加帧类型统计
+    probe_summary 为 stream_param_cache.summarize_probe 的结果，给出时追加流参数缓存的连接耗时对比
+    connect_rows 为 connect_phases.summarize_connect_phases 的结果，给出时追加逐路连接阶段耗时
+    dns_summary 为 dns_cache.summarize_dns 的结果，给出时追加 DNS 缓存命中统计"""
+    f.write(f"RTSP 压测报告 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    f.write("=" * 60 + "\n\n")
+
+    f.write(f"总监控地址数: {total_url_count}\n")
+    f.write(f"总监控线程数: {total_threads_count}\n\n")
+
+    f.write("### 各流监控统计\n")
+    f.write("-" * 50 + "\n")
+    for item in url_rows:
+        f.write(f"URL: {item['url']}\n")
+        f.write(f"  状态: {item['status']}\n")
+        f.write(f"  丢包率: {float(item['lost_rate']):.1f}%\n")
+        f.write(f"  总流量: {item['total_bytes'] / 1024 / 1024:.2f} MB\n")
+        f.write(f"  总重连次数: {item['reconnects']}\n")
+        f.write("-" * 50 + "\n")
+
+    f.write("\n\n### 性能指标汇总\n")
+    f.write("=" * 60 + "\n")
+    f.write(f"CPU 使用率: {sys_info['cpu_percent']:.1f}%\n")
+    f.write(f"内存使用率: {sys_info['mem_percent']:.1f}%\n")
+    f.write(f"网络下载速率: {sys_info['net_recv_mbps']:.1f} Mbps\n")
+
+    f.write("\n\n### 丢包率最高TOP 3\n")
+    f.write("=" * 60 + "\n")
+    top_3_lost = sorted(url_rows, key=lambda x: float(x['lost_rate']), reverse=True)[:3]
+    for i, item in enumerate(top_3_lost):
+        f.write(f"  {i+1}. {item['url']} - 丢包率: {float(item['lost_rate']):.1f}%\n")
+
+    if phase_rows and len(phase_rows) > 1:
+        write_load_phase_summary(f, phase_rows)
+
+    if decode_summary and decode_summary[1]:
+        write_decode_summary(f, *decode_summary)
+
+    if gop_rows:
+        write_gop_summary(f, gop_rows)
+
+    if slice_rows:
+        write_slice_summary(f, slice_rows)
+
+    if probe_summary:
+        write_probe_summary(f, probe_summary)
+
+    if connect_rows:
+        write_connect_phase_summary(f, connect_rows)
+
+    if dns_summary:
+        write_dns_summary(f, dns_summary)
+
+    if latency_sections:
+        write_latency_histograms(f, latency_sections)
+
+    if timeseries_path:
+        write_timeseries_summary(f, timeseries_path)
+
+
+def write_load_phase_summary(f, phase_rows):
+    """按会话启动阶段输出统计，用于定位服务器开始劣化的负载"""
+    f.write(f"\n\n### 按加压阶段统计（{SETTINGS.ramp_profile}）\n")
+    f.write("=" * 60 + "\n")
+    f.write(f"{'阶段':<8} {'启动时刻':>8} {'新增/累计会话':>12} {'已连接':>6} {'丢帧率':>8} {'平均/最大连接延迟':>16} {'重连':>6}\n")
+    for row in phase_rows:
+        sessions = f"{row['sessions']}/{row['total_sessions']}"
+        latency = f"{row['avg_latency']:.2f}s / {row['max_latency']:.2f}s"
+        f.write(f"{row['phase']:<8} {row['offset']:>7.0f}s {sessions:>12} {row['connected']:>6} "
+                f"{row['lost_rate']:>7.2f}% {latency:>16} {row['reconnects']:>6}\n")
+
+
+def write_decode_summary(f, rows, total):
+    """解码压测统计：汇总的每百万像素CPU按进程（含工作进程）CPU折算，单路值为解码线程自身的CPU"""
+    f.write(f"\n\n### 解码压测统计（{SETTINGS.decode_skip}，每路 {SETTINGS.decode_threads or '自动'} 线程/{SETTINGS.decode_thread_type}）\n")
+    f.write("=" * 60 + "\n")
+    f.write(f"解码会话数: {total['streams']}，解码帧数: {total['frames']}，解码丢帧: {total['dropped']}\n")
+    f.write(f"解码像素: {total['mpixels']:.1f} 百万，平均每帧解码耗时: {total['avg_ms']:.2f} ms，最大单包解码耗时: {total['max_ms']:.1f} ms\n")
+    f.write(f"进程CPU: {total['process_cpu_seconds']:.1f} 秒（含拉流与解复用），每百万像素CPU: {total['cpu_ms_per_mp']:.2f} ms\n")
+    f.write(f"\n{'线程':<14} {'解码帧':>8} {'丢帧':>6} {'队列':>4} {'平均/最大耗时':>16} {'每百万像素CPU':>12}\n")
+    for row in sorted(rows, key=lambda r: THREAD_NAME_MAP.get(r['thread_id'], r['thread_id'])):
+        name = THREAD_NAME_MAP.get(row['thread_id'], row['thread_id'])
+        cost = f"{row['avg_ms']:.2f} / {row['max_ms']:.1f} ms"
+        f.write(f"{name:<14} {row['frames']:>8} {row['dropped']:>6} {row['queue_depth']:>4} {cost:>16} "
+                f"{row['cpu_ms_per_mp']:>10.2f} ms\n")
+
+
+def write_gop_summary(f, rows, top_count=10):
+    """码率与GOP统计：关键帧间隔超过 gop_warn_seconds 的流单独列出，其余按峰值码率排序"""
+    f.write(f"\n\n### 码率与GOP统计（码率窗口 {SETTINGS.bitrate_window_seconds}s）\n")
+    f.write("=" * 60 + "\n")
+    f.write(f"统计流数: {len(rows)}，合计码率: {sum(r['bitrate_mbps'] for r in rows):.2f} Mbps，"
+            f"最高峰值码率: {max(r['peak_bitrate_mbps'] for r in rows):.2f} Mbps，"
+            f"最长GOP: {max(r['max_gop_length'] for r in rows)} 帧\n")
+
+    warn_ms = SETTINGS.gop_warn_seconds * 1000.0
+    long_gop = [r for r in rows if r['keyframe_max_interval_ms'] > warn_ms]
+    if long_gop:
+        f.write(f"\n关键帧间隔超过 {SETTINGS.gop_warn_seconds:g}s 的流: {len(long_gop)}\n")
+        for row in sorted(long_gop, key=lambda r: r['keyframe_max_interval_ms'], reverse=True)[:top_count]:
+            name = THREAD_NAME_MAP.get(row['thread_id'], row['thread_id'])
+            f.write(f"  {name} - 最大关键帧间隔: {row['keyframe_max_interval_ms'] / 1000:.1f}s，最长GOP: {row['max_gop_length']} 帧\n")
+
+    f.write(f"\n{'线程':<14} {'码率/峰值(Mbps)':>16} {'GOP/最长':>10} {'关键帧间隔':>10} {'间隔抖动':>8} {'I/P大小比':>10}\n")
+    for row in sorted(rows, key=lambda r: r['peak_bitrate_mbps'], reverse=True)[:top_count]:
+        name = THREAD_NAME_MAP.get(row['thread_id'], row['thread_id'])
+        bitrate = f"{row['bitrate_mbps']:.2f} / {row['peak_bitrate_mbps']:.2f}"
+        gop = f"{row['gop_length']} / {row['max_gop_length']}"
+        f.write(f"{name:<14} {bitrate:>16} {gop:>10} {row['keyframe_interval_ms'] / 1000:>9.2f}s "
+                f"{row['keyframe_jitter_ms']:>6.1f}ms {row['keyframe_size_ratio']:>10.1f}\n")
+
+
+def write_slice_summary(f, rows, top_count=10):
+    """码流解析得到的帧类型统计，按缺少参考帧的帧数排序"""
+    f.write("\n\n### 帧类型统计（码流解析）\n")
+    f.write("=" * 60 + "\n")
+    i_frames = sum(r['i_frames'] for r in rows)
+    p_frames = sum(r['p_frames'] for r in rows)
+    b_frames = sum(r['b_frames'] for r in rows)
+    f.write(f"统计流数: {len(rows)}，I帧: {i_frames}（其中IDR {sum(r['idr_frames'] for r in rows)}），"
+            f"P帧: {p_frames}，B帧: {b_frames}\n")
+    damaged = [r for r in rows if r['missing_refs']]
+    f.write(f"缺少参考帧的流: {len(damaged)}，缺少参考帧的帧数合计: {sum(r['missing_refs'] for r in rows)}\n")
+    f.write(f"\n{'线程':<14} {'I帧':>8} {'IDR':>6} {'P帧':>8} {'B帧':>8} {'缺参考帧':>8}\n")
+    for row in sorted(rows, key=lambda r: r['missing_refs'], reverse=True)[:top_count]:
+        name = THREAD_NAME_MAP.get(row['thread_id'], row['thread_id'])
+        f.write(f"{name:<14} {row['i_frames']:>8} {row['idr_frames']:>6} {row['p_frames']:>8} {row['b_frames']:>8} "
+                f"{row['missing_refs']:>8}\n")
+
+
+def write_probe_summary(f, summary):
+    """流参数缓存：快速探测与完整探测的连接次数、平均连接耗时和节省的时间"""
+    f.write("\n\n### 流参数缓存（重连探测）\n")
+    f.write("=" * 60 + "\n")
+    f.write(f"快速探测连接: {summary['fast_connects']} 次，平均耗时 {summary['fast_avg']:.3f} s\n")
+    f.write(f"完整探测连接: {summary['full_connects']} 次，平均耗时 {summary['full_avg']:.3f} s"
+            f"（其中参数不一致回退 {summary['fallbacks']} 次）\n")
+    f.write(f"相对完整探测节省的连接耗时合计: {summary['saved_seconds']:.2f} s\n")
+
+
+def write_connect_phase_summary(f, rows, top_count=20):
+    """各路最近一次连接的阶段耗时（毫秒），按阶段合计从慢到快列出，分布见延迟分布一节"""
+    f.write("\n\n### 连接阶段耗时（最近一次连接，毫秒）\n")
+    f.write("=" * 60 + "\n")
+    averages = [sum(r[name] for r in rows) / len(rows) for name in PHASE_FIELDS]
+    f.write(f"统计流数: {len(rows)}，各阶段平均: "
+            + "，".join(f"{label} {value:.1f}" for label, value in zip(PHASE_NAMES, averages)) + "\n")
+    f.write(f"重试退避等待合计: {sum(r['backoff_seconds'] for r in rows):.1f} s\n")
+    f.write(f"\n{'线程':<14}" + "".join(f" {label:>8}" for label in PHASE_NAMES) + f" {'退避(s)':>8}\n")
+    for row in sorted(rows, key=lambda r: r['total_ms'], reverse=True)[:top_count]:
+        name = THREAD_NAME_MAP.get(row['thread_id'], row['thread_id'])
+        f.write(f"{name:<14}" + "".join(f" {row[field]:>8.1f}" for field in PHASE_FIELDS)
+                + f" {row['backoff_seconds']:>8.1f}\n")
+
+
+def write_dns_summary(f, summary):
+    """DNS 缓存：全部会话的命中、未命中次数与实际解析耗时"""
+    f.write("\n\n### DNS 缓存\n")
+    f.write("=" * 60 + "\n")
+    f.write(f"命中: {summary['hits']} 次，未命中: {summary['misses']} 次，命中率: {summary['hit_rate']:.1f}%\n")
+    f.write(f"实际解析耗时合计: {summary['resolve_seconds']:.2f} s，平均每次 {summary['avg_miss_ms']:.1f} ms\n")
+
+
+def write_latency_histograms(f, sections):
+    """按直方图类型输出各分组的延迟分位数，数值为所在对数桶的上界（相对误差约 6%）"""
+    f.write("\n\n### 延迟分布（毫秒）\n")
+    f.write("=" * 60 + "\n")
+    kinds = min(len(hist) for _, hist in sections)
+    for kind, kind_name in enumerate(HIST_NAMES[:kinds]):
+        f.write(f"\n{kind_name}:\n")
+        summaries = [(label, summarize(hist[kind])) for label, hist in sections]
+        summaries = [(label, summary) for label, summary in summaries if summary['count']]
+        if not summaries:
+            f.write("  暂无样本\n")
+            continue
+        f.write(f"{'样本':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'p99.9':>9} {'最大':>9}  分组\n")
+        for label, summary in summaries:
+            f.write(f"{summary['count']:>8} {summary['p50']:>9.1f} {summary['p95']:>9.1f} {summary['p99']:>9.1f} "
+                    f"{summary['p999']:>9.1f} {summary['max']:>9.1f}  {label}\n")
+
+
+def write_timeseries_summary(f, timeseries_path, top_count=5):
+    """从时序存储的分钟汇总读取长稳统计，按块读取，不载入整段历史"""
+    f.write("\n\n### 长稳时序统计（按分钟汇总）\n")
+    f.write("=" * 60 + "\n")
+    f.write(f"记录目录: {timeseries_path}\n")
+    try:
+        store = TimeSeriesStore(timeseries_path)
+        streams = store.summarize('1min')
+    except (OSError, ValueError) as e:
+        f.write(f"读取时序数据失败: {e}\n")
+        return
+    if not streams:
+        f.write("暂无时序数据\n")
+        return
+
+    f.write(f"记录时长: {streams[0]['duration'] / 3600:.2f} 小时，秒级样本 {store.rows('1s')} 个，分钟样本 {store.rows('1min')} 个\n")
+    f.write(f"平均帧率（全部流合计）: {sum(s['avg_fps'] for s in streams):.1f} FPS\n")
+    worst_fps = min(streams, key=lambda s: s['min_fps'])
+    f.write(f"最低分钟帧率: {worst_fps['min_fps']:.1f} FPS ({THREAD_NAME_MAP.get(worst_fps['thread_id'], worst_fps['thread_id'])})\n")
+    f.write(f"总流量: {sum(s['total_bytes'] for s in streams) / 1024 / 1024:.2f} MB\n")
+    f.write(f"总丢帧: {sum(s['lost_frames'] for s in streams)}，总重连: {sum(s['reconnects'] for s in streams)}\n")
+
+    f.write(f"\n丢帧最多TOP {top_count}:\n")
+    for i, item in enumerate(sorted(streams, key=lambda s: s['lost_frames'], reverse=True)[:top_count]):
+        name = THREAD_NAME_MAP.get(item['thread_id'], item['thread_id'])
+        f.write(f"  {i+1}. {name} - 丢帧: {item['lost_frames']}，平均帧率: {item['avg_fps']:.1f}，"
+                f"最低分钟帧率: {item['min_fps']:.1f}，重连: {item['reconnects']}，最大连接延迟: {item['max_latency']:.1f}s\n")
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+H.264/H.265 码流级帧类型识别（不解码）
+
+核心思路：
+- 参照 Play/hiknvr/sps_pps.cpp 与 bs.h 的参数集和指数哥伦布读取逻辑，在解复用得到的包上直接解析 NAL 头和
+  片头的前几个字段（H.264: first_mb_in_slice/slice_type/frame_num；H.265: first_slice_segment_in_pic_flag/slice_type），
+  统计 I/P/B 帧、IDR 帧与参考帧缺失，代价只与包头部的几十个字节有关，远低于解码。
+- 同时支持 Annex-B（起始码，RTSP 解复用的常见输出）与 AVCC/HVCC（长度前缀，来自 MP4 等容器）两种封装，
+  长度前缀的字节数和初始参数集从 extradata 读取，码流中出现的 SPS/PPS 随时更新。
+- 每个包只解析到第一个片为止：起始码查找用 bytes.find（C 实现），片头前缀去除防竞争字节后按位读取，
+  SEI 等大块非片数据只在包头部窗口放不下时才复制整个包。
+- 参考帧缺失：连接后首个关键帧之前的预测帧；H.264 按 frame_num 跳变统计丢失的参考帧
+  （SPS 允许 frame_num 间断时不统计）；H.265 以 CRA 起播时其后的 RASL 帧。
+- 解析失败的包只计数不抛出，不影响拉流。
+"""
+
+H264_NAL_SLICE = 1
+H264_NAL_IDR = 5
+H264_NAL_SPS = 7
+H264_NAL_PPS = 8
+# slice_type % 5：0 P，1 B，2 I，3 SP，4 SI
+H264_SLICE_TYPES = ('P', 'B', 'I', 'P', 'I')
+# 带色度格式等扩展字段的 H.264 档次
+H264_HIGH_PROFILES = frozenset((100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135))
+
+HEVC_NAL_RASL_N = 8
+HEVC_NAL_RASL_R = 9
+HEVC_NAL_BLA_W_LP = 16
+HEVC_NAL_IDR_W_RADL = 19
+HEVC_NAL_IDR_N_LP = 20
+HEVC_NAL_CRA = 21
+HEVC_NAL_SPS = 33
+HEVC_NAL_PPS = 34
+# slice_type：0 B，1 P，2 I
+HEVC_SLICE_TYPES = ('B', 'P', 'I')
+
+# 包头部窗口：多数包的第一个片在该范围内开始
+HEAD_BYTES = 512
+# 片头只需要前若干字节
+SLICE_HEADER_BYTES = 16
+
+# H.264 片头前两字节 -> (first_mb_in_slice, slice_type, pic_parameter_set_id, 已读位数)；
+# 同一路流的片头前缀只有少数几种，命中后不再逐位解析
+_H264_PREFIX_CACHE = {}
+
+
+class BitReader:
+    """按位读取去除防竞争字节后的 RBSP，对应 bs.h 的 bs_read/bs_read_ue/bs_read_se"""
+    __slots__ = ('value', 'bits', 'pos')
+
+    def __init__(self, rbsp):
+        self.value = int.from_bytes(rbsp, 'big')
+        self.bits = len(rbsp) * 8
+        self.pos = 0
+
+    def u(self, count):
+        self.pos += count
+        if self.pos > self.bits:
+            raise ValueError("码流长度不足")
+        return (self.value >> (self.bits - self.pos)) & ((1 << count) - 1)
+
+    def ue(self):
+        remaining = self.bits - self.pos
+        rest = self.value & ((1 << remaining) - 1)
+        if not rest:
+            raise ValueError("指数哥伦布码不完整")
+        zeros = remaining - rest.bit_length()
+        self.pos += zeros
+        return self.u(zeros + 1) - 1
+
+    def ues(self, count):
+        """连续读取 count 个 ue(v)，片头前缀的热路径"""
+        value = self.value
+        bits = self.bits
+        pos = self.pos
+        result = []
+        for _ in range(count):
+            rest = value & ((1 << (bits - pos)) - 1)
+            if not rest:
+                raise ValueError("指数哥伦布码不完整")
+            length = 2 * (bits - pos - rest.bit_length()) + 1
+            pos += length
+            result.append((rest >> (bits - pos)) - 1)
+        self.pos = pos
+        return result
+
+    def se(self):
+        k = self.ue()
+        return (k + 1) // 2 if k & 1 else -(k // 2)
+
+
+def unescape(nal):
+    """去除防竞争字节 0x000003 中的 03"""
+    return nal.replace(b'\x00\x00\x03', b'\x00\x00')
+
+
+def iter_annexb(data):
+    """按起始码切分 Annex-B 码流，逐个返回 NAL（含 NAL 头）的 (起点, 终点)，最后一个 NAL 的终点为数据长度"""
+    pos = data.find(b'\x00\x00\x01')
+    while pos >= 0:
+        start = pos + 3
+        pos = data.find(b'\x00\x00\x01', start)
+        if pos < 0:
+            yield start, len(data)
+            return
+        end = pos
+        # 四字节起始码的前导 0 不属于上一个 NAL
+        while end > start and data[end - 1] == 0:
+            end -= 1
+        yield start, end
+
+
+def iter_length_prefixed(data, length_size):
+    """按长度前缀切分 AVCC/HVCC 码流，返回值同 iter_annexb；数据被截断时终点可能超出数据长度"""
+    pos = 0
+    total = len(data)
+    while pos + length_size <= total:
+        size = int.from_bytes(data[pos:pos + length_size], 'big')
+        pos += length_size
+        if size <= 0:
+            return
+        yield pos, pos + size
+        pos += size
+
+
+def skip_scaling_list(r, size):
+    last = 8
+    next_scale = 8
+    for _ in range(size):
+        if next_scale:
+            next_scale = (last + r.se()) & 0xFF
+        last = next_scale or last
+
+
+def parse_h264_sps(nal):
+    """返回 (sps_id, {log2_max_frame_num, gaps_allowed, separate_colour_plane})"""
+    r = BitReader(unescape(nal[1:]))
+    profile_idc = r.u(8)
+    r.u(16)  # constraint_set 标志与 level_idc
+    sps_id = r.ue()
+    separate_colour_plane = 0
+    if profile_idc in H264_HIGH_PROFILES:
+        chroma_format_idc = r.ue()
+        if chroma_format_idc == 3:
+            separate_colour_plane = r.u(1)
+        r.ue()  # bit_depth_luma_minus8
+        r.ue()  # bit_depth_chroma_minus8
+        r.u(1)  # qpprime_y_zero_transform_bypass_flag
+        if r.u(1):  # seq_scaling_matrix_present_flag
+            for i in range(12 if chroma_format_idc == 3 else 8):
+                if r.u(1):
+                    skip_scaling_list(r, 16 if i < 6 else 64)
+    log2_max_frame_num = r.ue() + 4
+    poc_type = r.ue()
+    if poc_type == 0:
+        r.ue()  # log2_max_pic_order_cnt_lsb_minus4
+    elif poc_type == 1:
+        r.u(1)  # delta_pic_order_always_zero_flag
+        r.se()  # offset_for_non_ref_pic
+        r.se()  # offset_for_top_to_bottom_field
+        for _ in range(r.ue()):
+            r.se()
+    r.ue()  # max_num_ref_frames
+    gaps_allowed = r.u(1)
+    return sps_id, {'log2_max_frame_num': log2_max_frame_num, 'gaps_allowed': gaps_allowed,
+                    'separate_colour_plane': separate_colour_plane}
+
+
+def parse_h264_pps(nal):
+    """返回 (pps_id, sps_id)"""
+    r = BitReader(unescape(nal[1:SLICE_HEADER_BYTES]))
+    return r.ue(), r.ue()
+
+
+def parse_hevc_pps(nal):
+    """返回 (pps_id, {dependent_slices, extra_bits})，片头解析只需要这两个字段"""
+    r = BitReader(unescape(nal[2:SLICE_HEADER_BYTES]))
+    pps_id = r.ue()
+    r.ue()  # pps_seq_parameter_set_id
+    dependent_slices = r.u(1)
+    r.u(1)  # output_flag_present_flag
+    return pps_id, {'dependent_slices': dependent_slices, 'extra_bits': r.u(3)}
+
+
+def extradata_nals(codec, extradata):
+    """从 extradata 取出参数集，返回 (长度前缀字节数, [NAL])；Annex-B 格式的长度前缀字节数为 0"""
+    if not extradata:
+        return 0, []
+    if extradata[:3] == b'\x00\x00\x01' or extradata[:4] == b'\x00\x00\x00\x01':
+        return 0, [extradata[start:end] for start, end in iter_annexb(extradata)]
+    nals = []
+    try:
+        if codec == 'hevc' and len(extradata) >= 23:
+            # HEVCDecoderConfigurationRecord
+            length_size = (extradata[21] & 0x03) + 1
+            pos = 23
+            for _ in range(extradata[22]):
+                count = int.from_bytes(extradata[pos + 1:pos + 3], 'big')
+                pos += 3
+                for _ in range(count):
+                    size = int.from_bytes(extradata[pos:pos + 2], 'big')
+                    nals.append(extradata[pos + 2:pos + 2 + size])
+                    pos += 2 + size
+            return length_size, nals
+        if extradata[0] == 1 and len(extradata) >= 7:
+            # AVCDecoderConfigurationRecord
+            length_size = (extradata[4] & 0x03) + 1
+            pos = 6
+            for _ in range(extradata[5] & 0x1F):
+                size = int.from_bytes(extradata[pos:pos + 2], 'big')
+                nals.append(extradata[pos + 2:pos + 2 + size])
+                pos += 2 + size
+            pps_count = extradata[pos]
+            pos += 1
+            for _ in range(pps_count):
+                size = int.from_bytes(extradata[pos:pos + 2], 'big')
+                nals.append(extradata[pos + 2:pos + 2 + size])
+                pos += 2 + size
+            return length_size, nals
+    except IndexError:
+        pass
+    return 4, nals
+
+
+class SliceClassifier:
+    """单路会话的帧类型统计：计数跨重连累计，参数集与同步状态按连接重建"""
+    __slots__ = ('codec', 'length_size', 'sps', 'pps', 'synced', 'prev_frame_num', 'cra_start',
+                 'i_frames', 'p_frames', 'b_frames', 'idr_frames', 'missing_refs', 'unparsed', 'last_type')
+
+    def __init__(self):
+        self.codec = None
+        self.length_size = 0
+        self.sps = {}
+        self.pps = {}
+        self.synced = False
+        self.prev_frame_num = None
+        self.cra_start = False
+        self.i_frames = 0
+        self.p_frames = 0
+        self.b_frames = 0
+        self.idr_frames = 0
+        self.missing_refs = 0
+        self.unparsed = 0
+        self.last_type = None
+
+    def configure(self, codec_name, extradata):
+        """每次连接成功后按视频流的编码与 extradata 重建解析状态，不支持的编码返回 False"""
+        codec_name = (codec_name or '').lower()
+        self.codec = 'h264' if codec_name == 'h264' else 'hevc' if codec_name in ('hevc', 'h265') else None
+        self.sps = {}
+        self.pps = {}
+        self.synced = False
+        self.prev_frame_num = None
+        self.cra_start = False
+        if self.codec is None:
+            return False
+        self.length_size, nals = extradata_nals(self.codec, bytes(extradata or b''))
+        for nal in nals:
+            self._parameter_set(nal)
+        return True
+
+    def _nal_type(self, nal):
+        return nal[0] & 0x1F if self.codec == 'h264' else (nal[0] >> 1) & 0x3F
+
+    def _parameter_set(self, nal):
+        if not nal:
+            return
+        try:
+            nal_type = self._nal_type(nal)
+            if self.codec == 'h264':
+                if nal_type == H264_NAL_SPS:
+                    sps_id, sps = parse_h264_sps(nal)
+                    self.sps[sps_id] = sps
+                elif nal_type == H264_NAL_PPS:
+                    pps_id, sps_id = parse_h264_pps(nal)
+                    self.pps[pps_id] = sps_id
+            elif nal_type == HEVC_NAL_PPS:
+                pps_id, pps = parse_hevc_pps(nal)
+                self.pps[pps_id] = pps
+        except ValueError:
+            self.unparsed += 1
+
+    def _nals(self, data):
+        if self.length_size:
+            return iter_length_prefixed(data, self.length_size)
+        return iter_annexb(data)
+
+    def classify(self, packet):
+        """识别一个视频包（一个访问单元）的帧类型，返回 'I'/'P'/'B'，无法识别时返回 None"""
+        if self.codec is None:
+            return None
+        try:
+            view = memoryview(packet)
+        except TypeError:
+            # 不支持缓冲区协议的包对象（如基准测试的合成包）
+            view = memoryview(bytes(packet))
+        data = bytes(view[:HEAD_BYTES])
+        whole = len(view) <= HEAD_BYTES
+        h264 = self.codec == 'h264'
+        try:
+            while True:
+                total = len(data)
+                for start, end in self._nals(data):
+                    if start >= total:
+                        continue
+                    if h264:
+                        nal_type = data[start] & 0x1F
+                        is_slice = nal_type == H264_NAL_SLICE or nal_type == H264_NAL_IDR
+                    else:
+                        nal_type = (data[start] >> 1) & 0x3F
+                        is_slice = nal_type < 32
+                    if not whole and end >= total and (not is_slice or total - start < SLICE_HEADER_BYTES):
+                        # NAL 被头部窗口截断（大块 SEI 或片头不完整），改用整个包重新解析
+                        break
+                    if is_slice:
+                        if h264:
+                            return self._h264_slice(data, start, nal_type)
+                        return self._hevc_slice(data, start, nal_type)
+                    self._parameter_set(data[start:end])
+                else:
+                    return None
+                data = bytes(view)
+                whole = True
+        except (ValueError, IndexError):
+            self.unparsed += 1
+            return None
+
+    def _count(self, frame_type, key):
+        if frame_type == 'I':
+            self.i_frames += 1
+        elif frame_type == 'P':
+            self.p_frames += 1
+        else:
+            self.b_frames += 1
+        if key:
+            self.idr_frames += 1
+        self.last_type = frame_type
+        return frame_type
+
+    def _h264_slice(self, data, start, nal_type):
+        rbsp = unescape(data[start + 1:start + SLICE_HEADER_BYTES])
+        prefix = _H264_PREFIX_CACHE.get(rbsp[:2])
+        if prefix is None:
+            r = BitReader(rbsp)
+            prefix = (*r.ues(3), r.pos)
+            if r.pos <= 16:
+                _H264_PREFIX_CACHE[rbsp[:2]] = prefix
+        first_mb, slice_type, pps_id, pos = prefix
+        if first_mb != 0:
+            # 不是图像的第一个片（同一访问单元的后续片），不重复计数
+            return None
+        frame_type = H264_SLICE_TYPES[slice_type % 5]
+        sps = self.sps.get(self.pps.get(pps_id))
+        idr = nal_type == H264_NAL_IDR
+        if not self.synced:
+            if not idr and frame_type != 'I':
+                # 首个关键帧之前的预测帧缺少参考帧
+                self.missing_refs += 1
+                return self._count(frame_type, idr)
+            # 部分设备以非 IDR 的 I 帧作为随机接入点
+            self.synced = True
+            self.prev_frame_num = None
+        if sps is not None:
+            r = BitReader(rbsp)
+            r.pos = pos
+            if sps['separate_colour_plane']:
+                r.u(2)
+            max_frame_num = 1 << sps['log2_max_frame_num']
+            frame_num = r.u(sps['log2_max_frame_num'])
+            prev = self.prev_frame_num
+            if (not idr and prev is not None and not sps['gaps_allowed']
+                    and frame_num != prev and frame_num != (prev + 1) % max_frame_num):
+                # frame_num 跳过的值即丢失的参考帧数
+                self.missing_refs += (frame_num - prev - 1) % max_frame_num
+            # nal_ref_idc 非 0 的图像是参考帧，后续图像的 frame_num 以它为基准
+            if data[start] & 0x60:
+                self.prev_frame_num = frame_num
+        return self._count(frame_type, idr)
+
+    def _hevc_slice(self, data, start, nal_type):
+        r = BitReader(unescape(data[start + 2:start + SLICE_HEADER_BYTES]))
+        if not r.u(1):
+            # first_slice_segment_in_pic_flag 为 0：同一图像的后续片段
+            return None
+        irap = HEVC_NAL_BLA_W_LP <= nal_type <= 23
+        if irap:
+            r.u(1)  # no_output_of_prior_pics_flag
+        pps = self.pps.get(r.ue(), {'extra_bits': 0})
+        r.u(pps['extra_bits'])
+        frame_type = HEVC_SLICE_TYPES[r.ue() % 3]
+        idr = nal_type in (HEVC_NAL_IDR_W_RADL, HEVC_NAL_IDR_N_LP)
+        if irap:
+            # 以 CRA 起播或遇到 BLA 时，其后的 RASL 帧引用了随机接入点之前的图像
+            self.cra_start = nal_type < HEVC_NAL_IDR_W_RADL or (not self.synced and not idr)
+            self.synced = True
+        elif not self.synced or (self.cra_start and nal_type in (HEVC_NAL_RASL_N, HEVC_NAL_RASL_R)):
+            self.missing_refs += 1
+        return self._count(frame_type, idr)
+
+
+def summarize_slices(statuses):
+    """按指标表的状态字典整理每路帧类型统计，没有统计数据的流不列出"""
+    rows = []
+    for thread_id, status_info in statuses.items():
+        i_frames = status_info.get('i_frames', 0)
+        p_frames = status_info.get('p_frames', 0)
+        b_frames = status_info.get('b_frames', 0)
+        if not (i_frames or p_frames or b_frames):
+            continue
+        rows.append({
+            'thread_id': thread_id,
+            'i_frames': i_frames,
+            'p_frames': p_frames,
+            'b_frames': b_frames,
+            'idr_frames': status_info.get('idr_frames', 0),
+            'missing_refs': status_info.get('missing_refs', 0),
+        })
+    return rows
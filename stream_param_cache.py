@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+按 URL 缓存的流参数（缩短重连探测）
+
+核心思路：
+- 完整探测（rtsp_probe_size / rtsp_analyzeduration）成功后，按 URL 记录编码、分辨率、帧率、时间基与
+  extradata（SPS/PPS/VPS），写入 JSON 文件，下一次压测启动后同样生效；URL 中的用户名密码不写入文件。
+- 命中缓存的连接改用 fast_probe_size / fast_analyzeduration 打开，打开后由 check_params 核对编码、分辨率、
+  时间基与 extradata，任一项不一致，或分辨率与 extradata 都没探测到时，调用方关闭容器改用完整探测，
+  并用新结果覆盖缓存。
+- 快速探测可能拿不到帧率和 extradata，由调用方按缓存补齐（帧率用于丢帧检测，extradata 用于解码与帧类型识别）。
+- 每个条目保存完整探测连接耗时（与会话的 connect_latency 同口径）的滑动平均，作为快速探测节省时间的基准，
+  重启压测后仍可比较。
+- 本模块不依赖全局配置，文件路径由调用方传入；多进程引擎的每个工作进程各自加载，写盘时与文件中已有条目合并。
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+# 完整探测耗时基准的平滑系数
+LATENCY_SMOOTHING = 0.2
+
+
+def cache_key(url):
+    """去掉用户名密码的 URL，作为缓存键和文件中的条目名"""
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        netloc = f"{host}:{parts.port}" if host and parts.port else (host or parts.netloc)
+    except ValueError:
+        return url
+    return urlunsplit((parts.scheme, netloc, parts.path, parts.query, ''))
+
+
+def read_stream_params(container):
+    """读取已打开容器的视频流参数，没有视频流时返回 None"""
+    try:
+        stream = container.streams.video[0]
+    except (IndexError, AttributeError):
+        return None
+    codec_context = stream.codec_context
+    time_base = stream.time_base
+    fps = float(stream.average_rate) if stream.average_rate else 0.0
+    return {
+        'codec': codec_context.name or '',
+        'width': codec_context.width or 0,
+        'height': codec_context.height or 0,
+        'fps': fps if 1 <= fps <= 120 else 0.0,
+        'time_base': [time_base.numerator, time_base.denominator] if time_base else None,
+        'extradata': bytes(codec_context.extradata or b''),
+    }
+
+
+def check_params(cached, probed):
+    """核对快速探测结果与缓存，一致时返回 None，否则返回不一致的项名"""
+    if probed is None or not probed['codec']:
+        return "视频流"
+    if probed['codec'] != cached['codec']:
+        return "编码"
+    if probed['width'] and (probed['width'], probed['height']) != (cached['width'], cached['height']):
+        return "分辨率"
+    if probed['time_base'] and cached['time_base'] and probed['time_base'] != cached['time_base']:
+        return "时间基"
+    if probed['extradata'] and probed['extradata'] != cached['extradata']:
+        return "extradata"
+    if not probed['width'] and not probed['extradata']:
+        # 两者都没有时无法确认参数未变
+        return "分辨率"
+    return None
+
+
+class StreamParamCache:
+    """进程内共享的流参数缓存，读写加锁，条目变化时写盘"""
+    def __init__(self):
+        self.entries = {}
+        self.path = None
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """切换到 path 对应的缓存文件，路径未变时不重复读取"""
+        with self._lock:
+            if path == self.path:
+                return
+            self.path = path
+            self.entries = self._read_file(path)
+
+    def get(self, url):
+        with self._lock:
+            return self.entries.get(cache_key(url))
+
+    def put(self, url, params, full_latency):
+        """记录一次完整探测的结果，full_latency 为该次连接耗时，为 None 时沿用原有基准"""
+        key = cache_key(url)
+        with self._lock:
+            old = self.entries.get(key)
+            entry = dict(params)
+            if full_latency is None:
+                entry['full_latency'] = old.get('full_latency', 0.0) if old else 0.0
+            elif old and old.get('full_latency'):
+                entry['full_latency'] = old['full_latency'] + LATENCY_SMOOTHING * (full_latency - old['full_latency'])
+            else:
+                entry['full_latency'] = full_latency
+            if not entry['fps'] and old and self._same_stream(old, entry):
+                entry['fps'] = old['fps']
+            changed = old is None or not self._same_stream(old, entry) or old['fps'] != entry['fps']
+            self.entries[key] = entry
+            if changed:
+                self._write_file()
+
+    def invalidate(self, url):
+        with self._lock:
+            if self.entries.pop(cache_key(url), None) is not None:
+                self._write_file()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._write_file()
+
+    @staticmethod
+    def _same_stream(a, b):
+        return all(a[name] == b[name] for name in ('codec', 'width', 'height', 'time_base', 'extradata'))
+
+    @staticmethod
+    def _read_file(path):
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            entries = {}
+            for key, item in raw.items():
+                entry = dict(item)
+                entry['extradata'] = base64.b64decode(item.get('extradata', ''))
+                entries[key] = entry
+            return entries
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"流参数缓存文件 {path} 无法读取，将重新探测: {e}")
+            return {}
+
+    def _write_file(self):
+        """与文件中其他进程写入的条目合并后整体替换，写入失败只记录日志"""
+        if not self.path:
+            return
+        merged = self._read_file(self.path)
+        merged.update(self.entries)
+        raw = {key: dict(entry, extradata=base64.b64encode(entry['extradata']).decode('ascii'))
+               for key, entry in merged.items()}
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(raw, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"流参数缓存写入失败: {e}")
+
+
+PARAM_CACHE = StreamParamCache()
+
+
+def summarize_probe(statuses):
+    """按指标表的状态字典汇总快速探测与完整探测的连接次数、平均耗时和节省的时间"""
+    totals = {'fast_connects': 0, 'full_connects': 0, 'fallbacks': 0,
+              'fast_seconds': 0.0, 'full_seconds': 0.0, 'saved_seconds': 0.0}
+    for status_info in statuses.values():
+        totals['fast_connects'] += status_info.get('probe_fast_connects', 0)
+        totals['full_connects'] += status_info.get('probe_full_connects', 0)
+        totals['fallbacks'] += status_info.get('probe_fallbacks', 0)
+        totals['fast_seconds'] += status_info.get('probe_fast_seconds', 0.0)
+        totals['full_seconds'] += status_info.get('probe_full_seconds', 0.0)
+        totals['saved_seconds'] += status_info.get('probe_saved_seconds', 0.0)
+    if not totals['fast_connects'] and not totals['full_connects']:
+        return None
+    totals['fast_avg'] = totals['fast_seconds'] / totals['fast_connects'] if totals['fast_connects'] else 0.0
+    totals['full_avg'] = totals['full_seconds'] / totals['full_connects'] if totals['full_connects'] else 0.0
+    return totals
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+长稳测试时序存储
+
+核心思路：
+- 独立采样线程每秒对指标表取一次快照（序列锁读取，不阻塞会话线程），会话线程本身不做任何额外写入。
+- 按列存储：每个分辨率（1s/10s/1min）一个目录，每列一个只追加的二维定长文件 [时间槽, 流]，
+  列号即指标表行号；文件按块预扩容并用 numpy.memmap 映射，写入只是内存拷贝，刷盘交给采样线程。
+- 10s/1min 汇总由采样线程在内存中累加，满周期追加一行，长时间运行时报表与图表直接读汇总列。
+- rows.bin 记录各分辨率已提交的行数（先写数据再更新行数），读取方随时打开都能看到完整的行；
+  meta.json 记录列定义、流列表和采样间隔。
+- 读取方 TimeSeriesStore 只映射需要的列，按块遍历统计，不会把整段历史读入内存。
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+# 每秒序列的列：(列名, 类型, 汇总方式)
+# fps/connect_latency 为采样瞬时值，bytes/lost_frames 为本周期增量，reconnects 为累计值，status 为状态编码
+COLUMNS = (
+    ('fps', 'f4', 'mean'),
+    ('bytes', 'i8', 'sum'),
+    ('lost_frames', 'i4', 'sum'),
+    ('reconnects', 'i4', 'last'),
+    ('connect_latency', 'f4', 'max'),
+    ('status', 'i1', 'last'),
+)
+# (分辨率名, 每行覆盖的采样数)
+RESOLUTIONS = (('1s', 1), ('10s', 10), ('1min', 60))
+
+CHUNK_ROWS = 3600           # 文件每次扩容的行数
+FLUSH_INTERVAL = 10.0       # 刷盘间隔，秒
+META_FILE = 'meta.json'
+ROWS_FILE = 'rows.bin'
+
+
+def new_run_dir(base_dir):
+    """在 base_dir 下按启动时间创建本次运行的目录"""
+    path = os.path.join(base_dir, datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+    suffix = 1
+    candidate = path
+    while os.path.exists(candidate):
+        suffix += 1
+        candidate = f"{path}-{suffix}"
+    os.makedirs(candidate)
+    return candidate
+
+
+def _column_path(path, resolution, name):
+    return os.path.join(path, resolution, f"{name}.bin")
+
+
+class _ColumnFile:
+    """一个只追加的定长列文件，width 为 0 时是一维（时间列）"""
+    def __init__(self, filename, dtype, width):
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.capacity = 0
+        self.data = None
+        open(filename, 'wb').close()
+
+    def ensure(self, rows):
+        if rows <= self.capacity:
+            return
+        capacity = self.capacity + max(CHUNK_ROWS, rows - self.capacity)
+        if self.data is not None:
+            self.data.flush()
+            self.data = None
+        with open(self.filename, 'r+b') as f:
+            f.truncate(capacity * max(1, self.width) * self.dtype.itemsize)
+        shape = (capacity, self.width) if self.width else (capacity,)
+        self.data = np.memmap(self.filename, dtype=self.dtype, mode='r+', shape=shape)
+        self.capacity = capacity
+
+    def flush(self):
+        if self.data is not None:
+            self.data.flush()
+
+    def close(self):
+        self.flush()
+        self.data = None
+
+
+class _ResolutionWriter:
+    """某个分辨率下全部列的写入"""
+    def __init__(self, path, name, width, rows_view, rows_index):
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+        self.name = name
+        self.rows = 0
+        self._rows_view = rows_view
+        self._rows_index = rows_index
+        self.time = _ColumnFile(_column_path(path, name, 'time'), 'f8', 0)
+        self.columns = {column: _ColumnFile(_column_path(path, name, column), dtype, width)
+                        for column, dtype, _ in COLUMNS}
+
+    def append(self, timestamp, values):
+        row = self.rows
+        self.time.ensure(row + 1)
+        self.time.data[row] = timestamp
+        for column, data in values.items():
+            column_file = self.columns[column]
+            column_file.ensure(row + 1)
+            column_file.data[row] = data
+        # 数据写完后再提交行数
+        self.rows = row + 1
+        self._rows_view[self._rows_index] = self.rows
+
+    def flush(self):
+        self.time.flush()
+        for column_file in self.columns.values():
+            column_file.flush()
+
+    def close(self):
+        self.time.close()
+        for column_file in self.columns.values():
+            column_file.close()
+
+
+class _Rollup:
+    """按采样数累加一个汇总周期"""
+    def __init__(self, writer, samples, width):
+        self.writer = writer
+        self.samples = samples
+        self.count = 0
+        self.fps_sum = np.zeros(width, dtype=np.float64)
+        self.bytes_sum = np.zeros(width, dtype=np.int64)
+        self.lost_sum = np.zeros(width, dtype=np.int64)
+        self.latency_max = np.zeros(width, dtype=np.float32)
+        self.last = None
+
+    def add(self, timestamp, values):
+        self.count += 1
+        self.fps_sum += values['fps']
+        self.bytes_sum += values['bytes']
+        self.lost_sum += values['lost_frames']
+        np.maximum(self.latency_max, values['connect_latency'], out=self.latency_max)
+        self.last = values
+        if self.count >= self.samples:
+            self.emit(timestamp)
+
+    def emit(self, timestamp):
+        if not self.count:
+            return
+        self.writer.append(timestamp, {
+            'fps': self.fps_sum / self.count,
+            'bytes': self.bytes_sum,
+            'lost_frames': self.lost_sum,
+            'reconnects': self.last['reconnects'],
+            'connect_latency': self.latency_max,
+            'status': self.last['status'],
+        })
+        self.count = 0
+        self.fps_sum[:] = 0
+        self.bytes_sum[:] = 0
+        self.lost_sum[:] = 0
+        self.latency_max[:] = 0
+
+
+class TimeSeriesWriter(threading.Thread):
+    """每 interval 秒采样一次指标表并追加到时序存储，width 为预计的流数量（列数）"""
+    def __init__(self, table, path, width, interval=1.0):
+        super().__init__(name="TimeSeriesWriter", daemon=True)
+        self.table = table
+        self.path = path
+        self.width = max(1, width)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.streams = []
+        self.started_at = None
+
+        with open(os.path.join(path, ROWS_FILE), 'wb') as f:
+            f.write(bytes(8 * len(RESOLUTIONS)))
+        self._rows = np.memmap(os.path.join(path, ROWS_FILE), dtype='<i8', mode='r+', shape=(len(RESOLUTIONS),))
+        self.resolutions = [_ResolutionWriter(path, name, self.width, self._rows, i)
+                            for i, (name, _) in enumerate(RESOLUTIONS)]
+        self.rollups = [_Rollup(writer, samples, self.width)
+                        for writer, (_, samples) in zip(self.resolutions[1:], RESOLUTIONS[1:])]
+        self._last_bytes = np.zeros(self.width, dtype=np.int64)
+        self._last_lost = np.zeros(self.width, dtype=np.int64)
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'version': 1,
+            'interval': self.interval,
+            'width': self.width,
+            'started_at': self.started_at,
+            'columns': [[name, dtype, rollup] for name, dtype, rollup in COLUMNS],
+            'resolutions': [[name, samples] for name, samples in RESOLUTIONS],
+            'streams': self.streams,
+        }
+        tmp = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def run(self):
+        self.started_at = time.time()
+        self._write_meta()
+        next_sample = self.started_at + self.interval
+        last_flush = self.started_at
+        while not self.stop_event.wait(max(0.0, next_sample - time.time())):
+            try:
+                self.sample(next_sample)
+                if time.time() - last_flush >= FLUSH_INTERVAL:
+                    self.flush()
+                    last_flush = time.time()
+            except Exception as e:
+                logging.error(f"时序数据写入失败，停止记录: {e}")
+                break
+            next_sample += self.interval
+            # 采样落后（如系统休眠）时跳过缺失的时间槽
+            if next_sample < time.time():
+                next_sample = time.time() + self.interval
+        self._finish()
+
+    def sample(self, timestamp):
+        """读取一次指标表快照并追加一行"""
+        snapshot = self.table.snapshot()[:self.width]
+        count = len(snapshot)
+        thread_ids = self.table.thread_ids[:count]
+        if len(thread_ids) > len(self.streams):
+            self.streams.extend(thread_ids[len(self.streams):])
+            self._write_meta()
+
+        total_bytes = np.zeros(self.width, dtype=np.int64)
+        total_lost = np.zeros(self.width, dtype=np.int64)
+        total_bytes[:count] = snapshot['total_bytes']
+        total_lost[:count] = snapshot['lost_frames']
+        values = {name: np.zeros(self.width, dtype=dtype) for name, dtype, _ in COLUMNS}
+        values['fps'][:count] = snapshot['current_fps']
+        values['reconnects'][:count] = snapshot['reconnect_count']
+        values['connect_latency'][:count] = snapshot['connect_latency']
+        values['status'][:count] = snapshot['status']
+        # 会话的累计计数在重连后可能回落，增量按 0 处理
+        values['bytes'][:] = np.maximum(total_bytes - self._last_bytes, 0)
+        values['lost_frames'][:] = np.maximum(total_lost - self._last_lost, 0)
+        self._last_bytes = total_bytes
+        self._last_lost = total_lost
+
+        self.resolutions[0].append(timestamp, values)
+        for rollup in self.rollups:
+            rollup.add(timestamp, values)
+
+    def flush(self):
+        for writer in self.resolutions:
+            writer.flush()
+        self._rows.flush()
+
+    def _finish(self):
+        # 不足一个汇总周期的尾部数据也写出
+        timestamp = time.time()
+        for rollup in self.rollups:
+            rollup.emit(timestamp)
+        self.flush()
+        self._write_meta()
+        for writer in self.resolutions:
+            writer.close()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join(timeout=timeout)
+
+
+def start_recording(table, base_dir, width):
+    """在 base_dir 下新建本次运行目录并启动采样线程"""
+    writer = TimeSeriesWriter(table, new_run_dir(base_dir), width)
+    writer.start()
+    logging.info(f"长稳时序记录已启动: {writer.path}")
+    return writer
+
+
+class TimeSeriesStore:
+    """只读打开一次运行的时序数据，列按需映射"""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.width = self.meta['width']
+        self.streams = self.meta['streams']
+        self.resolution_names = [name for name, _ in self.meta['resolutions']]
+        self.dtypes = {name: dtype for name, dtype, _ in self.meta['columns']}
+
+    def rows(self, resolution='1s'):
+        """已提交的行数，写入方运行中也可以读取"""
+        rows = np.fromfile(os.path.join(self.path, ROWS_FILE), dtype='<i8')
+        return int(rows[self.resolution_names.index(resolution)])
+
+    def _map(self, resolution, name, dtype, width):
+        rows = self.rows(resolution)
+        if not rows:
+            return np.zeros((0, width) if width else (0,), dtype=dtype)
+        shape = (rows, width) if width else (rows,)
+        return np.memmap(_column_path(self.path, resolution, name), dtype=dtype, mode='r', shape=shape)
+
+    def times(self, resolution='1s'):
+        return self._map(resolution, 'time', 'f8', 0)
+
+    def column(self, name, resolution='1s'):
+        """返回 [时间槽, 流] 的只读映射，列号与 streams 对应"""
+        return self._map(resolution, name, self.dtypes[name], self.width)
+
+    def iter_chunks(self, name, resolution='1min', chunk_rows=CHUNK_ROWS):
+        data = self.column(name, resolution)
+        for start in range(0, len(data), chunk_rows):
+            yield np.asarray(data[start:start + chunk_rows])
+
+    def summarize(self, resolution='1min'):
+        """按流汇总整段历史，返回每路流一项的列表"""
+        count = len(self.streams)
+        rows = self.rows(resolution)
+        if not count or not rows:
+            return []
+        fps_sum = np.zeros(count)
+        fps_min = np.full(count, np.inf)
+        for chunk in self.iter_chunks('fps', resolution):
+            fps_sum += chunk[:, :count].sum(axis=0)
+            np.minimum(fps_min, chunk[:, :count].min(axis=0), out=fps_min)
+        total_bytes = np.zeros(count, dtype=np.int64)
+        for chunk in self.iter_chunks('bytes', resolution):
+            total_bytes += chunk[:, :count].sum(axis=0)
+        total_lost = np.zeros(count, dtype=np.int64)
+        for chunk in self.iter_chunks('lost_frames', resolution):
+            total_lost += chunk[:, :count].sum(axis=0)
+        latency_max = np.zeros(count)
+        for chunk in self.iter_chunks('connect_latency', resolution):
+            np.maximum(latency_max, chunk[:, :count].max(axis=0), out=latency_max)
+        reconnects = np.asarray(self.column('reconnects', resolution)[-1, :count])
+
+        times = self.times(resolution)
+        duration = float(times[-1] - self.meta['started_at']) if self.meta.get('started_at') else 0.0
+        return [{
+            'thread_id': thread_id,
+            'duration': duration,
+            'avg_fps': float(fps_sum[i] / rows),
+            'min_fps': float(fps_min[i]),
+            'total_bytes': int(total_bytes[i]),
+            'lost_frames': int(total_lost[i]),
+            'reconnects': int(reconnects[i]),
+            'max_latency': float(latency_max[i]),
+        } for i, thread_id in enumerate(self.streams)]